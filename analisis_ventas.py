@@ -0,0 +1,243 @@
+import argparse
+import sqlite3
+
+import pandas as pd
+
+import presupuesto_backend
+
+# --- Análisis de ventas y márgenes ---
+# Todas las agregaciones se hacen dentro de SQLite (GROUP BY y funciones de ventana) y llegan
+# ya resumidas a pandas. Los resultados se cachean y la caché se invalida sola cuando otra
+# conexión guarda cambios en la base (PRAGMA data_version).
+# Con usar_snapshot() (o --snapshot) los análisis corren sobre un snapshot exportado con
+# exportacion.py en lugar de la base en uso.
+
+ESTADOS_PEDIDO_VALIDOS = ('pendiente', 'aprobada', 'entregada') # Las notas canceladas no cuentan como venta
+
+_conexion = None
+_conexion_db_path = None
+_snapshot = None # Carpeta del snapshot en uso, o None para leer de la base
+_version_datos = None
+_cache = {}
+
+
+def _conexion_lectura():
+    """Conexión de solo lectura reutilizada por todos los análisis (se reabre si cambia DB_PATH)."""
+    global _conexion, _conexion_db_path
+    if _snapshot is not None:
+        return _conexion
+    if _conexion is None or _conexion_db_path != presupuesto_backend.DB_PATH:
+        if _conexion is not None:
+            _conexion.close()
+        _conexion = sqlite3.connect(presupuesto_backend.DB_PATH)
+        _conexion_db_path = presupuesto_backend.DB_PATH
+        _cache.clear()
+    return _conexion
+
+
+def _consultar(nombre, query, params=()):
+    """
+    Ejecuta una consulta de análisis y cachea el DataFrame resultante por (nombre, parámetros).
+    PRAGMA data_version cambia cada vez que otra conexión confirma una escritura, así que
+    si cambió desde la última consulta se descarta toda la caché.
+    """
+    global _version_datos
+    conn = _conexion_lectura()
+    version = conn.execute("PRAGMA data_version").fetchone()[0]
+    if version != _version_datos:
+        _cache.clear()
+        _version_datos = version
+
+    clave = (nombre, tuple(params))
+    if clave not in _cache:
+        _cache[clave] = pd.read_sql_query(query, conn, params=params)
+    return _cache[clave].copy()
+
+
+def usar_snapshot(carpeta=None):
+    """
+    Hace que los análisis lean del snapshot en 'carpeta' (cargado en una base en memoria) en lugar de
+    presupuestos.db. Con carpeta=None se vuelve a leer de la base.
+    """
+    global _conexion, _conexion_db_path, _snapshot
+    import exportacion
+
+    if _conexion is not None:
+        _conexion.close()
+    _conexion, _conexion_db_path, _snapshot = None, None, None
+    _cache.clear()
+    if carpeta is not None:
+        _conexion = exportacion.base_en_memoria(carpeta, ['clientes', 'productos', 'notas_pedido', 'detalle_pedido', 'presupuestos'])
+        _snapshot = carpeta
+
+
+def invalidar_cache():
+    """Descarta todos los resultados cacheados (por ejemplo, después de escribir con la misma conexión)."""
+    _cache.clear()
+
+
+def _filtro_fechas(columna, desde, hasta):
+    """Devuelve (condición SQL, parámetros) para un rango de fechas opcional en formato AAAA-MM-DD."""
+    condiciones, params = [], []
+    if desde:
+        condiciones.append(f"{columna} >= ?")
+        params.append(desde)
+    if hasta:
+        condiciones.append(f"{columna} <= ?")
+        params.append(hasta)
+    return "".join(f" AND {c}" for c in condiciones), params
+
+
+def margen_por_producto(desde=None, hasta=None):
+    """
+    Ventas, costo y margen por producto sobre las líneas de notas de pedido no canceladas.
+    El costo usa el costo_base actual del producto (no se guarda el costo histórico de cada venta).
+    Columnas: codigo, descripcion, unidades, ventas, costo, margen, margen_pct, ranking.
+    """
+    filtro, params = _filtro_fechas("np.fecha_creacion", desde, hasta)
+    estados = ", ".join(f"'{e}'" for e in ESTADOS_PEDIDO_VALIDOS)
+    query = f"""
+        SELECT codigo, descripcion, unidades, ventas, costo,
+               ventas - costo AS margen,
+               CASE WHEN ventas > 0 THEN ROUND(100.0 * (ventas - costo) / ventas, 2) END AS margen_pct,
+               RANK() OVER (ORDER BY ventas - costo DESC) AS ranking
+        FROM (
+            SELECT p.codigo, p.descripcion,
+                   SUM(dp.cantidad) AS unidades,
+                   ROUND(SUM(dp.cantidad * dp.precio_unitario), 2) AS ventas,
+                   ROUND(SUM(dp.cantidad * p.costo_base), 2) AS costo
+            FROM detalle_pedido dp
+            JOIN notas_pedido np ON np.id = dp.nota_pedido_id
+            JOIN productos p ON p.id = dp.producto_id
+            WHERE np.estado IN ({estados}){filtro}
+            GROUP BY dp.producto_id
+        )
+        ORDER BY ranking
+    """
+    return _consultar("margen_por_producto", query, params)
+
+
+def top_clientes(limite=20, desde=None, hasta=None):
+    """
+    Clientes con mayor facturación (totales guardados de las notas de pedido no canceladas).
+    Columnas: cliente, pedidos, total, ticket_promedio, participacion_pct, ranking.
+    """
+    filtro, params = _filtro_fechas("np.fecha_creacion", desde, hasta)
+    estados = ", ".join(f"'{e}'" for e in ESTADOS_PEDIDO_VALIDOS)
+    query = f"""
+        SELECT cliente, pedidos, total, ticket_promedio, participacion_pct, ranking
+        FROM (
+            SELECT c.nombre AS cliente,
+                   COUNT(*) AS pedidos,
+                   ROUND(SUM(np.total), 2) AS total,
+                   ROUND(AVG(np.total), 2) AS ticket_promedio,
+                   ROUND(100.0 * SUM(np.total) / SUM(SUM(np.total)) OVER (), 2) AS participacion_pct,
+                   RANK() OVER (ORDER BY SUM(np.total) DESC) AS ranking
+            FROM notas_pedido np
+            JOIN clientes c ON c.id = np.cliente_id
+            WHERE np.estado IN ({estados}){filtro}
+            GROUP BY np.cliente_id
+        )
+        WHERE ranking <= ?
+        ORDER BY ranking
+    """
+    return _consultar("top_clientes", query, params + [limite])
+
+
+def conversion_presupuestos(desde=None, hasta=None):
+    """
+    Tasa de conversión de presupuestos por mes: cuántos se aprobaron y cuántos terminaron facturados.
+    Columnas: mes, presupuestos, aprobados, facturados, rechazados, importe_presupuestado,
+    importe_facturado, conversion_pct, conversion_acumulada_pct.
+    """
+    filtro, params = _filtro_fechas("fecha_creacion", desde, hasta)
+    query = f"""
+        SELECT mes, presupuestos, aprobados, facturados, rechazados,
+               importe_presupuestado, importe_facturado,
+               ROUND(100.0 * facturados / presupuestos, 2) AS conversion_pct,
+               ROUND(100.0 * SUM(facturados) OVER (ORDER BY mes) / SUM(presupuestos) OVER (ORDER BY mes), 2)
+                   AS conversion_acumulada_pct
+        FROM (
+            SELECT strftime('%Y-%m', fecha_creacion) AS mes,
+                   COUNT(*) AS presupuestos,
+                   SUM(estado = 'aprobado') AS aprobados,
+                   SUM(estado = 'facturado') AS facturados,
+                   SUM(estado = 'rechazado') AS rechazados,
+                   ROUND(SUM(total), 2) AS importe_presupuestado,
+                   ROUND(SUM(CASE WHEN estado = 'facturado' THEN total ELSE 0 END), 2) AS importe_facturado
+            FROM presupuestos
+            WHERE 1 = 1{filtro}
+            GROUP BY mes
+        )
+        ORDER BY mes
+    """
+    return _consultar("conversion_presupuestos", query, params)
+
+
+def tendencia_mensual(desde=None, hasta=None):
+    """
+    Ventas y margen por mes con variación contra el mes anterior y acumulado.
+    Columnas: mes, pedidos, ventas, margen, ticket_promedio, variacion_pct, ventas_acumuladas.
+    """
+    filtro, params = _filtro_fechas("np.fecha_creacion", desde, hasta)
+    estados = ", ".join(f"'{e}'" for e in ESTADOS_PEDIDO_VALIDOS)
+    query = f"""
+        WITH margen_por_pedido AS (
+            SELECT dp.nota_pedido_id, SUM(dp.cantidad * (dp.precio_unitario - p.costo_base)) AS margen
+            FROM detalle_pedido dp JOIN productos p ON p.id = dp.producto_id
+            GROUP BY dp.nota_pedido_id
+        )
+        SELECT mes, pedidos, ventas, margen, ticket_promedio,
+               ROUND(100.0 * (ventas - LAG(ventas) OVER (ORDER BY mes)) / LAG(ventas) OVER (ORDER BY mes), 2)
+                   AS variacion_pct,
+               ROUND(SUM(ventas) OVER (ORDER BY mes), 2) AS ventas_acumuladas
+        FROM (
+            SELECT strftime('%Y-%m', np.fecha_creacion) AS mes,
+                   COUNT(*) AS pedidos,
+                   ROUND(SUM(np.total), 2) AS ventas,
+                   ROUND(SUM(COALESCE(m.margen, 0)), 2) AS margen,
+                   ROUND(AVG(np.total), 2) AS ticket_promedio
+            FROM notas_pedido np
+            LEFT JOIN margen_por_pedido m ON m.nota_pedido_id = np.id
+            WHERE np.estado IN ({estados}){filtro}
+            GROUP BY mes
+        )
+        ORDER BY mes
+    """
+    return _consultar("tendencia_mensual", query, params)
+
+
+ANALISIS = {
+    'margen': margen_por_producto,
+    'clientes': top_clientes,
+    'conversion': conversion_presupuestos,
+    'tendencia': tendencia_mensual,
+}
+
+
+def exportar(df, ruta_salida):
+    """Guarda un resultado en CSV (separador ';' y decimal ',') o en Parquet según la extensión."""
+    if ruta_salida.lower().endswith('.parquet'):
+        df.to_parquet(ruta_salida, index=False)
+    else:
+        df.to_csv(ruta_salida, sep=';', decimal=',', index=False)
+    return ruta_salida
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reportes de ventas y márgenes de presupuestos.db")
+    parser.add_argument("analisis", choices=sorted(ANALISIS), help="Reporte a generar.")
+    parser.add_argument("--desde", help="Fecha inicial (AAAA-MM-DD).")
+    parser.add_argument("--hasta", help="Fecha final (AAAA-MM-DD).")
+    parser.add_argument("--salida", help="Archivo .csv o .parquet donde guardar el resultado.")
+    parser.add_argument("--snapshot", help="Carpeta de un snapshot de exportacion.py para no leer la base en uso.")
+    args = parser.parse_args()
+
+    if args.snapshot:
+        usar_snapshot(args.snapshot)
+
+    resultado = ANALISIS[args.analisis](desde=args.desde, hasta=args.hasta)
+    if args.salida:
+        print(f"✅ Reporte guardado en '{exportar(resultado, args.salida)}'.")
+    else:
+        print(resultado.to_string(index=False))
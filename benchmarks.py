@@ -0,0 +1,1845 @@
+import argparse
+import calendar
+import contextlib
+import datetime
+import io
+import itertools
+import json
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import datos_sinteticos
+import presupuesto_backend
+
+# --- Benchmarks de rendimiento del backend ---
+# Cada benchmark trabaja sobre una base temporal generada con datos_sinteticos (nunca sobre presupuestos.db)
+# y devuelve un diccionario de métricas. Los tiempos terminan en '_ms'; el resto son contadores.
+#   python benchmarks.py <nombre|todos> [--escala N] [--guardar]
+# Con --guardar los resultados quedan en RESULTADOS_PATH como referencia; las corridas siguientes
+# marcan como regresión cualquier tiempo que empeore más de UMBRAL_REGRESION contra esa referencia.
+
+RESULTADOS_PATH = "benchmarks_resultados.json"
+UMBRAL_REGRESION = 0.20
+
+
+def _base_temporal():
+    """Apunta el backend a una base de datos nueva en una carpeta temporal y la inicializa."""
+    carpeta = tempfile.mkdtemp(prefix="bench_presupuestos_")
+    presupuesto_backend.DB_PATH = os.path.join(carpeta, "bench.db")
+    with contextlib.redirect_stdout(io.StringIO()):
+        presupuesto_backend.inicializar_base_de_datos()
+    return presupuesto_backend.DB_PATH
+
+
+def _base_sintetica(escala, **opciones):
+    """Base temporal con datos sintéticos de 'escala' líneas de detalle por módulo."""
+    db_path = _base_temporal()
+    with contextlib.redirect_stdout(io.StringIO()):
+        return datos_sinteticos.generar_base(db_path, escala, **opciones)
+
+
+def _medir(funcion, repeticiones=5):
+    """Ejecuta la función varias veces y devuelve el mejor tiempo en milisegundos."""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return round(min(tiempos), 3)
+
+
+def _silencioso(funcion):
+    """Envuelve una función del backend para que sus print() no ensucien la salida del benchmark."""
+    def envuelta(*args, **kwargs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return funcion(*args, **kwargs)
+    return envuelta
+
+
+def bench_listados(escala):
+    """Latencia de los listados de pedidos y presupuestos: totales guardados vs. SUM sobre el detalle."""
+    carga = _base_sintetica(escala)
+
+    conn = presupuesto_backend.conectar()
+    consulta_anterior_pedidos = """
+        SELECT np.id, c.nombre, np.fecha_creacion, np.tipo_entrega, np.direccion_envio,
+               np.telefono_contacto, np.estado, SUM(dp.cantidad * dp.precio_unitario) AS total
+        FROM notas_pedido np
+        JOIN clientes c ON np.cliente_id = c.id
+        JOIN detalle_pedido dp ON np.id = dp.nota_pedido_id
+        GROUP BY np.id ORDER BY np.fecha_creacion DESC, np.id DESC
+    """
+    consulta_anterior_presupuestos = """
+        SELECT p.id, c.nombre, p.fecha_creacion, p.estado, SUM(dp.cantidad * dp.precio_unitario) AS total
+        FROM presupuestos p
+        JOIN clientes c ON p.cliente_id = c.id
+        JOIN detalle_presupuesto dp ON p.id = dp.presupuesto_id
+        GROUP BY p.id ORDER BY p.fecha_creacion DESC, p.id DESC
+    """
+    resultados = {
+        "carga_datos_sinteticos_ms": carga['segundos'] * 1000,
+        "notas_pedido_sum_detalle_ms": _medir(lambda: conn.execute(consulta_anterior_pedidos).fetchall(), 3),
+        "notas_pedido_ms": _medir(lambda: presupuesto_backend.obtener_notas_pedido()),
+        "notas_pedido_expedicion_ms": _medir(lambda: presupuesto_backend.obtener_notas_pedido(True)),
+        "presupuestos_sum_detalle_ms": _medir(lambda: conn.execute(consulta_anterior_presupuestos).fetchall(), 3),
+        "presupuestos_ms": _medir(lambda: presupuesto_backend.obtener_todos_los_presupuestos()),
+        "verificar_totales_ms": _medir(_silencioso(presupuesto_backend.verificar_totales), 1),
+    }
+    conn.close()
+    return resultados
+
+
+def bench_detalle(escala):
+    """Apertura del detalle de documentos al azar (lo que hace la GUI al hacer doble clic en un listado)."""
+    carga = _base_sintetica(escala)
+    rnd = random.Random(1)
+    ids_pedidos = [rnd.randint(1, carga['notas_pedido']) for _ in range(200)]
+    ids_presupuestos = [rnd.randint(1, carga['presupuestos']) for _ in range(200)]
+
+    def detalles(funcion, ids):
+        for documento_id in ids:
+            funcion(documento_id)
+
+    return {
+        "detalle_nota_pedido_x200_ms": _medir(lambda: detalles(presupuesto_backend.obtener_detalle_nota_pedido, ids_pedidos), 3),
+        "detalle_presupuesto_x200_ms": _medir(lambda: detalles(presupuesto_backend.obtener_detalle_presupuesto, ids_presupuestos), 3),
+    }
+
+
+def bench_sentencias(escala):
+    """
+    Costo de parsear/preparar una sentencia por llamada: conexión nueva por llamada (como antes),
+    conexión de larga vida sin caché de sentencias y con caché (consultas.conexion).
+    También la carga del detalle de un documento de 1000 líneas: un execute por línea vs. executemany.
+    """
+    import consultas
+
+    carga = _base_sintetica(escala)
+    rnd = random.Random(3)
+    llamadas = 2000
+    ids = [rnd.randint(1, carga['notas_pedido']) for _ in range(llamadas)]
+    sql = consultas.SENTENCIAS["detalle_nota_pedido"]
+
+    def por_llamada():
+        for nota_id in ids:
+            conn = presupuesto_backend.conectar()
+            conn.execute(sql, (nota_id,)).fetchall()
+            conn.close()
+
+    def con_conexion(conn):
+        def consultar():
+            for nota_id in ids:
+                conn.execute(sql, (nota_id,)).fetchall()
+        return consultar
+
+    sin_cache = sqlite3.connect(presupuesto_backend.DB_PATH, cached_statements=0)
+    con_cache = presupuesto_backend.conexion()
+    ms_por_llamada = _medir(por_llamada, 3)
+    ms_sin_cache = _medir(con_conexion(sin_cache), 3)
+    ms_con_cache = _medir(con_conexion(con_cache), 3)
+    sin_cache.close()
+
+    productos = [fila[0] for fila in con_cache.execute("SELECT id FROM productos LIMIT 1000")]
+    cliente_id = con_cache.execute("SELECT id FROM clientes LIMIT 1").fetchone()[0]
+
+    def cargar_detalle(masivo):
+        def cargar():
+            with con_cache:
+                presupuesto_id = consultas.ejecutar(con_cache, "insertar_presupuesto", (cliente_id, "2024-01-01", "borrador")).lastrowid
+                lineas = [(presupuesto_id, producto_id, 1 + i % 7, 10.0 + i) for i, producto_id in enumerate(productos)]
+                if masivo:
+                    consultas.muchos(con_cache, "insertar_detalle_presupuesto", lineas)
+                else:
+                    for linea in lineas:
+                        con_cache.execute(consultas.SENTENCIAS["insertar_detalle_presupuesto"], linea)
+        return cargar
+
+    resultados = {
+        "detalle_x2000_conexion_por_llamada_ms": ms_por_llamada,
+        "detalle_x2000_larga_vida_sin_cache_ms": ms_sin_cache,
+        "detalle_x2000_larga_vida_con_cache_ms": ms_con_cache,
+        "preparacion_por_llamada_us": round((ms_sin_cache - ms_con_cache) * 1000 / llamadas, 2),
+        "apertura_conexion_por_llamada_us": round((ms_por_llamada - ms_sin_cache) * 1000 / llamadas, 2),
+        "presupuesto_1000_lineas_execute_ms": _medir(cargar_detalle(False), 3),
+        "presupuesto_1000_lineas_executemany_ms": _medir(cargar_detalle(True), 3),
+    }
+
+    # Con la instrumentación activa, las sentencias de los helpers de consultas.py tienen que llegar al perfilador
+    import instrumentacion
+    instrumentacion.activar()
+    instrumentacion.reiniciar()
+    try:
+        presupuesto_backend.obtener_notas_pedido()
+        presupuesto_backend.obtener_detalle_nota_pedido(ids[0])
+        sentencias_medidas = sum(e["llamadas"] for e in instrumentacion.instantanea()["sql"].values())
+    finally:
+        instrumentacion.desactivar()
+        instrumentacion.reiniciar()
+    if not sentencias_medidas:
+        raise RuntimeError("Los helpers de consultas.py no registraron sentencias con la instrumentación activa.")
+
+    resultados["sentencias_instrumentadas_listado"] = sentencias_medidas
+    return resultados
+
+
+def bench_conversion(escala):
+    """
+    Conversión de presupuestos de 1000 líneas en notas de pedido: copiando las líneas por Python con un
+    execute por línea (como antes), de a uno con INSERT ... SELECT y en lote con convertir_presupuestos_en_pedidos.
+    'escala' es la cantidad de presupuestos de cada grupo.
+    """
+    import logging
+    import consultas
+
+    _base_sintetica(20_000)
+    conn = presupuesto_backend.conexion()
+    productos = [fila[0] for fila in conn.execute("SELECT id FROM productos")]
+    cliente_id = conn.execute("SELECT id FROM clientes LIMIT 1").fetchone()[0]
+    lineas_por_presupuesto = 1000
+
+    def crear_presupuestos(cantidad):
+        ids = []
+        with conn:
+            for _ in range(cantidad):
+                presupuesto_id = consultas.ejecutar(conn, "insertar_presupuesto", (cliente_id, "2024-01-01", "aprobado")).lastrowid
+                consultas.muchos(conn, "insertar_detalle_presupuesto",
+                                 [(presupuesto_id, productos[i % len(productos)], 1 + i % 7, 10.0 + i % 90)
+                                  for i in range(lineas_por_presupuesto)])
+                ids.append(presupuesto_id)
+        return ids
+
+    def copia_por_python(ids):
+        for presupuesto_id in ids:
+            with conn:
+                lineas = conn.execute("SELECT producto_id, cantidad, precio_unitario FROM detalle_presupuesto WHERE presupuesto_id = ?",
+                                      (presupuesto_id,)).fetchall()
+                nota_id = conn.execute("""INSERT INTO notas_pedido (cliente_id, fecha_creacion, tipo_entrega, estado)
+                                          VALUES (?, '2024-01-02', 'Retiro por mostrador', 'pendiente')""", (cliente_id,)).lastrowid
+                for producto_id, cantidad, precio_unitario in lineas:
+                    conn.execute("INSERT INTO detalle_pedido (nota_pedido_id, producto_id, cantidad, precio_unitario) VALUES (?, ?, ?, ?)",
+                                 (nota_id, producto_id, cantidad, precio_unitario))
+                conn.execute("UPDATE presupuestos SET estado = 'facturado' WHERE id = ?", (presupuesto_id,))
+
+    def medir(funcion):
+        inicio = time.perf_counter()
+        funcion()
+        return round((time.perf_counter() - inicio) * 1000, 3)
+
+    por_python, de_a_uno, en_lote = crear_presupuestos(escala), crear_presupuestos(escala), crear_presupuestos(escala)
+    ms_python = medir(lambda: copia_por_python(por_python))
+    ms_de_a_uno = medir(lambda: [_silencioso(presupuesto_backend.actualizar_estado_presupuesto)(i, 'facturado', True) for i in de_a_uno])
+    resultado = {}
+    ms_lote = medir(lambda: resultado.update(lote=presupuesto_backend.convertir_presupuestos_en_pedidos(en_lote)))
+    convertidos = resultado['lote'][2]['convertidos']
+
+    # Cada nota generada tiene que tener las mismas líneas y totales que su presupuesto
+    diferentes = conn.execute("""
+        SELECT COUNT(*) FROM notas_pedido np JOIN presupuestos p ON p.id = np.presupuesto_id
+        WHERE np.cantidad_lineas != p.cantidad_lineas OR ABS(np.total - p.total) > 0.005
+    """).fetchone()[0]
+    log_backend = logging.getLogger("presupuesto_backend")
+    nivel_anterior = log_backend.level
+    log_backend.setLevel(logging.ERROR) # El aviso de presupuesto ya convertido es esperado acá
+    try:
+        repetida = presupuesto_backend.convertir_presupuestos_en_pedidos(en_lote[:1])[2]
+    finally:
+        log_backend.setLevel(nivel_anterior)
+    return {
+        "presupuestos_por_grupo": escala,
+        "lineas_por_presupuesto": lineas_por_presupuesto,
+        "copia_por_python_por_presupuesto_ms": round(ms_python / escala, 3),
+        "insert_select_por_presupuesto_ms": round(ms_de_a_uno / escala, 3),
+        "lote_por_presupuesto_ms": round(ms_lote / escala, 3),
+        "lote_total_ms": ms_lote,
+        "convertidos_en_lote": len(convertidos),
+        "notas_con_diferencias": diferentes,
+        "omitidos_al_repetir": len(repetida['omitidos']),
+    }
+
+
+def bench_estados(escala):
+    """Transiciones de estado de notas de pedido (reserva y entrega de stock) sobre pedidos pendientes."""
+    _base_sintetica(escala)
+    conn = presupuesto_backend.conectar()
+    pendientes = [fila[0] for fila in conn.execute("SELECT id FROM notas_pedido WHERE estado = 'pendiente' ORDER BY id LIMIT 200")]
+    conn.close()
+    actualizar = _silencioso(presupuesto_backend.actualizar_estado_nota_pedido)
+
+    def transicion(estado):
+        inicio = time.perf_counter()
+        fallidas = sum(1 for nota_id in pendientes if not actualizar(nota_id, estado)[0])
+        return round((time.perf_counter() - inicio) * 1000 / len(pendientes), 3), fallidas
+
+    ms_aprobar, fallidas_aprobar = transicion('aprobada')
+    ms_entregar, fallidas_entregar = transicion('entregada')
+    return {
+        "pendiente_a_aprobada_por_pedido_ms": ms_aprobar,
+        "aprobada_a_entregada_por_pedido_ms": ms_entregar,
+        "transiciones": 2 * len(pendientes),
+        "transiciones_fallidas": fallidas_aprobar + fallidas_entregar,
+    }
+
+
+def bench_importacion(escala):
+    """Importación de la lista de precios (import_data_to_sql.py) con 'escala' productos sintéticos."""
+    carpeta = tempfile.mkdtemp(prefix="bench_importacion_")
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "import_data_to_sql.py")
+    datos_sinteticos.generar_csv_precios(os.path.join(carpeta, "Lista de Precios - Costos.csv"), escala)
+
+    def importar():
+        proceso = subprocess.run([sys.executable, script], cwd=carpeta, capture_output=True, text=True)
+        if proceso.returncode != 0:
+            raise RuntimeError(f"La importación falló:\n{proceso.stderr}")
+
+    resultados = {"importar_lista_precios_ms": _medir(importar, 3)}
+    shutil.rmtree(carpeta, ignore_errors=True)
+    return resultados
+
+
+def bench_sync(escala):
+    """
+    Sincronización contra un Google Sheets falso (sin red): módulo por módulo y de todos los módulos en un
+    solo envío por lotes, en frío (abrir la planilla y crear las pestañas) y en régimen. Tiempo, requests y bytes.
+    """
+    import sheets_falso
+
+    _base_sintetica(escala)
+    modulos = list(presupuesto_backend.MODULOS_SHEETS)
+    resultados = {}
+    original = presupuesto_backend.get_google_sheet_client
+    try:
+        for latencia in (0.0, 0.05):
+            sufijo = f"latencia_{int(latencia * 1000)}ms"
+            presupuesto_backend.olvidar_cliente_sheets()
+            cliente = sheets_falso.ClienteSheetsFalso(latencia=latencia)
+            presupuesto_backend.get_google_sheet_client = lambda: cliente
+            for modulo in modulos:
+                inicio = time.perf_counter()
+                _silencioso(presupuesto_backend.sincronizar_a_google_sheets)(modulo)
+                resultados[f"sync_{modulo}_{sufijo}_ms"] = round((time.perf_counter() - inicio) * 1000, 3)
+            resultados[f"requests_{sufijo}"] = cliente.estadisticas.requests
+            resultados[f"bytes_{sufijo}"] = cliente.estadisticas.bytes_enviados
+
+            for etapa in ("frio", "regimen"):
+                if etapa == "frio":
+                    presupuesto_backend.olvidar_cliente_sheets()
+                    cliente = sheets_falso.ClienteSheetsFalso(latencia=latencia)
+                cliente.estadisticas = sheets_falso.EstadisticasSheets()
+                inicio = time.perf_counter()
+                exito, mensaje = presupuesto_backend.sincronizar_modulos_a_google_sheets(modulos)
+                resultados[f"sync_todos_{etapa}_{sufijo}_ms"] = round((time.perf_counter() - inicio) * 1000, 3)
+                if not exito:
+                    raise RuntimeError(mensaje)
+                resultados[f"requests_todos_{etapa}_{sufijo}"] = cliente.estadisticas.requests
+                resultados[f"bytes_todos_{etapa}_{sufijo}"] = cliente.estadisticas.bytes_enviados
+                resultados[f"envios_batch_todos_{etapa}_{sufijo}"] = cliente.estadisticas.por_operacion.get('values_batch_update', 0)
+
+        # Lo subido tiene que coincidir fila por fila con lo que hay en la base
+        planilla = cliente.planillas[presupuesto_backend.NOMBRE_HOJA_CALCULO]
+        for modulo in modulos:
+            titulo = presupuesto_backend.MODULOS_SHEETS[modulo][0]
+            if planilla.pestanas[titulo].valores != presupuesto_backend._valores_modulo(modulo):
+                raise RuntimeError(f"La pestaña '{titulo}' no coincide con la base.")
+    finally:
+        presupuesto_backend.get_google_sheet_client = original
+        presupuesto_backend.olvidar_cliente_sheets()
+    return resultados
+
+
+def bench_sheets_bidireccional(escala):
+    """
+    Traer de Google Sheets (falso) los precios y el stock editados en la planilla: se editan filas solo en la
+    planilla, solo en la base y en las dos (conflictos), y se mide la lectura, los bytes y el resultado.
+    """
+    import sheets_falso
+
+    _base_sintetica(escala)
+    original = presupuesto_backend.get_google_sheet_client
+    cliente = sheets_falso.ClienteSheetsFalso()
+    presupuesto_backend.get_google_sheet_client = lambda: cliente
+    presupuesto_backend.olvidar_cliente_sheets()
+    try:
+        presupuesto_backend.sincronizar_a_google_sheets('productos')
+        pestana = cliente.planillas[presupuesto_backend.NOMBRE_HOJA_CALCULO].pestanas['Productos']
+        encabezado = pestana.valores[0]
+        columna_precio, columna_stock = encabezado.index('Precio_1'), encabezado.index('Stock_Disponible')
+        filas = pestana.valores[1:]
+        editadas = max(1, len(filas) // 100)
+        solo_hoja, en_conflicto, solo_base = filas[:editadas], filas[editadas:2 * editadas], filas[2 * editadas:3 * editadas]
+        for fila in solo_hoja + en_conflicto:
+            fila[columna_precio] = round(fila[columna_precio] * 1.1, 4)
+            fila[columna_stock] += 5
+        conn = presupuesto_backend.conectar()
+        conn.executemany("UPDATE productos SET precio_1 = precio_1 * 0.9 WHERE codigo = ?",
+                         [(fila[0],) for fila in en_conflicto + solo_base])
+        conn.commit()
+        conn.close()
+        bytes_pestana_completa = len(json.dumps(pestana.valores, default=str))
+
+        cliente.estadisticas = sheets_falso.EstadisticasSheets()
+        inicio = time.perf_counter()
+        exito, mensaje, resumen = presupuesto_backend.traer_productos_de_google_sheets()
+        ms_traer = (time.perf_counter() - inicio) * 1000
+        if not exito:
+            raise RuntimeError(mensaje)
+        if resumen['aplicadas'] != len(solo_hoja) or len(resumen['conflictos']) != len(en_conflicto):
+            raise RuntimeError(f"Resultado inesperado al traer productos: {mensaje}")
+        estadisticas_traer = cliente.estadisticas.como_dict()
+
+        # Al volver a subir gana la base en los conflictos y la planilla queda igual a la base
+        presupuesto_backend.sincronizar_a_google_sheets('productos')
+        if pestana.valores != presupuesto_backend._valores_modulo('productos'):
+            raise RuntimeError("La pestaña de productos no coincide con la base después de sincronizar.")
+        _, _, resumen_final = presupuesto_backend.traer_productos_de_google_sheets()
+    finally:
+        presupuesto_backend.get_google_sheet_client = original
+        presupuesto_backend.olvidar_cliente_sheets()
+
+    return {
+        "productos": len(filas),
+        "traer_productos_ms": round(ms_traer, 3),
+        "requests_traer": estadisticas_traer['requests'],
+        "bytes_recibidos_traer": estadisticas_traer['bytes_recibidos'],
+        "bytes_pestana_completa": bytes_pestana_completa,
+        "aplicadas": resumen['aplicadas'],
+        "conflictos": len(resumen['conflictos']),
+        "cambios_tras_resincronizar": resumen_final['aplicadas'] + len(resumen_final['conflictos']),
+    }
+
+
+def bench_ocr(escala):
+    """
+    Parseo de textos de comprobantes (la parte de extraer_datos_comprobante posterior al OCR) y OCR de
+    comprobantes por segundo: un proceso de tesseract por imagen (frío, como antes), el servicio de OCR
+    sin agrupar (frío pero en paralelo) y el servicio con sus trabajadores precalentados.
+    Sin un tesseract instalado el OCR se mide con tesseract_falso (arranque y costo por imagen simulados).
+    """
+    import shutil
+    from PIL import Image, ImageDraw
+    import ocr
+    import tesseract_falso
+
+    rnd = random.Random(42)
+    textos = [datos_sinteticos.texto_comprobante(rnd, i) for i in range(escala)]
+
+    def parsear():
+        for texto in textos:
+            presupuesto_backend.parsear_texto_comprobante(texto)
+
+    ms = _medir(parsear, 3)
+    resultados = {"parsear_comprobantes_ms": ms, "por_comprobante_us": round(ms * 1000 / escala, 3)}
+
+    carpeta = tempfile.mkdtemp(prefix="bench_ocr_")
+    entorno_anterior = os.environ.get("PRESUPUESTOS_TESSERACT")
+    tesseract_real = ocr.tesserocr is not None or shutil.which("tesseract") is not None or bool(entorno_anterior)
+    if not tesseract_real:
+        os.environ["PRESUPUESTOS_TESSERACT"] = tesseract_falso.instalar(os.path.join(carpeta, "bin"))
+    ocr.olvidar_ruta_tesseract()
+    try:
+        cantidad = min(escala, 200)
+        imagenes = []
+        for i, texto in enumerate(textos[:cantidad]):
+            ruta = os.path.join(carpeta, f"comprobante_{i}.png")
+            imagen = Image.new("L", (900, 60 + 40 * texto.count("\n")), 255)
+            ImageDraw.Draw(imagen).multiline_text((30, 30), texto, fill=0, spacing=18)
+            imagen.save(ruta)
+            tesseract_falso.escribir_imagen(ruta, texto)
+            imagenes.append(ruta)
+
+        def por_segundo(segundos):
+            return round(cantidad / segundos, 2)
+
+        ocr.ruta_tesseract()
+        inicio = time.perf_counter()
+        textos_frio = [ocr.pytesseract.image_to_string(ruta, lang=ocr.IDIOMA) for ruta in imagenes]
+        segundos_frio = time.perf_counter() - inicio
+
+        resultados_servicio = {}
+        for nombre, lote_maximo in (("pool_frio", 1), ("servicio", ocr.LOTE_MAXIMO)):
+            servicio = ocr.ServicioOCR(lote_maximo=lote_maximo)
+            try:
+                servicio.reconocer(imagenes[0]) # Precalentar los trabajadores (con tesserocr carga el idioma)
+                inicio = time.perf_counter()
+                leidos = list(servicio.reconocer_varios(imagenes))
+                resultados_servicio[nombre] = (time.perf_counter() - inicio, leidos, dict(servicio.estadisticas))
+            finally:
+                servicio.cerrar()
+
+        segundos_pool, _, _ = resultados_servicio["pool_frio"]
+        segundos_servicio, leidos, estadisticas = resultados_servicio["servicio"]
+        nros = [presupuesto_backend.parsear_texto_comprobante(texto)["nro_operacion"] for texto in textos[:cantidad]]
+        reconocidos = sum(1 for (_, texto, error), nro in zip(leidos, nros)
+                          if error is None and presupuesto_backend.parsear_texto_comprobante(texto)["nro_operacion"] == nro)
+        resultados.update({
+            "tesseract_real": int(tesseract_real),
+            "comprobantes_ocr": cantidad,
+            "ocr_frio_por_comprobante_ms": round(segundos_frio * 1000 / cantidad, 3),
+            "ocr_pool_frio_por_comprobante_ms": round(segundos_pool * 1000 / cantidad, 3),
+            "ocr_servicio_por_comprobante_ms": round(segundos_servicio * 1000 / cantidad, 3),
+            "comprobantes_por_segundo_frio": por_segundo(segundos_frio),
+            "comprobantes_por_segundo_pool_frio": por_segundo(segundos_pool),
+            "comprobantes_por_segundo_servicio": por_segundo(segundos_servicio),
+            "ejecuciones_tesseract_servicio": estadisticas['lotes'] - 1,
+            "textos_iguales_frio_vs_servicio": sum(1 for a, (_, b, _) in zip(textos_frio, leidos) if a.strip() == (b or "").strip()),
+            "nro_operacion_reconocidos": reconocidos,
+        })
+    finally:
+        if entorno_anterior is None:
+            os.environ.pop("PRESUPUESTOS_TESSERACT", None)
+        else:
+            os.environ["PRESUPUESTOS_TESSERACT"] = entorno_anterior
+        ocr.olvidar_ruta_tesseract()
+        shutil.rmtree(carpeta, ignore_errors=True)
+    return resultados
+
+
+def bench_duplicados(escala):
+    """
+    Detección de comprobantes casi duplicados sobre 'escala' comprobantes guardados: armado del índice y
+    costo por comprobante de buscar con los índices vs. recorriendo la tabla, con la mitad de las consultas
+    siendo copias con errores de OCR. Los hashes guardados simulan plantillas de pocos bancos (todos los
+    comprobantes de un banco se parecen), que es el peor caso del índice por imagen. Además, el hash
+    perceptual de imágenes de comprobantes.
+    """
+    import duplicados
+    from PIL import Image, ImageDraw, ImageFont
+
+    _base_temporal()
+    conn = presupuesto_backend.conexion()
+    rnd = random.Random(11)
+    plantillas = [rnd.getrandbits(duplicados.BITS_HASH) for _ in range(5)]
+    ruido_imagen = duplicados.UMBRAL_HAMMING // 2 # Dos comprobantes del mismo banco quedan dentro del umbral
+
+    def parecido(valor, bits):
+        for _ in range(bits):
+            valor ^= 1 << rnd.randrange(duplicados.BITS_HASH)
+        return valor
+
+    inicio_anio = datetime.date(2024, 1, 1).toordinal()
+    filas = []
+    for i in range(escala):
+        fecha = datetime.date.fromordinal(inicio_anio + rnd.randrange(365)).strftime('%d/%m/%Y')
+        filas.append((f"{rnd.randrange(10**11):011d}", fecha, round(rnd.uniform(50, 50_000), 2), rnd.choice(datos_sinteticos.CUENTAS),
+                      duplicados.hash_a_texto(parecido(rnd.choice(plantillas), ruido_imagen))))
+    with conn:
+        cliente_id = conn.execute("INSERT INTO clientes (nombre, cuit, razon_social) VALUES ('Bench', '0', 'Bench')").lastrowid
+        conn.executemany("INSERT INTO comprobantes (nro_operacion, fecha, importe, cuenta, cliente_id, hash_imagen) VALUES (?, ?, ?, ?, ?, ?)",
+                         [(*fila[:4], cliente_id, fila[4]) for fila in filas])
+
+    # Consultas: la mitad son comprobantes ya guardados releídos con ruido de OCR, la otra mitad son nuevos
+    consultas_lote, esperados = [], 0
+    for i in range(1000):
+        nro, fecha, importe, cuenta, hash_texto = rnd.choice(filas)
+        if i % 2 == 0:
+            esperados += 1
+            variante = i % 6
+            if variante == 0: # El OCR confundió un dígito con una letra
+                consulta = (nro.replace('0', 'O', 1), fecha, importe, cuenta, None)
+            elif variante == 2: # Otro número de operación, mismos datos
+                consulta = (f"{rnd.randrange(10**11):011d}", fecha, importe, cuenta, None)
+            else: # Misma imagen re-comprimida, número con un dígito mal leído e importe ilegible
+                consulta = (nro[:-1] + str((int(nro[-1]) + 1) % 10), fecha, None, cuenta,
+                            parecido(duplicados.hash_de_texto(hash_texto), ruido_imagen))
+        else:
+            fecha = datetime.date.fromordinal(inicio_anio + rnd.randrange(365)).strftime('%d/%m/%Y')
+            consulta = (f"{rnd.randrange(10**11):011d}", fecha, round(rnd.uniform(50, 50_000), 2),
+                        rnd.choice(datos_sinteticos.CUENTAS), parecido(rnd.choice(plantillas), ruido_imagen))
+        consultas_lote.append(consulta)
+
+    inicio = time.perf_counter()
+    indice = duplicados.IndiceComprobantes.desde_filas(presupuesto_backend.consultas.todos(conn, "comprobantes_para_indice", (0,)))
+    ms_indice = (time.perf_counter() - inicio) * 1000
+
+    def con_indice():
+        return [indice.buscar(*consulta) for consulta in consultas_lote]
+
+    def recorriendo(consultas_a_medir):
+        def buscar():
+            resultados = []
+            for nro, fecha, importe, cuenta, hash_perceptual in consultas_a_medir:
+                nro_normalizado, dia_fecha = duplicados.normalizar_nro_operacion(nro), duplicados.dia(fecha)
+                importe_centavos, cuenta_normalizada = duplicados.centavos(importe), duplicados.normalizar_cuenta(cuenta)
+                encontrados = []
+                for id_fila, nro_fila, fecha_fila, importe_fila, cuenta_fila, hash_fila in conn.execute(
+                        presupuesto_backend.consultas.SENTENCIAS["comprobantes_para_indice"], (0,)):
+                    nro_fila = duplicados.normalizar_nro_operacion(nro_fila)
+                    dia_fila, centavos_fila = duplicados.dia(fecha_fila), duplicados.centavos(importe_fila)
+                    if nro_fila == nro_normalizado or (
+                            importe_centavos == centavos_fila and cuenta_normalizada == duplicados.normalizar_cuenta(cuenta_fila)
+                            and dia_fecha is not None and abs(dia_fila - dia_fecha) <= duplicados.TOLERANCIA_DIAS) or (
+                            hash_perceptual is not None
+                            and (duplicados.hash_de_texto(hash_fila) ^ hash_perceptual).bit_count() <= duplicados.UMBRAL_HAMMING
+                            and (importe_centavos == centavos_fila or duplicados.distancia_edicion(nro_normalizado, nro_fila) <= duplicados.DISTANCIA_MAXIMA_NRO)):
+                        encontrados.append(id_fila)
+                resultados.append(encontrados)
+            return resultados
+        return buscar
+
+    ms_indice_busquedas = _medir(con_indice, 3)
+    muestra = consultas_lote[:20]
+    ms_recorriendo = _medir(recorriendo(muestra), 1)
+    resultados = con_indice()
+    detectados = sum(1 for i, encontrados in enumerate(resultados) if i % 2 == 0 and encontrados)
+    falsos = sum(1 for i, encontrados in enumerate(resultados) if i % 2 == 1 and encontrados)
+    iguales = sum(1 for consulta, encontrados in zip(muestra, recorriendo(muestra)())
+                  if sorted(c.clave for c in indice.buscar(*consulta)) == sorted(encontrados))
+
+    # Hash perceptual de comprobantes en imagen
+    carpeta = tempfile.mkdtemp(prefix="bench_duplicados_")
+    try:
+        fuente = ImageFont.load_default(size=34)
+        rutas = []
+        for i in range(50):
+            ruta = os.path.join(carpeta, f"comprobante_{i}.png")
+            imagen = Image.new("L", (1080, 520), 255)
+            ImageDraw.Draw(imagen).multiline_text((60, 40), datos_sinteticos.texto_comprobante(rnd, rnd.randrange(10**9)),
+                                                  fill=0, spacing=22, font=fuente)
+            imagen.save(ruta)
+            rutas.append(ruta)
+        inicio = time.perf_counter()
+        duplicados.hashes_archivos(rutas)
+        ms_hash = (time.perf_counter() - inicio) * 1000 / len(rutas)
+    finally:
+        shutil.rmtree(carpeta, ignore_errors=True)
+
+    return {
+        "comprobantes": escala,
+        "armar_indice_ms": round(ms_indice, 3),
+        "busqueda_con_indice_us": round(ms_indice_busquedas * 1000 / len(consultas_lote), 3),
+        "busqueda_recorriendo_tabla_us": round(ms_recorriendo * 1000 / len(muestra), 3),
+        "casi_duplicados_esperados": esperados,
+        "casi_duplicados_detectados": detectados,
+        "falsos_positivos": falsos,
+        "resultados_iguales_indice_vs_recorrido": iguales,
+        "hash_perceptual_por_imagen_ms": round(ms_hash, 3),
+    }
+
+
+def bench_conciliacion(escala):
+    """
+    Conciliación de 'escala' pagos contra 'escala' notas de pedido (50 por cliente): emparejamiento en memoria
+    con listas ordenadas (bisect y dos punteros) vs. los mismos pasos con bucles anidados por cliente, y la conciliación completa
+    con la escritura en pagos_aplicados. Pagos: 60% exactos, 20% de notas pagadas en dos partes,
+    10% que cubren dos notas juntas y el resto notas sin pagar.
+    """
+    import conciliacion
+
+    _base_temporal()
+    conn = presupuesto_backend.conexion()
+    rnd = random.Random(21)
+    clientes = max(1, escala // 50)
+    inicio_anio = datetime.date(2024, 1, 1).toordinal()
+    with conn:
+        conn.executemany("INSERT INTO clientes (nombre, cuit, razon_social) VALUES (?, ?, ?)",
+                         [(f"Cliente {i}", f"20-{i:08d}-0", f"Razón Social {i}") for i in range(clientes)])
+        notas = [(1 + rnd.randrange(clientes), inicio_anio + rnd.randrange(365), round(rnd.uniform(100, 20_000), 2)) for _ in range(escala)]
+        notas.sort(key=lambda nota: (nota[0], nota[1]))
+        conn.executemany("""INSERT INTO notas_pedido (cliente_id, fecha_creacion, estado, total, total_con_iva, cantidad_lineas)
+                            VALUES (?, ?, 'pendiente', ?, ?, 1)""",
+                         [(cliente, datetime.date.fromordinal(dia).isoformat(), round(total / 1.21, 2), total) for cliente, dia, total in notas])
+
+        pagos = []
+        posicion = 0
+        while posicion < len(notas) and len(pagos) < escala:
+            cliente, dia, total = notas[posicion]
+            tipo = rnd.random()
+            if tipo < 0.6:
+                pagos.append((cliente, dia + rnd.randrange(10), round(total + rnd.uniform(-0.5, 0.5), 2)))
+            elif tipo < 0.8:
+                primera = round(total * rnd.uniform(0.3, 0.7), 2)
+                pagos.append((cliente, dia + rnd.randrange(5), primera))
+                pagos.append((cliente, dia + 20 + rnd.randrange(10), round(total - primera, 2)))
+            elif tipo < 0.9 and posicion + 1 < len(notas) and notas[posicion + 1][0] == cliente:
+                posicion += 1
+                pagos.append((cliente, max(dia, notas[posicion][1]) + rnd.randrange(5), round(total + notas[posicion][2], 2)))
+            posicion += 1
+        conn.executemany("INSERT INTO comprobantes (nro_operacion, fecha, importe, cuenta, cliente_id) VALUES (?, ?, ?, 'CBU-0001', ?)",
+                         [(f"OP-{i:09d}", datetime.date.fromordinal(dia).strftime('%d/%m/%Y'), importe, cliente)
+                          for i, (cliente, dia, importe) in enumerate(pagos)])
+
+    notas_abiertas = conciliacion._saldos_notas(conn, None, conciliacion.TOLERANCIA_IMPORTE)
+    pagos_sin_aplicar = conciliacion._disponibles_pagos(conn, conciliacion.TOLERANCIA_IMPORTE)
+
+    def anidado():
+        """Los mismos cuatro pasos con bucles anidados: cada pago (o nota) recorre todas las notas (o pagos) de su cliente."""
+        tolerancia = conciliacion.TOLERANCIA_IMPORTE
+        en_ventana = lambda dia_nota, dia_pago: dia_nota - conciliacion.DIAS_ANTES <= dia_pago <= dia_nota + conciliacion.DIAS_DESPUES
+        notas_por_cliente, pagos_por_cliente = {}, {}
+        for nota in sorted(notas_abiertas, key=lambda nota: nota[2]):
+            notas_por_cliente.setdefault(nota[1], []).append(list(nota))
+        for pago in sorted(pagos_sin_aplicar, key=lambda pago: pago[2]):
+            pagos_por_cliente.setdefault(pago[1], []).append(list(pago))
+        aplicaciones = []
+
+        def aplicar(pago, nota, importe=None):
+            importe = min(nota[3], pago[3]) if importe is None else importe
+            aplicaciones.append((pago[0], nota[0], importe))
+            nota[3] -= importe
+            pago[3] -= importe
+            if nota[3] <= tolerancia:
+                nota[3] = 0
+            if pago[3] <= tolerancia:
+                pago[3] = 0
+
+        for cliente, pagos_cliente in pagos_por_cliente.items():
+            notas_cliente = notas_por_cliente.get(cliente, [])
+            for pago in pagos_cliente: # Exactos
+                for nota in notas_cliente:
+                    if nota[3] and abs(nota[3] - pago[3]) <= tolerancia and en_ventana(nota[2], pago[2]):
+                        aplicar(pago, nota, min(nota[3], pago[3]))
+                        nota[3] = pago[3] = 0
+                        break
+            for pago in pagos_cliente: # Un pago que cubre dos notas
+                ventana = [nota for nota in notas_cliente if pago[3] and nota[3] and en_ventana(nota[2], pago[2])]
+                for una, otra in itertools.combinations(ventana, 2):
+                    if abs(una[3] + otra[3] - pago[3]) <= tolerancia:
+                        aplicar(pago, una)
+                        aplicar(pago, otra)
+                        break
+            for nota in notas_cliente: # Una nota pagada en dos partes
+                ventana = [pago for pago in pagos_cliente if nota[3] and pago[3] and en_ventana(nota[2], pago[2])]
+                for uno, otro in itertools.combinations(ventana, 2):
+                    if abs(uno[3] + otro[3] - nota[3]) <= tolerancia:
+                        aplicar(uno, nota)
+                        aplicar(otro, nota)
+                        break
+            for pago in pagos_cliente: # El resto, a las notas más antiguas que alcance
+                for nota in notas_cliente:
+                    if not pago[3]:
+                        break
+                    if nota[3] and en_ventana(nota[2], pago[2]):
+                        aplicar(pago, nota)
+        return aplicaciones
+
+    ms_ordenado = _medir(lambda: conciliacion.emparejar(pagos_sin_aplicar, notas_abiertas), 3)
+    ms_anidado = _medir(anidado, 1)
+    inicio = time.perf_counter()
+    exito, _, resumen = conciliacion.conciliar_pagos()
+    ms_completa = (time.perf_counter() - inicio) * 1000
+    saldadas = conn.execute("""
+        SELECT COUNT(*) FROM notas_pedido np
+        WHERE np.total_con_iva - (SELECT COALESCE(SUM(importe), 0) FROM pagos_aplicados WHERE nota_pedido_id = np.id)
+              <= ?""", (conciliacion.TOLERANCIA_IMPORTE,)).fetchone()[0]
+    excedidas = conn.execute("""
+        SELECT COUNT(*) FROM notas_pedido np
+        WHERE (SELECT COALESCE(SUM(importe), 0) FROM pagos_aplicados WHERE nota_pedido_id = np.id) > np.total_con_iva + 0.01""").fetchone()[0]
+    return {
+        "notas": len(notas),
+        "pagos": len(pagos),
+        "emparejar_ordenado_ms": ms_ordenado,
+        "emparejar_bucles_anidados_ms": ms_anidado,
+        "conciliacion_completa_ms": round(ms_completa, 3),
+        "exitosa": int(exito),
+        "exactos": resumen.get('exactos', 0),
+        "parciales": resumen.get('parciales', 0),
+        "combinados": resumen.get('combinados', 0),
+        "notas_saldadas": saldadas,
+        "notas_con_aplicado_mayor_al_total": excedidas,
+        "pagos_aplicados_por_segundo": round(len(pagos) / (ms_completa / 1000), 1),
+    }
+
+
+def bench_cuenta_corriente(escala):
+    """
+    Cuenta corriente de 'escala' clientes con 20 notas entregadas y 15 pagos cada uno en dos años: asientos
+    escritos por los triggers, cierres mensuales, estado de cuenta de un año de cada cliente, antigüedad de
+    saldos de todos y saldo a una fecha con cierres vs. sumando toda la historia del cliente.
+    """
+    import cuenta_corriente
+
+    _base_temporal()
+    conn = presupuesto_backend.conexion()
+    rnd = random.Random(43)
+    inicio_periodo = datetime.date(2023, 1, 1).toordinal()
+    with conn:
+        conn.executemany("INSERT INTO clientes (nombre, cuit, razon_social) VALUES (?, ?, ?)",
+                         [(f"Cliente {i}", f"20-{i:08d}-0", f"Razón Social {i}") for i in range(escala)])
+        notas = [(1 + i // 20, datetime.date.fromordinal(inicio_periodo + rnd.randrange(730)).isoformat(),
+                  round(rnd.uniform(100, 20_000), 2)) for i in range(escala * 20)]
+        conn.executemany("""INSERT INTO notas_pedido (cliente_id, fecha_creacion, estado, total, total_con_iva, cantidad_lineas)
+                            VALUES (?, ?, 'aprobada', ROUND(?3 / 1.21, 4), ?3, 1)""", notas)
+
+    inicio = time.perf_counter()
+    with conn:
+        conn.executemany("UPDATE notas_pedido SET estado = 'entregada', fecha_entrega = fecha_creacion WHERE id = ?",
+                         [(i,) for i in range(1, len(notas) + 1)])
+        conn.executemany("INSERT INTO comprobantes (nro_operacion, fecha, importe, cuenta, cliente_id) VALUES (?, ?, ?, 'CBU-0001', ?)",
+                         [(f"OP-{i:09d}", datetime.date.fromordinal(inicio_periodo + 15 + rnd.randrange(730)).strftime('%d/%m/%Y'),
+                           round(rnd.uniform(100, 20_000), 2), 1 + i // 15) for i in range(escala * 15)])
+    segundos_asientos = time.perf_counter() - inicio
+    asientos = conn.execute("SELECT COUNT(*) FROM cuenta_corriente").fetchone()[0]
+
+    inicio = time.perf_counter()
+    cierres = cuenta_corriente.generar_cierres(datetime.date(2024, 12, 31))
+    ms_cierres = (time.perf_counter() - inicio) * 1000
+
+    clientes = range(1, escala + 1)
+    inicio = time.perf_counter()
+    movimientos = sum(len(cuenta_corriente.estado_de_cuenta(cliente, '2024-01-01', '2024-12-31')[1]) for cliente in clientes)
+    ms_estados = (time.perf_counter() - inicio) * 1000
+    ms_antiguedad = _medir(lambda: cuenta_corriente.antiguedad_saldos('2024-12-31'), 3)
+
+    consultas_saldo = [(rnd.choice(clientes), datetime.date.fromordinal(inicio_periodo + rnd.randrange(730)).isoformat())
+                       for _ in range(escala)]
+    def toda_la_historia(cliente, fecha):
+        return conn.execute("SELECT ROUND(COALESCE(SUM(debe - haber), 0), 2) FROM cuenta_corriente WHERE cliente_id = ? AND fecha <= ?",
+                            (cliente, fecha)).fetchone()[0]
+    inicio = time.perf_counter()
+    con_cierres = [cuenta_corriente.saldo_a_fecha(cliente, fecha) for cliente, fecha in consultas_saldo]
+    us_con_cierres = (time.perf_counter() - inicio) / len(consultas_saldo) * 1e6
+    inicio = time.perf_counter()
+    sumando = [toda_la_historia(cliente, fecha) for cliente, fecha in consultas_saldo]
+    us_sumando = (time.perf_counter() - inicio) / len(consultas_saldo) * 1e6
+
+    saldos_distintos = conn.execute("""
+        SELECT COUNT(*) FROM (
+            SELECT cliente_id, ROUND(SUM(debe - haber), 2) AS suma FROM cuenta_corriente GROUP BY cliente_id
+        ) JOIN cuenta_corriente_saldos USING (cliente_id) WHERE ABS(suma - saldo) > 0.01""").fetchone()[0]
+    return {
+        "clientes": escala,
+        "asientos": asientos,
+        "asientos_por_segundo": round(asientos / segundos_asientos, 1),
+        "cierres": cierres,
+        "generar_cierres_ms": round(ms_cierres, 3),
+        "estados_de_cuenta_ms": round(ms_estados, 3),
+        "estado_de_cuenta_por_cliente_ms": round(ms_estados / escala, 4),
+        "movimientos_en_estados": movimientos,
+        "antiguedad_todos_los_clientes_ms": ms_antiguedad,
+        "saldo_a_fecha_con_cierres_us": round(us_con_cierres, 2),
+        "saldo_a_fecha_sumando_historia_us": round(us_sumando, 2),
+        "saldos_a_fecha_distintos": sum(abs(a - b) > 0.01 for a, b in zip(con_cierres, sumando)),
+        "saldos_actuales_distintos": saldos_distintos,
+    }
+
+
+def bench_movimientos_stock(escala):
+    """
+    Libro de movimientos de stock con 'escala' movimientos de escala // 1000 productos en dos años: alta de
+    movimientos con el trigger de proyección (carga masiva sin registro de cambios, y con registro como la
+    app), instantáneas mensuales incrementales, stock de un producto a un momento con instantáneas vs.
+    sumando toda su historia, stock de todos los productos a un momento y verificación contra la proyección.
+    """
+    import movimientos_stock
+
+    _base_temporal()
+    conn = presupuesto_backend.conexion()
+    rnd = random.Random(44)
+    productos = max(escala // 1000, 1)
+    with conn:
+        conn.executemany("INSERT INTO productos (codigo, descripcion) VALUES (?, ?)",
+                         [(f"SKU-{i:06d}", f"Producto {i}") for i in range(1, productos + 1)])
+    tipos = [('ingreso', 1, 0), ('ajuste', -1, 0), ('reserva', -1, 1), ('liberacion', 1, -1), ('entrega', 0, -1)]
+    pesos = [25, 5, 30, 10, 30]
+
+    def movimientos_del_mes(anio, mes, cantidad):
+        dias = (datetime.date(anio + mes // 12, mes % 12 + 1, 1) - datetime.date(anio, mes, 1)).days
+        paso = dias * 86_400_000 // cantidad # Milisegundos entre movimientos: en orden de momento, como llegan
+        for i, (tipo, signo_disponible, signo_reservado) in enumerate(rnd.choices(tipos, pesos, k=cantidad)):
+            dia, ms = divmod(i * paso, 86_400_000)
+            segundos, ms = divmod(ms, 1000)
+            cantidad_movida = rnd.randint(1, 20)
+            yield (rnd.randint(1, productos), f"{anio}-{mes:02d}-{dia + 1:02d}T{segundos // 3600:02d}:{segundos // 60 % 60:02d}:{segundos % 60:02d}.{ms:03d}",
+                   tipo, signo_disponible * cantidad_movida, signo_reservado * cantidad_movida)
+
+    meses = [(2023 + m // 12, m % 12 + 1) for m in range(24)]
+    por_mes = escala // len(meses)
+    presupuesto_backend._quitar_triggers_registro(conn.cursor()) # Carga masiva, como datos_sinteticos
+    segundos_carga = segundos_instantaneas = 0.0
+    instantaneas = 0
+    for anio, mes in meses:
+        inicio = time.perf_counter()
+        with conn:
+            conn.executemany("INSERT INTO movimientos_stock (producto_id, momento, tipo, disponible, reservado) VALUES (?, ?, ?, ?, ?)",
+                             movimientos_del_mes(anio, mes, por_mes))
+        segundos_carga += time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        instantaneas += movimientos_stock.generar_instantaneas(f"{anio}-{mes:02d}-{calendar.monthrange(anio, mes)[1]:02d}")
+        segundos_instantaneas += time.perf_counter() - inicio
+    for tabla in presupuesto_backend.TABLAS_CON_REGISTRO:
+        presupuesto_backend._crear_triggers_registro(conn.cursor(), tabla)
+    conn.commit()
+    movimientos = conn.execute("SELECT COUNT(*) FROM movimientos_stock").fetchone()[0]
+
+    inicio = time.perf_counter()
+    with conn:
+        conn.executemany("INSERT INTO movimientos_stock (producto_id, tipo, disponible, reservado) VALUES (?, 'ingreso', ?, 0)",
+                         [(rnd.randint(1, productos), rnd.randint(1, 20)) for _ in range(100_000)])
+    por_segundo_con_registro = 100_000 / (time.perf_counter() - inicio)
+    llamadas = 1000
+    inicio = time.perf_counter()
+    for _ in range(llamadas):
+        movimientos_stock.registrar_movimiento(rnd.randint(1, productos), 'ajuste', -1)
+    ms_registrar = (time.perf_counter() - inicio) * 1000 / llamadas
+
+    inicio_periodo = datetime.datetime(2023, 1, 1)
+    consultas_stock = [(rnd.randint(1, productos), (inicio_periodo + datetime.timedelta(seconds=rnd.randrange(730 * 86_400))).isoformat(timespec='milliseconds'))
+                       for _ in range(10_000)]
+    def toda_la_historia(producto_id, momento):
+        return conn.execute("""SELECT COALESCE(SUM(disponible), 0), COALESCE(SUM(reservado), 0) FROM movimientos_stock
+                               WHERE producto_id = ? AND momento <= ?""", (producto_id, momento)).fetchone()
+    inicio = time.perf_counter()
+    con_instantaneas = [movimientos_stock.stock_a_fecha(momento, producto_id) for producto_id, momento in consultas_stock]
+    us_con_instantaneas = (time.perf_counter() - inicio) / len(consultas_stock) * 1e6
+    inicio = time.perf_counter()
+    sumando = [toda_la_historia(producto_id, momento) for producto_id, momento in consultas_stock]
+    us_sumando = (time.perf_counter() - inicio) / len(consultas_stock) * 1e6
+
+    ms_todos = _medir(lambda: movimientos_stock.stock_a_fecha('2024-06-15T12:00:00.000'), 3)
+    inicio = time.perf_counter()
+    proyeccion, ultimas = movimientos_stock.verificar()
+    ms_verificar = (time.perf_counter() - inicio) * 1000
+    return {
+        "productos": productos,
+        "movimientos": movimientos,
+        "movimientos_por_segundo_carga": round(movimientos / segundos_carga, 1),
+        "movimientos_por_segundo_con_registro": round(por_segundo_con_registro, 1),
+        "registrar_movimiento_ms": round(ms_registrar, 4),
+        "instantaneas": instantaneas,
+        "instantaneas_mensuales_ms": round(segundos_instantaneas * 1000, 3),
+        "stock_a_fecha_con_instantaneas_us": round(us_con_instantaneas, 2),
+        "stock_a_fecha_sumando_historia_us": round(us_sumando, 2),
+        "stocks_a_fecha_distintos": sum(tuple(a) != tuple(b) for a, b in zip(con_instantaneas, sumando)),
+        "stock_a_fecha_todos_los_productos_ms": ms_todos,
+        "verificar_ms": round(ms_verificar, 3),
+        "diferencias_verificacion": len(proyeccion) + len(ultimas),
+    }
+
+
+def bench_conteo_stock(escala):
+    """
+    Conteo físico de 'escala' productos (un 20% con diferencias, más códigos desconocidos): importación en
+    una transacción con las diferencias y los estados calculados en SQL vs. modificar_stock_producto por
+    producto (medido sobre una muestra y extrapolado a todas las diferencias).
+    """
+    import conteo_stock
+    import movimientos_stock
+
+    db_path = _base_temporal()
+    conn = presupuesto_backend.conexion()
+    rnd = random.Random(45)
+    stocks = [rnd.randint(0, 200) for _ in range(escala)]
+    with conn:
+        conn.executemany("INSERT INTO productos (codigo, descripcion, costo_base) VALUES (?, ?, ?)",
+                         [(f"SKU-{i:06d}", f"Producto {i}", round(rnd.uniform(1, 500), 2)) for i in range(escala)])
+        conn.executemany("INSERT INTO movimientos_stock (producto_id, tipo, disponible, motivo) VALUES (?, 'ingreso', ?, 'Stock inicial')",
+                         [(i + 1, stock) for i, stock in enumerate(stocks) if stock])
+
+    def contado(stock):
+        return max(stock + rnd.randint(-5, 5), 0) if rnd.random() < 0.2 else stock
+    conteos = [(f"SKU-{i:06d}", contado(stock)) for i, stock in enumerate(stocks)]
+    conteos += [(f"NUEVO-{i:05d}", rnd.randint(1, 10)) for i in range(escala // 100)]
+    ruta = os.path.join(os.path.dirname(db_path), "conteo.csv")
+    with open(ruta, "w", encoding="utf-8") as archivo:
+        archivo.write("codigo;cantidad_contada\n")
+        archivo.writelines(f"{codigo};{cantidad}\n" for codigo, cantidad in conteos)
+
+    # Camino de a un producto, sobre una muestra de las diferencias (cada llamada es una transacción y un recálculo de estado)
+    diferencias = [(codigo, cantidad - stocks[i]) for i, (codigo, cantidad) in enumerate(conteos[:escala]) if cantidad != stocks[i]]
+    muestra = diferencias[:1000]
+    modificar = _silencioso(presupuesto_backend.modificar_stock_producto)
+    inicio = time.perf_counter()
+    for codigo, cambio in muestra:
+        modificar(codigo, cambio, 'ajuste', 'Conteo de a uno')
+    ms_por_producto = (time.perf_counter() - inicio) * 1000 / len(muestra)
+    with conn: # Se deshace la muestra con movimientos inversos, así el conteo encuentra todas las diferencias
+        conn.executemany("INSERT INTO movimientos_stock (producto_id, tipo, disponible) SELECT id, 'ajuste', ? FROM productos WHERE codigo = ?",
+                         [(-cambio, codigo) for codigo, cambio in muestra])
+
+    ms_simular = _medir(lambda: conteo_stock.importar_conteo(ruta, simular=True), 3)
+    inicio = time.perf_counter()
+    informe, resumen = conteo_stock.importar_conteo(ruta, informe_path=os.path.join(os.path.dirname(db_path), "diferencias.csv"))
+    ms_importar = (time.perf_counter() - inicio) * 1000
+    stock_distinto = sum(disponible + reservado != cantidad for (disponible, reservado), (_, cantidad) in zip(
+        conn.execute("SELECT stock_disponible, stock_reservado FROM productos ORDER BY id"), conteos))
+    proyeccion, instantaneas = movimientos_stock.verificar()
+    return {
+        "productos": escala,
+        "lineas_conteo": len(conteos),
+        "diferencias": len(diferencias),
+        "ajustados": resumen['ajustados'],
+        "desconocidos": resumen['desconocido'],
+        "simular_ms": ms_simular,
+        "importar_ms": round(ms_importar, 3),
+        "de_a_un_producto_ms": round(ms_por_producto, 4),
+        "de_a_un_producto_estimado_ms": round(ms_por_producto * len(diferencias), 3),
+        "stock_distinto_del_conteo": stock_distinto,
+        "diferencias_verificacion": len(proyeccion) + len(instantaneas),
+    }
+
+
+def bench_reposicion(escala):
+    """
+    Reposición sobre datos sintéticos de 'escala' líneas: recálculo de consumos y puntos en una pasada sobre
+    las notas entregadas, costo por movimiento de mantener las alertas con triggers (contra los mismos
+    movimientos sin ellos) y lo que costaría en cambio buscar los productos en alerta recorriendo el catálogo.
+    """
+    import reposicion
+
+    _base_sintetica(escala)
+    conn = presupuesto_backend.conexion()
+    rnd = random.Random(46)
+    inicio = time.perf_counter()
+    consumos, puntos = reposicion.recalcular_puntos('2024-12-31')
+    ms_recalcular = (time.perf_counter() - inicio) * 1000
+    alertas_iniciales = reposicion.cantidad_alertas()
+
+    productos = [fila[0] for fila in conn.execute("SELECT producto_id FROM reposicion_productos WHERE punto_reposicion > 0")]
+    insertar = "INSERT INTO movimientos_stock (producto_id, tipo, disponible) VALUES (?, 'ajuste', ?)"
+    cantidad = 50_000
+    presupuesto_backend._quitar_triggers_registro(conn.cursor()) # Se mide solo la proyección y las alertas
+
+    def insertar_movimientos():
+        lote = [(rnd.choice(productos), rnd.choice((-1, 1)) * rnd.randint(1, 30)) for _ in range(cantidad)]
+        inicio = time.perf_counter()
+        with conn:
+            conn.executemany(insertar, lote)
+        return (time.perf_counter() - inicio) / cantidad * 1e6
+    con_alertas, sin_alertas = [], [] # Alternados, para que el crecimiento de la tabla no favorezca a ninguno
+    for _ in range(5):
+        con_alertas.append(insertar_movimientos())
+        presupuesto_backend._quitar_triggers_alertas_stock(conn.cursor())
+        sin_alertas.append(insertar_movimientos())
+        presupuesto_backend._crear_triggers_alertas_stock(conn.cursor())
+    presupuesto_backend._reconstruir_alertas_stock(conn.cursor()) # Las de los movimientos sin triggers
+    conn.commit()
+    us_con_alertas, us_sin_alertas = min(con_alertas), min(sin_alertas)
+
+    recorrer = """SELECT p.id FROM productos p JOIN reposicion_productos r ON r.producto_id = p.id
+                  WHERE r.punto_reposicion > 0 AND p.stock_disponible <= r.punto_reposicion"""
+    ms_recorrer = _medir(lambda: conn.execute(recorrer).fetchall())
+    en_alerta = {fila[0] for fila in conn.execute("SELECT producto_id FROM alertas_stock")}
+    return {
+        "productos": conn.execute("SELECT COUNT(*) FROM productos").fetchone()[0],
+        "productos_con_consumo": len(productos),
+        "consumos_calculados": consumos,
+        "puntos_calculados": puntos,
+        "recalcular_puntos_ms": round(ms_recalcular, 3),
+        "alertas_iniciales": alertas_iniciales,
+        "movimiento_con_alertas_us": round(us_con_alertas, 2),
+        "movimiento_sin_alertas_us": round(us_sin_alertas, 2),
+        "costo_alertas_por_movimiento_us": round(us_con_alertas - us_sin_alertas, 2),
+        "recorrer_catalogo_ms": ms_recorrer,
+        "alertas": len(en_alerta),
+        "alertas_distintas_del_recorrido": len(en_alerta ^ {fila[0] for fila in conn.execute(recorrer)}),
+    }
+
+
+def bench_expedicion(escala):
+    """
+    Cola de expedición sobre datos sintéticos de 'escala' líneas (400k: unas 10k notas abiertas): refresco sin
+    cambios (solo PRAGMA data_version), refresco después de cambiar unas pocas notas desde otra conexión y
+    relectura completa de la cola, que es lo que haría cada refresco sin el seguimiento de cambios.
+    También la lista de picking consolidada de todas las notas aprobadas y la de una zona.
+    """
+    import expedicion
+
+    _base_sintetica(escala)
+    conn = presupuesto_backend.conexion() # La de la aplicación; la cola usa una propia
+    rnd = random.Random(47)
+    cola = expedicion.ColaExpedicion()
+    inicio = time.perf_counter()
+    cola.refrescar()
+    ms_primera_carga = (time.perf_counter() - inicio) * 1000
+    ms_releer = _medir(lambda: cola.refrescar(completo=True))
+    ms_listado_actual = _medir(lambda: presupuesto_backend.obtener_notas_pedido(True))
+    ms_sin_cambios = _medir(cola.refrescar, 1000)
+
+    actualizar = _silencioso(presupuesto_backend.actualizar_estado_nota_pedido)
+    aprobadas = [nota_id for nota_id, fila in cola.notas.items() if fila[6] == 'aprobada']
+    pendientes = [nota_id for nota_id, fila in cola.notas.items() if fila[6] == 'pendiente']
+    tiempos, cambiadas, quitadas = [], 0, 0
+    # Por refresco: una nota entregada, una aprobada y una línea nueva en otra pendiente (siempre queda una);
+    # con pocas notas abiertas (escala chica) se hacen menos refrescos, o ninguno
+    refrescos = max(0, min(20, len(aprobadas), len(pendientes) - 1))
+    for _ in range(refrescos):
+        actualizar(aprobadas.pop(rnd.randrange(len(aprobadas))), 'entregada', confirmar_salto=True)
+        actualizar(pendientes.pop(rnd.randrange(len(pendientes))), 'aprobada', confirmar_salto=True)
+        with conn:
+            conn.execute("""INSERT INTO detalle_pedido (nota_pedido_id, producto_id, cantidad, precio_unitario)
+                            VALUES (?, (SELECT MIN(id) FROM productos), 1, 10.0)""", (rnd.choice(pendientes),))
+        inicio = time.perf_counter()
+        nuevas, salidas = cola.refrescar()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        cambiadas, quitadas = cambiadas + len(nuevas), quitadas + len(salidas)
+
+    completa = expedicion.ColaExpedicion()
+    completa.refrescar()
+    diferencias = set(cola.notas.items()) ^ set(completa.notas.items())
+    zonas = cola.zonas()
+    zona_envio = max((z for z in zonas if z != expedicion.ZONA_MOSTRADOR), key=lambda z: len(zonas[z]), default=None)
+    notas_zona = cola.aprobadas(zona_envio) if zona_envio else []
+    ms_picking = _medir(expedicion.lista_de_picking, 3)
+    ms_picking_zona = _medir(lambda: expedicion.lista_de_picking(notas_zona), 3)
+    resultados = {
+        "notas_abiertas": len(cola.notas),
+        "notas_aprobadas": len(cola.aprobadas()),
+        "zonas": len(zonas),
+        "primera_carga_ms": round(ms_primera_carga, 3),
+        "releer_cola_completa_ms": ms_releer,
+        "listado_expedicion_actual_ms": ms_listado_actual,
+        "refresco_sin_cambios_ms": ms_sin_cambios,
+        "refrescos_con_cambios": refrescos,
+        # Sin refrescos no hay tiempo que informar (las métricas son siempre números)
+        **({"refresco_con_3_cambios_ms": round(min(tiempos), 3)} if tiempos else {}),
+        "notas_releidas": cambiadas,
+        "notas_quitadas": quitadas,
+        "diferencias_con_relectura": len(diferencias),
+        "productos_picking": len(expedicion.lista_de_picking()),
+        "lista_picking_ms": ms_picking,
+        "notas_zona": len(notas_zona),
+        "lista_picking_zona_ms": ms_picking_zona,
+    }
+    cola.cerrar()
+    completa.cerrar()
+    return resultados
+
+
+def bench_revisiones(escala):
+    """
+    'escala' presupuestos de 500 líneas con 20 revisiones cada uno (unas 10 líneas cambiadas por revisión):
+    costo de guardar una revisión, filas escritas contra copiar el presupuesto entero en cada revisión,
+    armar una revisión cualquiera, diferencias entre la primera y la última, y clonar un presupuesto en SQL
+    contra leer sus líneas y volver a insertarlas desde Python. Verifica cada revisión armada contra lo esperado.
+    """
+    import revisiones_presupuesto
+
+    _base_temporal()
+    conn = presupuesto_backend.conexion()
+    rnd = random.Random(48)
+    lineas_por_presupuesto, cantidad_revisiones = 500, 20
+    with conn:
+        conn.executemany("INSERT INTO productos (codigo, descripcion) VALUES (?, ?)",
+                         [(f"SKU-{i:05d}", f"Producto {i}") for i in range(1, 2001)])
+        cliente_id = conn.execute("INSERT INTO clientes (nombre, cuit, razon_social) VALUES ('Bench', '0', 'Bench')").lastrowid
+    presupuestos, esperadas = [], {} # (presupuesto, revisión) -> {producto_id: (cantidad, precio)}
+    for _ in range(escala):
+        contenido = {producto_id: (rnd.randint(1, 50), round(rnd.uniform(1, 500), 2))
+                     for producto_id in rnd.sample(range(1, 2001), lineas_por_presupuesto)}
+        with conn:
+            presupuesto_id = conn.execute("INSERT INTO presupuestos (cliente_id, fecha_creacion, estado) VALUES (?, '2024-01-02', 'borrador')",
+                                          (cliente_id,)).lastrowid
+            conn.executemany("INSERT INTO detalle_presupuesto (presupuesto_id, producto_id, cantidad, precio_unitario) VALUES (?, ?, ?, ?)",
+                             [(presupuesto_id, producto_id, cantidad, precio) for producto_id, (cantidad, precio) in contenido.items()])
+        presupuestos.append(presupuesto_id)
+        esperadas[(presupuesto_id, 1)] = dict(contenido)
+
+    tiempos_revision = []
+    for numero in range(2, cantidad_revisiones + 1):
+        for presupuesto_id in presupuestos:
+            contenido = dict(esperadas[(presupuesto_id, numero - 1)])
+            productos = list(contenido)
+            for producto_id in rnd.sample(productos, 6):
+                contenido[producto_id] = (contenido[producto_id][0] + rnd.randint(1, 5), contenido[producto_id][1])
+            for producto_id in rnd.sample(productos, 2):
+                del contenido[producto_id]
+            for producto_id in rnd.sample([p for p in range(1, 2001) if p not in contenido], 2):
+                contenido[producto_id] = (rnd.randint(1, 50), round(rnd.uniform(1, 500), 2))
+            inicio = time.perf_counter()
+            revisiones_presupuesto.revisar(presupuesto_id, [(p, c, pr) for p, (c, pr) in contenido.items()])
+            tiempos_revision.append((time.perf_counter() - inicio) * 1000)
+            esperadas[(presupuesto_id, numero)] = contenido
+
+    distintas = sum(1 for (presupuesto_id, numero), contenido in esperadas.items()
+                    if {p: (c, pr) for p, _, _, c, pr in revisiones_presupuesto.lineas(presupuesto_id, numero)} != contenido)
+    actuales_distintas = sum(1 for presupuesto_id in presupuestos
+                             if {p: (c, pr) for p, _, _, c, pr in revisiones_presupuesto.lineas(presupuesto_id)}
+                             != esperadas[(presupuesto_id, cantidad_revisiones)])
+    filas_delta = conn.execute("SELECT COUNT(*) FROM lineas_revision_presupuesto").fetchone()[0]
+    ejemplo = presupuestos[len(presupuestos) // 2]
+
+    def clonar_desde_python():
+        filas = conn.execute("SELECT producto_id, cantidad, precio_unitario FROM detalle_presupuesto WHERE presupuesto_id = ?",
+                             (ejemplo,)).fetchall()
+        with conn:
+            nuevo_id = conn.execute("INSERT INTO presupuestos (cliente_id, fecha_creacion, estado) VALUES (?, '2024-01-02', 'borrador')",
+                                    (cliente_id,)).lastrowid
+            conn.executemany("INSERT INTO detalle_presupuesto (presupuesto_id, producto_id, cantidad, precio_unitario) VALUES (?, ?, ?, ?)",
+                             [(nuevo_id,) + fila for fila in filas])
+    return {
+        "presupuestos": len(presupuestos),
+        "lineas_por_presupuesto": lineas_por_presupuesto,
+        "revisiones_por_presupuesto": cantidad_revisiones,
+        "guardar_revision_ms": round(sorted(tiempos_revision)[len(tiempos_revision) // 2], 3),
+        "filas_delta": filas_delta,
+        "filas_copiando_cada_revision": sum(len(contenido) for contenido in esperadas.values()),
+        "armar_revision_1_ms": _medir(lambda: revisiones_presupuesto.lineas(ejemplo, 1), 20),
+        "armar_revision_10_ms": _medir(lambda: revisiones_presupuesto.lineas(ejemplo, 10), 20),
+        "armar_revision_20_ms": _medir(lambda: revisiones_presupuesto.lineas(ejemplo, 20), 20),
+        "lineas_actuales_ms": _medir(lambda: revisiones_presupuesto.lineas(ejemplo), 20),
+        "diferencias_1_a_20_ms": _medir(lambda: revisiones_presupuesto.diferencias(ejemplo, 1, 20), 20),
+        "diferencias_19_a_20_ms": _medir(lambda: revisiones_presupuesto.diferencias(ejemplo, 19, 20), 20),
+        "clonar_sql_ms": _medir(lambda: revisiones_presupuesto.clonar(ejemplo, cliente_id), 20),
+        "clonar_revision_1_sql_ms": _medir(lambda: revisiones_presupuesto.clonar(ejemplo, cliente_id, 1), 20),
+        "clonar_desde_python_ms": _medir(clonar_desde_python, 20),
+        "revisiones_distintas_de_lo_esperado": distintas,
+        "detalle_actual_distinto": actuales_distintas,
+    }
+
+
+def bench_revalidacion(escala):
+    """
+    'escala' líneas de presupuestos abiertos (20 por presupuesto, 70 % borradores) cotizados en los 40 días
+    anteriores y una lista de precios nueva para el 20 % de los productos: revalidación en una consulta contra
+    recorrer presupuesto por presupuesto y línea por línea, vencimientos, y actualización de los borradores con
+    su revisión. Verifica las líneas marcadas contra el recorrido, los totales y las revisiones armadas.
+    """
+    import revalidacion_precios
+    import revisiones_presupuesto
+
+    _base_temporal()
+    conn = presupuesto_backend.conexion()
+    rnd = random.Random(49)
+    hoy, lineas_por_presupuesto, cantidad_productos = datetime.date(2025, 1, 31), 20, 2000
+    with conn:
+        conn.executemany("INSERT INTO productos (codigo, descripcion, precio_1, precio_5, precio_10, precio_25) VALUES (?, ?, ?, ?, ?, ?)",
+                         [(f"SKU-{i:05d}", f"Producto {i}", precio, round(precio * 0.92, 2), round(precio * 0.87, 2), round(precio * 0.76, 2))
+                          for i, precio in ((i, round(rnd.uniform(1, 500), 2)) for i in range(1, cantidad_productos + 1))])
+        cliente_id = conn.execute("INSERT INTO clientes (nombre, cuit, razon_social) VALUES ('Bench', '0', 'Bench')").lastrowid
+        precios = dict(conn.execute("SELECT id, precio_1 FROM productos"))
+        for _ in range(max(1, escala // lineas_por_presupuesto)):
+            fecha = (hoy - datetime.timedelta(days=rnd.randint(0, 40))).isoformat()
+            presupuesto_id = conn.execute("INSERT INTO presupuestos (cliente_id, fecha_creacion, estado) VALUES (?, ?, ?)",
+                                          (cliente_id, fecha, 'borrador' if rnd.random() < 0.7 else 'aprobado')).lastrowid
+            conn.executemany("INSERT INTO detalle_presupuesto (presupuesto_id, producto_id, cantidad, precio_unitario) VALUES (?, ?, ?, ?)",
+                             [(presupuesto_id, producto_id, rnd.randint(1, 30), precios[producto_id])
+                              for producto_id in rnd.sample(range(1, cantidad_productos + 1), lineas_por_presupuesto)])
+    lineas_abiertas = conn.execute("SELECT COUNT(*) FROM detalle_presupuesto").fetchone()[0]
+    limite = (hoy - datetime.timedelta(days=revalidacion_precios.DIAS_VALIDEZ)).isoformat()
+    vencidos_esperados = conn.execute("SELECT COUNT(*) FROM presupuestos WHERE estado = 'borrador' AND fecha_creacion < ?",
+                                      (limite,)).fetchone()[0]
+    inicio = time.perf_counter()
+    with conn: # Lista nueva: el trigger anota precios_desde en cada producto que cambió
+        conn.executemany("UPDATE productos SET precio_1 = ROUND(precio_1 * ?1, 2), precio_5 = ROUND(precio_5 * ?1, 2), "
+                         "precio_10 = ROUND(precio_10 * ?1, 2), precio_25 = ROUND(precio_25 * ?1, 2) WHERE id = ?2",
+                         [(round(rnd.uniform(1.03, 1.15), 2), producto_id)
+                          for producto_id in rnd.sample(range(1, cantidad_productos + 1), cantidad_productos // 5)])
+    importar_lista_ms = (time.perf_counter() - inicio) * 1000
+
+    inicio = time.perf_counter()
+    vencidos, marcados, _ = revalidacion_precios.revalidar(hoy=hoy)
+    primera_revalidacion_ms = (time.perf_counter() - inicio) * 1000
+    lineas_marcadas = conn.execute("SELECT COALESCE(SUM(lineas), 0) FROM precios_desactualizados").fetchone()[0]
+
+    def revalidar_por_linea():
+        marcadas = 0
+        abiertos = conn.execute("SELECT id, fecha_creacion FROM presupuestos WHERE estado IN ('borrador', 'aprobado')").fetchall()
+        for presupuesto_id, cotizado in abiertos:
+            for producto_id, cantidad, precio in conn.execute(
+                    "SELECT producto_id, cantidad, precio_unitario FROM detalle_presupuesto WHERE presupuesto_id = ?", (presupuesto_id,)).fetchall():
+                desde, precio_1, precio_5, precio_10, precio_25 = conn.execute(
+                    "SELECT precios_desde, precio_1, precio_5, precio_10, precio_25 FROM productos WHERE id = ?", (producto_id,)).fetchone()
+                if desde is None or desde <= cotizado:
+                    continue
+                lista = precio_25 if cantidad >= 25 else precio_10 if cantidad >= 10 else precio_5 if cantidad >= 5 else precio_1
+                marcadas += abs(precio - lista) >= 0.005
+        return marcadas
+
+    lineas_por_recorrido = revalidar_por_linea()
+    resultados = {
+        "lineas_abiertas": lineas_abiertas,
+        "importar_lista_ms": round(importar_lista_ms, 3),
+        "vencidos": vencidos,
+        "vencidos_distintos_de_lo_esperado": abs(vencidos - vencidos_esperados),
+        "presupuestos_marcados": marcados,
+        "lineas_marcadas": lineas_marcadas,
+        "lineas_distintas_del_recorrido": abs(lineas_marcadas - lineas_por_recorrido),
+        "primera_revalidacion_ms": round(primera_revalidacion_ms, 3),
+        "revalidar_ms": _medir(lambda: revalidacion_precios.revalidar(hoy=hoy), 3),
+        "revalidar_por_linea_ms": _medir(revalidar_por_linea, 1),
+    }
+
+    borradores = [presupuesto_id for (presupuesto_id,) in conn.execute(
+        "SELECT presupuesto_id FROM precios_desactualizados JOIN presupuestos p ON p.id = presupuesto_id WHERE p.estado = 'borrador'")]
+    inicio = time.perf_counter()
+    _, marcados_despues, repreciados = revalidacion_precios.revalidar(repreciar=True, hoy=hoy)
+    resultados["repreciar_borradores_ms"] = round((time.perf_counter() - inicio) * 1000, 3)
+    resultados["borradores_repreciados"] = repreciados
+    resultados["borradores_aun_marcados"] = conn.execute(
+        "SELECT COUNT(*) FROM precios_desactualizados JOIN presupuestos p ON p.id = presupuesto_id WHERE p.estado = 'borrador'").fetchone()[0]
+    resultados["aprobados_marcados"] = marcados_despues
+    resultados["totales_distintos_del_detalle"] = conn.execute("""
+        SELECT COUNT(*) FROM presupuestos p
+        WHERE ABS(p.total - (SELECT COALESCE(SUM(cantidad * precio_unitario), 0) FROM detalle_presupuesto WHERE presupuesto_id = p.id)) > 0.01
+    """).fetchone()[0]
+    resultados["revisiones_distintas_del_detalle"] = sum(
+        1 for presupuesto_id in borradores
+        if revisiones_presupuesto.lineas(presupuesto_id, revisiones_presupuesto.ultima_revision(presupuesto_id))
+        != revisiones_presupuesto.lineas(presupuesto_id))
+    return resultados
+
+
+def bench_reglas_precio(escala):
+    """
+    Catálogo de 'escala' productos con costo y precios por escala: reglas sugeridas desde la lista, cálculo
+    vectorial de la lista entera contra un bucle por producto y escala, y aplicación escribiendo solo los
+    productos que cambian contra reescribir el catálogo. Verifica el cálculo contra el bucle y que una segunda
+    aplicación no cambie nada.
+    """
+    import math
+    import reglas_precio
+
+    _base_temporal()
+    conn = presupuesto_backend.conexion()
+    rnd = random.Random(50)
+    columnas = presupuesto_backend.COLUMNAS_PRECIO
+    with conn:
+        filas = []
+        for i in range(1, escala + 1):
+            precio_unitario = round(rnd.uniform(2, 120), 4)
+            filas.append((f"SKU-{i:06d}", f"{rnd.choice(datos_sinteticos.RUBROS)} {i}", round(precio_unitario * rnd.uniform(0.45, 0.7), 4),
+                          *(0.0 if columna == 'precio_tambor_rollo' and i % 3 else round(precio_unitario * factor, 4)
+                            for columna, factor in datos_sinteticos.FACTORES_PRECIO)))
+        conn.executemany(f"INSERT INTO productos (codigo, descripcion, costo_base, {', '.join(columnas)}) "
+                         f"VALUES (?, ?, ?, {', '.join('?' * len(columnas))})", filas)
+    resultados = {"productos": escala}
+
+    inicio = time.perf_counter()
+    sugeridas = reglas_precio.sugerir_reglas()
+    resultados["sugerir_reglas_ms"] = round((time.perf_counter() - inicio) * 1000, 3)
+    resultados["reglas_sugeridas"] = reglas_precio.guardar_reglas(sugeridas)
+    inicio = time.perf_counter()
+    resultados["aplicar_inicial_productos"], resultados["aplicar_inicial_precios"] = reglas_precio.aplicar()
+    resultados["aplicar_inicial_ms"] = round((time.perf_counter() - inicio) * 1000, 3)
+
+    # Cambio habitual: sube el recargo de un rubro y el costo del 1 % de los productos
+    for categoria, escala_precio, recargo, margen_minimo, redondeo in sugeridas:
+        if categoria == reglas_precio.CATEGORIA_GENERAL:
+            reglas_precio.guardar_regla('RESINA', escala_precio, recargo + 0.05, margen_minimo, redondeo)
+    with conn:
+        conn.executemany("UPDATE productos SET costo_base = ROUND(costo_base * ?, 4) WHERE id = ?",
+                         [(round(rnd.uniform(1.02, 1.1), 2), producto_id) for producto_id in rnd.sample(range(1, escala + 1), escala // 100)])
+
+    def calcular_por_producto():
+        por_clave = {(categoria, escala_precio): (recargo, margen, redondeo)
+                     for categoria, escala_precio, recargo, margen, redondeo in reglas_precio.reglas()}
+        cambios = {}
+        for producto_id, descripcion, costo, *actuales in conn.execute(
+                f"SELECT id, descripcion, costo_base, {', '.join(columnas)} FROM productos ORDER BY id"):
+            palabras = (descripcion or "").split()
+            categoria = palabras[0].upper() if palabras else ""
+            sin_precios = all(actual == 0 for actual in actuales)
+            for escala_precio, actual in zip(columnas, actuales):
+                regla = por_clave.get((categoria, escala_precio), por_clave.get((reglas_precio.CATEGORIA_GENERAL, escala_precio)))
+                if regla is None or costo <= 0 or (actual == 0 and not sin_precios):
+                    continue
+                recargo, margen, redondeo = regla
+                precio = max(costo * (1 + recargo), costo / (1 - margen))
+                precio = round(math.ceil(round(precio / redondeo, 6)) * redondeo, 4)
+                if abs(precio - actual) >= reglas_precio.TOLERANCIA:
+                    cambios[(producto_id, escala_precio)] = precio
+        return cambios
+
+    vista = reglas_precio.vista_previa()
+    por_producto = calcular_por_producto()
+    ids = dict(conn.execute("SELECT codigo, id FROM productos"))
+    vectorial = {(ids[codigo], escala_precio): precio for codigo, escala_precio, precio
+                 in zip(vista['codigo'], vista['escala'], vista['precio_nuevo'])}
+    resultados["precios_a_cambiar"] = len(vista)
+    resultados["precios_distintos_del_bucle"] = len(set(vectorial.items()) ^ set(por_producto.items()))
+    resultados["vista_previa_ms"] = _medir(reglas_precio.vista_previa, 3)
+    resultados["calcular_por_producto_ms"] = _medir(calcular_por_producto, 1)
+
+    inicio = time.perf_counter()
+    resultados["aplicar_productos"], resultados["aplicar_precios"] = reglas_precio.aplicar()
+    resultados["aplicar_ms"] = round((time.perf_counter() - inicio) * 1000, 3)
+    inicio = time.perf_counter()
+    resultados["aplicar_sin_cambios_productos"], _ = reglas_precio.aplicar()
+    resultados["aplicar_sin_cambios_ms"] = round((time.perf_counter() - inicio) * 1000, 3)
+
+    lista = conn.execute(f"SELECT id, {', '.join(columnas)} FROM productos").fetchall()
+    inicio = time.perf_counter()
+    with conn: # Lo que haría regenerar la lista sin comparar: reescribir todos los productos
+        conn.executemany(f"UPDATE productos SET {', '.join(f'{columna} = ?{i + 2}' for i, columna in enumerate(columnas))} WHERE id = ?1", lista)
+    resultados["reescribir_catalogo_ms"] = round((time.perf_counter() - inicio) * 1000, 3)
+    return resultados
+
+
+def bench_instrumentacion(escala):
+    """Costo de la instrumentación: función sin decorar, decorada e inactiva, y decorada y activa."""
+    import instrumentacion
+
+    _base_sintetica(escala)
+    rnd = random.Random(42)
+    textos = [datos_sinteticos.texto_comprobante(rnd, i) for i in range(10_000)]
+    parsear = presupuesto_backend.parsear_texto_comprobante
+    sin_decorar = parsear.__wrapped__
+
+    def parsear_todos(funcion):
+        for texto in textos:
+            funcion(texto)
+
+    resultados = {"parsear_sin_decorar_ms": _medir(lambda: parsear_todos(sin_decorar))}
+    instrumentacion.desactivar()
+    resultados["parsear_instrumentacion_inactiva_ms"] = _medir(lambda: parsear_todos(parsear))
+    resultados["listado_pedidos_instrumentacion_inactiva_ms"] = _medir(presupuesto_backend.obtener_notas_pedido)
+    instrumentacion.activar()
+    try:
+        resultados["parsear_instrumentacion_activa_ms"] = _medir(lambda: parsear_todos(parsear))
+        resultados["listado_pedidos_instrumentacion_activa_ms"] = _medir(presupuesto_backend.obtener_notas_pedido)
+        # Las sentencias del backend (conn.execute sobre la conexión de larga vida) tienen que llegar al perfilador
+        resultados["sentencias_sql_medidas"] = sum(e["llamadas"] for e in instrumentacion.instantanea()["sql"].values())
+        if not resultados["sentencias_sql_medidas"]:
+            raise RuntimeError("Con la instrumentación activa, el listado de pedidos no registró ninguna sentencia SQL.")
+    finally:
+        instrumentacion.desactivar()
+        instrumentacion.reiniciar()
+
+    # Costo fijo del decorador inactivo, medido sobre una función vacía para que no lo tape el ruido
+    def vacia():
+        return None
+    vacia_decorada = instrumentacion.medir()(vacia)
+    llamadas = 1_000_000
+    ms_vacia = _medir(lambda: [vacia() for _ in range(llamadas)])
+    ms_decorada = _medir(lambda: [vacia_decorada() for _ in range(llamadas)])
+    resultados["costo_inactiva_por_llamada_ns"] = round((ms_decorada - ms_vacia) * 1e6 / llamadas, 1)
+    return resultados
+
+
+def bench_registro(escala):
+    """Costo de una llamada de log en un bucle caliente: desactivada, con guarda, activa (cola + archivo) y print()."""
+    import logging
+    import registro
+
+    carpeta = tempfile.mkdtemp(prefix="bench_registro_")
+    registro.configurar(nivel="INFO", ruta=os.path.join(carpeta, "bench.log"))
+    log = logging.getLogger("benchmarks.registro")
+    llamadas = range(escala)
+
+    def vacio():
+        for i in llamadas:
+            pass
+
+    def debug_desactivado():
+        for i in llamadas:
+            log.debug("Procesando fila %s de %s", i, escala)
+
+    def debug_con_guarda():
+        habilitado = log.isEnabledFor(logging.DEBUG)
+        for i in llamadas:
+            if habilitado:
+                log.debug("Procesando fila %s de %s", i, escala)
+
+    def info_activo():
+        for i in llamadas:
+            log.info("Procesando fila %s de %s", i, escala)
+
+    def con_print():
+        with open(os.devnull, "w") as nulo, contextlib.redirect_stdout(nulo):
+            for i in llamadas:
+                print(f"Procesando fila {i} de {escala}")
+
+    ms_vacio = _medir(vacio)
+    resultados = {
+        "bucle_vacio_ms": ms_vacio,
+        "debug_desactivado_ms": _medir(debug_desactivado),
+        "debug_con_guarda_ms": _medir(debug_con_guarda),
+        "info_activo_en_cola_ms": _medir(info_activo, 1),
+        "print_a_devnull_ms": _medir(con_print, 1),
+    }
+    registro.detener()
+    resultados["debug_desactivado_por_llamada_ns"] = round((resultados["debug_desactivado_ms"] - ms_vacio) * 1e6 / escala, 1)
+    resultados["info_activo_por_llamada_ns"] = round((resultados["info_activo_en_cola_ms"] - ms_vacio) * 1e6 / escala, 1)
+    shutil.rmtree(carpeta, ignore_errors=True)
+    return resultados
+
+
+def bench_cola_sheets(escala):
+    """
+    Sincronización sin conexión y recuperación contra el Google Sheets falso: costo de anotar en la cola
+    durante la caída, reenvío en orden al volver la conexión y requests ahorrados por el cliente cacheado.
+    """
+    import logging
+    import sheets_falso
+
+    _base_sintetica(escala)
+    log_backend = logging.getLogger("presupuesto_backend")
+    nivel_anterior = log_backend.level
+    log_backend.setLevel(logging.ERROR) # Los avisos de "sin conexión" son esperados acá
+    modulos = list(presupuesto_backend.MODULOS_SHEETS)
+    rondas = 5
+    original = presupuesto_backend.get_google_sheet_client
+    cliente = sheets_falso.ClienteSheetsFalso(caido=True)
+    presupuesto_backend.get_google_sheet_client = lambda: cliente
+    presupuesto_backend.olvidar_cliente_sheets()
+    try:
+        inicio = time.perf_counter()
+        en_cola = sum(1 for _ in range(rondas) for modulo in modulos
+                      if not presupuesto_backend.sincronizar_a_google_sheets(modulo)[0])
+        ms_sin_conexion = (time.perf_counter() - inicio) * 1000 / (rondas * len(modulos))
+
+        cliente.caido = False
+        inicio = time.perf_counter()
+        reenviadas, pendientes, errores = presupuesto_backend.procesar_cola_sheets()
+        ms_reenvio = (time.perf_counter() - inicio) * 1000
+
+        cliente.estadisticas = sheets_falso.EstadisticasSheets()
+        for modulo in modulos:
+            presupuesto_backend.sincronizar_a_google_sheets(modulo)
+        requests_con_cache = cliente.estadisticas.requests
+    finally:
+        presupuesto_backend.get_google_sheet_client = original
+        presupuesto_backend.olvidar_cliente_sheets()
+        log_backend.setLevel(nivel_anterior)
+
+    return {
+        "sync_sin_conexion_por_modulo_ms": round(ms_sin_conexion, 3),
+        "sincronizaciones_en_cola": en_cola,
+        "reenvio_al_reconectar_ms": round(ms_reenvio, 3),
+        "entradas_reenviadas": reenviadas,
+        "pendientes_tras_reenvio": pendientes + len(errores),
+        "requests_4_modulos_con_cliente_cacheado": requests_con_cache,
+    }
+
+
+def bench_pdf(escala):
+    """Documentos PDF: render individual (plantilla fría y cacheada) y lote con pool de procesos."""
+    import generador_pdf
+
+    _base_sintetica(escala * 20, lineas_por_documento=20)
+    ids = list(range(1, escala + 1))
+
+    inicio = time.perf_counter()
+    generador_pdf.renderizar_documento(generador_pdf.obtener_documento('presupuesto', 1))
+    ms_frio = (time.perf_counter() - inicio) * 1000
+    documento = generador_pdf.obtener_documento('presupuesto', 2)
+    ms_caliente = _medir(lambda: generador_pdf.renderizar_documento(documento), 20)
+
+    carpeta = tempfile.mkdtemp(prefix="bench_pdf_")
+    inicio = time.perf_counter()
+    errores = sum(1 for _, exito, _ in generador_pdf.exportar_lote('presupuesto', ids, carpeta) if not exito)
+    segundos = time.perf_counter() - inicio
+    shutil.rmtree(carpeta, ignore_errors=True)
+    return {
+        "render_primera_vez_ms": round(ms_frio, 3),
+        "render_con_cache_ms": ms_caliente,
+        "lote_por_documento_ms": round(segundos * 1000 / len(ids), 3),
+        "documentos_por_segundo": round(len(ids) / segundos),
+        "errores": errores,
+    }
+
+
+def bench_tipo_cambio(escala):
+    """Conversión USD -> ARS de un año de notas de pedido: as-of join en SQL y en pandas vs. búsqueda por fila."""
+    import pandas as pd
+    import tipo_cambio
+
+    _base_temporal()
+    rnd = random.Random(42)
+    conn = presupuesto_backend.conectar()
+    conn.execute("INSERT INTO clientes (nombre, cuit, razon_social) VALUES ('Cliente', '20-0-1', 'Cliente')")
+    inicio_anio = datetime.date(2024, 1, 1)
+    dias = [inicio_anio + datetime.timedelta(days=i) for i in range(366)]
+    valor = 800.0
+    cotizaciones = []
+    for dia in dias:
+        if dia.weekday() < 5: # Solo días hábiles: los fines de semana usan la cotización del viernes
+            valor *= 1 + rnd.uniform(-0.002, 0.006)
+            cotizaciones.append(('ARS', dia.isoformat(), round(valor, 2)))
+    conn.executemany("INSERT INTO tipo_cambio (moneda, fecha, valor) VALUES (?, ?, ?)", cotizaciones)
+    conn.executemany("INSERT INTO notas_pedido (cliente_id, fecha_creacion, total, total_con_iva) VALUES (1, ?, ?, ?)",
+                     [(rnd.choice(dias).isoformat(), t, round(t * 1.21, 4))
+                      for t in (round(rnd.uniform(10, 5000), 2) for _ in range(escala))])
+    conn.commit()
+    cabeceras = pd.read_sql_query("SELECT id, fecha_creacion, total, total_con_iva FROM notas_pedido", conn)
+    conn.close()
+
+    def por_fila():
+        tipo_cambio.limpiar_cache()
+        return [total * tipo_cambio.obtener_tipo_cambio(fecha) for fecha, total in zip(cabeceras['fecha_creacion'], cabeceras['total'])]
+
+    return {
+        "asof_sql_ms": _medir(lambda: tipo_cambio.totales_convertidos('notas_pedido'), 3),
+        "asof_pandas_ms": _medir(lambda: tipo_cambio.convertir_dataframe(cabeceras, 'fecha_creacion', ['total', 'total_con_iva']), 3),
+        "por_fila_con_cache_ms": _medir(por_fila, 3),
+    }
+
+
+def bench_analisis(escala):
+    """Reportes de ventas y márgenes sobre 5 años de pedidos: primera ejecución, desde caché y tras una escritura."""
+    import analisis_ventas
+
+    _base_sintetica(escala, anios=5)
+    resultados = {}
+    for nombre, funcion in analisis_ventas.ANALISIS.items():
+        inicio = time.perf_counter()
+        funcion()
+        resultados[f"{nombre}_primera_vez_ms"] = round((time.perf_counter() - inicio) * 1000, 3)
+        resultados[f"{nombre}_desde_cache_ms"] = _medir(funcion, 20)
+
+    conn = presupuesto_backend.conectar()
+    conn.execute("UPDATE notas_pedido SET estado = 'cancelada' WHERE id = 1")
+    conn.commit()
+    conn.close()
+    inicio = time.perf_counter()
+    analisis_ventas.tendencia_mensual()
+    resultados["tendencia_tras_escritura_ms"] = round((time.perf_counter() - inicio) * 1000, 3)
+
+    carpeta = tempfile.mkdtemp(prefix="bench_analisis_")
+    for extension in ("csv", "parquet"):
+        resultados[f"exportar_margen_{extension}_ms"] = _medir(
+            lambda: analisis_ventas.exportar(analisis_ventas.margen_por_producto(), os.path.join(carpeta, f"margen.{extension}")), 3)
+    shutil.rmtree(carpeta, ignore_errors=True)
+    return resultados
+
+
+def bench_exportacion(escala):
+    """
+    Snapshots a Parquet y CSV: tiempo de exportación completa e incremental, memoria máxima al exportar
+    la tabla más grande (detalle_pedido) y lectura posterior del snapshot.
+    """
+    import tracemalloc
+    import pyarrow
+    import analisis_ventas
+    import exportacion
+
+    _base_sintetica(escala)
+    carpeta = tempfile.mkdtemp(prefix="bench_exportacion_")
+    resultados = {}
+    try:
+        for formato, compresion in (("parquet", "zstd"), ("parquet", "snappy"), ("csv", "gzip")):
+            destino = os.path.join(carpeta, f"{formato}_{compresion}")
+            inicio = time.perf_counter()
+            partes = exportacion.exportar_snapshot(carpeta=destino, formato=formato, compresion=compresion)
+            segundos = time.perf_counter() - inicio
+            filas = sum(parte['filas'] for parte in partes.values() if parte)
+            resultados[f"exportar_{formato}_{compresion}_ms"] = round(segundos * 1000, 3)
+            resultados[f"filas_por_segundo_{formato}_{compresion}"] = round(filas / segundos)
+            resultados[f"mb_{formato}_{compresion}"] = round(sum(parte['bytes'] for parte in partes.values() if parte) / 2**20, 2)
+
+        # Memoria: tracemalloc cuenta la de Python y el pool de Arrow la de los buffers de Parquet
+        destino = os.path.join(carpeta, "memoria")
+        pool = pyarrow.default_memory_pool()
+        tracemalloc.start()
+        exportacion.exportar_snapshot(['detalle_pedido'], carpeta=destino)
+        _, pico_python = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        resultados["filas_detalle_pedido"] = escala
+        resultados["pico_memoria_python_mb"] = round(pico_python / 2**20, 2)
+        resultados["pico_memoria_arrow_mb"] = round(pool.max_memory() / 2**20, 2)
+
+        # Incremental: 1% de notas de pedido nuevas con sus líneas
+        destino = os.path.join(carpeta, "parquet_zstd")
+        conn = presupuesto_backend.conectar()
+        conn.execute("""INSERT INTO detalle_pedido (nota_pedido_id, producto_id, cantidad, precio_unitario)
+                        SELECT nota_pedido_id, producto_id, cantidad, precio_unitario FROM detalle_pedido
+                        WHERE id <= ?""", (max(1, escala // 100),))
+        conn.commit()
+        conn.close()
+        inicio = time.perf_counter()
+        partes = exportacion.exportar_snapshot(carpeta=destino, incremental=True)
+        resultados["exportar_incremental_1pct_ms"] = round((time.perf_counter() - inicio) * 1000, 3)
+        resultados["filas_incremental"] = sum(parte['filas'] for parte in partes.values() if parte)
+
+        inicio = time.perf_counter()
+        detalle = exportacion.leer_snapshot('detalle_pedido', destino)
+        resultados["leer_detalle_pedido_parquet_ms"] = round((time.perf_counter() - inicio) * 1000, 3)
+        if len(detalle) != escala + max(1, escala // 100):
+            raise RuntimeError(f"El snapshot tiene {len(detalle)} líneas de detalle_pedido.")
+
+        inicio = time.perf_counter()
+        analisis_ventas.usar_snapshot(destino)
+        resultados["cargar_snapshot_en_memoria_ms"] = round((time.perf_counter() - inicio) * 1000, 3)
+        inicio = time.perf_counter()
+        analisis_ventas.tendencia_mensual()
+        resultados["tendencia_desde_snapshot_ms"] = round((time.perf_counter() - inicio) * 1000, 3)
+    finally:
+        analisis_ventas.usar_snapshot(None)
+        shutil.rmtree(carpeta, ignore_errors=True)
+    return resultados
+
+
+def bench_mantenimiento(escala):
+    """
+    Mantenimiento con la app escribiendo: un hilo hace una escritura chica cada ~2 ms mientras corre el
+    backup por pasos y el de un solo paso, y se mide la espera máxima de esas escrituras. Además, tiempo
+    y pausa de quick_check, integrity_check, vacuum incremental, optimizar y una restauración a un momento dado.
+    """
+    import logging
+    import threading
+    import mantenimiento
+
+    _base_sintetica(escala)
+    logging.getLogger("mantenimiento").setLevel(logging.WARNING)
+    resultados = {}
+    mantenimiento.preparar_base()
+
+    def con_escrituras(operacion):
+        """Corre 'operacion' con un hilo escribiendo en paralelo. Devuelve (resumen, espera máxima ms, escrituras)."""
+        esperas, fin = [], threading.Event()
+
+        def escribir():
+            conn = sqlite3.connect(presupuesto_backend.DB_PATH, timeout=30)
+            i = 0
+            while not fin.is_set():
+                inicio = time.perf_counter()
+                conn.execute("UPDATE productos SET stock_disponible = stock_disponible + 1 WHERE id = ?", (i % 100 + 1,))
+                conn.commit()
+                esperas.append((time.perf_counter() - inicio) * 1000)
+                i += 1
+                time.sleep(0.002)
+            conn.close()
+
+        hilo = threading.Thread(target=escribir)
+        hilo.start()
+        try:
+            resumen = operacion()
+        finally:
+            fin.set()
+            hilo.join()
+        return resumen, max(esperas, default=0.0), len(esperas)
+
+    for nombre, operacion in (("por_pasos", mantenimiento.backup),
+                              ("un_paso", lambda: mantenimiento.backup(paginas_por_paso=-1))):
+        resumen, espera, escrituras = con_escrituras(operacion)
+        resultados[f"backup_{nombre}_ms"] = round(resumen['segundos'] * 1000, 3)
+        resultados[f"backup_{nombre}_pausa_max_ms"] = resumen['pausa_max_ms']
+        resultados[f"backup_{nombre}_espera_max_escritura_ms"] = round(espera, 3)
+        resultados[f"backup_{nombre}_escrituras_concurrentes"] = escrituras
+    resultados["backup_mb"] = round(resumen['detalle']['bytes'] / 2**20, 2)
+
+    for nombre, operacion in (("quick_check", mantenimiento.verificar_integridad),
+                              ("integrity_check", lambda: mantenimiento.verificar_integridad(completa=True)),
+                              ("optimizar", mantenimiento.optimizar)):
+        resumen, espera, _ = con_escrituras(operacion)
+        resultados[f"{nombre}_ms"] = round(resumen['segundos'] * 1000, 3)
+        resultados[f"{nombre}_espera_max_escritura_ms"] = round(espera, 3)
+
+    # Cambios registrados después del backup: se borra el 10% del detalle y se restaura a antes de borrarlo
+    conn = sqlite3.connect(presupuesto_backend.DB_PATH)
+    conn.execute("UPDATE productos SET precio_1 = precio_1 * 1.05 WHERE id % 10 = 0")
+    conn.commit()
+    time.sleep(0.01)
+    antes_de_borrar = datetime.datetime.now()
+    time.sleep(0.01)
+    conn.execute("DELETE FROM detalle_pedido WHERE id % 10 = 0")
+    conn.commit()
+    lineas_esperadas = escala
+    conn.close()
+
+    resumen, espera, _ = con_escrituras(mantenimiento.vacuum_incremental)
+    resultados["vacuum_incremental_ms"] = round(resumen['segundos'] * 1000, 3)
+    resultados["vacuum_incremental_pausa_max_ms"] = resumen['pausa_max_ms']
+    resultados["vacuum_mb_liberados"] = round(resumen['detalle'].get('bytes_liberados', 0) / 2**20, 2)
+
+    destino = presupuesto_backend.DB_PATH + ".restaurada"
+    resumen = mantenimiento.restaurar(antes_de_borrar, destino)
+    resultados["restaurar_ms"] = round(resumen['segundos'] * 1000, 3)
+    resultados["restaurar_cambios_aplicados"] = resumen['detalle']['cambios_aplicados']
+    conn = sqlite3.connect(destino)
+    lineas = conn.execute("SELECT COUNT(*) FROM detalle_pedido").fetchone()[0]
+    conn.close()
+    if lineas != lineas_esperadas:
+        raise RuntimeError(f"La base restaurada tiene {lineas} líneas de detalle_pedido; se esperaban {lineas_esperadas}.")
+    return resultados
+
+
+BENCHMARKS = {
+    "listados": (bench_listados, 1_000_000),
+    "detalle": (bench_detalle, 1_000_000),
+    "sentencias": (bench_sentencias, 100_000),
+    "conversion": (bench_conversion, 50),
+    "estados": (bench_estados, 100_000),
+    "importacion": (bench_importacion, 10_000),
+    "sync": (bench_sync, 100_000),
+    "cola_sheets": (bench_cola_sheets, 100_000),
+    "sheets_bidireccional": (bench_sheets_bidireccional, 1_000_000),
+    "ocr": (bench_ocr, 10_000),
+    "duplicados": (bench_duplicados, 100_000),
+    "conciliacion": (bench_conciliacion, 100_000),
+    "cuenta_corriente": (bench_cuenta_corriente, 10_000),
+    "movimientos_stock": (bench_movimientos_stock, 10_000_000),
+    "conteo_stock": (bench_conteo_stock, 50_000),
+    "reposicion": (bench_reposicion, 1_000_000),
+    "expedicion": (bench_expedicion, 400_000),
+    "revisiones": (bench_revisiones, 100),
+    "revalidacion": (bench_revalidacion, 100_000),
+    "reglas_precio": (bench_reglas_precio, 100_000),
+    "instrumentacion": (bench_instrumentacion, 100_000),
+    "registro": (bench_registro, 100_000),
+    "pdf": (bench_pdf, 500),
+    "tipo_cambio": (bench_tipo_cambio, 200_000),
+    "exportacion": (bench_exportacion, 10_000_000),
+    "mantenimiento": (bench_mantenimiento, 1_000_000),
+    "analisis": (bench_analisis, 1_000_000),
+}
+
+
+# --- Resultados guardados y detección de regresiones ---
+
+def cargar_resultados(ruta=RESULTADOS_PATH):
+    """Resultados de referencia guardados: {benchmark: {'escala', 'fecha', 'metricas'}}."""
+    if not os.path.exists(ruta):
+        return {}
+    with open(ruta, encoding="utf-8") as archivo:
+        return json.load(archivo)
+
+
+def guardar_resultados(resultados, ruta=RESULTADOS_PATH):
+    with open(ruta, "w", encoding="utf-8") as archivo:
+        json.dump(resultados, archivo, indent=2, ensure_ascii=False, sort_keys=True)
+
+
+def comparar(metricas, referencia, umbral=UMBRAL_REGRESION):
+    """
+    Compara los tiempos ('_ms') de una corrida con la referencia.
+    Devuelve [(métrica, ms_referencia, ms_actual, variación)] de los que empeoraron más del umbral.
+    """
+    regresiones = []
+    for nombre, actual in metricas.items():
+        anterior = referencia.get(nombre)
+        if nombre.endswith("_ms") and anterior and actual > anterior * (1 + umbral):
+            regresiones.append((nombre, anterior, actual, actual / anterior - 1))
+    return regresiones
+
+
+def ejecutar(nombres, escala=None, guardar=False, ruta=RESULTADOS_PATH):
+    """Ejecuta los benchmarks indicados, muestra sus métricas contra la referencia y devuelve la cantidad de regresiones."""
+    guardados = cargar_resultados(ruta)
+    total_regresiones = 0
+    for nombre in nombres:
+        funcion, escala_por_defecto = BENCHMARKS[nombre]
+        escala_usada = escala or escala_por_defecto
+        print(f"▶ {nombre} (escala {escala_usada:,})")
+        metricas = funcion(escala_usada)
+
+        referencia = guardados.get(nombre, {})
+        comparable = referencia.get("escala") == escala_usada
+        valores_referencia = referencia.get("metricas", {}) if comparable else {}
+        for metrica, valor in metricas.items():
+            anterior = valores_referencia.get(metrica)
+            variacion = f"{(valor / anterior - 1) * 100:+7.1f}%" if anterior else ""
+            print(f"  {metrica:<45} {valor:>14,.3f} {variacion}")
+
+        regresiones = comparar(metricas, valores_referencia)
+        for metrica, anterior, actual, variacion in regresiones:
+            print(f"  ❌ Regresión en {metrica}: {anterior:.3f} ms -> {actual:.3f} ms ({variacion * 100:+.0f}%)")
+        if referencia and not comparable:
+            print(f"  ⚠️ La referencia guardada es de escala {referencia.get('escala'):,}; no se compara.")
+        total_regresiones += len(regresiones)
+
+        if guardar:
+            guardados[nombre] = {"escala": escala_usada, "fecha": datetime.datetime.now().isoformat(timespec="seconds"),
+                                 "metricas": metricas}
+    if guardar:
+        guardar_resultados(guardados, ruta)
+        print(f"✅ Resultados guardados en '{ruta}'.")
+    return total_regresiones
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks del backend de presupuestos.")
+    parser.add_argument("nombre", choices=sorted(BENCHMARKS) + ["todos"], help="Benchmark a ejecutar.")
+    parser.add_argument("--escala", type=int, help="Cantidad de filas a generar (por defecto depende del benchmark).")
+    parser.add_argument("--guardar", action="store_true", help=f"Guardar los resultados como nueva referencia en {RESULTADOS_PATH}.")
+    parser.add_argument("--resultados", default=RESULTADOS_PATH, help="Archivo de resultados de referencia.")
+    args = parser.parse_args()
+
+    nombres = sorted(BENCHMARKS) if args.nombre == "todos" else [args.nombre]
+    regresiones = ejecutar(nombres, args.escala, args.guardar, args.resultados)
+    raise SystemExit(1 if regresiones else 0)
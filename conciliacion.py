@@ -0,0 +1,251 @@
+import argparse
+import bisect
+import collections
+import datetime
+import itertools
+import logging
+
+import consultas
+import duplicados
+import presupuesto_backend
+
+log = logging.getLogger(__name__)
+
+# --- Conciliación de pagos ---
+# Aplica los comprobantes (pagos) a las notas de pedido abiertas del mismo cliente y deja el resultado en
+# pagos_aplicados. Un pago puede aplicarse a una nota a partir de DIAS_ANTES días antes de su fecha y
+# hasta DIAS_DESPUES días después. Por cliente, en cuatro pasadas sobre listas ordenadas (sin bucles anidados):
+#  1. Pagos exactos: las notas se ordenan por saldo y cada pago busca con bisect las de saldo dentro de
+#     ±TOLERANCIA_IMPORTE; entre ellas, la de fecha más cercana dentro de la ventana.
+#  2. Pagos combinados: un pago que cubre dos notas de su ventana de fechas ('combinado').
+#  3. Pagos parciales: una nota cubierta por dos pagos de su ventana de fechas ('parcial').
+#     En 2 y 3 la ventana avanza con dos punteros sobre las listas ordenadas por fecha y el par se busca
+#     con dos punteros sobre los importes ordenados.
+#  4. Lo que queda, en orden de fecha con dos punteros (uno por notas, otro por pagos): cada pago cancela
+#     las notas más antiguas que alcanza, repartiéndose entre varias si sobra.
+# Un saldo o un resto de pago de hasta TOLERANCIA_IMPORTE se da por cancelado (redondeos, comisiones).
+# Los importes de los comprobantes se comparan con el total con IVA de las notas; con moneda='ARS' (u otra
+# moneda cargada en tipo_cambio) los totales se convierten con la cotización vigente a la fecha de la nota.
+
+TOLERANCIA_IMPORTE = 1.0
+DIAS_ANTES = 7 # Señas: pagos hasta una semana antes de la nota
+DIAS_DESPUES = 60
+
+
+def _saldos_notas(conn, moneda, tolerancia):
+    """Notas abiertas: [(nota_id, cliente_id, día, saldo)] con saldo mayor a la tolerancia."""
+    convertidos = None
+    if moneda:
+        import tipo_cambio
+        convertidos = {fila[0]: fila[6] for fila in tipo_cambio.totales_convertidos('notas_pedido', moneda)}
+    notas = []
+    for nota_id, cliente_id, fecha, total_con_iva, aplicado in consultas.todos(conn, "notas_a_conciliar"):
+        total = total_con_iva if convertidos is None else convertidos.get(nota_id)
+        if total is None: # Nota anterior a la primera cotización cargada
+            continue
+        saldo = total - aplicado
+        if saldo > tolerancia:
+            notas.append((nota_id, cliente_id, duplicados.dia(fecha), saldo))
+    return notas
+
+
+def _disponibles_pagos(conn, tolerancia):
+    """Comprobantes con importe sin aplicar: [(comprobante_id, cliente_id, día, disponible)]."""
+    pagos = []
+    for comprobante_id, cliente_id, fecha, importe, aplicado in consultas.todos(conn, "comprobantes_a_conciliar"):
+        dia_pago = duplicados.dia(fecha)
+        if dia_pago is not None and importe - aplicado > tolerancia:
+            pagos.append((comprobante_id, cliente_id, dia_pago, importe - aplicado))
+    return pagos
+
+
+def _dos_que_suman(candidatos, objetivo, tolerancia, importe):
+    """Dos candidatos cuyos importes suman 'objetivo' ± tolerancia (dos punteros sobre la lista ordenada), o None."""
+    candidatos = sorted(candidatos, key=importe)
+    izquierda, derecha = 0, len(candidatos) - 1
+    while izquierda < derecha:
+        suma = importe(candidatos[izquierda]) + importe(candidatos[derecha])
+        if suma < objetivo - tolerancia:
+            izquierda += 1
+        elif suma > objetivo + tolerancia:
+            derecha -= 1
+        else:
+            return candidatos[izquierda], candidatos[derecha]
+    return None
+
+
+def _en_ventanas(fijos, moviles, desde, hasta):
+    """
+    Recorre 'fijos' (ordenados por día) junto con la ventana de 'moviles' (ordenados por día) cuyo día está
+    entre desde(fijo) y hasta(fijo), que avanza con dos punteros. Devuelve (fijo, móviles de su ventana).
+    """
+    inicio = fin = 0
+    for fijo in fijos:
+        while inicio < len(moviles) and moviles[inicio][2] < desde(fijo):
+            inicio += 1
+        fin = max(fin, inicio)
+        while fin < len(moviles) and moviles[fin][2] <= hasta(fijo):
+            fin += 1
+        if fin - inicio >= 2:
+            yield fijo, moviles[inicio:fin]
+
+
+def _emparejar_cliente(pagos, notas, tolerancia, dias_antes, dias_despues):
+    """Aplicaciones [(comprobante_id, nota_id, importe, tipo)] de los pagos de un cliente a sus notas (tipo None: se decide al final)."""
+    saldo = {nota[0]: nota[3] for nota in notas}
+    disponible = {pago[0]: pago[3] for pago in pagos}
+    aplicaciones = []
+
+    def aplicar(pago_id, nota_id, tipo, importe=None):
+        importe = min(saldo[nota_id], disponible[pago_id]) if importe is None else importe
+        aplicaciones.append((pago_id, nota_id, importe, tipo))
+        saldo[nota_id] -= importe
+        disponible[pago_id] -= importe
+        if saldo[nota_id] <= tolerancia: # Un resto menor a la tolerancia se da por cancelado
+            saldo[nota_id] = 0.0
+        if disponible[pago_id] <= tolerancia:
+            disponible[pago_id] = 0.0
+
+    # 1. Exactos: bisect sobre las notas ordenadas por saldo
+    por_saldo = sorted(notas, key=lambda nota: nota[3])
+    saldos = [nota[3] for nota in por_saldo]
+    for pago_id, _, dia_pago, importe in sorted(pagos, key=lambda pago: pago[3]):
+        mejor = None
+        for posicion in range(bisect.bisect_left(saldos, importe - tolerancia), bisect.bisect_right(saldos, importe + tolerancia)):
+            nota = por_saldo[posicion]
+            if saldo[nota[0]] and nota[2] - dias_antes <= dia_pago <= nota[2] + dias_despues:
+                if mejor is None or abs(dia_pago - nota[2]) < abs(dia_pago - mejor[2]):
+                    mejor = nota
+        if mejor is not None:
+            aplicar(pago_id, mejor[0], 'exacto', min(importe, saldo[mejor[0]]))
+            saldo[mejor[0]] = disponible[pago_id] = 0.0
+
+    # Después de los exactos quedan pocas notas y pagos abiertos: las pasadas siguientes recorren solo esos
+    notas_abiertas = sorted((nota for nota in notas if saldo[nota[0]]), key=lambda nota: (nota[2], nota[0]))
+    pagos_abiertos = sorted((pago for pago in pagos if disponible[pago[0]]), key=lambda pago: (pago[2], pago[0]))
+
+    # 2. Un pago que cubre dos notas: entre las notas de su ventana, dos cuyo saldo sume el pago
+    for pago, ventana in _en_ventanas(pagos_abiertos, notas_abiertas, lambda pago: pago[2] - dias_despues,
+                                      lambda pago: pago[2] + dias_antes):
+        candidatas = [nota for nota in ventana if saldo[nota[0]]]
+        if disponible[pago[0]] and len(candidatas) >= 2:
+            par = _dos_que_suman(candidatas, disponible[pago[0]], tolerancia, lambda nota: saldo[nota[0]])
+            if par:
+                for nota in par:
+                    aplicar(pago[0], nota[0], 'combinado')
+
+    # 3. Una nota pagada en dos partes: entre los pagos de su ventana, dos que sumen el saldo
+    for nota, ventana in _en_ventanas(notas_abiertas, pagos_abiertos, lambda nota: nota[2] - dias_antes,
+                                      lambda nota: nota[2] + dias_despues):
+        candidatos = [pago for pago in ventana if disponible[pago[0]]]
+        if saldo[nota[0]] and len(candidatos) >= 2:
+            par = _dos_que_suman(candidatos, saldo[nota[0]], tolerancia, lambda pago: disponible[pago[0]])
+            if par:
+                for pago in par:
+                    aplicar(pago[0], nota[0], 'parcial')
+
+    # 4. El resto, por fecha con dos punteros: cada pago cancela las notas más antiguas que alcanza
+    notas_abiertas = [nota for nota in notas_abiertas if saldo[nota[0]]]
+    pagos_abiertos = [pago for pago in pagos_abiertos if disponible[pago[0]]]
+    i = j = 0
+    while i < len(notas_abiertas) and j < len(pagos_abiertos):
+        nota_id, _, dia_nota, _ = notas_abiertas[i]
+        pago_id, _, dia_pago, _ = pagos_abiertos[j]
+        if dia_pago < dia_nota - dias_antes: # Anterior a esta nota y a todas las que siguen
+            j += 1
+            continue
+        if dia_pago > dia_nota + dias_despues: # Esta nota ya no puede recibir este pago ni los siguientes
+            i += 1
+            continue
+        aplicar(pago_id, nota_id, None)
+        if not saldo[nota_id]:
+            i += 1
+        if not disponible[pago_id]:
+            j += 1
+    return aplicaciones
+
+
+def emparejar(pagos, notas, tolerancia=TOLERANCIA_IMPORTE, dias_antes=DIAS_ANTES, dias_despues=DIAS_DESPUES):
+    """
+    Empareja pagos [(comprobante_id, cliente_id, día, importe disponible)] con notas
+    [(nota_id, cliente_id, día, saldo)], donde 'día' es un ordinal (date.toordinal()).
+    Devuelve [(comprobante_id, nota_id, importe, tipo)] con tipo 'exacto', 'combinado' o 'parcial'.
+    """
+    por_cliente = lambda fila: fila[1]
+    pagos_por_cliente = {cliente: list(grupo) for cliente, grupo in itertools.groupby(sorted(pagos, key=por_cliente), por_cliente)}
+    aplicaciones = []
+    for cliente, notas_cliente in itertools.groupby(sorted(notas, key=por_cliente), por_cliente):
+        if cliente in pagos_por_cliente:
+            aplicaciones.extend(_emparejar_cliente(pagos_por_cliente[cliente], list(notas_cliente), tolerancia, dias_antes, dias_despues))
+
+    # En la pasada por fecha, un pago repartido entre varias notas es 'combinado' y uno aplicado a una sola, 'parcial'
+    notas_por_pago = collections.Counter(pago_id for pago_id, _, _, tipo in aplicaciones if tipo is None)
+    return [(pago_id, nota_id, round(importe, 2),
+             tipo or ('combinado' if notas_por_pago[pago_id] > 1 else 'parcial'))
+            for pago_id, nota_id, importe, tipo in aplicaciones]
+
+
+def conciliar_pagos(tolerancia=TOLERANCIA_IMPORTE, dias_antes=DIAS_ANTES, dias_despues=DIAS_DESPUES, moneda=None,
+                    simular=False, rehacer=False):
+    """
+    Aplica los pagos sin aplicar a las notas de pedido abiertas y guarda el resultado en pagos_aplicados,
+    en una sola transacción. Con simular=True solo calcula; con rehacer=True descarta antes todas las
+    aplicaciones anteriores y concilia desde cero.
+    Devuelve (éxito, mensaje, resumen) con la cantidad de aplicaciones por tipo, el importe aplicado y
+    las aplicaciones calculadas.
+    """
+    conn = presupuesto_backend.conexion()
+    try:
+        with conn:
+            conn.execute("BEGIN IMMEDIATE") # Los saldos que se leen no pueden cambiar hasta el commit
+            if rehacer:
+                consultas.ejecutar(conn, "borrar_pagos_aplicados")
+            notas = _saldos_notas(conn, moneda, tolerancia)
+            pagos = _disponibles_pagos(conn, tolerancia)
+            aplicaciones = emparejar(pagos, notas, tolerancia, dias_antes, dias_despues)
+            if simular:
+                conn.rollback() # También deshace el borrado de rehacer
+            else:
+                hoy = datetime.date.today().isoformat()
+                consultas.muchos(conn, "insertar_pago_aplicado",
+                                 [(pago_id, nota_id, importe, tipo, hoy) for pago_id, nota_id, importe, tipo in aplicaciones])
+    except Exception as e:
+        log.error("Error al conciliar pagos: %s", e)
+        return False, f"Error al conciliar pagos: {e}", {}
+
+    por_tipo = collections.Counter(tipo for _, _, _, tipo in aplicaciones)
+    resumen = {
+        'notas_abiertas': len(notas),
+        'pagos_sin_aplicar': len(pagos),
+        'exactos': por_tipo['exacto'],
+        'parciales': por_tipo['parcial'],
+        'combinados': por_tipo['combinado'],
+        'importe_aplicado': round(sum(importe for _, _, importe, _ in aplicaciones), 2),
+        'aplicaciones': aplicaciones,
+    }
+    mensaje = (f"{len(aplicaciones)} pagos aplicados{' (simulación)' if simular else ''}: "
+               f"{resumen['exactos']} exactos, {resumen['parciales']} parciales y {resumen['combinados']} combinados, "
+               f"por {resumen['importe_aplicado']:.2f}.")
+    log.info(mensaje)
+    return True, mensaje, resumen
+
+
+def obtener_pagos_aplicados():
+    """Pagos aplicados, del más reciente al más antiguo. Cada fila: (id, nro_operacion, fecha del pago, nota_pedido_id, cliente, importe, tipo, fecha_aplicacion)."""
+    return consultas.todos(presupuesto_backend.conexion(), "pagos_aplicados")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concilia los comprobantes de pago con las notas de pedido abiertas.")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA_IMPORTE, help="Diferencia de importe aceptada.")
+    parser.add_argument("--dias-antes", type=int, default=DIAS_ANTES, help="Días antes de la nota en que se acepta un pago.")
+    parser.add_argument("--dias-despues", type=int, default=DIAS_DESPUES, help="Días después de la nota en que se acepta un pago.")
+    parser.add_argument("--moneda", help="Moneda de los comprobantes (ej: ARS) para convertir los totales en USD de las notas.")
+    parser.add_argument("--simular", action="store_true", help="Calcular sin guardar.")
+    parser.add_argument("--rehacer", action="store_true", help="Descartar las aplicaciones anteriores y conciliar desde cero.")
+    args = parser.parse_args()
+
+    presupuesto_backend.inicializar_base_de_datos()
+    exito, mensaje, _ = conciliar_pagos(args.tolerancia, args.dias_antes, args.dias_despues, args.moneda, args.simular, args.rehacer)
+    print(("✅ " if exito else "❌ ") + mensaje)
+    raise SystemExit(0 if exito else 1)
@@ -0,0 +1,964 @@
+import logging
+import threading
+
+import instrumentacion
+
+log = logging.getLogger(__name__)
+
+# --- Repositorio de sentencias SQL del backend ---
+# Cada sentencia tiene un nombre y se escribe una sola vez, siempre parametrizada (nunca armada
+# concatenando texto), así el texto es idéntico en cada llamada y sqlite3 la encuentra ya preparada
+# en el caché de sentencias de la conexión en lugar de volver a parsearla.
+# Las sentencias corren sobre una conexión de larga vida por hilo (conexion()): abrir una conexión
+# por llamada también tira el caché, que es por conexión.
+#
+#   conn = consultas.conexion(presupuesto_backend.DB_PATH)
+#   consultas.todos(conn, "detalle_nota_pedido", (nota_id,))
+#   with conn:  # las escrituras van en un bloque with: commit al salir o rollback si hay un error
+#       consultas.muchos(conn, "insertar_detalle_pedido", lineas)
+
+TAMANO_CACHE_SENTENCIAS = 256 # Mayor que la cantidad de SENTENCIAS, para que ninguna se desaloje del caché LRU
+
+# Antigüedad de la deuda de cada cliente a la fecha ?1, en tramos de 30, 60, 90 y más de 90 días. Los pagos
+# cancelan primero las entregas más antiguas: lo pendiente de cada entrega es lo que su debe acumulado
+# (en orden de fecha) supera a todo lo pagado, hasta su propio importe.
+_SQL_ANTIGUEDAD = """
+    WITH movimientos AS (
+        SELECT cliente_id, fecha, tipo, referencia_id, debe, haber FROM cuenta_corriente WHERE fecha <= ?1 {filtro}
+    ),
+    entregas AS ( -- Cada entrega con su importe neto de anulaciones y ajustes
+        SELECT cliente_id, referencia_id, MIN(fecha) AS fecha, SUM(debe) AS importe
+        FROM movimientos WHERE tipo = 'entrega'
+        GROUP BY cliente_id, referencia_id HAVING SUM(debe) > 0.005
+    ),
+    pagado AS (
+        SELECT cliente_id, SUM(haber) AS total FROM movimientos GROUP BY cliente_id
+    ),
+    pendientes AS (
+        SELECT e.cliente_id, julianday(?1) - julianday(e.fecha) AS dias,
+               MIN(e.importe, MAX(0, SUM(e.importe) OVER (PARTITION BY e.cliente_id ORDER BY e.fecha, e.referencia_id
+                                                          ROWS UNBOUNDED PRECEDING) - COALESCE(p.total, 0))) AS pendiente
+        FROM entregas e LEFT JOIN pagado p USING (cliente_id)
+    )
+    SELECT pe.cliente_id, c.nombre,
+           ROUND(SUM(CASE WHEN dias <= 30 THEN pendiente ELSE 0 END), 2),
+           ROUND(SUM(CASE WHEN dias > 30 AND dias <= 60 THEN pendiente ELSE 0 END), 2),
+           ROUND(SUM(CASE WHEN dias > 60 AND dias <= 90 THEN pendiente ELSE 0 END), 2),
+           ROUND(SUM(CASE WHEN dias > 90 THEN pendiente ELSE 0 END), 2),
+           ROUND(SUM(pendiente), 2)
+    FROM pendientes pe JOIN clientes c ON c.id = pe.cliente_id
+    GROUP BY pe.cliente_id
+    HAVING SUM(pendiente) > 0.005
+    ORDER BY SUM(pendiente) DESC
+"""
+
+# Punto de reposición automático: el consumo del plazo de entrega más los días de seguridad (?1), redondeado
+# hacia arriba (CAST trunca; se suma 1 si quedó parte decimal)
+_CONSUMO_EN_PLAZO = "consumo_diario * (plazo_entrega_dias + ?1)"
+_SQL_PUNTO_REPOSICION = f"(CAST({_CONSUMO_EN_PLAZO} AS INTEGER) + ({_CONSUMO_EN_PLAZO} > CAST({_CONSUMO_EN_PLAZO} AS INTEGER)))"
+
+# Notas abiertas de la cola de expedición, con las unidades a preparar de cada una ({filtro} restringe las notas)
+_SQL_COLA_EXPEDICION = """
+    SELECT np.id, c.nombre, np.fecha_creacion, np.tipo_entrega, np.direccion_envio, np.telefono_contacto,
+           np.estado, np.total_con_iva, np.cantidad_lineas,
+           (SELECT COALESCE(SUM(dp.cantidad), 0) FROM detalle_pedido dp WHERE dp.nota_pedido_id = np.id)
+    FROM notas_pedido np
+    JOIN clientes c ON np.cliente_id = c.id
+    WHERE np.estado IN ('pendiente', 'aprobada') {filtro}
+"""
+
+# As-of join de tipo_cambio.py: la última cotización :moneda vigente a {columna_fecha}, con una búsqueda en la
+# clave primaria (moneda, fecha)
+_SQL_COTIZACION_VIGENTE = """(SELECT tc.valor FROM tipo_cambio tc WHERE tc.moneda = :moneda AND tc.fecha <= {columna_fecha}
+                              ORDER BY tc.fecha DESC LIMIT 1)"""
+
+# Totales de las cabeceras de {tabla} (alias {alias}) entre :desde y :hasta (NULL: sin límite) convertidos a :moneda.
+# La cotización se busca una sola vez por fecha distinta (no por fila) y después se une por igualdad.
+_SQL_TOTALES_CONVERTIDOS = """
+    WITH fechas AS MATERIALIZED (
+        SELECT DISTINCT {alias}.fecha_creacion AS fecha FROM {tabla} {alias}
+        WHERE (:desde IS NULL OR {alias}.fecha_creacion >= :desde) AND (:hasta IS NULL OR {alias}.fecha_creacion <= :hasta)
+    ),
+    cotizaciones AS MATERIALIZED (
+        SELECT fechas.fecha, {cotizacion} AS tc FROM fechas
+    )
+    SELECT {alias}.id, {alias}.fecha_creacion, {alias}.total, {alias}.total_con_iva, cot.tc,
+           ROUND({alias}.total * cot.tc, 2), ROUND({alias}.total_con_iva * cot.tc, 2)
+    FROM {tabla} {alias}
+    JOIN cotizaciones cot ON cot.fecha = {alias}.fecha_creacion
+    ORDER BY {alias}.fecha_creacion, {alias}.id
+"""
+
+# Lista de picking: lo que hay que sacar del depósito para las notas aprobadas, una fila por producto
+_SQL_LISTA_PICKING = """
+    SELECT p.codigo, p.descripcion, SUM(dp.cantidad), COUNT(DISTINCT dp.nota_pedido_id),
+           p.stock_disponible, p.stock_reservado
+    FROM notas_pedido np
+    JOIN detalle_pedido dp ON dp.nota_pedido_id = np.id
+    JOIN productos p ON p.id = dp.producto_id
+    WHERE np.estado = 'aprobada' {filtro}
+    GROUP BY dp.producto_id
+    ORDER BY p.codigo
+"""
+
+# Líneas del presupuesto ?1 a la revisión {revision}: la última versión de cada producto hasta esa revisión
+# (con MAX() en un GROUP BY, SQLite toma las demás columnas de la fila del máximo). Las quitadas vienen con
+# cantidad NULL; {filtro} restringe los productos.
+_SQL_LINEAS_REVISION = """
+    SELECT l.producto_id, l.cantidad, l.precio_unitario, MAX(r.numero) AS numero
+    FROM revisiones_presupuesto r
+    JOIN lineas_revision_presupuesto l ON l.revision_id = r.id
+    WHERE r.presupuesto_id = ?1 AND r.numero <= {revision} {filtro}
+    GROUP BY l.producto_id
+"""
+
+# Momento al que están cotizados los precios del presupuesto p: el de su última revisión, o su fecha de creación
+_SQL_PRECIOS_PRESUPUESTO = """COALESCE((SELECT r.fecha FROM revisiones_presupuesto r WHERE r.presupuesto_id = p.id
+                                        ORDER BY r.numero DESC LIMIT 1), p.fecha_creacion)"""
+
+# Precio de lista del producto pr para {cantidad} unidades: la escala más alta alcanzada que tenga precio
+# cargado (precio_5 desde 5 unidades, precio_10 desde 10, precio_25 desde 25), si no precio_1
+_SQL_PRECIO_ESCALA = """CASE WHEN {cantidad} >= 25 AND pr.precio_25 > 0 THEN pr.precio_25
+                             WHEN {cantidad} >= 10 AND pr.precio_10 > 0 THEN pr.precio_10
+                             WHEN {cantidad} >= 5 AND pr.precio_5 > 0 THEN pr.precio_5
+                             ELSE pr.precio_1 END"""
+
+SENTENCIAS = {
+    # --- Clientes y comprobantes ---
+    "cliente_por_nombre": "SELECT id FROM clientes WHERE nombre = ?",
+    "cliente_existe": "SELECT 1 FROM clientes WHERE id = ?",
+    "insertar_cliente": "INSERT INTO clientes (nombre, cuit, razon_social) VALUES (?, ?, ?)",
+    "comprobante_por_nro_operacion": "SELECT id FROM comprobantes WHERE nro_operacion = ?",
+    "insertar_comprobante": """
+        INSERT INTO comprobantes (nro_operacion, fecha, importe, cuenta, cliente_id, hash_imagen)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """,
+    "comprobantes_para_indice": """
+        SELECT id, nro_operacion, fecha, importe, cuenta, hash_imagen
+        FROM comprobantes WHERE id > ? ORDER BY id
+    """,
+    "comprobantes_por_ids": """
+        SELECT id, nro_operacion, fecha, importe, cuenta
+        FROM comprobantes WHERE id IN (SELECT value FROM json_each(?1))
+        ORDER BY id
+    """,
+    "comprobantes": """
+        SELECT comp.id, c.nombre, comp.nro_operacion, comp.fecha, comp.importe
+        FROM comprobantes comp JOIN clientes c ON comp.cliente_id = c.id
+        ORDER BY comp.fecha DESC
+    """,
+
+    # --- Productos ---
+    "insertar_producto": "INSERT INTO productos (codigo, descripcion) VALUES (?, ?)", # El stock inicial entra como movimiento
+    "productos": """
+        SELECT codigo, descripcion, stock_disponible, stock_reservado, estado_producto, precio_1
+        FROM productos ORDER BY codigo
+    """,
+    "producto_para_pedido": """
+        SELECT id, descripcion, stock_disponible, stock_reservado, estado_producto, precio_1
+        FROM productos WHERE codigo = ?
+    """,
+    "producto_para_presupuesto": "SELECT id, descripcion, precio_1 FROM productos WHERE codigo = ?",
+    "producto_stock": "SELECT id, descripcion, stock_disponible, stock_reservado FROM productos WHERE codigo = ?",
+    "producto_estado": "SELECT id, descripcion, estado_producto FROM productos WHERE codigo = ?",
+    # El stock solo cambia con movimientos (movimientos_stock.py); el trigger de proyección actualiza productos
+    "registrar_movimiento_stock": """
+        INSERT INTO movimientos_stock (producto_id, tipo, disponible, reservado, nota_pedido_id, motivo)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """,
+    "actualizar_estado_producto": "UPDATE productos SET estado_producto = ? WHERE id = ?",
+
+    # --- Notas de pedido ---
+    "insertar_nota_pedido": """
+        INSERT INTO notas_pedido (cliente_id, fecha_creacion, tipo_entrega, direccion_envio, telefono_contacto, estado)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """,
+    "insertar_detalle_pedido": """
+        INSERT INTO detalle_pedido (nota_pedido_id, producto_id, cantidad, precio_unitario)
+        VALUES (?, ?, ?, ?)
+    """,
+    "notas_pedido": """
+        SELECT
+            np.id, c.nombre, np.fecha_creacion, np.tipo_entrega, np.direccion_envio,
+            np.telefono_contacto, np.estado, np.total, np.total_con_iva, np.cantidad_lineas
+        FROM notas_pedido np
+        JOIN clientes c ON np.cliente_id = c.id
+        ORDER BY np.fecha_creacion DESC, np.id DESC
+    """,
+    "notas_pedido_expedicion": """
+        SELECT
+            np.id, c.nombre, np.fecha_creacion, np.tipo_entrega, np.direccion_envio,
+            np.telefono_contacto, np.estado, np.total, np.total_con_iva, np.cantidad_lineas
+        FROM notas_pedido np
+        JOIN clientes c ON np.cliente_id = c.id
+        WHERE np.estado IN ('pendiente', 'aprobada')
+        ORDER BY np.fecha_creacion DESC, np.id DESC
+    """,
+    "nota_pedido": """
+        SELECT
+            np.id, c.nombre, np.fecha_creacion, np.tipo_entrega, np.direccion_envio,
+            np.telefono_contacto, np.estado, np.total, np.total_iva, np.total_con_iva
+        FROM notas_pedido np
+        JOIN clientes c ON np.cliente_id = c.id
+        WHERE np.id = ?
+    """,
+    "detalle_nota_pedido": """
+        SELECT p.codigo, p.descripcion, dp.cantidad, dp.precio_unitario
+        FROM detalle_pedido dp
+        JOIN productos p ON dp.producto_id = p.id
+        WHERE dp.nota_pedido_id = ?
+    """,
+    "estado_nota_pedido": "SELECT estado FROM notas_pedido WHERE id = ?",
+    "lineas_nota_pedido": "SELECT producto_id, cantidad FROM detalle_pedido WHERE nota_pedido_id = ?",
+    "actualizar_estado_nota_pedido": """
+        UPDATE notas_pedido SET estado = ?1,
+            fecha_entrega = CASE WHEN ?1 = 'entregada' THEN date('now', 'localtime') ELSE fecha_entrega END
+        WHERE id = ?2
+    """,
+
+    # Movimientos de stock por cambio de estado de un pedido; parámetros (cantidad, producto_id, nota_pedido_id)
+    "reservar_stock": """
+        INSERT INTO movimientos_stock (producto_id, tipo, disponible, reservado, nota_pedido_id)
+        VALUES (?2, 'reserva', -?1, ?1, ?3)
+    """,
+    "entregar_reservado": """
+        INSERT INTO movimientos_stock (producto_id, tipo, disponible, reservado, nota_pedido_id)
+        VALUES (?2, 'entrega', 0, -?1, ?3)
+    """,
+    "liberar_reserva": """
+        INSERT INTO movimientos_stock (producto_id, tipo, disponible, reservado, nota_pedido_id)
+        VALUES (?2, 'liberacion', ?1, -?1, ?3)
+    """,
+    "descontar_disponible": """
+        INSERT INTO movimientos_stock (producto_id, tipo, disponible, reservado, nota_pedido_id)
+        VALUES (?2, 'entrega', -?1, 0, ?3)
+    """,
+
+    # --- Presupuestos ---
+    "insertar_presupuesto": "INSERT INTO presupuestos (cliente_id, fecha_creacion, estado) VALUES (?, ?, ?)",
+    "insertar_detalle_presupuesto": """
+        INSERT INTO detalle_presupuesto (presupuesto_id, producto_id, cantidad, precio_unitario)
+        VALUES (?, ?, ?, ?)
+    """,
+    "presupuestos": """
+        SELECT p.id, c.nombre, p.fecha_creacion, p.estado, p.total, p.total_con_iva, p.cantidad_lineas
+        FROM presupuestos p
+        JOIN clientes c ON p.cliente_id = c.id
+        ORDER BY p.fecha_creacion DESC, p.id DESC
+    """,
+    "presupuesto": """
+        SELECT p.id, c.nombre, p.fecha_creacion, p.estado, p.total, p.total_iva, p.total_con_iva
+        FROM presupuestos p
+        JOIN clientes c ON p.cliente_id = c.id
+        WHERE p.id = ?
+    """,
+    "detalle_presupuesto": """
+        SELECT prod.codigo, prod.descripcion, dp.cantidad, dp.precio_unitario
+        FROM detalle_presupuesto dp
+        JOIN productos prod ON dp.producto_id = prod.id
+        WHERE dp.presupuesto_id = ?
+    """,
+    "estado_presupuesto": "SELECT estado, cantidad_lineas FROM presupuestos WHERE id = ?",
+    "actualizar_estado_presupuesto": "UPDATE presupuestos SET estado = ? WHERE id = ?",
+
+    # Revisiones de presupuestos (revisiones_presupuesto.py); ?1 es siempre el presupuesto
+    "revisiones_de_presupuesto": """
+        SELECT r.numero, r.fecha, r.motivo, COUNT(l.producto_id)
+        FROM revisiones_presupuesto r
+        LEFT JOIN lineas_revision_presupuesto l ON l.revision_id = r.id
+        WHERE r.presupuesto_id = ?1
+        GROUP BY r.id ORDER BY r.numero
+    """,
+    "ultima_revision_presupuesto": "SELECT COALESCE(MAX(numero), 0) FROM revisiones_presupuesto WHERE presupuesto_id = ?1",
+    "insertar_revision_presupuesto": "INSERT INTO revisiones_presupuesto (presupuesto_id, numero, motivo) VALUES (?1, ?2, ?3)",
+    # ?1 (la excepción): arreglo JSON de [producto_id, cantidad, precio_unitario]
+    "productos_inexistentes": """
+        SELECT COUNT(*) FROM json_each(?1) j
+        WHERE NOT EXISTS (SELECT 1 FROM productos p WHERE p.id = json_extract(j.value, '$[0]'))
+    """,
+    # Revisión 1 (?2) desde detalle_presupuesto; un producto repetido queda en una sola línea con el mismo importe
+    "revision_base_presupuesto": """
+        INSERT INTO lineas_revision_presupuesto (revision_id, producto_id, cantidad, precio_unitario)
+        SELECT ?2, producto_id, SUM(cantidad),
+               CASE WHEN COUNT(*) = 1 THEN MAX(precio_unitario) ELSE ROUND(SUM(cantidad * precio_unitario) / SUM(cantidad), 4) END
+        FROM detalle_presupuesto WHERE presupuesto_id = ?1
+        GROUP BY producto_id
+    """,
+    "productos_repetidos_presupuesto": "SELECT COUNT(*) - COUNT(DISTINCT producto_id) FROM detalle_presupuesto WHERE presupuesto_id = ?1",
+    "vaciar_detalle_presupuesto": "DELETE FROM detalle_presupuesto WHERE presupuesto_id = ?1",
+    # Delta de la revisión ?2 contra detalle_presupuesto (la revisión anterior): solo las líneas nuevas o
+    # cambiadas de ?3 (arreglo JSON de [producto_id, cantidad, precio_unitario]) y las quitadas, con cantidad NULL
+    "insertar_delta_revision": """
+        INSERT INTO lineas_revision_presupuesto (revision_id, producto_id, cantidad, precio_unitario)
+        WITH nuevas AS MATERIALIZED (
+            SELECT json_extract(value, '$[0]') AS producto_id, json_extract(value, '$[1]') AS cantidad,
+                   json_extract(value, '$[2]') AS precio_unitario
+            FROM json_each(?3)
+        ),
+        -- Materializadas, SQLite las cruza con un índice automático por producto en lugar de buscar cada
+        -- línea nueva entre todas las del presupuesto
+        actuales AS MATERIALIZED (
+            SELECT producto_id, cantidad, precio_unitario FROM detalle_presupuesto WHERE presupuesto_id = ?1
+        )
+        SELECT ?2, n.producto_id, n.cantidad, n.precio_unitario
+        FROM nuevas n
+        LEFT JOIN actuales a ON a.producto_id = n.producto_id
+        WHERE a.producto_id IS NULL OR a.cantidad != n.cantidad OR a.precio_unitario != n.precio_unitario
+        UNION ALL
+        SELECT ?2, a.producto_id, NULL, NULL
+        FROM actuales a
+        WHERE a.producto_id NOT IN (SELECT producto_id FROM nuevas)
+    """,
+    # Aplican el delta de la revisión ?2 a detalle_presupuesto tocando solo esas líneas
+    "actualizar_lineas_revisadas": """
+        UPDATE detalle_presupuesto SET cantidad = l.cantidad, precio_unitario = l.precio_unitario
+        FROM lineas_revision_presupuesto l
+        WHERE l.revision_id = ?2 AND l.cantidad IS NOT NULL
+          AND detalle_presupuesto.presupuesto_id = ?1 AND detalle_presupuesto.producto_id = l.producto_id
+    """,
+    "agregar_lineas_revisadas": """
+        INSERT INTO detalle_presupuesto (presupuesto_id, producto_id, cantidad, precio_unitario)
+        SELECT ?1, l.producto_id, l.cantidad, l.precio_unitario
+        FROM lineas_revision_presupuesto l
+        WHERE l.revision_id = ?2 AND l.cantidad IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM detalle_presupuesto dp WHERE dp.presupuesto_id = ?1 AND dp.producto_id = l.producto_id)
+    """,
+    "quitar_lineas_revisadas": """
+        DELETE FROM detalle_presupuesto
+        WHERE presupuesto_id = ?1
+          AND producto_id IN (SELECT producto_id FROM lineas_revision_presupuesto WHERE revision_id = ?2 AND cantidad IS NULL)
+    """,
+    "volver_a_borrador": "UPDATE presupuestos SET estado = 'borrador' WHERE id = ?1 AND estado != 'borrador'",
+    "lineas_actuales_presupuesto": """
+        SELECT dp.producto_id, p.codigo, p.descripcion, dp.cantidad, dp.precio_unitario
+        FROM detalle_presupuesto dp
+        JOIN productos p ON p.id = dp.producto_id
+        WHERE dp.presupuesto_id = ?1
+        ORDER BY p.codigo
+    """,
+    # Presupuesto ?1 a la revisión ?2: (producto_id, codigo, descripcion, cantidad, precio_unitario)
+    "lineas_revision": f"""
+        SELECT v.producto_id, p.codigo, p.descripcion, v.cantidad, v.precio_unitario
+        FROM ({_SQL_LINEAS_REVISION.format(revision='?2', filtro='')}) v
+        JOIN productos p ON p.id = v.producto_id
+        WHERE v.cantidad IS NOT NULL
+        ORDER BY p.codigo
+    """,
+    # Diferencias entre las revisiones ?2 y ?3: solo pueden cambiar los productos con líneas en las revisiones entre ambas
+    "diferencias_revisiones": f"""
+        WITH tocados AS (
+            SELECT DISTINCT l.producto_id
+            FROM revisiones_presupuesto r
+            JOIN lineas_revision_presupuesto l ON l.revision_id = r.id
+            WHERE r.presupuesto_id = ?1 AND r.numero > min(?2, ?3) AND r.numero <= max(?2, ?3)
+        ),
+        antes AS ({_SQL_LINEAS_REVISION.format(revision='?2', filtro='AND l.producto_id IN tocados')}),
+        despues AS ({_SQL_LINEAS_REVISION.format(revision='?3', filtro='AND l.producto_id IN tocados')})
+        SELECT p.codigo, p.descripcion, a.cantidad, a.precio_unitario, d.cantidad, d.precio_unitario
+        FROM tocados t
+        JOIN productos p ON p.id = t.producto_id
+        LEFT JOIN antes a ON a.producto_id = t.producto_id
+        LEFT JOIN despues d ON d.producto_id = t.producto_id
+        WHERE a.cantidad IS NOT d.cantidad OR a.precio_unitario IS NOT d.precio_unitario
+        ORDER BY p.codigo
+    """,
+    # Clonación de un presupuesto (?1) en otro (?2) sin pasar las líneas por Python: las actuales o las de la revisión ?3
+    "clonar_detalle_presupuesto": """
+        INSERT INTO detalle_presupuesto (presupuesto_id, producto_id, cantidad, precio_unitario)
+        SELECT ?2, producto_id, cantidad, precio_unitario FROM detalle_presupuesto WHERE presupuesto_id = ?1 ORDER BY id
+    """,
+    "clonar_revision_presupuesto": f"""
+        INSERT INTO detalle_presupuesto (presupuesto_id, producto_id, cantidad, precio_unitario)
+        SELECT ?2, producto_id, cantidad, precio_unitario
+        FROM ({_SQL_LINEAS_REVISION.format(revision='?3', filtro='')})
+        WHERE cantidad IS NOT NULL
+    """,
+
+    # Revalidación de precios y vencimiento de presupuestos (revalidacion_precios.py)
+    "vencer_presupuestos": f"""
+        UPDATE presupuestos AS p SET estado = 'vencido'
+        WHERE p.estado = 'borrador' AND {_SQL_PRECIOS_PRESUPUESTO} < ?1
+    """,
+    "crear_revalidacion_lineas": """
+        CREATE TEMP TABLE IF NOT EXISTS revalidacion_lineas (
+            presupuesto_id INTEGER NOT NULL, producto_id INTEGER NOT NULL, cantidad INTEGER NOT NULL,
+            precio_presupuestado REAL NOT NULL, precio_lista REAL NOT NULL,
+            PRIMARY KEY (presupuesto_id, producto_id)
+        ) WITHOUT ROWID
+    """,
+    "vaciar_revalidacion_lineas": "DELETE FROM temp.revalidacion_lineas",
+    "crear_revalidacion_presupuestos": "CREATE TEMP TABLE IF NOT EXISTS revalidacion_presupuestos (presupuesto_id INTEGER PRIMARY KEY)",
+    "vaciar_revalidacion_presupuestos": "DELETE FROM temp.revalidacion_presupuestos",
+    # Líneas de los presupuestos abiertos con un precio distinto del de lista, en una sola pasada: solo se miran
+    # los productos cuya lista cambió después de cotizado el presupuesto (así no se marcan los precios puestos
+    # a mano). Un producto repetido en el detalle cuenta como una línea con su precio promedio.
+    "detectar_precios_desactualizados": f"""
+        INSERT INTO temp.revalidacion_lineas (presupuesto_id, producto_id, cantidad, precio_presupuestado, precio_lista)
+        WITH abiertos AS MATERIALIZED (
+            SELECT p.id, {_SQL_PRECIOS_PRESUPUESTO} AS cotizado
+            FROM presupuestos p WHERE p.estado IN ('borrador', 'aprobado')
+        ),
+        lineas AS (
+            SELECT dp.presupuesto_id, dp.producto_id, SUM(dp.cantidad) AS cantidad,
+                   ROUND(SUM(dp.cantidad * dp.precio_unitario) / SUM(dp.cantidad), 4) AS precio_presupuestado
+            FROM abiertos a
+            JOIN detalle_presupuesto dp ON dp.presupuesto_id = a.id
+            JOIN productos pr ON pr.id = dp.producto_id
+            WHERE pr.precios_desde > a.cotizado
+            GROUP BY dp.presupuesto_id, dp.producto_id
+        )
+        SELECT l.presupuesto_id, l.producto_id, l.cantidad, l.precio_presupuestado,
+               {_SQL_PRECIO_ESCALA.format(cantidad='l.cantidad')} AS precio_lista
+        FROM lineas l JOIN productos pr ON pr.id = l.producto_id
+        WHERE precio_lista > 0 AND ABS(l.precio_presupuestado - precio_lista) >= 0.005
+    """,
+    "quitar_precios_al_dia": """
+        DELETE FROM precios_desactualizados WHERE presupuesto_id NOT IN (SELECT presupuesto_id FROM temp.revalidacion_lineas)
+    """,
+    # La fecha 'detectado' queda la de la primera vez que se marcó el presupuesto
+    "marcar_precios_desactualizados": """
+        INSERT INTO precios_desactualizados (presupuesto_id, lineas, total_presupuestado, total_lista)
+        SELECT presupuesto_id, COUNT(*), ROUND(SUM(cantidad * precio_presupuestado), 2), ROUND(SUM(cantidad * precio_lista), 2)
+        FROM temp.revalidacion_lineas WHERE true
+        GROUP BY presupuesto_id
+        ON CONFLICT(presupuesto_id) DO UPDATE SET
+            lineas = excluded.lineas, total_presupuestado = excluded.total_presupuestado, total_lista = excluded.total_lista
+    """,
+    "cantidad_precios_desactualizados": "SELECT COUNT(*) FROM precios_desactualizados",
+    "precios_desactualizados": """
+        SELECT pd.presupuesto_id, c.nombre, p.fecha_creacion, p.estado, pd.lineas, pd.total_presupuestado,
+               pd.total_lista, pd.detectado
+        FROM precios_desactualizados pd
+        JOIN presupuestos p ON p.id = pd.presupuesto_id
+        JOIN clientes c ON c.id = p.cliente_id
+        ORDER BY ABS(pd.total_lista - pd.total_presupuestado) DESC, pd.presupuesto_id
+    """,
+    # Se actualizan solo los borradores; uno con productos repetidos en el detalle queda marcado para revisarlo a mano
+    "repreciables_revalidacion": """
+        INSERT INTO temp.revalidacion_presupuestos (presupuesto_id)
+        SELECT t.presupuesto_id
+        FROM (SELECT DISTINCT presupuesto_id FROM temp.revalidacion_lineas) t
+        JOIN presupuestos p ON p.id = t.presupuesto_id
+        WHERE p.estado = 'borrador'
+          AND NOT EXISTS (SELECT 1 FROM detalle_presupuesto dp WHERE dp.presupuesto_id = t.presupuesto_id
+                          GROUP BY dp.producto_id HAVING COUNT(*) > 1)
+    """,
+    "ultimo_id_revision": "SELECT COALESCE(MAX(id), 0) FROM revisiones_presupuesto",
+    # Revisión 1 de los que nunca se revisaron, y sus líneas (las de las revisiones de ID mayor a ?1)
+    "revisiones_base_revalidacion": """
+        INSERT INTO revisiones_presupuesto (presupuesto_id, numero, motivo)
+        SELECT rp.presupuesto_id, 1, 'Original' FROM temp.revalidacion_presupuestos rp
+        WHERE NOT EXISTS (SELECT 1 FROM revisiones_presupuesto r WHERE r.presupuesto_id = rp.presupuesto_id)
+    """,
+    "lineas_base_revalidacion": """
+        INSERT INTO lineas_revision_presupuesto (revision_id, producto_id, cantidad, precio_unitario)
+        SELECT r.id, dp.producto_id, dp.cantidad, dp.precio_unitario
+        FROM revisiones_presupuesto r
+        JOIN detalle_presupuesto dp ON dp.presupuesto_id = r.presupuesto_id
+        WHERE r.id > ?1
+    """,
+    # Una revisión nueva (motivo ?1) por presupuesto con solo las líneas que cambian de precio (revisiones de ID mayor a ?1)
+    "revisiones_revalidacion": """
+        INSERT INTO revisiones_presupuesto (presupuesto_id, numero, motivo)
+        SELECT rp.presupuesto_id,
+               (SELECT MAX(r.numero) FROM revisiones_presupuesto r WHERE r.presupuesto_id = rp.presupuesto_id) + 1, ?1
+        FROM temp.revalidacion_presupuestos rp
+    """,
+    "lineas_revalidacion": """
+        INSERT INTO lineas_revision_presupuesto (revision_id, producto_id, cantidad, precio_unitario)
+        SELECT r.id, t.producto_id, t.cantidad, t.precio_lista
+        FROM revisiones_presupuesto r
+        JOIN temp.revalidacion_lineas t ON t.presupuesto_id = r.presupuesto_id
+        WHERE r.id > ?1
+    """,
+    "repreciar_revalidacion": """
+        UPDATE detalle_presupuesto SET precio_unitario = t.precio_lista
+        FROM temp.revalidacion_lineas t
+        WHERE detalle_presupuesto.presupuesto_id IN (SELECT presupuesto_id FROM temp.revalidacion_presupuestos)
+          AND t.presupuesto_id = detalle_presupuesto.presupuesto_id AND t.producto_id = detalle_presupuesto.producto_id
+    """,
+    "quitar_precios_repreciados": """
+        DELETE FROM precios_desactualizados WHERE presupuesto_id IN (SELECT presupuesto_id FROM temp.revalidacion_presupuestos)
+    """,
+
+    # Reglas de precios (reglas_precio.py)
+    "reglas_precio": "SELECT categoria, escala, recargo, margen_minimo, redondeo FROM reglas_precio ORDER BY categoria, escala",
+    "guardar_regla_precio": """
+        INSERT INTO reglas_precio (categoria, escala, recargo, margen_minimo, redondeo) VALUES (?1, ?2, ?3, ?4, ?5)
+        ON CONFLICT(categoria, escala) DO UPDATE SET
+            recargo = excluded.recargo, margen_minimo = excluded.margen_minimo, redondeo = excluded.redondeo
+        WHERE (recargo, margen_minimo, redondeo) IS NOT (excluded.recargo, excluded.margen_minimo, excluded.redondeo)
+    """,
+    "quitar_regla_precio": "DELETE FROM reglas_precio WHERE categoria = ?1 AND escala = ?2",
+    "catalogo_para_reglas": """
+        SELECT id, codigo, descripcion, costo_base, precio_0_1, precio_1, precio_5, precio_10, precio_25, precio_tambor_rollo
+        FROM productos ORDER BY id
+    """,
+    # Solo se escribe si algún precio cambió (así tampoco se anota en registro_cambios ni mueve precios_desde)
+    "actualizar_precios_producto": """
+        UPDATE productos SET precio_0_1 = ?2, precio_1 = ?3, precio_5 = ?4, precio_10 = ?5, precio_25 = ?6, precio_tambor_rollo = ?7
+        WHERE id = ?1 AND (precio_0_1, precio_1, precio_5, precio_10, precio_25, precio_tambor_rollo) IS NOT (?2, ?3, ?4, ?5, ?6, ?7)
+    """,
+
+    # Conversión de presupuestos en notas de pedido, sin pasar las líneas por Python.
+    # ?1 es la lista de IDs de presupuestos como arreglo JSON (una sola sentencia para 1 o N presupuestos).
+    "presupuestos_a_convertir": """
+        SELECT p.id, p.estado, p.cantidad_lineas, np.id
+        FROM presupuestos p
+        LEFT JOIN notas_pedido np ON np.presupuesto_id = p.id
+        WHERE p.id IN (SELECT value FROM json_each(?1))
+    """,
+    "insertar_notas_pedido_de_presupuestos": """
+        INSERT INTO notas_pedido (cliente_id, fecha_creacion, tipo_entrega, estado, presupuesto_id)
+        SELECT cliente_id, ?2, 'Retiro por mostrador', 'pendiente', id
+        FROM presupuestos WHERE id IN (SELECT value FROM json_each(?1))
+        ORDER BY id
+    """,
+    "copiar_detalle_presupuestos_a_pedidos": """
+        INSERT INTO detalle_pedido (nota_pedido_id, producto_id, cantidad, precio_unitario)
+        SELECT np.id, dp.producto_id, dp.cantidad, dp.precio_unitario
+        FROM detalle_presupuesto dp
+        JOIN notas_pedido np ON np.presupuesto_id = dp.presupuesto_id
+        WHERE dp.presupuesto_id IN (SELECT value FROM json_each(?1))
+        ORDER BY dp.id
+    """,
+    "facturar_presupuestos": "UPDATE presupuestos SET estado = 'facturado' WHERE id IN (SELECT value FROM json_each(?1))",
+    "notas_pedido_de_presupuestos": """
+        SELECT presupuesto_id, id FROM notas_pedido
+        WHERE presupuesto_id IN (SELECT value FROM json_each(?1))
+    """,
+    "presupuestos_aprobados": "SELECT id FROM presupuestos WHERE estado = 'aprobado' ORDER BY id",
+
+    # --- Conciliación de pagos (conciliacion.py) ---
+    "notas_a_conciliar": """
+        SELECT np.id, np.cliente_id, np.fecha_creacion, np.total_con_iva,
+               COALESCE((SELECT SUM(pa.importe) FROM pagos_aplicados pa WHERE pa.nota_pedido_id = np.id), 0)
+        FROM notas_pedido np
+        WHERE np.estado != 'cancelada' AND np.cantidad_lineas > 0
+    """,
+    "comprobantes_a_conciliar": """
+        SELECT comp.id, comp.cliente_id, comp.fecha, comp.importe,
+               COALESCE((SELECT SUM(pa.importe) FROM pagos_aplicados pa WHERE pa.comprobante_id = comp.id), 0)
+        FROM comprobantes comp
+        WHERE comp.cliente_id IS NOT NULL AND comp.importe > 0
+    """,
+    "insertar_pago_aplicado": """
+        INSERT INTO pagos_aplicados (comprobante_id, nota_pedido_id, importe, tipo, fecha_aplicacion)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (comprobante_id, nota_pedido_id) DO UPDATE SET
+            importe = importe + excluded.importe, tipo = excluded.tipo, fecha_aplicacion = excluded.fecha_aplicacion
+    """,
+    "borrar_pagos_aplicados": "DELETE FROM pagos_aplicados",
+    "pagos_aplicados": """
+        SELECT pa.id, comp.nro_operacion, comp.fecha, pa.nota_pedido_id, c.nombre, pa.importe, pa.tipo, pa.fecha_aplicacion
+        FROM pagos_aplicados pa
+        JOIN comprobantes comp ON pa.comprobante_id = comp.id
+        JOIN clientes c ON comp.cliente_id = c.id
+        ORDER BY pa.id DESC
+    """,
+
+    # --- Movimientos de stock e instantáneas (movimientos_stock.py) ---
+    "movimientos_producto": """
+        SELECT id, momento, tipo, disponible, reservado, nota_pedido_id, motivo
+        FROM movimientos_stock WHERE producto_id = ?1 AND momento BETWEEN ?2 AND ?3
+        ORDER BY momento, id
+    """,
+    # Instantánea de cada producto con movimientos nuevos hasta ?1: la anterior más los movimientos posteriores.
+    # Cada corrida incluye todos los movimientos hasta su corte, así que los nuevos son los de ID mayor al
+    # último movimiento incluido en alguna instantánea.
+    "generar_instantaneas_stock": """
+        WITH nuevos AS MATERIALIZED (  -- Por rango de ID: sin recorrer el índice de todos los movimientos
+            SELECT id, producto_id, momento, disponible, reservado FROM movimientos_stock
+            WHERE id > (SELECT COALESCE(MAX(movimiento_id), 0) FROM stock_instantaneas) AND momento <= ?1
+        )
+        INSERT OR REPLACE INTO stock_instantaneas (producto_id, momento, movimiento_id, disponible, reservado)
+        SELECT m.producto_id, MAX(m.momento), MAX(m.id),
+               COALESCE(u.disponible, 0) + SUM(m.disponible), COALESCE(u.reservado, 0) + SUM(m.reservado)
+        FROM nuevos m
+        LEFT JOIN (
+            SELECT producto_id, MAX(momento), disponible, reservado FROM stock_instantaneas GROUP BY producto_id
+        ) u ON u.producto_id = m.producto_id
+        GROUP BY m.producto_id
+    """,
+    # Desde cero: una instantánea por producto y mes, en el último movimiento del mes, con sumas de ventana
+    "reconstruir_instantaneas_stock": """
+        INSERT INTO stock_instantaneas (producto_id, momento, movimiento_id, disponible, reservado)
+        SELECT producto_id, momento, id, disponible, reservado FROM (
+            SELECT producto_id, momento, id,
+                   SUM(disponible) OVER acumulado AS disponible, SUM(reservado) OVER acumulado AS reservado,
+                   ROW_NUMBER() OVER (PARTITION BY producto_id, substr(momento, 1, 7) ORDER BY id DESC) AS desde_el_final
+            FROM movimientos_stock
+            WINDOW acumulado AS (PARTITION BY producto_id ORDER BY id ROWS UNBOUNDED PRECEDING)
+        ) WHERE desde_el_final = 1
+    """,
+    # Stock a un momento: la última instantánea hasta ese momento más los movimientos posteriores a ella
+    "stock_producto_a_fecha": """
+        WITH ultima AS (
+            SELECT momento, movimiento_id, disponible, reservado FROM stock_instantaneas
+            WHERE producto_id = ?1 AND momento <= ?2 ORDER BY momento DESC LIMIT 1
+        )
+        SELECT COALESCE((SELECT disponible FROM ultima), 0) + COALESCE(SUM(m.disponible), 0),
+               COALESCE((SELECT reservado FROM ultima), 0) + COALESCE(SUM(m.reservado), 0)
+        FROM movimientos_stock m
+        WHERE m.producto_id = ?1 AND m.momento >= COALESCE((SELECT momento FROM ultima), '') AND m.momento <= ?2
+          AND m.id > COALESCE((SELECT movimiento_id FROM ultima), 0)
+    """,
+    "stock_a_fecha": """
+        WITH ultimas AS (
+            SELECT producto_id, MAX(momento) AS momento, movimiento_id, disponible, reservado
+            FROM stock_instantaneas WHERE momento <= ?1 GROUP BY producto_id
+        )
+        SELECT p.id, p.codigo, COALESCE(u.disponible, 0) + COALESCE(SUM(m.disponible), 0),
+               COALESCE(u.reservado, 0) + COALESCE(SUM(m.reservado), 0)
+        FROM productos p
+        LEFT JOIN ultimas u ON u.producto_id = p.id
+        LEFT JOIN movimientos_stock m ON m.producto_id = p.id AND m.momento >= COALESCE(u.momento, '')
+                                     AND m.momento <= ?1 AND m.id > COALESCE(u.movimiento_id, 0)
+        GROUP BY p.id
+        ORDER BY p.codigo
+    """,
+    # Productos cuya proyección (stock en productos) no coincide con la suma de sus movimientos
+    "verificar_proyeccion_stock": """
+        SELECT p.id, p.codigo, p.stock_disponible, p.stock_reservado, COALESCE(t.disponible, 0), COALESCE(t.reservado, 0)
+        FROM productos p
+        LEFT JOIN (
+            SELECT producto_id, SUM(disponible) AS disponible, SUM(reservado) AS reservado
+            FROM movimientos_stock GROUP BY producto_id
+        ) t ON t.producto_id = p.id
+        WHERE p.stock_disponible != COALESCE(t.disponible, 0) OR p.stock_reservado != COALESCE(t.reservado, 0)
+    """,
+    # Productos cuya última instantánea no coincide con la suma de sus movimientos hasta ella
+    "verificar_instantaneas_stock": """
+        WITH ultimas AS (
+            SELECT producto_id, MAX(momento) AS momento, movimiento_id, disponible, reservado
+            FROM stock_instantaneas GROUP BY producto_id
+        )
+        SELECT u.producto_id, u.disponible, u.reservado, SUM(m.disponible), SUM(m.reservado)
+        FROM ultimas u
+        JOIN movimientos_stock m ON m.producto_id = u.producto_id AND m.momento <= u.momento AND m.id <= u.movimiento_id
+        GROUP BY u.producto_id
+        HAVING u.disponible != SUM(m.disponible) OR u.reservado != SUM(m.reservado)
+    """,
+    "reparar_proyeccion_stock": """
+        UPDATE productos SET stock_disponible = COALESCE(t.disponible, 0), stock_reservado = COALESCE(t.reservado, 0)
+        FROM (
+            SELECT p.id AS id, SUM(m.disponible) AS disponible, SUM(m.reservado) AS reservado
+            FROM productos p LEFT JOIN movimientos_stock m ON m.producto_id = p.id GROUP BY p.id
+        ) AS t
+        WHERE productos.id = t.id AND (productos.stock_disponible, productos.stock_reservado)
+              IS NOT (COALESCE(t.disponible, 0), COALESCE(t.reservado, 0))
+    """,
+
+    # --- Tipos de cambio (tipo_cambio.py) ---
+    "guardar_tipo_cambio": "INSERT OR REPLACE INTO tipo_cambio (moneda, fecha, valor) VALUES (?, ?, ?)",
+    "tipo_cambio_vigente": "SELECT valor FROM tipo_cambio WHERE moneda = ? AND fecha <= ? ORDER BY fecha DESC LIMIT 1",
+    "cotizaciones_moneda": "SELECT fecha, valor FROM tipo_cambio WHERE moneda = ? ORDER BY fecha",
+    "totales_convertidos_notas_pedido": _SQL_TOTALES_CONVERTIDOS.format(
+        tabla="notas_pedido", alias="np", cotizacion=_SQL_COTIZACION_VIGENTE.format(columna_fecha="fechas.fecha")),
+    "totales_convertidos_presupuestos": _SQL_TOTALES_CONVERTIDOS.format(
+        tabla="presupuestos", alias="p", cotizacion=_SQL_COTIZACION_VIGENTE.format(columna_fecha="fechas.fecha")),
+    "presupuesto_con_cotizacion": f"""
+        SELECT p.fecha_creacion, c.razon_social, c.cuit, p.total_con_iva,
+               {_SQL_COTIZACION_VIGENTE.format(columna_fecha="p.fecha_creacion")}
+        FROM presupuestos p JOIN clientes c ON p.cliente_id = c.id
+        WHERE p.id = :id
+    """,
+    "guardar_presupuesto_guardado": """
+        INSERT OR REPLACE INTO presupuestos_guardados
+            (numero_presupuesto, fecha_presupuesto, razon_social_cliente, documento_cliente,
+             total_usd, total_ars, tipo_cambio, metodo_pago, detalles_pago)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """,
+
+    # --- Conteo físico de stock (conteo_stock.py) ---
+    "crear_conteo_temporal": """
+        CREATE TEMP TABLE IF NOT EXISTS conteo_stock (codigo TEXT PRIMARY KEY, cantidad_contada INTEGER NOT NULL)
+    """,
+    "vaciar_conteo_temporal": "DELETE FROM temp.conteo_stock",
+    "insertar_conteo": "INSERT INTO temp.conteo_stock (codigo, cantidad_contada) VALUES (?, ?)",
+    # Lo contado es el stock físico (disponible + reservado); la diferencia se ajusta en el disponible
+    "diferencias_conteo": """
+        SELECT c.codigo, p.descripcion, p.stock_disponible + p.stock_reservado, p.stock_reservado, c.cantidad_contada,
+               c.cantidad_contada - p.stock_disponible - p.stock_reservado,
+               ROUND((c.cantidad_contada - p.stock_disponible - p.stock_reservado) * p.costo_base, 2) AS valor,
+               CASE WHEN p.id IS NULL THEN 'desconocido'
+                    WHEN c.cantidad_contada = p.stock_disponible + p.stock_reservado THEN 'sin_diferencia'
+                    WHEN c.cantidad_contada < p.stock_reservado THEN 'menos_que_reservado'
+                    ELSE 'ajuste' END
+        FROM temp.conteo_stock c
+        LEFT JOIN productos p ON p.codigo = c.codigo
+        ORDER BY ABS(COALESCE(valor, 0)) DESC, c.codigo
+    """,
+    "ultimo_movimiento_stock": "SELECT COALESCE(MAX(id), 0) FROM movimientos_stock",
+    "movimientos_desde": "SELECT COUNT(*) FROM movimientos_stock WHERE id > ?",
+    "ajustar_stock_por_conteo": """
+        INSERT INTO movimientos_stock (producto_id, tipo, disponible, reservado, motivo)
+        SELECT p.id, 'ajuste', c.cantidad_contada - p.stock_disponible - p.stock_reservado, 0, ?1
+        FROM temp.conteo_stock c
+        JOIN productos p ON p.codigo = c.codigo
+        WHERE c.cantidad_contada != p.stock_disponible + p.stock_reservado AND c.cantidad_contada >= p.stock_reservado
+    """,
+    # Mismo criterio que actualizar_estado_producto_automatico, para todos los productos con movimientos de ID mayor a ?1
+    "actualizar_estado_productos_movidos": """
+        UPDATE productos SET estado_producto = nuevo.estado
+        FROM (
+            SELECT id, CASE WHEN stock_disponible = 0 AND stock_reservado = 0 THEN 'sin_stock'
+                            WHEN stock_disponible = 0 AND stock_reservado > 0 THEN 'reservado'
+                            ELSE 'disponible' END AS estado
+            FROM productos WHERE id IN (SELECT producto_id FROM movimientos_stock WHERE id > ?1)
+        ) AS nuevo
+        WHERE productos.id = nuevo.id AND productos.estado_producto IS NOT nuevo.estado
+    """,
+
+    # --- Reposición y alertas de stock (reposicion.py) ---
+    # Consumo diario de cada producto: unidades de las notas entregadas entre ?1 (exclusive) y ?2, sobre ?3 días.
+    # Solo se escriben los productos con consumo o con reposición ya configurada, y solo si el consumo cambió.
+    "recalcular_consumo_reposicion": """
+        INSERT INTO reposicion_productos (producto_id, consumo_diario)
+        SELECT p.id, ROUND(COALESCE(c.unidades, 0) * 1.0 / ?3, 4)
+        FROM productos p
+        LEFT JOIN (
+            SELECT d.producto_id, SUM(d.cantidad) AS unidades
+            FROM notas_pedido n JOIN detalle_pedido d ON d.nota_pedido_id = n.id
+            WHERE n.estado = 'entregada' AND COALESCE(n.fecha_entrega, substr(n.fecha_creacion, 1, 10)) > ?1
+              AND COALESCE(n.fecha_entrega, substr(n.fecha_creacion, 1, 10)) <= ?2
+            GROUP BY d.producto_id
+        ) c ON c.producto_id = p.id
+        WHERE c.unidades > 0 OR p.id IN (SELECT producto_id FROM reposicion_productos)
+        ON CONFLICT(producto_id) DO UPDATE SET consumo_diario = excluded.consumo_diario
+        WHERE consumo_diario IS NOT excluded.consumo_diario
+    """,
+    "recalcular_puntos_reposicion": f"""
+        UPDATE reposicion_productos SET punto_reposicion = {_SQL_PUNTO_REPOSICION}
+        WHERE punto_manual = 0 AND punto_reposicion != {_SQL_PUNTO_REPOSICION}
+    """,
+    "configurar_reposicion": """
+        INSERT INTO reposicion_productos (producto_id, plazo_entrega_dias, punto_reposicion, punto_manual)
+        VALUES (?1, COALESCE(?2, 7), COALESCE(?3, 0), ?3 IS NOT NULL)
+        ON CONFLICT(producto_id) DO UPDATE SET
+            plazo_entrega_dias = COALESCE(?2, plazo_entrega_dias),
+            punto_reposicion = CASE WHEN ?4 THEN punto_reposicion ELSE COALESCE(?3, punto_reposicion) END,
+            punto_manual = CASE WHEN ?4 THEN 0 WHEN ?3 IS NOT NULL THEN 1 ELSE punto_manual END
+    """,
+    "punto_reposicion_automatico": f"""
+        UPDATE reposicion_productos SET punto_reposicion = {_SQL_PUNTO_REPOSICION}
+        WHERE producto_id = ?2 AND punto_manual = 0
+    """,
+    "reposicion_producto": """
+        SELECT p.id, p.descripcion, p.stock_disponible, COALESCE(r.plazo_entrega_dias, 7), COALESCE(r.consumo_diario, 0),
+               COALESCE(r.punto_reposicion, 0), COALESCE(r.punto_manual, 0), a.producto_id IS NOT NULL
+        FROM productos p
+        LEFT JOIN reposicion_productos r ON r.producto_id = p.id
+        LEFT JOIN alertas_stock a ON a.producto_id = p.id
+        WHERE p.codigo = ?
+    """,
+    # Productos en alerta con los días que cubre su stock y la cantidad a pedir para llegar al punto más ?1 días de consumo
+    "alertas_stock": """
+        SELECT p.codigo, p.descripcion, a.stock_disponible, p.stock_reservado, a.punto_reposicion, r.consumo_diario,
+               CASE WHEN r.consumo_diario > 0 THEN ROUND(a.stock_disponible / r.consumo_diario, 1) END,
+               MAX(a.punto_reposicion + CAST(r.consumo_diario * ?1 + 0.999 AS INTEGER) - a.stock_disponible, 1),
+               r.plazo_entrega_dias, a.desde
+        FROM alertas_stock a
+        JOIN productos p ON p.id = a.producto_id
+        JOIN reposicion_productos r ON r.producto_id = a.producto_id
+        ORDER BY a.stock_disponible - a.punto_reposicion, p.codigo
+    """,
+    "cantidad_alertas_stock": "SELECT COUNT(*) FROM alertas_stock",
+
+    # --- Expedición (expedicion.py) ---
+    "cola_expedicion": _SQL_COLA_EXPEDICION.format(filtro=""),
+    # ?1: arreglo JSON con los IDs de las notas a releer
+    "cola_expedicion_notas": _SQL_COLA_EXPEDICION.format(filtro="AND np.id IN (SELECT value FROM json_each(?1))"),
+    "ultimo_cambio_registro": "SELECT COALESCE(MAX(id), 0) FROM registro_cambios",
+    # Notas de pedido tocadas por los cambios ?1 < id <= ?2 (las bajas de detalle solo traen su propio ID,
+    # pero también cambian los totales de la cabecera, que sí queda anotada)
+    "notas_cambiadas_desde": """
+        SELECT DISTINCT CASE tabla WHEN 'notas_pedido' THEN json_extract(datos, '$.id')
+                                   ELSE json_extract(datos, '$.nota_pedido_id') END
+        FROM registro_cambios
+        WHERE id > ?1 AND id <= ?2 AND tabla IN ('notas_pedido', 'detalle_pedido')
+    """,
+    "lista_picking": _SQL_LISTA_PICKING.format(filtro=""),
+    "lista_picking_notas": _SQL_LISTA_PICKING.format(filtro="AND np.id IN (SELECT value FROM json_each(?1))"),
+
+    # --- Cuenta corriente de clientes (cuenta_corriente.py) ---
+    "saldo_actual_cliente": "SELECT saldo FROM cuenta_corriente_saldos WHERE cliente_id = ?",
+    # Saldo a una fecha: el del último cierre hasta esa fecha más los asientos posteriores al cierre
+    "saldo_cliente_a_fecha": """
+        WITH cierre AS (
+            SELECT fecha, saldo FROM cuenta_corriente_cierres
+            WHERE cliente_id = ?1 AND fecha <= ?2 ORDER BY fecha DESC LIMIT 1
+        )
+        SELECT ROUND(COALESCE((SELECT saldo FROM cierre), 0) + COALESCE((
+            SELECT SUM(debe - haber) FROM cuenta_corriente
+            WHERE cliente_id = ?1 AND fecha > COALESCE((SELECT fecha FROM cierre), '') AND fecha <= ?2
+        ), 0), 2)
+    """,
+    # Parámetros (cliente_id, desde, hasta, saldo al día anterior a 'desde')
+    "estado_de_cuenta": """
+        SELECT fecha, tipo, referencia_id, debe, haber,
+               ROUND(?4 + SUM(debe - haber) OVER (ORDER BY fecha, id ROWS UNBOUNDED PRECEDING), 2)
+        FROM cuenta_corriente
+        WHERE cliente_id = ?1 AND fecha BETWEEN ?2 AND ?3
+        ORDER BY fecha, id
+    """,
+    # Cierres al último día de cada mes con asientos hasta ?1, con el saldo acumulado del cliente a ese día
+    "generar_cierres_cuenta_corriente": """
+        INSERT OR REPLACE INTO cuenta_corriente_cierres (cliente_id, fecha, saldo)
+        SELECT cliente_id, fin_de_mes,
+               ROUND(SUM(neto) OVER (PARTITION BY cliente_id ORDER BY fin_de_mes ROWS UNBOUNDED PRECEDING), 4)
+        FROM (
+            SELECT cliente_id, date(fecha, 'start of month', '+1 month', '-1 day') AS fin_de_mes, SUM(debe - haber) AS neto
+            FROM cuenta_corriente WHERE fecha <= ?1
+            GROUP BY cliente_id, fin_de_mes
+        )
+    """,
+    "antiguedad_saldos": _SQL_ANTIGUEDAD.format(filtro=""),
+    "antiguedad_saldo_cliente": _SQL_ANTIGUEDAD.format(filtro="AND cliente_id = ?2"),
+
+    # --- Cola de sincronización y base de la sincronización bidireccional con Google Sheets ---
+    "encolar_sheets": "INSERT INTO sheets_cola (modulo, hoja_calculo, creado) VALUES (?, ?, ?)",
+    "cola_sheets": "SELECT id, modulo, hoja_calculo, creado, intentos, ultimo_error FROM sheets_cola ORDER BY id",
+    "error_cola_sheets": "UPDATE sheets_cola SET intentos = intentos + 1, ultimo_error = ? WHERE id = ?",
+    "quitar_de_cola_sheets": "DELETE FROM sheets_cola WHERE id = ?",
+    "borrar_base_productos": "DELETE FROM sheets_base WHERE modulo = 'productos'",
+    "insertar_base_productos": "INSERT INTO sheets_base (modulo, clave, hash) VALUES ('productos', ?, ?)",
+    "base_productos": "SELECT clave, hash FROM sheets_base WHERE modulo = 'productos'",
+    "guardar_base_producto": "INSERT OR REPLACE INTO sheets_base (modulo, clave, hash) VALUES ('productos', ?, ?)",
+    # Columnas editables en la planilla, en el orden de presupuesto_backend.COLUMNAS_EDITABLES_PRODUCTOS
+    "editables_productos": """
+        SELECT codigo, stock_disponible, costo_base, precio_0_1, precio_1, precio_5, precio_10, precio_25,
+               precio_tambor_rollo
+        FROM productos
+    """,
+    # El stock editado en la planilla (?1) entra como un movimiento de ajuste del producto de código ?2
+    "ajustar_stock_desde_sheets": """
+        INSERT INTO movimientos_stock (producto_id, tipo, disponible, motivo)
+        SELECT id, 'ajuste', ?1 - stock_disponible, 'Google Sheets' FROM productos
+        WHERE codigo = ?2 AND stock_disponible != ?1
+    """,
+    "actualizar_editables_producto": """
+        UPDATE productos SET stock_disponible = ?, costo_base = ?, precio_0_1 = ?, precio_1 = ?, precio_5 = ?,
+                             precio_10 = ?, precio_25 = ?, precio_tambor_rollo = ?
+        WHERE codigo = ?
+    """,
+
+    # --- Datos que se suben a cada pestaña de Google Sheets (los alias son los encabezados) ---
+    "sheets_comprobantes": """
+        SELECT
+            c.nombre AS Nombre_Cliente,
+            c.cuit AS CUIT_Cliente,
+            c.razon_social AS Razon_Social_Cliente,
+            comp.nro_operacion AS Numero_Operacion,
+            comp.fecha AS Fecha_Comprobante,
+            comp.importe AS Importe_Comprobante,
+            comp.cuenta AS Cuenta_Destino
+        FROM
+            comprobantes comp
+        JOIN
+            clientes c ON comp.cliente_id = c.id
+        ORDER BY comp.id ASC
+    """,
+    "sheets_productos": """
+        SELECT
+            codigo AS Codigo_Producto,
+            descripcion AS Descripcion,
+            stock_disponible AS Stock_Disponible,
+            stock_reservado AS Stock_Reservado,
+            estado_producto AS Estado,
+            costo_base AS Costo_Base,
+            precio_0_1 AS Precio_0_1,
+            precio_1 AS Precio_1,
+            precio_5 AS Precio_5,
+            precio_10 AS Precio_10,
+            precio_25 AS Precio_25,
+            precio_tambor_rollo AS Precio_Tambor_Rollo
+        FROM
+            productos
+        ORDER BY codigo ASC
+    """,
+    "sheets_pedidos": """
+        SELECT
+            np.id AS ID_Pedido,
+            c.nombre AS Cliente,
+            np.fecha_creacion AS Fecha_Creacion,
+            np.tipo_entrega AS Tipo_Entrega,
+            np.direccion_envio AS Direccion_Envio,
+            np.telefono_contacto AS Telefono_Contacto,
+            np.estado AS Estado_Pedido,
+            np.total AS Total_Pedido,
+            np.total_iva AS IVA_Pedido,
+            np.total_con_iva AS Total_Con_IVA
+        FROM
+            notas_pedido np
+        JOIN
+            clientes c ON np.cliente_id = c.id
+        ORDER BY np.fecha_creacion DESC, np.id DESC
+    """,
+    "sheets_presupuestos": """
+        SELECT
+            p.id AS ID_Presupuesto,
+            c.nombre AS Cliente,
+            p.fecha_creacion AS Fecha_Creacion,
+            p.estado AS Estado_Presupuesto,
+            p.total AS Total_Presupuesto,
+            p.total_iva AS IVA_Presupuesto,
+            p.total_con_iva AS Total_Con_IVA
+        FROM
+            presupuestos p
+        JOIN
+            clientes c ON p.cliente_id = c.id
+        ORDER BY p.fecha_creacion DESC, p.id DESC
+    """,
+}
+
+_hilo = threading.local() # conexion / clave (ruta, instrumentada) de la conexión de cada hilo
+
+
+def conexion(db_path):
+    """
+    Conexión de larga vida del hilo actual a db_path, con el caché de sentencias agrandado.
+    Se reabre sola si cambia la ruta o si se activa/desactiva la instrumentación. No hay que cerrarla;
+    las escrituras se hacen dentro de 'with conn:' para que ninguna transacción quede abierta entre llamadas.
+    """
+    clave = (db_path, instrumentacion.activo())
+    conn = getattr(_hilo, "conexion", None)
+    if conn is not None and _hilo.clave == clave:
+        return conn
+    if conn is not None:
+        conn.close()
+    conn = instrumentacion.conectar(db_path, cached_statements=TAMANO_CACHE_SENTENCIAS)
+    _hilo.conexion, _hilo.clave = conn, clave
+    log.debug("Conexión de larga vida abierta a '%s' (hilo %s).", db_path, threading.current_thread().name)
+    return conn
+
+
+def cerrar_conexion():
+    """Cierra la conexión de larga vida del hilo actual (la próxima llamada a conexion() abre otra)."""
+    conn = getattr(_hilo, "conexion", None)
+    if conn is not None:
+        conn.close()
+        _hilo.conexion = _hilo.clave = None
+
+
+# Los helpers ejecutan sobre conn.cursor() y no sobre conn.execute: así pasan siempre por el cursor de la
+# conexión (CursorInstrumentado con la instrumentación activa) y el perfilador ve cada sentencia.
+
+def ejecutar(conn, nombre, parametros=()):
+    """Ejecuta la sentencia 'nombre' y devuelve el cursor."""
+    return conn.cursor().execute(SENTENCIAS[nombre], parametros)
+
+
+def uno(conn, nombre, parametros=()):
+    """Primera fila de la sentencia 'nombre' (o None)."""
+    return conn.cursor().execute(SENTENCIAS[nombre], parametros).fetchone()
+
+
+def todos(conn, nombre, parametros=()):
+    """Todas las filas de la sentencia 'nombre'."""
+    return conn.cursor().execute(SENTENCIAS[nombre], parametros).fetchall()
+
+
+def muchos(conn, nombre, secuencia_parametros):
+    """Ejecuta la sentencia 'nombre' una vez por juego de parámetros, preparada una sola vez (executemany)."""
+    return conn.cursor().executemany(SENTENCIAS[nombre], secuencia_parametros)
@@ -0,0 +1,119 @@
+import argparse
+import datetime
+import logging
+
+import pandas as pd
+
+import consultas
+import presupuesto_backend
+
+log = logging.getLogger(__name__)
+
+# --- Conteo físico de stock ---
+# Aplica un inventario contado (CSV o XLSX con codigo;cantidad_contada) de una sola vez: el conteo se carga
+# en una tabla temporal y las diferencias contra el stock actual se calculan en SQL, dentro de una misma
+# transacción (nadie puede mover stock entre el cálculo y el ajuste). Cada diferencia entra como un
+# movimiento 'ajuste' (ver movimientos_stock.py) y el estado de los productos ajustados se recalcula con
+# una sola sentencia. La cantidad contada es la física: incluye lo reservado, así que el ajuste va a
+# stock_disponible (contado - reservado); si se contó menos de lo reservado, el producto no se ajusta.
+# El informe de diferencias queda en un DataFrame (y en un CSV si se pide).
+
+COLUMNAS_CONTEO = ('codigo', 'cantidad_contada')
+COLUMNAS_INFORME = ['codigo', 'descripcion', 'stock_sistema', 'reservado', 'cantidad_contada', 'diferencia', 'valor_diferencia', 'resultado']
+RESULTADOS = ('ajuste', 'sin_diferencia', 'menos_que_reservado', 'desconocido', 'invalido')
+
+
+def leer_conteo(ruta, separador=';'):
+    """
+    Lee un conteo (CSV con 'separador' o XLSX) con las columnas codigo y cantidad_contada.
+    Devuelve (conteo, invalidos): el conteo con una fila por código (las líneas repetidas se suman, como
+    cuando un producto se cuenta en varios lugares) y las líneas que no se pudieron leer.
+    """
+    if ruta.lower().endswith(('.xlsx', '.xls')):
+        df = pd.read_excel(ruta, dtype=str)
+    else:
+        df = pd.read_csv(ruta, sep=separador, dtype=str, encoding='utf-8-sig')
+    df.columns = df.columns.astype(str).str.strip().str.lower()
+    faltantes = [columna for columna in COLUMNAS_CONTEO if columna not in df.columns]
+    if faltantes:
+        raise ValueError(f"Faltan columnas en el conteo: {', '.join(faltantes)}. Encontradas: {', '.join(df.columns)}.")
+
+    df = df[list(COLUMNAS_CONTEO)].copy()
+    df['codigo'] = df['codigo'].fillna('').str.strip().str.upper()
+    cantidades = pd.to_numeric(df['cantidad_contada'].str.strip().str.replace(',', '.', regex=False), errors='coerce')
+    validas = (df['codigo'] != '') & cantidades.notna() & (cantidades >= 0) & (cantidades % 1 == 0)
+    invalidos = df[~validas]
+    conteo = (pd.DataFrame({'codigo': df.loc[validas, 'codigo'], 'cantidad_contada': cantidades[validas].astype('int64')})
+              .groupby('codigo', as_index=False, sort=False)['cantidad_contada'].sum())
+    return conteo, invalidos
+
+
+def aplicar_conteo(conteo, motivo=None, simular=False):
+    """
+    Ajusta el stock según 'conteo' (DataFrame de leer_conteo) en una sola transacción. Con simular=True
+    solo calcula las diferencias. Devuelve el informe (DataFrame con COLUMNAS_INFORME, de mayor a menor
+    diferencia valorizada) y la cantidad de productos ajustados.
+    """
+    motivo = motivo or f"Conteo físico {datetime.date.today().isoformat()}"
+    conn = presupuesto_backend.conexion()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        consultas.ejecutar(conn, "crear_conteo_temporal")
+        consultas.ejecutar(conn, "vaciar_conteo_temporal")
+        consultas.muchos(conn, "insertar_conteo", conteo[list(COLUMNAS_CONTEO)].itertuples(index=False, name=None))
+        informe = pd.DataFrame(consultas.todos(conn, "diferencias_conteo"), columns=COLUMNAS_INFORME).astype(
+            {'stock_sistema': 'Int64', 'reservado': 'Int64', 'diferencia': 'Int64'}) # Enteros con vacíos para los desconocidos
+        ajustados = 0
+        if not simular:
+            ultimo_movimiento = consultas.uno(conn, "ultimo_movimiento_stock")[0]
+            consultas.ejecutar(conn, "ajustar_stock_por_conteo", (motivo,))
+            ajustados = consultas.uno(conn, "movimientos_desde", (ultimo_movimiento,))[0]
+            consultas.ejecutar(conn, "actualizar_estado_productos_movidos", (ultimo_movimiento,))
+        consultas.ejecutar(conn, "vaciar_conteo_temporal")
+    log.info("Conteo de %d productos %s: %d ajustados, %d sin diferencia, %d desconocidos.", len(informe),
+             "simulado" if simular else "aplicado", ajustados,
+             (informe['resultado'] == 'sin_diferencia').sum(), (informe['resultado'] == 'desconocido').sum())
+    return informe, ajustados
+
+
+def importar_conteo(ruta, motivo=None, simular=False, informe_path=None, separador=';'):
+    """
+    Lee el archivo de conteo, lo aplica (o lo simula) y, si se indica 'informe_path', guarda ahí el informe
+    de diferencias (CSV con ';' y coma decimal). Devuelve (informe, resumen); las unidades y el valor del
+    resumen son los de los ajustes (aplicados, o a aplicar si se simula).
+    """
+    conteo, invalidos = leer_conteo(ruta, separador)
+    informe, ajustados = aplicar_conteo(conteo, motivo, simular)
+    if len(invalidos):
+        informe = pd.concat([informe, pd.DataFrame({'codigo': invalidos['codigo'], 'cantidad_contada': invalidos['cantidad_contada'],
+                                                    'resultado': 'invalido'})], ignore_index=True)
+    if informe_path:
+        informe.to_csv(informe_path, sep=';', decimal=',', index=False, encoding='utf-8-sig')
+    ajustes = informe[informe['resultado'] == 'ajuste']
+    resumen = {
+        'productos_contados': len(conteo),
+        'ajustados': ajustados,
+        **{resultado: int((informe['resultado'] == resultado).sum()) for resultado in RESULTADOS},
+        'unidades_sobrantes': int(ajustes.loc[ajustes['diferencia'] > 0, 'diferencia'].sum()),
+        'unidades_faltantes': int(-ajustes.loc[ajustes['diferencia'] < 0, 'diferencia'].sum()),
+        'valor_ajustes': round(float(ajustes['valor_diferencia'].sum()), 2),
+    }
+    return informe, resumen
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ajusta el stock desde un conteo físico (CSV o XLSX con codigo;cantidad_contada).")
+    parser.add_argument("archivo")
+    parser.add_argument("--motivo", help="Motivo de los ajustes (por defecto 'Conteo físico <fecha>').")
+    parser.add_argument("--simular", action="store_true", help="Solo calcular las diferencias, sin ajustar.")
+    parser.add_argument("--informe", help="Guardar el informe de diferencias en este CSV.")
+    parser.add_argument("--separador", default=';', help="Separador del CSV (por defecto ';').")
+    args = parser.parse_args()
+
+    presupuesto_backend.inicializar_base_de_datos()
+    informe, resumen = importar_conteo(args.archivo, args.motivo, args.simular, args.informe, args.separador)
+    diferencias = informe[informe['resultado'] != 'sin_diferencia']
+    if len(diferencias):
+        print(diferencias.head(50).to_string(index=False))
+    for clave, valor in resumen.items():
+        print(f"{clave:<22} {valor}")
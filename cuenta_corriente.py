@@ -0,0 +1,153 @@
+import argparse
+import datetime
+import logging
+
+import consultas
+import presupuesto_backend
+
+log = logging.getLogger(__name__)
+
+# --- Cuenta corriente de clientes ---
+# Lo que debe cada cliente, desde la tabla cuenta_corriente que llenan los triggers de presupuesto_backend:
+# un asiento al debe por cada nota de pedido entregada y uno al haber por cada comprobante de pago.
+#  - Saldo actual: una fila de cuenta_corriente_saldos, que los triggers mantienen con cada asiento.
+#  - Saldo a una fecha: el del último cierre mensual hasta esa fecha más los asientos posteriores
+#    (a lo sumo un mes de asientos), en lugar de sumar toda la historia del cliente.
+#  - Estado de cuenta y antigüedad de saldos: funciones de ventana de SQLite (SUM() OVER) sobre los
+#    asientos, sin traerlos a Python para acumular.
+# generar_cierres() se corre una vez por mes (lo hace el mantenimiento programado); los triggers
+# corrigen los cierres ya generados cuando llega un asiento con fecha anterior.
+
+FECHA_MINIMA = '0001-01-01'
+FECHA_MAXIMA = '9999-12-31'
+TRAMOS_ANTIGUEDAD = ('0-30', '31-60', '61-90', '+90') # Días desde la entrega
+
+
+def _iso(fecha):
+    """Fecha AAAA-MM-DD de un date o de un texto ISO (None queda None)."""
+    if fecha is None or isinstance(fecha, str):
+        return fecha
+    return fecha.isoformat()
+
+
+def _concepto(tipo, referencia_id, debe, haber):
+    """Descripción de un asiento para el estado de cuenta."""
+    anulacion = "Anulación " if debe < 0 or haber < 0 else ""
+    if tipo == 'entrega':
+        return f"{anulacion}Entrega Nota de Pedido #{referencia_id}"
+    return f"{anulacion}Pago Comprobante #{referencia_id}"
+
+
+def id_cliente(nombre):
+    """ID del cliente con ese nombre (o None)."""
+    fila = consultas.uno(presupuesto_backend.conexion(), "cliente_por_nombre", (nombre,))
+    return fila[0] if fila else None
+
+
+def saldo_actual(cliente_id):
+    """Saldo de hoy del cliente (positivo: el cliente debe)."""
+    fila = consultas.uno(presupuesto_backend.conexion(), "saldo_actual_cliente", (cliente_id,))
+    return round(fila[0], 2) if fila else 0.0
+
+
+def saldo_a_fecha(cliente_id, fecha=None):
+    """Saldo del cliente al terminar el día 'fecha' (date o AAAA-MM-DD; por defecto hoy)."""
+    fecha = _iso(fecha) or datetime.date.today().isoformat()
+    return consultas.uno(presupuesto_backend.conexion(), "saldo_cliente_a_fecha", (cliente_id, fecha))[0]
+
+
+def estado_de_cuenta(cliente_id, desde=None, hasta=None):
+    """
+    Estado de cuenta del cliente entre 'desde' y 'hasta' (date o AAAA-MM-DD, inclusive; sin límites, toda la historia).
+    Devuelve (saldo_inicial, movimientos, saldo_final); cada movimiento: (fecha, concepto, debe, haber, saldo).
+    """
+    conn = presupuesto_backend.conexion()
+    desde, hasta = _iso(desde) or FECHA_MINIMA, _iso(hasta) or FECHA_MAXIMA
+    saldo_inicial = 0.0
+    if desde != FECHA_MINIMA:
+        dia_anterior = (datetime.date.fromisoformat(desde) - datetime.timedelta(days=1)).isoformat()
+        saldo_inicial = consultas.uno(conn, "saldo_cliente_a_fecha", (cliente_id, dia_anterior))[0]
+    movimientos = [(fecha, _concepto(tipo, referencia_id, debe, haber), debe, haber, saldo)
+                   for fecha, tipo, referencia_id, debe, haber, saldo
+                   in consultas.todos(conn, "estado_de_cuenta", (cliente_id, desde, hasta, saldo_inicial))]
+    return saldo_inicial, movimientos, movimientos[-1][4] if movimientos else saldo_inicial
+
+
+def antiguedad_saldos(fecha_corte=None, cliente_id=None):
+    """
+    Deuda de cada cliente a 'fecha_corte' (por defecto hoy) por antigüedad, imputando los pagos a las
+    entregas más antiguas. Cada fila: (cliente_id, nombre, 0-30, 31-60, 61-90, +90, total), de mayor a menor deuda.
+    """
+    fecha_corte = _iso(fecha_corte) or datetime.date.today().isoformat()
+    conn = presupuesto_backend.conexion()
+    if cliente_id is None:
+        return consultas.todos(conn, "antiguedad_saldos", (fecha_corte,))
+    return consultas.todos(conn, "antiguedad_saldo_cliente", (fecha_corte, cliente_id))
+
+
+def generar_cierres(hasta=None):
+    """
+    Genera (o regenera) los cierres mensuales de todos los clientes hasta 'hasta' (por defecto el último
+    día del mes anterior). Devuelve la cantidad de cierres escritos.
+    """
+    if hasta is None:
+        hasta = datetime.date.today().replace(day=1) - datetime.timedelta(days=1)
+    conn = presupuesto_backend.conexion()
+    with conn:
+        cierres = consultas.ejecutar(conn, "generar_cierres_cuenta_corriente", (_iso(hasta),)).rowcount
+    log.info("%d cierres de cuenta corriente generados hasta %s.", cierres, _iso(hasta))
+    return cierres
+
+
+def reconstruir():
+    """Vuelve a armar toda la cuenta corriente desde las notas entregadas y los comprobantes, con sus cierres."""
+    conn = presupuesto_backend.conexion()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        presupuesto_backend._reconstruir_cuenta_corriente(conn.cursor())
+        asientos = conn.execute("SELECT COUNT(*) FROM cuenta_corriente").fetchone()[0]
+    log.info("Cuenta corriente reconstruida: %d asientos.", asientos)
+    generar_cierres()
+    return asientos
+
+
+def _imprimir_estado(nombre, desde, hasta):
+    cliente_id = id_cliente(nombre)
+    if cliente_id is None:
+        print(f"❌ Cliente '{nombre}' no encontrado.")
+        return False
+    saldo_inicial, movimientos, saldo_final = estado_de_cuenta(cliente_id, desde, hasta)
+    print(f"Estado de cuenta de {nombre}")
+    print(f"{'':<12} {'Saldo inicial':<45} {'':>12} {'':>12} {saldo_inicial:>12.2f}")
+    for fecha, concepto, debe, haber, saldo in movimientos:
+        print(f"{fecha:<12} {concepto:<45} {f'{debe:.2f}' if debe else '':>12} {f'{haber:.2f}' if haber else '':>12} {saldo:>12.2f}")
+    print(f"{'':<12} {'Saldo final':<45} {'':>12} {'':>12} {saldo_final:>12.2f}")
+    return True
+
+
+def _imprimir_antiguedad(fecha_corte):
+    print(f"{'Cliente':<30} " + " ".join(f"{tramo:>12}" for tramo in TRAMOS_ANTIGUEDAD) + f" {'Total':>12}")
+    for _, nombre, *importes in antiguedad_saldos(fecha_corte):
+        print(f"{nombre:<30} " + " ".join(f"{importe:>12.2f}" for importe in importes))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cuenta corriente de clientes: estados de cuenta, antigüedad de saldos y cierres.")
+    parser.add_argument("operacion", choices=['estado', 'antiguedad', 'cierres', 'reconstruir'])
+    parser.add_argument("--cliente", help="Para 'estado': nombre del cliente.")
+    parser.add_argument("--desde", help="Para 'estado': fecha inicial (AAAA-MM-DD).")
+    parser.add_argument("--hasta", help="Para 'estado' y 'cierres': fecha final (AAAA-MM-DD).")
+    parser.add_argument("--fecha", help="Para 'antiguedad': fecha de corte (AAAA-MM-DD, por defecto hoy).")
+    args = parser.parse_args()
+
+    presupuesto_backend.inicializar_base_de_datos()
+    if args.operacion == 'estado':
+        if not args.cliente:
+            parser.error("'estado' necesita --cliente.")
+        raise SystemExit(0 if _imprimir_estado(args.cliente, args.desde, args.hasta) else 1)
+    elif args.operacion == 'antiguedad':
+        _imprimir_antiguedad(args.fecha)
+    elif args.operacion == 'cierres':
+        print(f"✅ {generar_cierres(args.hasta)} cierres generados.")
+    else:
+        print(f"✅ Cuenta corriente reconstruida: {reconstruir()} asientos.")
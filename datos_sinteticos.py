@@ -0,0 +1,215 @@
+import argparse
+import datetime
+import os
+import random
+import time
+
+import presupuesto_backend
+
+# --- Generador de datos sintéticos ---
+# Llena una base con clientes, productos (con sus precios por escala), presupuestos, notas de pedido
+# con sus líneas de detalle y comprobantes. Con la misma semilla y escala siempre genera los mismos
+# datos, así los benchmarks son comparables entre corridas.
+# La 'escala' es la cantidad de líneas de detalle por módulo; el resto de las tablas se dimensiona a partir de ella.
+
+ESTADOS_PEDIDO = ['pendiente', 'aprobada', 'entregada', 'cancelada']
+ESTADOS_PRESUPUESTO = ['borrador', 'aprobado', 'facturado', 'rechazado']
+TIPOS_ENTREGA = ['Retiro por mostrador', 'Pedido para envio']
+CUENTAS = ['CBU-0001', 'CBU-0002', 'CVU-0003', 'CTA-0004']
+LOCALIDADES = ['Quilmes', 'Avellaneda', 'Lanús', 'Lomas de Zamora', 'Berazategui', 'Florencio Varela', 'CABA']
+RUBROS = ['ACELERADOR', 'RESINA', 'FIBRA', 'GELCOAT', 'CATALIZADOR', 'PIGMENTO', 'SOLVENTE', 'MASILLA']
+
+# Factor de cada precio por escala sobre el precio unitario (precio_1), de menor a mayor cantidad
+FACTORES_PRECIO = [
+    ('precio_0_1', 1.13),
+    ('precio_1', 1.0),
+    ('precio_5', 0.92),
+    ('precio_10', 0.87),
+    ('precio_25', 0.76),
+    ('precio_tambor_rollo', 0.68),
+]
+
+TAMANO_LOTE = 50_000 # Filas por executemany, para no armar listas enormes en memoria
+
+
+def dimensiones(escala, lineas_por_documento=20):
+    """Cantidad de filas que genera cada tabla para una escala dada."""
+    documentos = max(1, escala // lineas_por_documento)
+    return {
+        'clientes': max(50, min(documentos // 10, 200_000)),
+        'productos': max(100, min(escala // 50, 50_000)),
+        'notas_pedido': documentos,
+        'presupuestos': documentos,
+        'detalle_pedido': documentos * lineas_por_documento,
+        'detalle_presupuesto': documentos * lineas_por_documento,
+        'comprobantes': max(1, documentos // 2),
+    }
+
+
+def _en_lotes(filas, cursor, sql):
+    """Inserta un iterable de filas con executemany en bloques de TAMANO_LOTE."""
+    lote = []
+    for fila in filas:
+        lote.append(fila)
+        if len(lote) >= TAMANO_LOTE:
+            cursor.executemany(sql, lote)
+            lote.clear()
+    if lote:
+        cursor.executemany(sql, lote)
+
+
+def _precios_producto(rnd):
+    """Costo y precios por escala (sin IVA) de un producto, con precios decrecientes por cantidad."""
+    precio_unitario = round(rnd.uniform(2, 120), 4)
+    costo = round(precio_unitario * rnd.uniform(0.45, 0.7), 4)
+    return [costo] + [round(precio_unitario * factor, 4) for _, factor in FACTORES_PRECIO]
+
+
+def generar_base(db_path, escala, lineas_por_documento=20, anios=1, semilla=42, hasta=datetime.date(2024, 12, 31)):
+    """
+    Crea (o completa) la base 'db_path' con datos sintéticos. Las fechas se reparten en los 'anios'
+    años anteriores a 'hasta'. Los triggers de totales se quitan durante la carga y los totales de las
+    cabeceras se calculan al final en una sola pasada, que es mucho más rápido que fila por fila.
+    La carga tampoco se anota en registro_cambios, y la cuenta corriente se arma al final de una vez.
+    Devuelve un diccionario con la cantidad de filas por tabla y los segundos de carga.
+    """
+    rnd = random.Random(semilla)
+    tamanos = dimensiones(escala, lineas_por_documento)
+    dias = anios * 365
+    fechas = [(hasta - datetime.timedelta(days=i)).isoformat() for i in range(dias)]
+
+    db_anterior = presupuesto_backend.DB_PATH
+    presupuesto_backend.DB_PATH = db_path
+    try:
+        presupuesto_backend.inicializar_base_de_datos()
+        conn = presupuesto_backend.conectar()
+    finally:
+        presupuesto_backend.DB_PATH = db_anterior
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA journal_mode = WAL")
+    cursor.execute("PRAGMA synchronous = OFF")
+    inicio = time.perf_counter()
+
+    for _, tabla_detalle, _ in presupuesto_backend.TABLAS_CON_TOTALES:
+        for evento in ('insert', 'update', 'delete'):
+            cursor.execute(f"DROP TRIGGER IF EXISTS trg_{tabla_detalle}_{evento}")
+    presupuesto_backend._quitar_triggers_registro(cursor) # La carga inicial no se anota en registro_cambios
+    presupuesto_backend._quitar_triggers_cuenta_corriente(cursor) # Se reconstruye al final, ya con los totales
+
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM clientes")
+    primer_cliente = cursor.fetchone()[0] + 1
+    _en_lotes(((f"Cliente {semilla}-{i}", f"20-{i:08d}-{i % 10}", f"Razón Social {i} S.A.")
+               for i in range(primer_cliente, primer_cliente + tamanos['clientes'])),
+              cursor, "INSERT INTO clientes (nombre, cuit, razon_social) VALUES (?, ?, ?)")
+
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM productos")
+    primer_producto = cursor.fetchone()[0] + 1
+    columnas_precio = ", ".join(['costo_base'] + [columna for columna, _ in FACTORES_PRECIO])
+    _en_lotes(([f"SKU-{semilla}-{i:06d}", f"{rnd.choice(RUBROS)} {i} {rnd.choice(['1 KG', '5 KG', '20 KG', 'X LT'])}",
+                rnd.randint(0, 500), 0] + _precios_producto(rnd)
+               for i in range(primer_producto, primer_producto + tamanos['productos'])),
+              cursor, f"""INSERT INTO productos (codigo, descripcion, stock_disponible, stock_reservado, {columnas_precio})
+                          VALUES (?, ?, ?, ?, {', '.join('?' * (len(FACTORES_PRECIO) + 1))})""")
+    cursor.execute("SELECT id, precio_1 FROM productos WHERE id >= ?", (primer_producto,))
+    productos = cursor.fetchall()
+
+    def cliente_al_azar():
+        return rnd.randint(primer_cliente, primer_cliente + tamanos['clientes'] - 1)
+
+    def lineas(primer_documento, cantidad_documentos):
+        for documento in range(primer_documento, primer_documento + cantidad_documentos):
+            for producto_id, precio in rnd.sample(productos, min(lineas_por_documento, len(productos))):
+                yield documento, producto_id, rnd.randint(1, 50), precio
+
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM notas_pedido")
+    primer_pedido = cursor.fetchone()[0] + 1
+    def cabecera_pedido():
+        tipo_entrega = rnd.choice(TIPOS_ENTREGA)
+        envio = tipo_entrega == 'Pedido para envio'
+        cliente, fecha = cliente_al_azar(), rnd.choice(fechas)
+        altura = rnd.randint(1, 9999) if envio else None # La localidad sale de la altura, para no cambiar la secuencia aleatoria
+        return (cliente, fecha, tipo_entrega,
+                f"Calle {altura}, {LOCALIDADES[altura % len(LOCALIDADES)]}" if envio else None,
+                f"11{rnd.randint(10_000_000, 99_999_999)}" if envio else None,
+                rnd.choice(ESTADOS_PEDIDO))
+    _en_lotes((cabecera_pedido() for _ in range(tamanos['notas_pedido'])), cursor,
+              """INSERT INTO notas_pedido (cliente_id, fecha_creacion, tipo_entrega, direccion_envio, telefono_contacto, estado)
+                 VALUES (?, ?, ?, ?, ?, ?)""")
+    _en_lotes(lineas(primer_pedido, tamanos['notas_pedido']), cursor,
+              "INSERT INTO detalle_pedido (nota_pedido_id, producto_id, cantidad, precio_unitario) VALUES (?, ?, ?, ?)")
+
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM presupuestos")
+    primer_presupuesto = cursor.fetchone()[0] + 1
+    _en_lotes(((cliente_al_azar(), rnd.choice(fechas), rnd.choice(ESTADOS_PRESUPUESTO)) for _ in range(tamanos['presupuestos'])),
+              cursor, "INSERT INTO presupuestos (cliente_id, fecha_creacion, estado) VALUES (?, ?, ?)")
+    _en_lotes(lineas(primer_presupuesto, tamanos['presupuestos']), cursor,
+              "INSERT INTO detalle_presupuesto (presupuesto_id, producto_id, cantidad, precio_unitario) VALUES (?, ?, ?, ?)")
+
+    def comprobante(i):
+        fecha = datetime.date.fromisoformat(rnd.choice(fechas))
+        return (f"OP-{semilla}-{i:09d}", fecha.strftime('%d/%m/%Y'), round(rnd.uniform(50, 50_000), 2),
+                rnd.choice(CUENTAS), cliente_al_azar())
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM comprobantes")
+    primer_comprobante = cursor.fetchone()[0] + 1
+    _en_lotes((comprobante(i) for i in range(primer_comprobante, primer_comprobante + tamanos['comprobantes'])),
+              cursor, "INSERT INTO comprobantes (nro_operacion, fecha, importe, cuenta, cliente_id) VALUES (?, ?, ?, ?, ?)")
+
+    presupuesto_backend._stock_inicial_en_movimientos(cursor) # El stock cargado entra como movimiento 'ajuste'
+    presupuesto_backend._reconstruir_totales(cursor)
+    for tabla_cabecera, tabla_detalle, columna_fk in presupuesto_backend.TABLAS_CON_TOTALES:
+        presupuesto_backend._crear_triggers_totales(cursor, tabla_detalle, tabla_cabecera, columna_fk)
+    for tabla in presupuesto_backend.TABLAS_CON_REGISTRO:
+        presupuesto_backend._crear_triggers_registro(cursor, tabla)
+    presupuesto_backend._reconstruir_cuenta_corriente(cursor)
+    presupuesto_backend._crear_triggers_cuenta_corriente(cursor)
+    conn.commit()
+    cursor.execute("ANALYZE")
+    conn.close()
+
+    tamanos['segundos'] = round(time.perf_counter() - inicio, 2)
+    return tamanos
+
+
+def generar_csv_precios(ruta_csv, cantidad_productos, semilla=42):
+    """
+    Escribe una lista de precios con el formato que espera import_data_to_sql.py
+    (separador ';', decimal ',', precios con IVA incluido). Devuelve la ruta.
+    """
+    rnd = random.Random(semilla)
+    encabezado = ['PRODUCTOS', 'COSTO', '0,1', '1', '5', '10', '25', 'tambor - rollo']
+    with open(ruta_csv, 'w', encoding='latin-1', newline='') as archivo:
+        archivo.write(';'.join(encabezado) + '\n')
+        for i in range(cantidad_productos):
+            precios = [f"{precio * (1 + presupuesto_backend.IVA_RATE):.2f}".replace('.', ',') for precio in _precios_producto(rnd)]
+            archivo.write(';'.join([f"{rnd.choice(RUBROS)} {i}"] + precios) + '\n')
+    return ruta_csv
+
+
+def texto_comprobante(rnd, i):
+    """Texto con el formato de un comprobante de transferencia, como el que devuelve el OCR."""
+    return (f"Comprobante de transferencia\nNro. Operación: OP-{i:09d}\n"
+            f"Fecha: {rnd.randint(1, 28):02d}/{rnd.randint(1, 12):02d}/2024\n"
+            f"Importe: $ {rnd.randint(100, 999)}.{rnd.randint(0, 999):03d},{rnd.randint(0, 99):02d}\n"
+            f"Cuenta: {rnd.choice(CUENTAS)}\nConcepto: Varios\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera una base de presupuestos con datos sintéticos.")
+    parser.add_argument("destino", help="Archivo .db a crear o completar (nunca usar presupuestos.db de producción).")
+    parser.add_argument("--escala", type=int, default=10_000, help="Líneas de detalle por módulo (10k a 10M).")
+    parser.add_argument("--lineas", type=int, default=20, help="Líneas por presupuesto / nota de pedido.")
+    parser.add_argument("--anios", type=int, default=1, help="Años de historia a generar.")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--csv-precios", help="Además, escribir una lista de precios sintética en este CSV.")
+    args = parser.parse_args()
+
+    if os.path.abspath(args.destino) == os.path.abspath(presupuesto_backend.DB_PATH):
+        print(f"❌ No se generan datos sintéticos sobre '{presupuesto_backend.DB_PATH}'. Elija otro archivo.")
+        raise SystemExit(1)
+
+    resultado = generar_base(args.destino, args.escala, args.lineas, args.anios, args.semilla)
+    for tabla, valor in resultado.items():
+        print(f"  {tabla:<22} {valor:>12,}")
+    if args.csv_precios:
+        generar_csv_precios(args.csv_precios, resultado['productos'], args.semilla)
+        print(f"✅ Lista de precios sintética guardada en '{args.csv_precios}'.")
@@ -0,0 +1,269 @@
+import bisect
+import collections
+import datetime
+import functools
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.getLogger(__name__)
+
+# --- Detección de comprobantes posiblemente duplicados ---
+# guardar_comprobante solo rechaza un nro_operacion idéntico, pero el OCR suele leer mal algún carácter
+# del número y la misma transferencia vuelve a entrar como otra. IndiceComprobantes guarda los comprobantes
+# en tres índices en memoria, todos con búsqueda sin recorrer la tabla:
+#  - por número de operación normalizado (confusiones típicas del OCR: O/0, I/l/1, S/5, B/8...): diccionario;
+#  - por datos: (importe en centavos, cuenta normalizada) -> lista ordenada por día; la ventana de
+#    ±TOLERANCIA_DIAS alrededor de la fecha se busca con bisect, O(log n);
+#  - por imagen: hash perceptual (pHash: signo de las frecuencias bajas de la DCT) de la imagen o de la
+#    primera página del PDF, partido en BANDAS baldes por día. Dos hashes a distancia de Hamming
+#    <= UMBRAL_HAMMING < BANDAS coinciden exactamente en al menos una banda (principio del palomar), así que
+#    solo se comparan los comprobantes de fecha cercana que comparten algún balde (o, si no se leyó la
+#    fecha, todos los que comparten algún balde).
+#    Un hash perceptual ve casi iguales dos comprobantes del mismo banco que solo difieren en los números,
+#    así que la imagen sola no alcanza: además tiene que coincidir el importe o el número de operación con
+#    a lo sumo DISTANCIA_MAXIMA_NRO caracteres mal leídos.
+
+TOLERANCIA_DIAS = 1 # Diferencia de fechas aceptada para considerar dos comprobantes con igual importe y cuenta
+LADO_MINIATURA = 32 # La DCT se calcula sobre una miniatura de LADO_MINIATURA x LADO_MINIATURA píxeles
+LADO_HASH = 8 # El hash usa las LADO_HASH x LADO_HASH frecuencias más bajas: LADO_HASH * LADO_HASH bits
+BANDAS = 8 # Baldes del índice por imagen (bits por banda = LADO_HASH * LADO_HASH / BANDAS)
+UMBRAL_HAMMING = 7 # Bits distintos aceptados entre dos hashes de la misma imagen; debe ser menor que BANDAS
+DISTANCIA_MAXIMA_NRO = 2 # Caracteres mal leídos aceptados en el número de operación de dos imágenes parecidas
+EXTENSIONES_IMAGEN = ('.png', '.jpg', '.jpeg')
+TRABAJADORES_HASH = min(4, os.cpu_count() or 1) # Hilos para los hashes de un lote (PIL y numpy liberan el GIL)
+
+BITS_HASH = LADO_HASH * LADO_HASH
+BITS_BANDA = BITS_HASH // BANDAS
+_MASCARA_BANDA = (1 << BITS_BANDA) - 1
+_BALDES_POR_DIA = BANDAS << BITS_BANDA
+_CONFUSIONES_OCR = str.maketrans("OQDILSZBG", "000115286")
+_NO_ALFANUMERICO = re.compile(r'[^0-9A-Z]')
+
+# Una coincidencia: 'clave' del comprobante encontrado (id en la base, o lo que use quien arma el índice),
+# 'motivos' ('nro_operacion', 'datos', 'imagen') y la distancia de Hamming entre las imágenes (o None).
+Coincidencia = collections.namedtuple('Coincidencia', 'clave motivos distancia_imagen')
+
+
+def normalizar_nro_operacion(nro_operacion):
+    """Número de operación sin separadores y con las letras que el OCR confunde con dígitos ya reemplazadas."""
+    if not nro_operacion:
+        return None
+    return _NO_ALFANUMERICO.sub('', str(nro_operacion).upper()).translate(_CONFUSIONES_OCR) or None
+
+
+def normalizar_cuenta(cuenta):
+    return _NO_ALFANUMERICO.sub('', str(cuenta).upper()) if cuenta else None
+
+
+def centavos(importe):
+    return None if importe is None else round(float(importe) * 100)
+
+
+def distancia_edicion(a, b, maximo=DISTANCIA_MAXIMA_NRO):
+    """Distancia de Levenshtein entre 'a' y 'b', o maximo + 1 en cuanto se sabe que la supera."""
+    if abs(len(a) - len(b)) > maximo:
+        return maximo + 1
+    # Cota inferior barata: cada edición cambia a lo sumo un carácter de más y uno de menos
+    diferencia = collections.Counter(a)
+    diferencia.subtract(b)
+    if max(sum(n for n in diferencia.values() if n > 0), -sum(n for n in diferencia.values() if n < 0)) > maximo:
+        return maximo + 1
+    anterior = list(range(len(b) + 1))
+    for i, caracter_a in enumerate(a, 1):
+        actual = [i]
+        for j, caracter_b in enumerate(b, 1):
+            actual.append(min(anterior[j] + 1, actual[j - 1] + 1, anterior[j - 1] + (caracter_a != caracter_b)))
+        if min(actual) > maximo:
+            return maximo + 1
+        anterior = actual
+    return anterior[-1]
+
+
+@functools.lru_cache(maxsize=4096) # Las fechas se repiten mucho y strptime es lo más caro de indexar un comprobante
+def dia(fecha):
+    """Número de día (ordinal) de una fecha DD/MM/AAAA, DD-MM-AAAA o AAAA-MM-DD; None si no se reconoce."""
+    if not fecha:
+        return None
+    for formato in ('%d/%m/%Y', '%d-%m-%Y', '%Y-%m-%d'):
+        try:
+            return datetime.datetime.strptime(str(fecha).strip(), formato).toordinal()
+        except ValueError:
+            continue
+    return None
+
+
+# --- Hash perceptual ---
+
+def _imagen_archivo(ruta):
+    """Imagen en escala de grises del comprobante (primera página si es PDF), decodificada a resolución reducida."""
+    from PIL import Image # Importar aquí: solo hace falta si se calcula el hash de un archivo
+    if ruta.lower().endswith('.pdf'):
+        import fitz # Importar PyMuPDF aquí para no forzar su instalación si solo se usan imágenes
+        documento = fitz.open(ruta)
+        try:
+            pixmap = documento.load_page(0).get_pixmap(matrix=fitz.Matrix(0.5, 0.5), colorspace=fitz.csGRAY, alpha=False)
+            return Image.frombytes('L', (pixmap.width, pixmap.height), pixmap.samples)
+        finally:
+            documento.close()
+    imagen = Image.open(ruta)
+    imagen.draft('L', (LADO_MINIATURA * 16, LADO_MINIATURA * 16)) # Los JPEG se decodifican directamente a menor tamaño
+    return imagen.convert('L')
+
+
+@functools.lru_cache(maxsize=1)
+def _matriz_dct():
+    import numpy as np
+    k = np.arange(LADO_MINIATURA)
+    return np.cos(np.pi * (2 * k[None, :] + 1) * k[:LADO_HASH, None] / (2 * LADO_MINIATURA))
+
+
+def hash_imagen(imagen):
+    """
+    pHash de una imagen PIL: un bit por frecuencia baja de la DCT de una miniatura, 1 si supera la mediana.
+    Antes se recorta el margen en blanco, para que el mismo comprobante con otro encuadre dé el mismo hash.
+    """
+    import numpy as np
+    from PIL import Image
+    imagen = imagen.convert('L')
+    contenido = imagen.point(lambda p: 255 if p < 128 else 0).getbbox()
+    if contenido:
+        imagen = imagen.crop(contenido)
+    miniatura = np.asarray(imagen.resize((LADO_MINIATURA, LADO_MINIATURA), Image.Resampling.BOX, reducing_gap=3.0), dtype=float)
+    dct = _matriz_dct()
+    frecuencias = (dct @ miniatura @ dct.T).ravel()
+    bits = frecuencias > np.median(frecuencias[1:]) # Sin la componente continua, que solo mide el brillo medio
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+@functools.lru_cache(maxsize=4096)
+def _hash_archivo(ruta, _modificado, _tamano):
+    return hash_imagen(_imagen_archivo(ruta))
+
+
+def hash_archivo(ruta):
+    """
+    Hash perceptual de un comprobante (imagen o PDF), o None si no es de un formato soportado.
+    Queda en caché por ruta, fecha de modificación y tamaño: revisar duplicados y después guardar no lo recalcula.
+    """
+    if not ruta or not ruta.lower().endswith(EXTENSIONES_IMAGEN + ('.pdf',)):
+        return None
+    estado = os.stat(ruta)
+    return _hash_archivo(os.path.abspath(ruta), estado.st_mtime_ns, estado.st_size)
+
+
+def _hash_o_none(ruta):
+    try:
+        return hash_archivo(ruta)
+    except Exception as e:
+        log.warning("No se pudo calcular el hash perceptual de '%s': %s", ruta, e)
+        return None
+
+
+def hashes_archivos(rutas, trabajadores=TRABAJADORES_HASH):
+    """Hashes perceptuales de varios archivos en paralelo, en el orden de 'rutas' (None si alguno falla)."""
+    rutas = list(rutas)
+    if trabajadores <= 1 or len(rutas) <= 1:
+        return [_hash_o_none(ruta) for ruta in rutas]
+    with ThreadPoolExecutor(max_workers=trabajadores, thread_name_prefix="hash") as pool:
+        return list(pool.map(_hash_o_none, rutas))
+
+
+def hash_a_texto(valor):
+    return None if valor is None else format(valor, f'0{BITS_HASH // 4}x')
+
+
+def hash_de_texto(texto):
+    return int(texto, 16) if texto else None
+
+
+def _baldes(valor):
+    """Balde de cada banda del hash: número de banda y valor de la banda en un solo entero."""
+    return [(banda << BITS_BANDA) | ((valor >> (banda * BITS_BANDA)) & _MASCARA_BANDA) for banda in range(BANDAS)]
+
+
+# --- Índice ---
+
+class IndiceComprobantes:
+    """Índices en memoria de comprobantes para encontrar posibles duplicados sin recorrer todos."""
+
+    def __init__(self, tolerancia_dias=TOLERANCIA_DIAS, umbral_hamming=UMBRAL_HAMMING):
+        if umbral_hamming >= BANDAS:
+            raise ValueError(f"El umbral de Hamming ({umbral_hamming}) debe ser menor que la cantidad de bandas ({BANDAS}).")
+        self.tolerancia_dias = tolerancia_dias
+        self.umbral_hamming = umbral_hamming
+        self.cantidad = 0
+        self._por_nro = collections.defaultdict(list) # nro normalizado -> [clave]
+        self._por_datos = collections.defaultdict(list) # (centavos, cuenta) -> [(día, orden, clave)] ordenada
+        self._por_balde = collections.defaultdict(list) # día * _BALDES_POR_DIA + balde -> [clave] (día 0: sin fecha)
+        self._por_balde_sin_dia = collections.defaultdict(list) # balde -> [clave]
+        self._hashes = {} # clave -> hash perceptual
+        self._datos = {} # clave -> (nro normalizado, centavos), para confirmar las coincidencias por imagen
+
+    @classmethod
+    def desde_filas(cls, filas, **opciones):
+        """Índice de filas (clave, nro_operacion, fecha, importe, cuenta, hash_imagen en hexadecimal o None)."""
+        indice = cls(**opciones)
+        for clave, nro_operacion, fecha, importe, cuenta, hash_texto in filas:
+            indice.agregar(clave, nro_operacion, fecha, importe, cuenta, hash_de_texto(hash_texto))
+        return indice
+
+    def agregar(self, clave, nro_operacion, fecha, importe, cuenta, hash_perceptual=None):
+        nro = normalizar_nro_operacion(nro_operacion)
+        if nro:
+            self._por_nro[nro].append(clave)
+        dia_fecha, importe_centavos = dia(fecha), centavos(importe)
+        if dia_fecha is not None and importe_centavos is not None:
+            # 'orden' desempata fechas iguales sin comparar claves (que pueden ser de tipos distintos)
+            bisect.insort(self._por_datos[(importe_centavos, normalizar_cuenta(cuenta))], (dia_fecha, self.cantidad, clave))
+        if hash_perceptual is not None:
+            self._hashes[clave] = hash_perceptual
+            self._datos[clave] = (nro, importe_centavos)
+            desplazamiento = (dia_fecha or 0) * _BALDES_POR_DIA
+            for balde in _baldes(hash_perceptual):
+                self._por_balde[desplazamiento + balde].append(clave)
+                self._por_balde_sin_dia[balde].append(clave)
+        self.cantidad += 1
+
+    def buscar(self, nro_operacion, fecha, importe, cuenta, hash_perceptual=None, excluir=None):
+        """Posibles duplicados de un comprobante (lista de Coincidencia); 'excluir' es la clave del propio comprobante si ya está en el índice."""
+        motivos = collections.defaultdict(list)
+        distancias = {}
+
+        nro = normalizar_nro_operacion(nro_operacion)
+        for clave in self._por_nro.get(nro, ()) if nro else ():
+            motivos[clave].append('nro_operacion')
+
+        dia_fecha, importe_centavos = dia(fecha), centavos(importe)
+        if dia_fecha is not None and importe_centavos is not None:
+            entradas = self._por_datos.get((importe_centavos, normalizar_cuenta(cuenta)), [])
+            desde = bisect.bisect_left(entradas, (dia_fecha - self.tolerancia_dias,))
+            hasta = bisect.bisect_left(entradas, (dia_fecha + self.tolerancia_dias + 1,))
+            for _, _, clave in entradas[desde:hasta]:
+                motivos[clave].append('datos')
+
+        if hash_perceptual is not None:
+            if dia_fecha is None:
+                baldes = [self._por_balde_sin_dia.get(balde, ()) for balde in _baldes(hash_perceptual)]
+            else:
+                desplazamientos = [0] + [dia_balde * _BALDES_POR_DIA for dia_balde in
+                                         range(dia_fecha - self.tolerancia_dias, dia_fecha + self.tolerancia_dias + 1)]
+                baldes = [self._por_balde.get(desplazamiento + balde, ()) for balde in _baldes(hash_perceptual)
+                          for desplazamiento in desplazamientos]
+            for balde in baldes:
+                for clave in balde:
+                    if clave in distancias:
+                        continue
+                    distancias[clave] = (self._hashes[clave] ^ hash_perceptual).bit_count()
+                    if distancias[clave] <= self.umbral_hamming and self._confirma_imagen(clave, nro, importe_centavos):
+                        motivos[clave].append('imagen')
+
+        return [Coincidencia(clave, tuple(lista), distancias.get(clave) if 'imagen' in lista else None)
+                for clave, lista in motivos.items() if clave != excluir]
+
+    def _confirma_imagen(self, clave, nro, importe_centavos):
+        nro_guardado, centavos_guardado = self._datos[clave]
+        if importe_centavos is not None and importe_centavos == centavos_guardado:
+            return True
+        return bool(nro and nro_guardado) and distancia_edicion(nro, nro_guardado) <= DISTANCIA_MAXIMA_NRO
@@ -0,0 +1,175 @@
+import argparse
+import csv
+import json
+import logging
+import unicodedata
+
+import consultas
+import presupuesto_backend
+
+log = logging.getLogger(__name__)
+
+# --- Expedición ---
+# Lo que necesita el depósito para preparar los pedidos:
+#  - lista_de_picking(): cuánto sacar de cada producto para todas las notas aprobadas (o para algunas, por
+#    ejemplo las de una zona), sumado en una sola consulta en lugar de recorrer nota por nota.
+#  - ColaExpedicion: las notas pendientes y aprobadas en memoria, agrupadas por zona de entrega. refrescar()
+#    no vuelve a leer toda la cola: con PRAGMA data_version sabe si alguien escribió en la base desde la
+#    última vez y, si escribió, relee solo las notas que aparecen en registro_cambios después del último
+#    cambio visto.
+# La zona de un envío es la localidad, lo que sigue a la última coma de la dirección ("Calle 123, Quilmes");
+# los retiros por mostrador van todos a ZONA_MOSTRADOR.
+
+TIPO_ENVIO = 'Pedido para envio'
+ZONA_MOSTRADOR = "MOSTRADOR"
+ZONA_SIN_LOCALIDAD = "SIN ZONA" # Envíos cuya dirección no tiene localidad
+REFRESCO_MS = 2000 # Cada cuánto refresca la cola la ventana de expedición
+COLUMNAS_COLA = ['id', 'cliente', 'fecha', 'tipo_entrega', 'direccion', 'telefono', 'estado', 'total_con_iva',
+                 'lineas', 'unidades', 'zona']
+COLUMNAS_PICKING = ['codigo', 'descripcion', 'cantidad', 'notas', 'disponible', 'reservado']
+
+
+def _normalizar_zona(texto):
+    """Nombre de zona en mayúsculas, sin acentos ni espacios de más."""
+    texto = unicodedata.normalize('NFKD', texto)
+    return " ".join("".join(c for c in texto if not unicodedata.combining(c)).upper().split())
+
+
+def zona(tipo_entrega, direccion):
+    """Zona de entrega de una nota: la localidad de su dirección, o ZONA_MOSTRADOR si no es un envío."""
+    if tipo_entrega != TIPO_ENVIO:
+        return ZONA_MOSTRADOR
+    if not direccion or ',' not in direccion:
+        return ZONA_SIN_LOCALIDAD
+    return _normalizar_zona(direccion.rsplit(',', 1)[1]) or ZONA_SIN_LOCALIDAD
+
+
+def lista_de_picking(notas=None):
+    """
+    Productos a preparar para las notas aprobadas (todas, o solo las de IDs en 'notas'), sumados por producto.
+    Cada fila: (codigo, descripcion, cantidad, notas, disponible, reservado), por código.
+    """
+    conn = presupuesto_backend.conexion()
+    if notas is None:
+        return consultas.todos(conn, "lista_picking")
+    return consultas.todos(conn, "lista_picking_notas", (json.dumps(sorted(notas)),))
+
+
+def exportar_picking(ruta, notas=None):
+    """Escribe la lista de picking en un CSV. Devuelve la cantidad de productos."""
+    filas = lista_de_picking(notas)
+    with open(ruta, "w", newline="", encoding="utf-8-sig") as archivo:
+        escritor = csv.writer(archivo, delimiter=';')
+        escritor.writerow(COLUMNAS_PICKING)
+        escritor.writerows(filas)
+    return len(filas)
+
+
+class ColaExpedicion:
+    """Notas pendientes y aprobadas en memoria, agrupadas por zona, que se refrescan leyendo solo lo que cambió."""
+
+    def __init__(self):
+        self.notas = {} # ID -> fila con COLUMNAS_COLA
+        self._conn = None
+        self._db_path = None
+        self._version = None # PRAGMA data_version del último refresco
+        self._ultimo_cambio = None # ID de registro_cambios hasta el que está al día la cola
+
+    def _conexion(self):
+        """
+        Conexión propia de la cola (se reabre si cambia DB_PATH): data_version solo cambia con escrituras
+        de otras conexiones, así que no puede ser la de la aplicación.
+        """
+        if self._conn is None or self._db_path != presupuesto_backend.DB_PATH:
+            self.cerrar()
+            self._conn = presupuesto_backend.conectar()
+            self._db_path = presupuesto_backend.DB_PATH
+        return self._conn
+
+    def cerrar(self):
+        if self._conn is not None:
+            self._conn.close()
+        self._conn, self._version, self._ultimo_cambio = None, None, None
+
+    def refrescar(self, completo=False):
+        """
+        Pone la cola al día. Devuelve (cambiadas, quitadas): los IDs de las notas nuevas o modificadas que
+        están en la cola y los de las que salieron (entregadas, canceladas o borradas).
+        Con completo=True (o la primera vez) relee todas las notas abiertas.
+        """
+        conn = self._conexion()
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if not completo and self._ultimo_cambio is not None and version == self._version:
+            return set(), set()
+        self._version = version
+        ultimo = consultas.uno(conn, "ultimo_cambio_registro")[0]
+
+        if completo or self._ultimo_cambio is None or ultimo < self._ultimo_cambio: # Registro restaurado
+            anteriores = set(self.notas)
+            self.notas = {fila[0]: fila + (zona(fila[3], fila[4]),) for fila in consultas.todos(conn, "cola_expedicion")}
+            self._ultimo_cambio = ultimo
+            return set(self.notas), anteriores - set(self.notas)
+
+        tocadas = {nota_id for (nota_id,) in consultas.todos(conn, "notas_cambiadas_desde", (self._ultimo_cambio, ultimo))
+                   if nota_id is not None}
+        self._ultimo_cambio = ultimo
+        if not tocadas:
+            return set(), set()
+        filas = consultas.todos(conn, "cola_expedicion_notas", (json.dumps(sorted(tocadas)),))
+        cambiadas = set()
+        for fila in filas:
+            self.notas[fila[0]] = fila + (zona(fila[3], fila[4]),)
+            cambiadas.add(fila[0])
+        quitadas = {nota_id for nota_id in tocadas - cambiadas if self.notas.pop(nota_id, None) is not None}
+        return cambiadas, quitadas
+
+    def zonas(self):
+        """{zona: [filas de la cola]} con las notas de cada zona de la más antigua a la más nueva."""
+        por_zona = {}
+        for fila in sorted(self.notas.values(), key=lambda fila: (fila[2], fila[0])):
+            por_zona.setdefault(fila[-1], []).append(fila)
+        return dict(sorted(por_zona.items()))
+
+    def aprobadas(self, zona_entrega=None):
+        """IDs de las notas aprobadas de la cola (solo las de 'zona_entrega' si se indica), para la lista de picking."""
+        return [fila[0] for fila in self.notas.values()
+                if fila[6] == 'aprobada' and (zona_entrega is None or fila[-1] == zona_entrega)]
+
+
+def _imprimir_cola():
+    cola = ColaExpedicion()
+    cola.refrescar()
+    for nombre_zona, filas in cola.zonas().items():
+        print(f"\n{nombre_zona} ({len(filas)} notas, {sum(fila[9] for fila in filas)} unidades)")
+        for nota_id, cliente, fecha, _, direccion, _, estado, _, lineas, unidades, _ in filas:
+            print(f"  #{nota_id:<7} {fecha:<12} {estado:<10} {lineas:>4} líneas {unidades:>6} u.  {cliente:<25} {direccion or ''}")
+    cola.cerrar()
+
+
+def _imprimir_picking(zona_entrega, ruta):
+    notas = None
+    if zona_entrega:
+        cola = ColaExpedicion()
+        cola.refrescar()
+        notas = cola.aprobadas(_normalizar_zona(zona_entrega))
+        cola.cerrar()
+    if ruta:
+        print(f"✅ Lista de picking con {exportar_picking(ruta, notas)} productos en '{ruta}'.")
+        return
+    print(f"{'Código':<20} {'Cantidad':>9} {'Notas':>6} {'Disp.':>7} {'Reserv.':>8}  Descripción")
+    for codigo, descripcion, cantidad, cantidad_notas, disponible, reservado in lista_de_picking(notas):
+        print(f"{codigo:<20} {cantidad:>9} {cantidad_notas:>6} {disponible:>7} {reservado:>8}  {descripcion}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Expedición: cola de notas por zona y listas de picking consolidadas.")
+    parser.add_argument("operacion", choices=['cola', 'picking'])
+    parser.add_argument("--zona", help="Para 'picking': solo las notas aprobadas de esa zona (localidad o MOSTRADOR).")
+    parser.add_argument("--csv", help="Para 'picking': escribir la lista en este archivo CSV.")
+    args = parser.parse_args()
+
+    presupuesto_backend.inicializar_base_de_datos()
+    if args.operacion == 'cola':
+        _imprimir_cola()
+    else:
+        _imprimir_picking(args.zona, args.csv)
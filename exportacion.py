@@ -0,0 +1,324 @@
+import argparse
+import csv
+import datetime
+import gzip
+import json
+import os
+import sqlite3
+
+import pandas as pd
+
+import presupuesto_backend
+
+# --- Exportación de snapshots (Parquet / CSV) ---
+# Copia tablas de presupuestos.db (o las vistas que se suben a Google Sheets) a archivos para
+# reportes sin conexión. Se lee con fetchmany() en bloques de TAMANO_BLOQUE filas y cada bloque
+# se escribe apenas se lee, así la memoria no depende del tamaño de la tabla.
+#
+# Cada fuente se guarda en su carpeta como una serie de partes (pedidos-00001.parquet, ...) y un
+# manifiesto.json anota qué filas tiene cada parte. Un snapshot incremental solo agrega una parte
+# con las filas de rowid (o ID de la vista) mayor al último exportado. Las tablas no tienen fecha
+# de modificación: las filas que se editaron después de exportarse solo se actualizan con un
+# snapshot completo.
+#
+# Para leer los snapshots: leer_snapshot() / iterar_snapshot() devuelven DataFrames, y
+# base_en_memoria() arma una base SQLite en memoria sobre la que corren las mismas consultas que
+# sobre presupuestos.db (la usa analisis_ventas.py con --snapshot).
+
+CARPETA_SNAPSHOTS = "snapshots"
+MANIFIESTO = "manifiesto.json"
+TAMANO_BLOQUE = 100_000 # Filas por fetchmany() y por bloque escrito
+FORMATOS = ('parquet', 'csv')
+COMPRESIONES = {'parquet': ('zstd', 'snappy', 'gzip', 'none'), 'csv': ('gzip', 'none')}
+
+# Tablas internas de la app que no tiene sentido exportar
+TABLAS_EXCLUIDAS = {'sheets_cola', 'sheets_base'}
+
+# Vistas exportables: nombre -> (módulo de MODULOS_SHEETS con la consulta, columna con el ID creciente)
+VISTAS = {
+    'vista_pedidos': ('pedidos', 'ID_Pedido'),
+    'vista_presupuestos': ('presupuestos', 'ID_Presupuesto'),
+}
+
+
+def fuentes_disponibles(conn):
+    """{nombre: (consulta, incremental)} de las tablas de la base y de las vistas exportables."""
+    fuentes = {}
+    tablas = conn.execute("""SELECT name, wr FROM pragma_table_list
+                             WHERE schema = 'main' AND type = 'table' AND name NOT LIKE 'sqlite_%'
+                             ORDER BY name""").fetchall()
+    for tabla, sin_rowid in tablas:
+        if tabla in TABLAS_EXCLUIDAS:
+            continue
+        if sin_rowid:
+            fuentes[tabla] = (f"SELECT NULL, * FROM {tabla}", False)
+        else:
+            fuentes[tabla] = (f"SELECT rowid, * FROM {tabla} WHERE rowid > ? ORDER BY rowid", True)
+    for vista, (modulo, columna_id) in VISTAS.items():
+        query = presupuesto_backend.MODULOS_SHEETS[modulo][1]
+        fuentes[vista] = (f"SELECT v.{columna_id}, v.* FROM ({query}) v WHERE v.{columna_id} > ? ORDER BY v.{columna_id}", True)
+    return fuentes
+
+
+def cargar_manifiesto(carpeta=CARPETA_SNAPSHOTS):
+    ruta = os.path.join(carpeta, MANIFIESTO)
+    if not os.path.exists(ruta):
+        return {}
+    with open(ruta, encoding='utf-8') as archivo:
+        return json.load(archivo)
+
+
+def _guardar_manifiesto(manifiesto, carpeta):
+    ruta = os.path.join(carpeta, MANIFIESTO)
+    temporal = ruta + ".tmp"
+    with open(temporal, 'w', encoding='utf-8') as archivo:
+        json.dump(manifiesto, archivo, ensure_ascii=False, indent=2)
+    os.replace(temporal, ruta) # El manifiesto nunca queda a medio escribir
+
+
+def _tipo_arrow(valores):
+    """Tipo de Arrow de una columna según los valores del primer bloque (SQLite no tiene tipos por columna)."""
+    import pyarrow as pa
+    tipos = {type(valor) for valor in valores} - {type(None)}
+    if tipos and tipos <= {int, bool}:
+        return pa.int64()
+    if tipos and tipos <= {int, bool, float}:
+        return pa.float64()
+    if tipos == {bytes}:
+        return pa.binary()
+    return pa.string()
+
+
+class _EscritorParquet:
+    """Escribe bloques de filas en un archivo Parquet; el esquema sale del primer bloque."""
+
+    def __init__(self, ruta, columnas, compresion):
+        self.ruta = ruta
+        self.columnas = columnas
+        self.compresion = None if compresion == 'none' else compresion
+        self._escritor = None
+        self._esquema = None
+
+    def escribir(self, columnas_valores):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        if self._esquema is None:
+            self._esquema = pa.schema([(nombre, _tipo_arrow(valores)) for nombre, valores in zip(self.columnas, columnas_valores)])
+            self._escritor = pq.ParquetWriter(self.ruta, self._esquema, compression=self.compresion)
+        arrays = []
+        for campo, valores in zip(self._esquema, columnas_valores):
+            if pa.types.is_string(campo.type):
+                valores = [v if v is None or isinstance(v, str) else str(v) for v in valores]
+            arrays.append(pa.array(valores, type=campo.type))
+        self._escritor.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self._esquema))
+
+    def cerrar(self):
+        if self._escritor is not None:
+            self._escritor.close()
+
+
+class _EscritorCSV:
+    """Escribe bloques de filas en un CSV estándar (coma y punto decimal), opcionalmente comprimido con gzip."""
+
+    def __init__(self, ruta, columnas, compresion):
+        self.ruta = ruta
+        if compresion == 'gzip':
+            self._archivo = gzip.open(ruta, 'wt', encoding='utf-8', newline='', compresslevel=6)
+        else:
+            self._archivo = open(ruta, 'w', encoding='utf-8', newline='')
+        self._csv = csv.writer(self._archivo)
+        self._csv.writerow(columnas)
+
+    def escribir(self, columnas_valores):
+        self._csv.writerows(zip(*columnas_valores))
+
+    def cerrar(self):
+        self._archivo.close()
+
+
+def _nombre_parte(fuente, numero, formato, compresion):
+    extension = 'parquet' if formato == 'parquet' else ('csv.gz' if compresion == 'gzip' else 'csv')
+    return f"{fuente}-{numero:05d}.{extension}"
+
+
+def exportar_fuente(conn, fuente, carpeta=CARPETA_SNAPSHOTS, formato='parquet', compresion=None,
+                    incremental=False, manifiesto=None, tamano_bloque=TAMANO_BLOQUE):
+    """
+    Exporta una tabla o vista a una nueva parte del snapshot y actualiza 'manifiesto' (sin guardarlo).
+    Con incremental=True solo se exportan las filas nuevas desde la última parte; si no hay ninguna
+    no se crea archivo. Un snapshot completo reemplaza las partes anteriores de la fuente.
+    Devuelve la entrada de la parte creada ({'archivo', 'filas', 'desde', 'hasta', ...}) o None.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato inválido: '{formato}'. Opciones: {', '.join(FORMATOS)}.")
+    compresion = compresion or COMPRESIONES[formato][0]
+    if compresion not in COMPRESIONES[formato]:
+        raise ValueError(f"Compresión inválida para {formato}: '{compresion}'. Opciones: {', '.join(COMPRESIONES[formato])}.")
+
+    fuentes = fuentes_disponibles(conn)
+    if fuente not in fuentes:
+        raise ValueError(f"Fuente desconocida: '{fuente}'. Opciones: {', '.join(fuentes)}.")
+    query, admite_incremental = fuentes[fuente]
+    manifiesto = {} if manifiesto is None else manifiesto
+    anterior = manifiesto.get(fuente)
+
+    if incremental and anterior and admite_incremental and anterior['formato'] == formato:
+        desde = anterior['ultimo_id']
+        partes = anterior['partes']
+    else:
+        desde = None
+        partes = []
+    carpeta_fuente = os.path.join(carpeta, fuente)
+    os.makedirs(carpeta_fuente, exist_ok=True)
+
+    cursor = conn.cursor()
+    cursor.execute(query, (desde if desde is not None else -2**63,) if admite_incremental else ())
+    columnas = [d[0] for d in cursor.description][1:]
+    # La numeración sigue aunque sea un snapshot completo, para no pisar una parte vieja hasta terminar la nueva
+    numero = max((p['numero'] for p in (anterior or {}).get('partes', [])), default=0) + 1
+    nombre = _nombre_parte(fuente, numero, formato, compresion)
+    ruta = os.path.join(carpeta_fuente, nombre)
+
+    escritor = None
+    filas, ultimo_id = 0, desde
+    try:
+        while True:
+            bloque = cursor.fetchmany(tamano_bloque)
+            if not bloque:
+                break
+            ids, *columnas_valores = zip(*bloque)
+            if escritor is None:
+                escritor = (_EscritorParquet if formato == 'parquet' else _EscritorCSV)(ruta, columnas, compresion)
+            escritor.escribir(columnas_valores)
+            filas += len(bloque)
+            ultimo_id = ids[-1]
+    except Exception:
+        if escritor is not None:
+            escritor.cerrar()
+            os.remove(ruta)
+        raise
+    if escritor is not None:
+        escritor.cerrar()
+
+    if desde is None:
+        # Snapshot completo: las partes anteriores (de cualquier formato) ya no valen
+        for parte in (anterior or {}).get('partes', []):
+            if parte['archivo'] != nombre:
+                ruta_vieja = os.path.join(carpeta_fuente, parte['archivo'])
+                if os.path.exists(ruta_vieja):
+                    os.remove(ruta_vieja)
+
+    parte = None
+    if filas:
+        parte = {'numero': numero, 'archivo': nombre, 'filas': filas, 'desde': desde, 'hasta': ultimo_id,
+                 'creado': datetime.datetime.now().isoformat(timespec='seconds'), 'bytes': os.path.getsize(ruta)}
+        partes = partes + [parte]
+    manifiesto[fuente] = {'formato': formato, 'compresion': compresion, 'columnas': columnas,
+                          'incremental': admite_incremental, 'ultimo_id': ultimo_id, 'partes': partes}
+    return parte
+
+
+def exportar_snapshot(fuentes=None, carpeta=CARPETA_SNAPSHOTS, formato='parquet', compresion=None,
+                      incremental=False, tamano_bloque=TAMANO_BLOQUE):
+    """
+    Exporta varias fuentes (por defecto todas las tablas y vistas) y guarda el manifiesto.
+    Lee de una sola transacción, así todas las fuentes corresponden al mismo momento de la base.
+    Devuelve {fuente: parte creada o None}.
+    """
+    os.makedirs(carpeta, exist_ok=True)
+    manifiesto = cargar_manifiesto(carpeta)
+    conn = sqlite3.connect(presupuesto_backend.DB_PATH)
+    resultado = {}
+    try:
+        conn.execute("BEGIN") # Lectura consistente entre fuentes
+        for fuente in fuentes or list(fuentes_disponibles(conn)):
+            resultado[fuente] = exportar_fuente(conn, fuente, carpeta, formato, compresion, incremental, manifiesto, tamano_bloque)
+        conn.rollback()
+    finally:
+        conn.close()
+    _guardar_manifiesto(manifiesto, carpeta)
+    return resultado
+
+
+# --- Lectura de snapshots ---
+
+def _rutas_partes(fuente, carpeta):
+    manifiesto = cargar_manifiesto(carpeta)
+    if fuente not in manifiesto:
+        raise ValueError(f"No hay snapshot de '{fuente}' en '{carpeta}'.")
+    entrada = manifiesto[fuente]
+    return entrada, [os.path.join(carpeta, fuente, parte['archivo']) for parte in entrada['partes']]
+
+
+def iterar_snapshot(fuente, carpeta=CARPETA_SNAPSHOTS, columnas=None, tamano_bloque=TAMANO_BLOQUE):
+    """Recorre el snapshot de una fuente en DataFrames de hasta 'tamano_bloque' filas, sin cargarlo entero."""
+    entrada, rutas = _rutas_partes(fuente, carpeta)
+    for ruta in rutas:
+        if entrada['formato'] == 'parquet':
+            import pyarrow.parquet as pq
+            for lote in pq.ParquetFile(ruta).iter_batches(batch_size=tamano_bloque, columns=columnas):
+                yield lote.to_pandas()
+        else:
+            yield from pd.read_csv(ruta, usecols=columnas, chunksize=tamano_bloque)
+
+
+def _iterar_filas(fuente, carpeta, tamano_bloque=TAMANO_BLOQUE):
+    """Como iterar_snapshot pero en listas de tuplas con tipos de Python (los enteros con nulos siguen siendo enteros)."""
+    entrada, rutas = _rutas_partes(fuente, carpeta)
+    for ruta in rutas:
+        if entrada['formato'] == 'parquet':
+            import pyarrow.parquet as pq
+            for lote in pq.ParquetFile(ruta).iter_batches(batch_size=tamano_bloque):
+                yield list(zip(*(columna.to_pylist() for columna in lote.columns)))
+        else:
+            for df in pd.read_csv(ruta, chunksize=tamano_bloque):
+                yield list(df.astype(object).where(df.notna(), None).itertuples(index=False, name=None))
+
+
+def leer_snapshot(fuente, carpeta=CARPETA_SNAPSHOTS, columnas=None):
+    """Snapshot completo de una fuente (todas sus partes) como un DataFrame."""
+    entrada, rutas = _rutas_partes(fuente, carpeta)
+    if not rutas:
+        return pd.DataFrame(columns=columnas or entrada['columnas'])
+    if entrada['formato'] == 'parquet':
+        return pd.concat([pd.read_parquet(ruta, columns=columnas) for ruta in rutas], ignore_index=True)
+    return pd.concat([pd.read_csv(ruta, usecols=columnas) for ruta in rutas], ignore_index=True)
+
+
+def base_en_memoria(carpeta=CARPETA_SNAPSHOTS, fuentes=None):
+    """
+    Base SQLite en memoria con las tablas de un snapshot, para correr consultas de análisis sin tocar
+    presupuestos.db. Se carga bloque por bloque. Devuelve la conexión.
+    """
+    manifiesto = cargar_manifiesto(carpeta)
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    for fuente in fuentes or [f for f in manifiesto if f not in VISTAS]:
+        columnas = manifiesto[fuente]['columnas']
+        conn.execute(f"CREATE TABLE {fuente} ({', '.join(columnas)})")
+        insert = f"INSERT INTO {fuente} VALUES ({', '.join('?' * len(columnas))})"
+        for filas in _iterar_filas(fuente, carpeta):
+            conn.executemany(insert, filas)
+        if 'id' in columnas:
+            conn.execute(f"CREATE INDEX idx_{fuente}_id ON {fuente} (id)")
+    for tabla, columna in (('detalle_pedido', 'nota_pedido_id'), ('detalle_presupuesto', 'presupuesto_id')):
+        if tabla in manifiesto and (fuentes is None or tabla in fuentes):
+            conn.execute(f"CREATE INDEX idx_{tabla}_{columna} ON {tabla} ({columna})")
+    conn.commit()
+    return conn
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta snapshots de presupuestos.db a Parquet o CSV.")
+    parser.add_argument("fuentes", nargs="*", help="Tablas o vistas a exportar (por defecto, todas).")
+    parser.add_argument("--carpeta", default=CARPETA_SNAPSHOTS)
+    parser.add_argument("--formato", choices=FORMATOS, default='parquet')
+    parser.add_argument("--compresion", help="zstd, snappy, gzip o none (Parquet); gzip o none (CSV).")
+    parser.add_argument("--incremental", action="store_true", help="Solo exportar las filas nuevas desde el último snapshot.")
+    args = parser.parse_args()
+
+    for fuente, parte in exportar_snapshot(args.fuentes, args.carpeta, args.formato, args.compresion, args.incremental).items():
+        if parte:
+            print(f"  {fuente:<24} {parte['filas']:>12,} filas  -> {parte['archivo']} ({parte['bytes']:,} bytes)")
+        else:
+            print(f"  {fuente:<24} {'sin filas nuevas':>12}")
+    print(f"✅ Snapshot guardado en '{args.carpeta}'.")
@@ -0,0 +1,223 @@
+import os
+import functools
+from concurrent.futures import ProcessPoolExecutor
+
+import presupuesto_backend
+
+# PyMuPDF (fitz) ya se usa en el backend para leer comprobantes PDF; acá lo usamos para generarlos.
+import fitz
+
+# --- Configuración de los documentos ---
+EMPRESA_NOMBRE = "Presupuestos.App"
+LOGO_PATH = "logo.png" # Si no existe, el documento se genera sin logo
+FUENTE_PATH = None # Ruta a un .ttf propio; None usa la Helvetica incorporada en los PDF
+
+ANCHO_PAGINA, ALTO_PAGINA = fitz.paper_size("a4")
+MARGEN = 40
+Y_INICIO_TABLA = 200 # Primera fila de ítems (debajo del encabezado de la tabla de la plantilla)
+ALTO_FILA = 14
+Y_FIN_TABLA = ALTO_PAGINA - 130 # Deja lugar para los totales y el pie
+FILAS_POR_PAGINA = int((Y_FIN_TABLA - Y_INICIO_TABLA) // ALTO_FILA)
+
+# Columnas de la tabla de ítems: (título, x, alineación)
+COLUMNAS = [
+    ("Código", MARGEN, "izq"),
+    ("Descripción", MARGEN + 90, "izq"),
+    ("Cantidad", MARGEN + 355, "der"),
+    ("P. Unit. (s/IVA)", MARGEN + 440, "der"),
+    ("Subtotal (s/IVA)", ANCHO_PAGINA - MARGEN, "der"),
+]
+
+TITULOS = {
+    'presupuesto': "PRESUPUESTO",
+    'nota_pedido': "NOTA DE PEDIDO",
+}
+
+
+# --- Recursos cacheados por proceso (fuente, logo y plantillas precompiladas) ---
+
+@functools.lru_cache(maxsize=None)
+def _fuente():
+    """Fuente usada para todo el texto dinámico. Se carga una sola vez por proceso."""
+    if FUENTE_PATH and os.path.exists(FUENTE_PATH):
+        return fitz.Font(fontfile=FUENTE_PATH)
+    return fitz.Font("helv")
+
+
+@functools.lru_cache(maxsize=None)
+def _logo():
+    """Bytes del logo de la empresa (o None). Se leen del disco una sola vez por proceso."""
+    if LOGO_PATH and os.path.exists(LOGO_PATH):
+        with open(LOGO_PATH, "rb") as archivo:
+            return archivo.read()
+    return None
+
+
+@functools.lru_cache(maxsize=20000)
+def _ancho_texto(texto, tamano):
+    """Ancho del texto en puntos. Cacheado: códigos, cantidades y descripciones se repiten entre documentos."""
+    return _fuente().text_length(texto, fontsize=tamano)
+
+
+def _escribir(writer, x, y, texto, tamano=9, alineacion="izq"):
+    """Agrega un texto al TextWriter, alineado a la izquierda o a la derecha de x."""
+    if alineacion == "der":
+        x -= _ancho_texto(texto, tamano)
+    writer.append((x, y), texto, font=_fuente(), fontsize=tamano)
+
+
+@functools.lru_cache(maxsize=None)
+def _plantilla(tipo):
+    """
+    Página precompilada con todo lo que no cambia entre documentos de un mismo tipo:
+    logo, nombre de la empresa, título, encabezado de la tabla y líneas de separación.
+    Cada documento la estampa con show_pdf_page en lugar de volver a dibujarla.
+    """
+    plantilla = fitz.open()
+    pagina = plantilla.new_page(width=ANCHO_PAGINA, height=ALTO_PAGINA)
+
+    logo = _logo()
+    if logo:
+        pagina.insert_image(fitz.Rect(MARGEN, MARGEN, MARGEN + 120, MARGEN + 60), stream=logo, keep_proportion=True)
+
+    writer = fitz.TextWriter(pagina.rect)
+    _escribir(writer, ANCHO_PAGINA - MARGEN, MARGEN + 15, EMPRESA_NOMBRE, tamano=12, alineacion="der")
+    _escribir(writer, ANCHO_PAGINA - MARGEN, MARGEN + 40, TITULOS[tipo], tamano=16, alineacion="der")
+    for titulo, x, alineacion in COLUMNAS:
+        _escribir(writer, x, Y_INICIO_TABLA - 18, titulo, tamano=9, alineacion=alineacion)
+    writer.write_text(pagina)
+
+    pagina.draw_line((MARGEN, Y_INICIO_TABLA - 12), (ANCHO_PAGINA - MARGEN, Y_INICIO_TABLA - 12), width=0.8)
+    pagina.draw_line((MARGEN, Y_FIN_TABLA), (ANCHO_PAGINA - MARGEN, Y_FIN_TABLA), width=0.8)
+    return plantilla
+
+
+# --- Obtención de datos ---
+
+def obtener_documento(tipo, documento_id):
+    """
+    Devuelve los datos de un presupuesto o nota de pedido en un formato común para el render:
+    {'tipo', 'id', 'cliente', 'fecha', 'estado', 'lineas_extra', 'detalles', 'total', 'total_iva', 'total_con_iva'}
+    o None si no existe.
+    """
+    if tipo == 'presupuesto':
+        datos, error = presupuesto_backend.obtener_detalle_presupuesto(documento_id)
+        if error:
+            return None
+        id_doc, cliente, fecha, estado, total, total_iva, total_con_iva = datos['presupuesto']
+        lineas_extra = []
+    elif tipo == 'nota_pedido':
+        datos, error = presupuesto_backend.obtener_detalle_nota_pedido(documento_id)
+        if error:
+            return None
+        id_doc, cliente, fecha, tipo_entrega, direccion, telefono, estado, total, total_iva, total_con_iva = datos['nota_pedido']
+        lineas_extra = [f"Entrega: {tipo_entrega}"]
+        if tipo_entrega == 'Pedido para envio':
+            lineas_extra.append(f"Dirección: {direccion or 'N/A'} - Tel: {telefono or 'N/A'}")
+    else:
+        raise ValueError(f"Tipo de documento inválido: '{tipo}'. Use 'presupuesto' o 'nota_pedido'.")
+
+    return {
+        'tipo': tipo, 'id': id_doc, 'cliente': cliente, 'fecha': fecha, 'estado': estado,
+        'lineas_extra': lineas_extra, 'detalles': datos['detalles'],
+        'total': total, 'total_iva': total_iva, 'total_con_iva': total_con_iva,
+    }
+
+
+# --- Render ---
+
+@functools.lru_cache(maxsize=20000)
+def _recortar(texto, ancho_max, tamano=9):
+    """Recorta un texto con '...' para que no invada la columna siguiente."""
+    texto = str(texto)
+    if _ancho_texto(texto, tamano) <= ancho_max:
+        return texto
+    while texto and _ancho_texto(texto + "...", tamano) > ancho_max:
+        texto = texto[:-1]
+    return texto + "..."
+
+
+def renderizar_documento(documento):
+    """Genera el PDF de un documento (ver obtener_documento) y devuelve sus bytes."""
+    plantilla = _plantilla(documento['tipo'])
+    detalles = documento['detalles']
+    paginas = max(1, -(-len(detalles) // FILAS_POR_PAGINA))
+    ancho_descripcion = COLUMNAS[2][1] - COLUMNAS[1][1] - 60
+
+    pdf = fitz.open()
+    for nro_pagina in range(paginas):
+        pagina = pdf.new_page(width=ANCHO_PAGINA, height=ALTO_PAGINA)
+        pagina.show_pdf_page(pagina.rect, plantilla, 0)
+        writer = fitz.TextWriter(pagina.rect)
+
+        _escribir(writer, ANCHO_PAGINA - MARGEN, MARGEN + 60, f"Nro. {documento['id']}", tamano=11, alineacion="der")
+        _escribir(writer, MARGEN, 120, f"Cliente: {documento['cliente']}", tamano=10)
+        _escribir(writer, MARGEN, 134, f"Fecha: {documento['fecha']}    Estado: {documento['estado']}", tamano=10)
+        for i, linea in enumerate(documento['lineas_extra']):
+            _escribir(writer, MARGEN, 148 + i * 14, linea, tamano=10)
+
+        y = Y_INICIO_TABLA
+        for codigo, descripcion, cantidad, precio_unitario in detalles[nro_pagina * FILAS_POR_PAGINA:(nro_pagina + 1) * FILAS_POR_PAGINA]:
+            _escribir(writer, COLUMNAS[0][1], y, str(codigo))
+            _escribir(writer, COLUMNAS[1][1], y, _recortar(descripcion, ancho_descripcion))
+            _escribir(writer, COLUMNAS[2][1], y, str(cantidad), alineacion="der")
+            _escribir(writer, COLUMNAS[3][1], y, f"{precio_unitario:.2f}", alineacion="der")
+            _escribir(writer, COLUMNAS[4][1], y, f"{cantidad * precio_unitario:.2f}", alineacion="der")
+            y += ALTO_FILA
+
+        if nro_pagina == paginas - 1:
+            x_totales = ANCHO_PAGINA - MARGEN
+            _escribir(writer, x_totales, Y_FIN_TABLA + 18, f"Total (s/IVA): {documento['total']:.2f} USD", alineacion="der")
+            _escribir(writer, x_totales, Y_FIN_TABLA + 32,
+                      f"IVA ({presupuesto_backend.IVA_RATE*100:.0f}%): {documento['total_iva']:.2f} USD", alineacion="der")
+            _escribir(writer, x_totales, Y_FIN_TABLA + 50, f"Total (c/IVA): {documento['total_con_iva']:.2f} USD",
+                      tamano=11, alineacion="der")
+        _escribir(writer, ANCHO_PAGINA / 2, ALTO_PAGINA - MARGEN, f"Página {nro_pagina + 1} de {paginas}", tamano=8)
+        writer.write_text(pagina)
+
+    contenido = pdf.tobytes(garbage=1, deflate=True)
+    pdf.close()
+    return contenido
+
+
+def exportar_pdf(tipo, documento_id, ruta_salida):
+    """Genera el PDF de un presupuesto o nota de pedido y lo guarda en ruta_salida. Devuelve (éxito, mensaje)."""
+    documento = obtener_documento(tipo, documento_id)
+    if not documento:
+        return False, f"No se encontró el documento {tipo} #{documento_id}."
+    try:
+        contenido = renderizar_documento(documento)
+        with open(ruta_salida, "wb") as archivo:
+            archivo.write(contenido)
+    except Exception as e:
+        return False, f"Error al generar el PDF: {e}"
+    return True, f"PDF de {tipo} #{documento_id} guardado en '{ruta_salida}'."
+
+
+# --- Exportación por lotes ---
+
+def _inicializar_proceso(db_path):
+    """Inicializa un proceso del pool: apunta a la misma base y precalienta fuente, logo y plantillas."""
+    presupuesto_backend.DB_PATH = db_path
+    for tipo in TITULOS:
+        _plantilla(tipo)
+
+
+def _exportar_en_proceso(argumentos):
+    tipo, documento_id, carpeta = argumentos
+    ruta = os.path.join(carpeta, f"{tipo}_{documento_id}.pdf")
+    exito, mensaje = exportar_pdf(tipo, documento_id, ruta)
+    return documento_id, exito, ruta if exito else mensaje
+
+
+def exportar_lote(tipo, ids, carpeta, procesos=None, tamano_bloque=16):
+    """
+    Genera en paralelo los PDF de muchos documentos, cada proceso con sus plantillas ya cargadas.
+    Cada PDF se escribe a disco apenas se genera, así la memoria no crece con el tamaño del lote.
+    Es un generador: va devolviendo (id, éxito, ruta_o_mensaje) en el orden de 'ids'.
+    """
+    os.makedirs(carpeta, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=procesos, initializer=_inicializar_proceso,
+                             initargs=(presupuesto_backend.DB_PATH,)) as pool:
+        tareas = ((tipo, documento_id, carpeta) for documento_id in ids)
+        yield from pool.map(_exportar_en_proceso, tareas, chunksize=tamano_bloque)
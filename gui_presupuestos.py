@@ -1,8 +1,25 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog, filedialog
 import presupuesto_backend # Importamos el módulo con la lógica de backend
+import conciliacion
+import conteo_stock
+import cuenta_corriente
+import expedicion
+import reglas_precio
+import reposicion
+import revalidacion_precios
+import revisiones_presupuesto
+import tipo_cambio
+import instrumentacion
+import mantenimiento
 import datetime
+import logging
 import os
+import threading
+
+import registro
+
+log = logging.getLogger(__name__)
 
 class PresupuestosAppGUI:
     def __init__(self, master):
@@ -13,7 +30,8 @@ class PresupuestosAppGUI:
         # --- Variables de estado de la GUI ---
         self.selected_client_id = None
         self.current_budget_items = {} # {codigo_producto: {"id":id, "desc":desc, "cantidad":cant, "precio":precio}}
-        self.IVA_RATE = 0.21 # Tasa de IVA, puedes hacerla configurable si quieres
+        self.editing_budget_id = None # Presupuesto cargado con "Revisar Presupuesto": al guardar se crea una revisión
+        self.IVA_RATE = presupuesto_backend.IVA_RATE # Tasa de IVA compartida con los totales del backend
 
         # --- Mensaje de estado en la parte inferior ---
         self.status_label = tk.Label(master, text="Listo.", bd=1, relief=tk.SUNKEN, anchor=tk.W)
@@ -50,13 +68,20 @@ class PresupuestosAppGUI:
         self.notebook.add(self.comprobantes_frame, text="Comprobantes")
         self.create_comprobantes_tab(self.comprobantes_frame)
 
+        # --- Pestaña de Diagnóstico (instrumentación y consultas lentas) ---
+        self.diagnostico_frame = ttk.Frame(self.notebook)
+        self.notebook.add(self.diagnostico_frame, text="Diagnóstico")
+        self.create_diagnostico_tab(self.diagnostico_frame)
+
         # --- Sincronizar todo al inicio (opcional, puede ser solo manual) ---
         self.sync_all_modules_to_sheets()
+        presupuesto_backend.iniciar_reintento_sheets() # Reenvía en segundo plano lo que quedó en cola sin conexión
+        mantenimiento.iniciar_mantenimiento_programado() # Backup, verificación y compactación diarios en segundo plano
 
     def update_status(self, message, is_error=False):
         """Actualiza el mensaje de estado en la GUI."""
         self.status_label.config(text=message, fg="red" if is_error else "black")
-        print(f"GUI Status: {message}") # Para ver en la consola de depuración
+        log.log(logging.WARNING if is_error else logging.INFO, "Estado GUI: %s", message)
 
 
     # =====================================================================
@@ -140,6 +165,8 @@ class PresupuestosAppGUI:
         self.iva_label.grid(row=13, column=2, columnspan=2, sticky="e", padx=5, pady=2)
         self.total_con_iva_label = tk.Label(parent_frame, text="Total (c/IVA): 0.00 USD", font=("Arial", 10, "bold"))
         self.total_con_iva_label.grid(row=14, column=2, columnspan=2, sticky="e", padx=5, pady=2)
+        self.total_ars_label = tk.Label(parent_frame, text="Total (c/IVA) ARS: sin tipo de cambio cargado")
+        self.total_ars_label.grid(row=14, column=0, columnspan=2, sticky="w", padx=5, pady=2)
 
 
         # --- Tabla de Historial de Presupuestos ---
@@ -164,6 +191,14 @@ class PresupuestosAppGUI:
         # Botones para el historial de presupuestos
         tk.Button(parent_frame, text="Actualizar Estado Presupuesto", command=self.update_budget_status_gui).grid(row=17, column=0, padx=5, pady=5, sticky="w")
         tk.Button(parent_frame, text="Ver Detalles Presupuesto", command=self.view_budget_details_gui).grid(row=17, column=1, padx=5, pady=5, sticky="w")
+        tk.Button(parent_frame, text="Exportar PDF", command=self.export_budget_pdf_gui).grid(row=17, column=2, padx=5, pady=5)
+        tk.Button(parent_frame, text="Exportar Todos (PDF)", command=self.export_all_budgets_pdf_gui).grid(row=17, column=3, padx=5, pady=5)
+        tk.Button(parent_frame, text="Convertir Aprobados en Pedidos", command=self.convert_approved_budgets_gui).grid(row=18, column=0, padx=5, pady=5, sticky="w")
+        tk.Button(parent_frame, text="Revisar Presupuesto", command=self.revise_budget_gui).grid(row=18, column=1, padx=5, pady=5, sticky="w")
+        tk.Button(parent_frame, text="Revisiones y Diferencias", command=self.budget_revisions_gui).grid(row=18, column=2, padx=5, pady=5)
+        tk.Button(parent_frame, text="Clonar para Cliente Seleccionado", command=self.clone_budget_gui).grid(row=18, column=3, padx=5, pady=5)
+        tk.Button(parent_frame, text="Revalidar Precios y Vencimientos", command=self.revalidate_prices_gui).grid(row=19, column=0, padx=5, pady=5, sticky="w")
+        tk.Button(parent_frame, text="Presupuestos con Precios Viejos", command=self.stale_budgets_gui).grid(row=19, column=1, padx=5, pady=5, sticky="w")
 
         # Cargar presupuestos existentes al iniciar la pestaña
         self.load_all_budgets() 
@@ -333,6 +368,13 @@ class PresupuestosAppGUI:
         self.iva_label.config(text=f"IVA ({self.IVA_RATE*100:.0f}%): {iva:.2f} USD")
         self.total_con_iva_label.config(text=f"Total (c/IVA): {total_con_iva:.2f} USD")
 
+        # Conversión a pesos con la cotización vigente hoy (cacheada por fecha en tipo_cambio)
+        cotizacion = tipo_cambio.obtener_tipo_cambio(datetime.date.today().isoformat())
+        if cotizacion:
+            self.total_ars_label.config(text=f"Total (c/IVA) ARS: {total_con_iva * cotizacion:,.2f} (TC {cotizacion:.2f})")
+        else:
+            self.total_ars_label.config(text="Total (c/IVA) ARS: sin tipo de cambio cargado")
+
 
     def clear_budget_form(self):
         """Limpia el formulario del presupuesto para crear uno nuevo."""
@@ -343,6 +385,7 @@ class PresupuestosAppGUI:
         self.search_client_entry.delete(0, tk.END)
         self.selected_client_label.config(text="Ninguno", fg="blue")
         self.selected_client_id = None
+        self.editing_budget_id = None
 
         self.product_search_entry.delete(0, tk.END)
         self.selected_product_label.config(text="Ninguno", fg="blue")
@@ -360,8 +403,8 @@ class PresupuestosAppGUI:
 
 
     def save_budget(self):
-        """Guarda el presupuesto actual en la base de datos."""
-        if not self.selected_client_id:
+        """Guarda el presupuesto actual en la base de datos (o una revisión, si se cargó uno con "Revisar Presupuesto")."""
+        if not self.selected_client_id and self.editing_budget_id is None:
             messagebox.showwarning("Advertencia", "Debe seleccionar un cliente para guardar el presupuesto.")
             return
         if not self.current_budget_items:
@@ -374,6 +417,19 @@ class PresupuestosAppGUI:
             for item in self.current_budget_items.values()
         ]
 
+        if self.editing_budget_id is not None:
+            motivo = simpledialog.askstring("Revisión", "Motivo de la revisión (opcional):")
+            success, message, _ = revisiones_presupuesto.revisar(self.editing_budget_id, detalle_presupuesto_list, motivo or None)
+            if not success:
+                messagebox.showerror("Error al revisar presupuesto", message)
+                self.update_status(f"Error al revisar presupuesto: {message}", True)
+                return
+            self.update_status(f"✅ {message}")
+            messagebox.showinfo("Presupuesto Revisado", message)
+            self.sync_module_to_sheets('presupuestos')
+            self.clear_budget_form()
+            return
+
         budget_id, message, is_error = presupuesto_backend.crear_presupuesto(
             self.selected_client_id, detalle_presupuesto_list
         )
@@ -384,6 +440,9 @@ class PresupuestosAppGUI:
         else:
             self.update_status(f"✅ {message}", False)
             messagebox.showinfo("Presupuesto Guardado", message)
+            # Registrar el total en USD y en pesos en el historial de presupuestos guardados
+            _, historial_message = tipo_cambio.registrar_presupuesto_guardado(budget_id)
+            self.update_status(historial_message)
             self.sync_module_to_sheets('presupuestos') # Sincronizar presupuestos a Sheets
             self.clear_budget_form() # Limpiar para un nuevo presupuesto
             self.load_all_budgets() # Recargar la tabla de presupuestos existentes
@@ -403,6 +462,7 @@ class PresupuestosAppGUI:
             elif state == 'facturado': color_tag = 'facturado_tag'
             elif state == 'borrador': color_tag = 'borrador_tag'
             elif state == 'rechazado': color_tag = 'rechazado_tag'
+            elif state == 'vencido': color_tag = 'vencido_tag'
             else: color_tag = 'default_tag' # Para cualquier otro estado desconocido
 
             self.list_all_budgets_tree.insert("", tk.END, values=(budget[0], budget[1], budget[2], state, f"{budget[4]:.2f}"), tags=(color_tag,))
@@ -412,6 +472,7 @@ class PresupuestosAppGUI:
         self.list_all_budgets_tree.tag_configure('facturado_tag', background='lightblue')
         self.list_all_budgets_tree.tag_configure('borrador_tag', background='lightgrey')
         self.list_all_budgets_tree.tag_configure('rechazado_tag', background='salmon')
+        self.list_all_budgets_tree.tag_configure('vencido_tag', background='khaki')
         self.list_all_budgets_tree.tag_configure('default_tag', background='white') # Por defecto
         
         self.update_status(f"Cargados {len(budgets)} presupuestos.")
@@ -425,7 +486,7 @@ class PresupuestosAppGUI:
         budget_id = self.list_all_budgets_tree.item(selected_item, 'values')[0]
         current_status = self.list_all_budgets_tree.item(selected_item, 'values')[3]
 
-        new_status = simpledialog.askstring("Actualizar Estado Presupuesto", f"Estado actual: {current_status}\nIngrese el nuevo estado (borrador, aprobado, facturado, rechazado):").strip().lower()
+        new_status = simpledialog.askstring("Actualizar Estado Presupuesto", f"Estado actual: {current_status}\nIngrese el nuevo estado (borrador, aprobado, facturado, rechazado, vencido):").strip().lower()
         if not new_status: return
 
         create_np = False
@@ -448,6 +509,183 @@ class PresupuestosAppGUI:
             messagebox.showerror("Error", message)
             self.update_status(f"Error: {message}", True)
 
+    def convert_approved_budgets_gui(self):
+        if not messagebox.askyesno("Convertir Presupuestos", "¿Crear una Nota de Pedido por cada presupuesto 'aprobado' y marcarlos como facturados?"):
+            return
+        success, message, _ = presupuesto_backend.convertir_presupuestos_en_pedidos()
+        if success:
+            messagebox.showinfo("Presupuestos Convertidos", message)
+            self.update_status(message)
+            self.load_all_budgets()
+            self.sync_module_to_sheets('presupuestos')
+            self.sync_module_to_sheets('pedidos')
+        else:
+            messagebox.showerror("Error", message)
+            self.update_status(f"Error: {message}", True)
+
+    def _selected_budget_id(self):
+        selected_item = self.list_all_budgets_tree.focus()
+        if not selected_item:
+            messagebox.showwarning("Advertencia", "Seleccione un presupuesto del historial.")
+            return None
+        return int(self.list_all_budgets_tree.item(selected_item, 'values')[0])
+
+    def revise_budget_gui(self):
+        """Carga las líneas actuales del presupuesto seleccionado en el formulario; al guardar se crea una revisión."""
+        budget_id = self._selected_budget_id()
+        if budget_id is None:
+            return
+        self.clear_budget_form()
+        for product_id, _, descripcion, cantidad, precio in revisiones_presupuesto.lineas(budget_id):
+            subtotal = cantidad * precio
+            if product_id in self.current_budget_items: # Producto repetido en un presupuesto viejo: se suma como en add_item_to_budget
+                item = self.current_budget_items[product_id]
+                item["cantidad"] += cantidad
+                item["subtotal"] = item["cantidad"] * item["precio"]
+                self.budget_items_tree.item(item["tree_item_id"], values=(product_id, descripcion, item["cantidad"], item["precio"], item["subtotal"]))
+                continue
+            tree_item_id = self.budget_items_tree.insert("", tk.END, values=(product_id, descripcion, cantidad, precio, subtotal))
+            self.current_budget_items[product_id] = {"id": product_id, "desc": descripcion, "cantidad": cantidad,
+                                                     "precio": precio, "subtotal": subtotal, "tree_item_id": tree_item_id}
+        self.editing_budget_id = budget_id
+        self.nro_presupuesto_entry.config(state="normal")
+        self.nro_presupuesto_entry.insert(0, f"{budget_id} (revisión)")
+        self.nro_presupuesto_entry.config(state="readonly")
+        self.calculate_budget_totals()
+        self.update_status(f"Presupuesto #{budget_id} cargado: modifique los ítems y guarde para crear una revisión.")
+
+    def budget_revisions_gui(self):
+        budget_id = self._selected_budget_id()
+        if budget_id is None:
+            return
+        filas = revisiones_presupuesto.revisiones(budget_id)
+        if not filas:
+            messagebox.showinfo("Revisiones", f"El presupuesto #{budget_id} todavía no fue revisado.")
+            return
+        revisions_window = tk.Toplevel(self.master)
+        revisions_window.title(f"Revisiones Presupuesto #{budget_id}")
+        revisions_tree = ttk.Treeview(revisions_window, columns=("Rev.", "Fecha", "Líneas", "Motivo"), show="headings", height=6)
+        for column, width, anchor in (("Rev.", 50, "center"), ("Fecha", 140, "center"), ("Líneas", 60, "e"), ("Motivo", 260, "w")):
+            revisions_tree.heading(column, text=column)
+            revisions_tree.column(column, width=width, anchor=anchor)
+        for numero, fecha, motivo, cambiadas in filas:
+            revisions_tree.insert("", tk.END, values=(numero, fecha[:16].replace("T", " "), cambiadas, motivo or ""))
+        revisions_tree.pack(fill="x", padx=10, pady=5)
+
+        tk.Label(revisions_window, text="Diferencias con la revisión anterior (o entre las dos seleccionadas):").pack(pady=2)
+        diff_tree = ttk.Treeview(revisions_window, columns=("Cambio", "Código", "Descripción", "Antes", "Después"), show="headings")
+        for column, width, anchor in (("Cambio", 90, "center"), ("Código", 110, "w"), ("Descripción", 220, "w"),
+                                      ("Antes", 120, "e"), ("Después", 120, "e")):
+            diff_tree.heading(column, text=column)
+            diff_tree.column(column, width=width, anchor=anchor)
+        diff_tree.pack(expand=True, fill="both", padx=10, pady=5)
+
+        def show_diff(_event=None):
+            numeros = sorted(int(revisions_tree.item(item, 'values')[0]) for item in revisions_tree.selection())
+            if not numeros:
+                return
+            desde, hasta = (numeros[0], numeros[-1]) if len(numeros) > 1 else (max(numeros[0] - 1, 1), numeros[0])
+            diff_tree.delete(*diff_tree.get_children())
+            for codigo, descripcion, cantidad_antes, precio_antes, cantidad_despues, precio_despues, cambio in \
+                    revisiones_presupuesto.diferencias(budget_id, desde, hasta):
+                antes = "" if cantidad_antes is None else f"{cantidad_antes} x {precio_antes:.2f}"
+                despues = "" if cantidad_despues is None else f"{cantidad_despues} x {precio_despues:.2f}"
+                diff_tree.insert("", tk.END, values=(cambio, codigo, descripcion, antes, despues))
+        revisions_tree.bind("<<TreeviewSelect>>", show_diff)
+
+        def restore():
+            numeros = [int(revisions_tree.item(item, 'values')[0]) for item in revisions_tree.selection()]
+            if len(numeros) != 1:
+                messagebox.showwarning("Advertencia", "Seleccione una sola revisión para volver a ella.", parent=revisions_window)
+                return
+            success, message, _ = revisiones_presupuesto.volver_a_revision(budget_id, numeros[0])
+            (messagebox.showinfo if success else messagebox.showerror)("Revisiones", message, parent=revisions_window)
+            if success:
+                self.update_status(message)
+                self.load_all_budgets()
+                self.sync_module_to_sheets('presupuestos')
+                revisions_window.destroy()
+        tk.Button(revisions_window, text="Volver a la Revisión Seleccionada", command=restore).pack(pady=5)
+
+    def revalidate_prices_gui(self, reprice=False):
+        """Corre la revalidación en un hilo aparte (puede tardar con muchos presupuestos) y muestra el resultado al terminar."""
+        self.update_status("Revalidando precios y vencimientos de los presupuestos abiertos...")
+        result = {}
+
+        def run():
+            try:
+                result['values'] = revalidacion_precios.revalidar(reprice)
+            except Exception as e:
+                log.exception("Error al revalidar los precios de los presupuestos.")
+                result['error'] = e
+        worker = threading.Thread(target=run, name="revalidacion-precios", daemon=True)
+        worker.start()
+
+        def check():
+            if worker.is_alive():
+                self.master.after(200, check)
+                return
+            if 'error' in result:
+                messagebox.showerror("Error", f"Error al revalidar los precios: {result['error']}")
+                self.update_status(f"Error al revalidar los precios: {result['error']}", True)
+                return
+            expired, flagged, repriced = result['values']
+            self.update_status(f"Revalidación: {expired} presupuestos vencidos, {flagged} con precios desactualizados"
+                               + (f", {repriced} borradores actualizados." if reprice else "."))
+            self.load_all_budgets()
+            if expired or repriced:
+                self.sync_module_to_sheets('presupuestos')
+            if flagged:
+                self.stale_budgets_gui()
+        check()
+
+    def stale_budgets_gui(self):
+        filas = revalidacion_precios.desactualizados()
+        if not filas:
+            messagebox.showinfo("Precios", "No hay presupuestos abiertos con precios desactualizados (según la última revalidación).")
+            return
+        stale_window = tk.Toplevel(self.master)
+        stale_window.title("Presupuestos con Precios Desactualizados")
+        columns = (("Presup.", 70, "center"), ("Cliente", 160, "w"), ("Fecha", 90, "center"), ("Estado", 80, "center"),
+                   ("Líneas", 60, "e"), ("Presupuestado", 110, "e"), ("Lista", 110, "e"), ("Detectado", 130, "center"))
+        stale_tree = ttk.Treeview(stale_window, columns=[column for column, _, _ in columns], show="headings")
+        for column, width, anchor in columns:
+            stale_tree.heading(column, text=column)
+            stale_tree.column(column, width=width, anchor=anchor)
+        for presupuesto_id, cliente, fecha, estado, lineas, total_presupuestado, total_lista, detectado in filas:
+            stale_tree.insert("", tk.END, values=(presupuesto_id, cliente, fecha, estado, lineas, f"{total_presupuestado:.2f}",
+                                                  f"{total_lista:.2f}", detectado[:16].replace("T", " ")))
+        stale_tree.pack(expand=True, fill="both", padx=10, pady=5)
+        drafts = sum(1 for fila in filas if fila[3] == 'borrador')
+        tk.Label(stale_window, text=f"{len(filas)} presupuestos ({drafts} borradores). Los aprobados no se actualizan: "
+                                    "revíselos con el cliente.").pack(pady=2)
+
+        def reprice():
+            if not messagebox.askyesno("Actualizar Precios", f"¿Pasar los {drafts} borradores a los precios de lista actuales? "
+                                       "Cada uno queda con una revisión nueva.", parent=stale_window):
+                return
+            stale_window.destroy()
+            self.revalidate_prices_gui(reprice=True)
+        tk.Button(stale_window, text="Actualizar Precios de los Borradores", command=reprice,
+                  state="normal" if drafts else "disabled").pack(pady=5)
+
+    def clone_budget_gui(self):
+        budget_id = self._selected_budget_id()
+        if budget_id is None:
+            return
+        if not self.selected_client_id:
+            messagebox.showwarning("Advertencia", "Primero busque y seleccione el cliente para el presupuesto nuevo.")
+            return
+        success, message, _ = revisiones_presupuesto.clonar(budget_id, self.selected_client_id)
+        if not success:
+            messagebox.showerror("Error", message)
+            self.update_status(f"Error: {message}", True)
+            return
+        self.update_status(message)
+        messagebox.showinfo("Presupuesto Clonado", message)
+        self.load_all_budgets()
+        self.sync_module_to_sheets('presupuestos')
+
     def view_budget_details_gui(self):
         selected_item = self.list_all_budgets_tree.focus()
         if not selected_item:
@@ -486,15 +724,82 @@ class PresupuestosAppGUI:
         detail_tree.column("P. Unit.", width=100, anchor="e")
         detail_tree.column("Subtotal", width=100, anchor="e")
         
-        total_items = 0
         for item in details['detalles']:
             subtotal = item[2] * item[3]
-            total_items += subtotal
             detail_tree.insert("", tk.END, values=(item[0], item[1], item[2], f"{item[3]:.2f}", f"{subtotal:.2f}"))
         
         detail_tree.pack(expand=True, fill="both", padx=10, pady=5)
         
-        tk.Label(detail_window, text=f"Total Presupuesto: {total_items:.2f} USD", font=("Arial", 10, "bold")).pack(pady=5)
+        # Los totales vienen guardados en la cabecera del presupuesto (no se recalculan sumando las líneas)
+        tk.Label(detail_window, text=f"Total (s/IVA): {details['presupuesto'][4]:.2f} USD").pack(pady=2)
+        tk.Label(detail_window, text=f"IVA ({self.IVA_RATE*100:.0f}%): {details['presupuesto'][5]:.2f} USD").pack(pady=2)
+        tk.Label(detail_window, text=f"Total Presupuesto (c/IVA): {details['presupuesto'][6]:.2f} USD", font=("Arial", 10, "bold")).pack(pady=5)
+
+
+    def export_budget_pdf_gui(self):
+        """Exporta a PDF el presupuesto seleccionado en el historial."""
+        selected_item = self.list_all_budgets_tree.focus()
+        if not selected_item:
+            messagebox.showwarning("Advertencia", "Seleccione un presupuesto para exportar.")
+            return
+
+        budget_id = self.list_all_budgets_tree.item(selected_item, 'values')[0]
+        ruta = filedialog.asksaveasfilename(defaultextension=".pdf", initialfile=f"presupuesto_{budget_id}.pdf",
+                                            filetypes=[("PDF files", "*.pdf")])
+        if not ruta: return
+
+        import generador_pdf # Importar aquí: PyMuPDF solo hace falta para exportar, no para abrir la aplicación
+        success, message = generador_pdf.exportar_pdf('presupuesto', budget_id, ruta)
+        if success:
+            self.update_status(message)
+        else:
+            messagebox.showerror("Error al exportar PDF", message)
+            self.update_status(f"Error: {message}", True)
+
+    def export_all_budgets_pdf_gui(self):
+        """
+        Exporta a PDF todos los presupuestos del historial en una carpeta, usando varios procesos. El lote corre
+        en un hilo aparte para no trabar la ventana; el avance se muestra en la barra de estado.
+        """
+        carpeta = filedialog.askdirectory(title="Carpeta de destino de los PDF")
+        if not carpeta: return
+
+        ids = [self.list_all_budgets_tree.item(item, 'values')[0] for item in self.list_all_budgets_tree.get_children()]
+        if not ids:
+            messagebox.showwarning("Advertencia", "No hay presupuestos para exportar.")
+            return
+
+        import generador_pdf # Importar aquí: PyMuPDF solo hace falta para exportar, no para abrir la aplicación
+        self.update_status(f"Exportando {len(ids)} presupuestos a PDF...")
+        progress = {'done': 0, 'errors': []}
+
+        def run():
+            try:
+                for _, exito, resultado in generador_pdf.exportar_lote('presupuesto', ids, carpeta):
+                    if not exito:
+                        progress['errors'].append(resultado)
+                    progress['done'] += 1
+            except Exception as e:
+                log.exception("Error al exportar los presupuestos a PDF.")
+                progress['error'] = e
+        worker = threading.Thread(target=run, name="exportacion-pdf", daemon=True)
+        worker.start()
+
+        def check():
+            if worker.is_alive():
+                self.update_status(f"Exportando presupuestos a PDF... {progress['done']}/{len(ids)}")
+                self.master.after(200, check)
+                return
+            if 'error' in progress:
+                messagebox.showerror("Error al exportar PDF", f"Error al exportar los presupuestos: {progress['error']}")
+                self.update_status(f"Error al exportar PDF: {progress['error']}", True)
+            elif progress['errors']:
+                messagebox.showerror("Error al exportar PDF", "\n".join(progress['errors'][:10]))
+                self.update_status(f"Exportación terminada con {len(progress['errors'])} errores.", True)
+            else:
+                messagebox.showinfo("Exportación Completa", f"Se exportaron {len(ids)} presupuestos a '{carpeta}'.")
+                self.update_status(f"Exportados {len(ids)} presupuestos a PDF.")
+        check()
 
 
     # =====================================================================
@@ -518,6 +823,13 @@ class PresupuestosAppGUI:
         tk.Button(parent_frame, text="Modificar Stock", command=self.modify_stock_gui).grid(row=3, column=1, padx=5, pady=5)
         tk.Button(parent_frame, text="Actualizar Estado", command=self.change_product_status_gui).grid(row=3, column=2, padx=5, pady=5)
         tk.Button(parent_frame, text="Cargar Productos", command=self.load_products_to_treeview).grid(row=3, column=3, padx=5, pady=5) # Botón para recargar tabla
+        tk.Button(parent_frame, text="Traer Cambios de Sheets", command=self.pull_products_from_sheets_gui).grid(row=3, column=4, padx=5, pady=5)
+        tk.Button(parent_frame, text="Importar Conteo Físico", command=self.import_stock_count_gui).grid(row=3, column=5, padx=5, pady=5)
+        tk.Button(parent_frame, text="Configurar Reposición", command=self.configure_reorder_gui).grid(row=2, column=2, padx=5, pady=5)
+        tk.Button(parent_frame, text="Alertas de Reposición", command=self.stock_alerts_gui).grid(row=2, column=3, padx=5, pady=5)
+        tk.Button(parent_frame, text="Reglas de Precios", command=self.price_rules_gui).grid(row=1, column=2, padx=5, pady=5)
+        self.stock_alerts_label = tk.Label(parent_frame, text="", fg="red")
+        self.stock_alerts_label.grid(row=2, column=4, columnspan=2, padx=5, pady=5, sticky="w")
 
         # Tabla de Productos
         self.products_tree = ttk.Treeview(parent_frame, columns=("ID", "Codigo", "Descripcion", "Disp", "Res", "Estado", "Precio 1"), show="headings")
@@ -537,7 +849,7 @@ class PresupuestosAppGUI:
         self.products_tree.column("Estado", width=100)
         self.products_tree.column("Precio 1", width=80, anchor="e")
 
-        self.products_tree.grid(row=4, column=0, columnspan=4, padx=5, pady=5, sticky="nsew")
+        self.products_tree.grid(row=4, column=0, columnspan=6, padx=5, pady=5, sticky="nsew")
         parent_frame.grid_rowconfigure(4, weight=1)
         parent_frame.grid_columnconfigure(1, weight=1)
 
@@ -595,6 +907,222 @@ class PresupuestosAppGUI:
             messagebox.showerror("Error", message)
             self.update_status(f"Error: {message}", True)
 
+    def import_stock_count_gui(self):
+        ruta = filedialog.askopenfilename(title="Conteo físico (codigo;cantidad_contada)",
+                                          filetypes=[("CSV", "*.csv"), ("Excel", "*.xlsx"), ("Todos los archivos", "*.*")])
+        if not ruta:
+            return
+        try:
+            _, resumen = conteo_stock.importar_conteo(ruta, simular=True)
+        except (ValueError, ImportError, OSError) as e:
+            messagebox.showerror("Error", f"No se pudo leer el conteo: {e}")
+            self.update_status(f"Error: {e}", True)
+            return
+        detalle = (f"Productos contados: {resumen['productos_contados']}\n"
+                   f"A ajustar: {resumen['ajuste']} (sobran {resumen['unidades_sobrantes']} u., faltan {resumen['unidades_faltantes']} u., "
+                   f"valor {resumen['valor_ajustes']:.2f})\n"
+                   f"Sin diferencia: {resumen['sin_diferencia']}\n"
+                   f"Contados por debajo de lo reservado (no se ajustan): {resumen['menos_que_reservado']}\n"
+                   f"Códigos desconocidos: {resumen['desconocido']}   Líneas inválidas: {resumen['invalido']}")
+        if not resumen['ajuste']:
+            messagebox.showinfo("Conteo Físico", f"{detalle}\n\nNo hay diferencias para ajustar.")
+            return
+        if not messagebox.askyesno("Conteo Físico", f"{detalle}\n\n¿Aplicar los ajustes?"):
+            return
+        informe_path = filedialog.asksaveasfilename(title="Guardar informe de diferencias (opcional)", defaultextension=".csv",
+                                                    initialfile=f"diferencias_conteo_{datetime.date.today().isoformat()}.csv")
+        _, resumen = conteo_stock.importar_conteo(ruta, informe_path=informe_path or None)
+        mensaje = f"Conteo físico aplicado: {resumen['ajustados']} productos ajustados."
+        messagebox.showinfo("Conteo Físico", mensaje)
+        self.update_status(mensaje)
+        self.load_products_to_treeview()
+        self.sync_module_to_sheets('productos')
+
+    def configure_reorder_gui(self):
+        codigo = self.prod_code_entry.get().strip()
+        if not codigo:
+            messagebox.showwarning("Advertencia", "Ingrese el código del producto a configurar.")
+            return
+        plazo = simpledialog.askinteger("Configurar Reposición", "Plazo de entrega del proveedor (días):", minvalue=0)
+        if plazo is None:
+            return
+        punto = simpledialog.askstring("Configurar Reposición", "Punto de reposición (vacío: calcularlo desde el consumo):")
+        if punto is None:
+            return
+        try:
+            punto = int(punto) if punto.strip() else None
+        except ValueError:
+            messagebox.showerror("Error", "Punto de reposición inválido. Ingrese un número entero.")
+            return
+        success, message = reposicion.configurar(codigo, plazo, punto, punto_automatico=punto is None)
+        if success:
+            messagebox.showinfo("Éxito", message)
+            self.update_status(message)
+            self.load_products_to_treeview()
+        else:
+            messagebox.showerror("Error", message)
+            self.update_status(f"Error: {message}", True)
+
+    def stock_alerts_gui(self):
+        alerts_window = tk.Toplevel(self.master)
+        alerts_window.title("Alertas de Reposición")
+        columns = (("Código", 100, "w"), ("Descripción", 220, "w"), ("Disp.", 60, "e"), ("Punto", 60, "e"),
+                   ("Consumo/día", 90, "e"), ("Días", 60, "e"), ("Pedir", 60, "e"), ("Desde", 140, "center"))
+        alerts_tree = ttk.Treeview(alerts_window, columns=[column for column, _, _ in columns], show="headings")
+        for column, width, anchor in columns:
+            alerts_tree.heading(column, text=column)
+            alerts_tree.column(column, width=width, anchor=anchor)
+        filas = reposicion.alertas()
+        for codigo, descripcion, disponible, _, punto, consumo, dias, sugerida, _, desde in filas:
+            alerts_tree.insert("", tk.END, values=(codigo, descripcion, disponible, punto, f"{consumo:.2f}",
+                                                   "" if dias is None else dias, sugerida, desde[:16].replace("T", " ")))
+        alerts_tree.pack(expand=True, fill="both", padx=10, pady=5)
+        tk.Label(alerts_window, text=f"{len(filas)} productos en su punto de reposición o por debajo.").pack(pady=5)
+
+    def price_rules_gui(self):
+        rules_window = tk.Toplevel(self.master)
+        rules_window.title("Reglas de Precios (desde el costo)")
+        tk.Label(rules_window, text="Precio = costo x (1 + recargo), al menos costo / (1 - margen mínimo), redondeado hacia arriba. "
+                                    "Rubro: primera palabra de la descripción; '*' vale para todos.").pack(padx=10, pady=5)
+        columns = (("Rubro", 140, "w"), ("Escala", 140, "w"), ("Recargo %", 90, "e"), ("Margen mín. %", 100, "e"), ("Redondeo", 80, "e"))
+        rules_tree = ttk.Treeview(rules_window, columns=[column for column, _, _ in columns], show="headings", height=12)
+        for column, width, anchor in columns:
+            rules_tree.heading(column, text=column)
+            rules_tree.column(column, width=width, anchor=anchor)
+        rules_tree.pack(expand=True, fill="both", padx=10, pady=5)
+
+        form = tk.Frame(rules_window)
+        form.pack(padx=10, pady=5)
+        tk.Label(form, text="Rubro:").grid(row=0, column=0, padx=5, sticky="w")
+        rubro_entry = tk.Entry(form, width=14)
+        rubro_entry.grid(row=0, column=1, padx=5)
+        tk.Label(form, text="Escala:").grid(row=0, column=2, padx=5, sticky="w")
+        escala_combo = ttk.Combobox(form, values=presupuesto_backend.COLUMNAS_PRECIO, state="readonly", width=18)
+        escala_combo.grid(row=0, column=3, padx=5)
+        tk.Label(form, text="Recargo %:").grid(row=1, column=0, padx=5, sticky="w")
+        recargo_entry = tk.Entry(form, width=14)
+        recargo_entry.grid(row=1, column=1, padx=5)
+        tk.Label(form, text="Margen mín. %:").grid(row=1, column=2, padx=5, sticky="w")
+        margen_entry = tk.Entry(form, width=20)
+        margen_entry.grid(row=1, column=3, padx=5)
+        tk.Label(form, text="Redondeo:").grid(row=1, column=4, padx=5, sticky="w")
+        redondeo_entry = tk.Entry(form, width=10)
+        redondeo_entry.grid(row=1, column=5, padx=5)
+
+        def set_entry(entry, value):
+            entry.delete(0, tk.END)
+            entry.insert(0, value)
+
+        def load_rules():
+            for item in rules_tree.get_children():
+                rules_tree.delete(item)
+            for categoria, escala, recargo, margen_minimo, redondeo in reglas_precio.reglas():
+                rules_tree.insert("", tk.END, values=(categoria, escala, f"{recargo * 100:.2f}", f"{margen_minimo * 100:.2f}", f"{redondeo:g}"))
+
+        def on_select(event):
+            selected = rules_tree.focus()
+            if selected:
+                categoria, escala, recargo, margen_minimo, redondeo = rules_tree.item(selected, "values")
+                set_entry(rubro_entry, categoria)
+                escala_combo.set(escala)
+                set_entry(recargo_entry, recargo)
+                set_entry(margen_entry, margen_minimo)
+                set_entry(redondeo_entry, redondeo)
+
+        def save_rule():
+            try:
+                recargo = float(recargo_entry.get().replace(",", ".")) / 100
+                margen_minimo = float(margen_entry.get().replace(",", ".") or reglas_precio.MARGEN_MINIMO * 100) / 100
+                redondeo = float(redondeo_entry.get().replace(",", ".") or reglas_precio.REDONDEO)
+            except ValueError:
+                messagebox.showerror("Error", "Recargo, margen mínimo y redondeo deben ser números.", parent=rules_window)
+                return
+            success, message = reglas_precio.guardar_regla(rubro_entry.get(), escala_combo.get(), recargo, margen_minimo, redondeo)
+            if success:
+                self.update_status(message)
+                load_rules()
+            else:
+                messagebox.showerror("Error", message, parent=rules_window)
+
+        def remove_rule():
+            success, message = reglas_precio.quitar_regla(rubro_entry.get(), escala_combo.get())
+            if success:
+                self.update_status(message)
+                load_rules()
+            else:
+                messagebox.showerror("Error", message, parent=rules_window)
+
+        def suggest_rules():
+            sugeridas = reglas_precio.sugerir_reglas()
+            if not sugeridas:
+                messagebox.showinfo("Reglas Sugeridas", "No hay productos con costo y precio para sugerir reglas.", parent=rules_window)
+                return
+            detalle = "\n".join(f"{categoria} / {escala}: {recargo:.2%}" for categoria, escala, recargo, _, _ in sugeridas[:30])
+            if len(sugeridas) > 30:
+                detalle += f"\n... y {len(sugeridas) - 30} más"
+            if messagebox.askyesno("Reglas Sugeridas", f"Recargos que reproducen la lista actual (mediana por rubro):\n\n{detalle}\n\n"
+                                   "¿Guardarlas? Reemplazan las reglas de los mismos rubros y escalas.", parent=rules_window):
+                self.update_status(f"{reglas_precio.guardar_reglas(sugeridas)} reglas sugeridas guardadas.")
+                load_rules()
+
+        def preview():
+            vista = reglas_precio.vista_previa()
+            if vista.empty:
+                messagebox.showinfo("Vista Previa", "Con las reglas actuales no cambia ningún precio.", parent=rules_window)
+                return
+            preview_window = tk.Toplevel(rules_window)
+            preview_window.title("Vista Previa de la Lista de Precios")
+            preview_columns = (("Código", 100, "w"), ("Descripción", 220, "w"), ("Escala", 120, "w"), ("Costo", 80, "e"),
+                               ("Actual", 80, "e"), ("Nuevo", 80, "e"), ("Var. %", 70, "e"), ("Margen %", 70, "e"))
+            preview_tree = ttk.Treeview(preview_window, columns=[column for column, _, _ in preview_columns], show="headings")
+            for column, width, anchor in preview_columns:
+                preview_tree.heading(column, text=column)
+                preview_tree.column(column, width=width, anchor=anchor)
+            for fila in vista.head(2000).itertuples(index=False): # Treeview no maneja bien cientos de miles de filas
+                preview_tree.insert("", tk.END, values=(fila.codigo, fila.descripcion, fila.escala, f"{fila.costo_base:.2f}",
+                                                        f"{fila.precio_actual:.2f}", f"{fila.precio_nuevo:.2f}",
+                                                        "" if fila.variacion_pct != fila.variacion_pct else f"{fila.variacion_pct:.2f}", # NaN: no tenía precio
+                                                        f"{fila.margen_pct:.2f}"))
+            preview_tree.pack(expand=True, fill="both", padx=10, pady=5)
+            resumen = f"{len(vista)} precios cambiarían en {vista['codigo'].nunique()} productos."
+            if len(vista) > 2000:
+                resumen += " Se muestran los primeros 2000; exporte el CSV para ver todos."
+            tk.Label(preview_window, text=resumen).pack(pady=5)
+
+            def export_preview():
+                ruta = filedialog.asksaveasfilename(parent=preview_window, title="Exportar vista previa", defaultextension=".csv",
+                                                    initialfile=f"vista_previa_precios_{datetime.date.today().isoformat()}.csv")
+                if ruta:
+                    cantidad = reglas_precio.exportar_vista_previa(ruta)
+                    self.update_status(f"Vista previa exportada: {cantidad} precios en '{ruta}'.")
+
+            tk.Button(preview_window, text="Exportar CSV", command=export_preview).pack(pady=5)
+
+        def apply_rules():
+            if not messagebox.askyesno("Aplicar Reglas", "¿Regenerar la lista de precios desde el costo con las reglas guardadas?\n"
+                                       "Solo se escriben los productos cuyo precio cambia.", parent=rules_window):
+                return
+            productos, precios = reglas_precio.aplicar()
+            message = f"Lista de precios regenerada: {precios} precios actualizados en {productos} productos."
+            messagebox.showinfo("Aplicar Reglas", message, parent=rules_window)
+            self.update_status(message)
+            if productos:
+                self.load_products_to_treeview()
+                self.sync_module_to_sheets('productos')
+
+        rules_tree.bind("<<TreeviewSelect>>", on_select)
+        buttons = tk.Frame(rules_window)
+        buttons.pack(pady=5)
+        tk.Button(buttons, text="Guardar Regla", command=save_rule).pack(side=tk.LEFT, padx=5)
+        tk.Button(buttons, text="Quitar Regla", command=remove_rule).pack(side=tk.LEFT, padx=5)
+        tk.Button(buttons, text="Sugerir desde la Lista Actual", command=suggest_rules).pack(side=tk.LEFT, padx=5)
+        tk.Button(buttons, text="Vista Previa", command=preview).pack(side=tk.LEFT, padx=5)
+        tk.Button(buttons, text="Aplicar", command=apply_rules).pack(side=tk.LEFT, padx=5)
+        set_entry(rubro_entry, reglas_precio.CATEGORIA_GENERAL)
+        set_entry(margen_entry, f"{reglas_precio.MARGEN_MINIMO * 100:g}")
+        set_entry(redondeo_entry, f"{reglas_precio.REDONDEO:g}")
+        load_rules()
+
     def change_product_status_gui(self):
         codigo = self.prod_code_entry.get().strip()
         if not codigo:
@@ -615,6 +1143,22 @@ class PresupuestosAppGUI:
             messagebox.showerror("Error", message)
             self.update_status(f"Error: {message}", True)
 
+    def pull_products_from_sheets_gui(self):
+        """Trae los precios y el stock editados en la planilla de Google Sheets."""
+        self.update_status("Trayendo cambios de productos desde Google Sheets...")
+        success, message, resumen = presupuesto_backend.traer_productos_de_google_sheets()
+        if not success:
+            self.update_status(message, True)
+            messagebox.showerror("Error", message)
+            return
+        self.update_status(message)
+        self.load_products_to_treeview()
+        if resumen['conflictos']:
+            messagebox.showwarning("Conflictos con Google Sheets",
+                                   f"{message}\n\nEn la próxima sincronización se conservarán los valores de la base para esos productos.")
+        else:
+            messagebox.showinfo("Éxito", message)
+
     def load_products_to_treeview(self):
         """Carga los productos de la DB en el Treeview de la pestaña de productos."""
         for item in self.products_tree.get_children():
@@ -626,6 +1170,8 @@ class PresupuestosAppGUI:
                 # p = (id, codigo, descripcion, stock_disponible, stock_reservado, estado_producto, precio_1, precio_5, precio_10)
                 self.products_tree.insert('', tk.END, values=(p[0], p[1], p[2], p[3], p[4], p[5], f"{p[6]:.2f}")) # ID, Código, Desc, Disp, Res, Estado, Precio_1
         self.update_status(f"Cargados {len(products)} productos en la tabla.")
+        alertas = reposicion.cantidad_alertas()
+        self.stock_alerts_label.config(text=f"⚠ {alertas} productos en su punto de reposición" if alertas else "")
 
 
     # =====================================================================
@@ -638,7 +1184,9 @@ class PresupuestosAppGUI:
         tk.Button(parent_frame, text="Crear Nueva Nota de Pedido", command=self.create_new_order_gui).pack(pady=5)
         tk.Button(parent_frame, text="Ver Todas las Notas de Pedido", command=lambda: self.load_orders_to_treeview(False)).pack(pady=5)
         tk.Button(parent_frame, text="Ver Notas para Expedición", command=lambda: self.load_orders_to_treeview(True)).pack(pady=5)
+        tk.Button(parent_frame, text="Cola de Expedición por Zona", command=self.expedition_queue_gui).pack(pady=5)
         tk.Button(parent_frame, text="Actualizar Estado de Nota de Pedido", command=self.update_order_status_gui).pack(pady=5)
+        tk.Button(parent_frame, text="Cuenta Corriente de Cliente", command=self.account_statement_gui).pack(pady=5)
 
         # Tabla de Notas de Pedido
         self.orders_tree = ttk.Treeview(parent_frame, columns=("ID", "Cliente", "Fecha", "Entrega", "Estado", "Total"), show="headings")
@@ -667,6 +1215,135 @@ class PresupuestosAppGUI:
 
         self.load_orders_to_treeview(False) # Cargar todas al inicio
 
+    def account_statement_gui(self):
+        client_name = simpledialog.askstring("Cuenta Corriente", "Nombre del cliente:")
+        if not client_name:
+            return
+        client_id = cuenta_corriente.id_cliente(client_name.strip())
+        if client_id is None:
+            messagebox.showerror("Error", f"Cliente '{client_name}' no encontrado.")
+            return
+
+        desde = (datetime.date.today() - datetime.timedelta(days=365)).isoformat() # Último año
+        saldo_inicial, movimientos, saldo_final = cuenta_corriente.estado_de_cuenta(client_id, desde)
+        antiguedad = cuenta_corriente.antiguedad_saldos(cliente_id=client_id)
+
+        statement_window = tk.Toplevel(self.master)
+        statement_window.title(f"Cuenta Corriente - {client_name}")
+        tk.Label(statement_window, text=f"Saldo al {desde}: {saldo_inicial:.2f}").pack(pady=2)
+
+        statement_tree = ttk.Treeview(statement_window, columns=("Fecha", "Concepto", "Debe", "Haber", "Saldo"), show="headings")
+        for column, width, anchor in (("Fecha", 90, "center"), ("Concepto", 260, "w"), ("Debe", 100, "e"),
+                                      ("Haber", 100, "e"), ("Saldo", 100, "e")):
+            statement_tree.heading(column, text=column)
+            statement_tree.column(column, width=width, anchor=anchor)
+        for fecha, concepto, debe, haber, saldo in movimientos:
+            statement_tree.insert("", tk.END, values=(fecha, concepto, f"{debe:.2f}" if debe else "",
+                                                      f"{haber:.2f}" if haber else "", f"{saldo:.2f}"))
+        statement_tree.pack(expand=True, fill="both", padx=10, pady=5)
+
+        tk.Label(statement_window, text=f"Saldo actual: {saldo_final:.2f}", font=("Arial", 10, "bold")).pack(pady=2)
+        tramos = antiguedad[0][2:6] if antiguedad else (0.0,) * len(cuenta_corriente.TRAMOS_ANTIGUEDAD)
+        tk.Label(statement_window, text="Deuda por antigüedad (días): " + "   ".join(
+            f"{tramo}: {importe:.2f}" for tramo, importe in zip(cuenta_corriente.TRAMOS_ANTIGUEDAD, tramos))).pack(pady=5)
+
+    def expedition_queue_gui(self):
+        """Cola de expedición por zona; se refresca sola cada expedicion.REFRESCO_MS leyendo solo las notas que cambiaron."""
+        queue_window = tk.Toplevel(self.master)
+        queue_window.title("Cola de Expedición")
+        cola = expedicion.ColaExpedicion()
+        columns = (("Nota", 70, "center"), ("Cliente", 160, "w"), ("Fecha", 90, "center"), ("Estado", 90, "center"),
+                   ("Líneas", 60, "e"), ("Unidades", 70, "e"), ("Dirección", 240, "w"))
+        queue_tree = ttk.Treeview(queue_window, columns=[column for column, _, _ in columns], show="tree headings")
+        queue_tree.heading("#0", text="Zona")
+        queue_tree.column("#0", width=170)
+        for column, width, anchor in columns:
+            queue_tree.heading(column, text=column)
+            queue_tree.column(column, width=width, anchor=anchor)
+        queue_tree.tag_configure('aprobada', background='lightgreen')
+        queue_tree.tag_configure('pendiente', background='yellow')
+        queue_tree.pack(expand=True, fill="both", padx=10, pady=5)
+        summary_label = tk.Label(queue_window, text="")
+        summary_label.pack(pady=2)
+        pending_refresh = [None] # ID del after() programado, para cancelarlo al cerrar
+
+        def refresh():
+            changed, removed = cola.refrescar()
+            zones = set()
+            for nota_id in removed:
+                if queue_tree.exists(str(nota_id)):
+                    zones.add(queue_tree.parent(str(nota_id)))
+                    queue_tree.delete(str(nota_id))
+            for fila in sorted((cola.notas[nota_id] for nota_id in changed), key=lambda fila: (fila[2], fila[0])):
+                nota_id, cliente, fecha, _, direccion, _, estado, _, lineas, unidades, zona = fila
+                zone_item = f"zona:{zona}"
+                if not queue_tree.exists(zone_item):
+                    queue_tree.insert("", tk.END, iid=zone_item, open=True)
+                values = (nota_id, cliente, fecha, estado, lineas, unidades, direccion or "")
+                if queue_tree.exists(str(nota_id)):
+                    zones.add(queue_tree.parent(str(nota_id)))
+                    if queue_tree.parent(str(nota_id)) != zone_item:
+                        queue_tree.move(str(nota_id), zone_item, tk.END)
+                    queue_tree.item(str(nota_id), values=values, tags=(estado,))
+                else:
+                    queue_tree.insert(zone_item, tk.END, iid=str(nota_id), values=values, tags=(estado,))
+                zones.add(zone_item)
+            for zone_item in zones:
+                orders = queue_tree.get_children(zone_item)
+                if not orders:
+                    queue_tree.delete(zone_item)
+                    continue
+                units = sum(int(queue_tree.set(order, "Unidades")) for order in orders)
+                queue_tree.item(zone_item, text=f"{zone_item[5:]} ({len(orders)} notas, {units} u.)")
+            if changed or removed:
+                summary_label.config(text=f"{len(cola.notas)} notas abiertas, {len(cola.aprobadas())} aprobadas "
+                                          f"(actualizado {datetime.datetime.now():%H:%M:%S}).")
+            pending_refresh[0] = queue_window.after(expedicion.REFRESCO_MS, refresh)
+
+        def selected_zone():
+            item = queue_tree.focus()
+            if item and not item.startswith("zona:"):
+                item = queue_tree.parent(item)
+            return item[5:] if item else None
+
+        def close():
+            if pending_refresh[0] is not None:
+                queue_window.after_cancel(pending_refresh[0])
+            cola.cerrar()
+            queue_window.destroy()
+
+        tk.Button(queue_window, text="Lista de Picking (zona seleccionada o todas)",
+                  command=lambda: self.pick_list_gui(selected_zone(), cola)).pack(pady=5)
+        queue_window.protocol("WM_DELETE_WINDOW", close)
+        refresh()
+
+    def pick_list_gui(self, zone, cola):
+        notas = cola.aprobadas(zone) if zone else None
+        title = f"Lista de Picking - {zone}" if zone else "Lista de Picking - Todas las zonas"
+        filas = expedicion.lista_de_picking(notas)
+        picking_window = tk.Toplevel(self.master)
+        picking_window.title(title)
+        columns = (("Código", 110, "w"), ("Descripción", 240, "w"), ("Cantidad", 80, "e"), ("Notas", 60, "e"),
+                   ("Disp.", 70, "e"), ("Reserv.", 70, "e"))
+        picking_tree = ttk.Treeview(picking_window, columns=[column for column, _, _ in columns], show="headings")
+        for column, width, anchor in columns:
+            picking_tree.heading(column, text=column)
+            picking_tree.column(column, width=width, anchor=anchor)
+        for fila in filas:
+            picking_tree.insert("", tk.END, values=fila)
+        picking_tree.pack(expand=True, fill="both", padx=10, pady=5)
+        tk.Label(picking_window, text=f"{len(filas)} productos, {sum(fila[2] for fila in filas)} unidades "
+                                      f"para {len(notas) if notas is not None else len(cola.aprobadas())} notas aprobadas.").pack(pady=2)
+
+        def export():
+            ruta = filedialog.asksaveasfilename(defaultextension=".csv", initialfile=f"picking_{datetime.date.today().isoformat()}.csv",
+                                                filetypes=[("CSV", "*.csv")])
+            if not ruta:
+                return
+            productos = expedicion.exportar_picking(ruta, notas)
+            self.update_status(f"Lista de picking con {productos} productos exportada a '{ruta}'.")
+        tk.Button(picking_window, text="Exportar CSV", command=export).pack(pady=5)
+
     def create_new_order_gui(self):
         # Simulación: abrir una ventana simple para crear pedido.
         # En tu app real, esto sería una ventana de formulario completa.
@@ -796,6 +1473,7 @@ class PresupuestosAppGUI:
         self.cuenta_comprobante_entry = tk.Entry(parent_frame)
         self.cuenta_comprobante_entry.pack()
         tk.Button(parent_frame, text="Guardar Comprobante", command=self.save_comprobante_from_gui).pack(pady=5) # Botón para guardar después de extraer/editar
+        tk.Button(parent_frame, text="Conciliar Pagos con Notas de Pedido", command=self.reconcile_payments_gui).pack(pady=5)
 
         # Tabla de Comprobantes (opcional, para ver historial)
         self.comprobantes_tree = ttk.Treeview(parent_frame, columns=("ID", "Cliente", "Nro Op", "Fecha", "Importe"), show="headings")
@@ -845,6 +1523,25 @@ class PresupuestosAppGUI:
             messagebox.showwarning("Advertencia", "No se pudieron extraer datos automáticamente. Por favor, ingrese manualmente.")
             self.clear_comprobante_entries() # Limpiar para entrada manual
 
+    def reconcile_payments_gui(self):
+        exito, mensaje, resumen = conciliacion.conciliar_pagos(simular=True)
+        if not exito:
+            messagebox.showerror("Error", mensaje)
+            self.update_status(f"Error: {mensaje}", True)
+            return
+        if not resumen['aplicaciones']:
+            messagebox.showinfo("Conciliación de Pagos", "No hay pagos para aplicar a notas de pedido abiertas.")
+            return
+        if not messagebox.askyesno("Conciliación de Pagos", f"{mensaje}\n\n¿Guardar estas aplicaciones?"):
+            return
+        exito, mensaje, _ = conciliacion.conciliar_pagos()
+        if exito:
+            messagebox.showinfo("Conciliación de Pagos", mensaje)
+            self.update_status(mensaje)
+        else:
+            messagebox.showerror("Error", mensaje)
+            self.update_status(f"Error: {mensaje}", True)
+
     def clear_comprobante_entries(self):
         self.nro_operacion_entry.delete(0, tk.END)
         self.fecha_comprobante_entry.delete(0, tk.END)
@@ -871,8 +1568,21 @@ class PresupuestosAppGUI:
             messagebox.showerror("Error", "Importe inválido. Ingrese un número válido.")
             return
 
+        file_path = self.comprobante_path_entry.get().strip() or None
+        if file_path and not os.path.exists(file_path):
+            file_path = None # Datos cargados a mano: se revisan sin imagen
+        posibles_duplicados = presupuesto_backend.buscar_comprobantes_duplicados(nro_operacion, fecha, importe, cuenta, file_path)
+        if posibles_duplicados:
+            detalle = "\n".join(
+                f"- ID {d['id']}: Op. {d['nro_operacion']}, {d['fecha']}, ${d['importe'] or 0:.2f}, {d['cuenta']} ({', '.join(d['motivos'])})"
+                for d in posibles_duplicados[:10])
+            if not messagebox.askyesno("Posible comprobante duplicado",
+                                       f"Este comprobante se parece a otros ya guardados:\n{detalle}\n\n¿Guardarlo de todos modos?"):
+                self.update_status("Comprobante no guardado: posible duplicado.", True)
+                return
+
         success, message = presupuesto_backend.guardar_comprobante(
-            nro_operacion, fecha, importe, cuenta, self.selected_client_id
+            nro_operacion, fecha, importe, cuenta, self.selected_client_id, file_path
         )
 
         if success:
@@ -890,16 +1600,7 @@ class PresupuestosAppGUI:
         for item in self.comprobantes_tree.get_children():
             self.comprobantes_tree.delete(item)
 
-        # Cargar comprobantes (obtener_comprobantes no existe en backend, la hacemos aquí para demo)
-        conn = sqlite3.connect('presupuestos.db')
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT comp.id, c.nombre, comp.nro_operacion, comp.fecha, comp.importe
-            FROM comprobantes comp JOIN clientes c ON comp.cliente_id = c.id
-            ORDER BY comp.fecha DESC
-        """)
-        comprobantes = cursor.fetchall()
-        conn.close()
+        comprobantes = presupuesto_backend.obtener_comprobantes()
 
         if comprobantes:
             for comp in comprobantes:
@@ -907,6 +1608,86 @@ class PresupuestosAppGUI:
         self.update_status(f"Cargados {len(comprobantes)} comprobantes.")
 
 
+    # =====================================================================
+    # === PESTAÑA DE DIAGNÓSTICO ===
+    # =====================================================================
+    def create_diagnostico_tab(self, parent_frame):
+        self.instrumentacion_var = tk.BooleanVar(value=instrumentacion.activo())
+        tk.Checkbutton(parent_frame, text="Medir tiempos (instrumentación activa)", variable=self.instrumentacion_var,
+                       command=self.toggle_instrumentacion).grid(row=0, column=0, padx=5, pady=5, sticky="w")
+        tk.Label(parent_frame, text="Mostrar las N más lentas:").grid(row=0, column=1, padx=5, pady=5, sticky="e")
+        self.diagnostico_top_spinbox = tk.Spinbox(parent_frame, from_=5, to=200, width=5)
+        self.diagnostico_top_spinbox.delete(0, tk.END)
+        self.diagnostico_top_spinbox.insert(0, "20")
+        self.diagnostico_top_spinbox.grid(row=0, column=2, padx=5, pady=5, sticky="w")
+
+        tk.Button(parent_frame, text="Actualizar", command=self.load_diagnostico).grid(row=1, column=0, padx=5, pady=5)
+        tk.Button(parent_frame, text="Reiniciar Contadores", command=self.reset_diagnostico).grid(row=1, column=1, padx=5, pady=5)
+        tk.Button(parent_frame, text="Exportar JSON", command=lambda: self.export_diagnostico("json")).grid(row=1, column=2, padx=5, pady=5)
+        tk.Button(parent_frame, text="Exportar Prometheus", command=lambda: self.export_diagnostico("prom")).grid(row=1, column=3, padx=5, pady=5)
+
+        # Operaciones más lentas (funciones del backend y sentencias SQL)
+        self.diagnostico_tree = ttk.Treeview(parent_frame, columns=("Tipo", "Operacion", "Llamadas", "Max", "Prom", "Total", "Filas"), show="headings")
+        for columna, titulo, ancho in [("Tipo", "Tipo", 60), ("Operacion", "Operación", 420), ("Llamadas", "Llamadas", 70),
+                                       ("Max", "Máx. (ms)", 80), ("Prom", "Prom. (ms)", 80), ("Total", "Total (ms)", 90),
+                                       ("Filas", "Filas", 80)]:
+            self.diagnostico_tree.heading(columna, text=titulo)
+            self.diagnostico_tree.column(columna, width=ancho, anchor="w" if columna == "Operacion" else "e")
+        self.diagnostico_tree.grid(row=2, column=0, columnspan=4, padx=5, pady=5, sticky="nsew")
+
+        # Consultas lentas con su plan de ejecución
+        tk.Label(parent_frame, text=f"Consultas lentas (>= {instrumentacion.UMBRAL_CONSULTA_LENTA_MS:.0f} ms) y su plan:").grid(row=3, column=0, columnspan=4, padx=5, sticky="w")
+        self.consultas_lentas_text = tk.Text(parent_frame, height=10, wrap="word")
+        self.consultas_lentas_text.grid(row=4, column=0, columnspan=4, padx=5, pady=5, sticky="nsew")
+
+        parent_frame.grid_rowconfigure(2, weight=2)
+        parent_frame.grid_rowconfigure(4, weight=1)
+        parent_frame.grid_columnconfigure(3, weight=1)
+
+    def toggle_instrumentacion(self):
+        if self.instrumentacion_var.get():
+            instrumentacion.activar()
+            self.update_status("Instrumentación activada. Las conexiones nuevas se miden.")
+        else:
+            instrumentacion.desactivar()
+            self.update_status("Instrumentación desactivada.")
+
+    def load_diagnostico(self):
+        for item in self.diagnostico_tree.get_children():
+            self.diagnostico_tree.delete(item)
+        try:
+            limite = int(self.diagnostico_top_spinbox.get())
+        except ValueError:
+            limite = 20
+        for fila in instrumentacion.mas_lentas(limite):
+            self.diagnostico_tree.insert("", tk.END, values=(fila["tipo"], fila["nombre"], fila["llamadas"], f"{fila['max_ms']:.2f}",
+                                                              f"{fila['promedio_ms']:.2f}", f"{fila['total_ms']:.1f}", fila["filas"]))
+
+        self.consultas_lentas_text.delete("1.0", tk.END)
+        for consulta in reversed(instrumentacion.consultas_lentas()):
+            self.consultas_lentas_text.insert(tk.END, f"[{consulta['momento']}] {consulta['ms']:.1f} ms\n{consulta['sentencia']}\n")
+            for paso in consulta["plan"]:
+                self.consultas_lentas_text.insert(tk.END, f"    {paso}\n")
+            self.consultas_lentas_text.insert(tk.END, "\n")
+        self.update_status("Diagnóstico actualizado.")
+
+    def reset_diagnostico(self):
+        instrumentacion.reiniciar()
+        self.load_diagnostico()
+
+    def export_diagnostico(self, formato):
+        extension = ".json" if formato == "json" else ".prom"
+        ruta = filedialog.asksaveasfilename(defaultextension=extension, initialfile=f"diagnostico{extension}",
+                                            filetypes=[("Métricas", f"*{extension}"), ("All files", "*.*")])
+        if not ruta:
+            return
+        if formato == "json":
+            instrumentacion.exportar_json(ruta)
+        else:
+            instrumentacion.exportar_prometheus(ruta)
+        self.update_status(f"Diagnóstico exportado en '{ruta}'.")
+
+
     # =====================================================================
     # === FUNCIONES DE SINCRONIZACIÓN GENERAL ===
     # =====================================================================
@@ -915,21 +1696,29 @@ class PresupuestosAppGUI:
         success, message = presupuesto_backend.sincronizar_a_google_sheets(modulo=module_name)
         if success:
             self.update_status(f"Sincronización de '{module_name}' exitosa: {message}")
+        elif presupuesto_backend.estado_sheets['conectado'] is False:
+            # Sin conexión: el cambio quedó en la cola y se reenvía solo; no hace falta un diálogo por módulo
+            self.update_status(f"Google Sheets sin conexión: '{module_name}' quedó en cola para reenviar.", True)
         else:
             self.update_status(f"Error al sincronizar '{module_name}': {message}", True)
             messagebox.showerror(f"Error Sincronización {module_name}", message)
 
     def sync_all_modules_to_sheets(self):
-        """Sincroniza todos los módulos con Google Sheets."""
+        """Sincroniza todos los módulos con Google Sheets en un solo envío por lotes."""
         self.update_status("Sincronizando todos los módulos...")
-        self.sync_module_to_sheets('productos')
-        self.sync_module_to_sheets('pedidos')
-        self.sync_module_to_sheets('presupuestos')
-        self.sync_module_to_sheets('comprobantes')
-        self.update_status("Sincronización completa de todos los módulos.")
+        success, message = presupuesto_backend.sincronizar_modulos_a_google_sheets(['productos', 'pedidos', 'presupuestos', 'comprobantes'])
+        if success:
+            self.update_status("Sincronización completa de todos los módulos.")
+        elif presupuesto_backend.estado_sheets['conectado'] is False:
+            pendientes = len(presupuesto_backend.pendientes_sheets())
+            self.update_status(f"Google Sheets sin conexión: {pendientes} sincronizaciones en cola, se reenviarán automáticamente.", True)
+        else:
+            self.update_status(f"Error al sincronizar los módulos: {message}", True)
+            messagebox.showerror("Error Sincronización", message)
 
 # --- Punto de entrada de la aplicación ---
 if __name__ == "__main__":
+    registro.configurar()
     root = tk.Tk()
     app = PresupuestosAppGUI(root)
     root.mainloop()
\ No newline at end of file
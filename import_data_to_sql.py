@@ -1,27 +1,32 @@
 import pandas as pd
-import sqlite3
 import os
 import sys
-import traceback
+import logging
+
+import mantenimiento
+import presupuesto_backend
+import registro
+
+registro.configurar(consola=True)
+log = logging.getLogger("import_data_to_sql")
 
 # --- Configuración de Archivos ---
 CSV_PRECIOS_PATH = 'Lista de Precios - Costos.csv' # Nombre de tu archivo CSV de precios
 DB_NAME = 'presupuestos.db' # Nombre del archivo de la base de datos SQLite
 TABLE_NAME = 'productos' # Nombre de la tabla donde se guardarán los productos
-DB_HISTORY_TABLE_NAME = 'presupuestos_guardados' # Nombre de la tabla para el historial
 
 # Tasa de IVA (la usaremos para quitar el IVA al importar si los precios del CSV lo tenían)
 IVA_RATE = 0.21
 
-print(f"DEBUG: [INICIO] Iniciando script de importación...")
-print(f"DEBUG: Archivo CSV de precios: {CSV_PRECIOS_PATH}")
-print(f"DEBUG: Archivo DB SQLite: {DB_NAME}")
+log.info("Iniciando importación: CSV de precios '%s' -> base '%s'.", CSV_PRECIOS_PATH, DB_NAME)
 
 try:
-    # 1. Eliminar base de datos antigua (si existe) para empezar de cero
+    # 1. La base ya no se borra: los productos se actualizan (o agregan) conservando clientes, pedidos y stock.
+    # Igual se hace un backup antes, por si la lista de precios vino mal.
+    presupuesto_backend.DB_PATH = DB_NAME
     if os.path.exists(DB_NAME):
-        os.remove(DB_NAME)
-        print(f"DEBUG: Archivo '{DB_NAME}' existente eliminado para crear uno nuevo.")
+        resguardo = mantenimiento.backup()
+        log.info("Backup previo a la importación: '%s'.", resguardo['detalle'].get('archivo'))
 
     # 2. Leer el CSV con la configuración exacta para tu formato actual
     # header=0: La primera fila es el encabezado.
@@ -29,9 +34,11 @@ try:
     # decimal=',': El separador decimal es la COMA (,) - CRUCIAL para números como "19,50".
     df = pd.read_csv(CSV_PRECIOS_PATH, sep=';', encoding='latin-1', header=0, decimal=',')
 
-    print(f"DEBUG: CSV leído exitosamente en DataFrame. Primeras 5 filas:\n{df.head()}")
-    print(f"DEBUG: Columnas del DataFrame inicial: {list(df.columns)}")
-    print(f"DEBUG: Tipos de datos iniciales:\n{df.dtypes}")
+    log.info("CSV leído: %d filas.", len(df))
+    if log.isEnabledFor(logging.DEBUG): # Armar las vistas previas del DataFrame cuesta; solo si se van a registrar
+        log.debug("Primeras 5 filas:\n%s", df.head())
+        log.debug("Columnas del DataFrame inicial: %s", list(df.columns))
+        log.debug("Tipos de datos iniciales:\n%s", df.dtypes)
 
     # 3. Normalizar nombres de columnas para que coincidan con los que usaremos en la DB
     # Convertir a mayúsculas y limpiar espacios.
@@ -52,8 +59,8 @@ try:
     # Verificar si las columnas esperadas existen ANTES de renombrar
     missing_csv_cols = [col for col in COL_MAPPING.keys() if col not in df.columns]
     if missing_csv_cols:
-        print(f"ERROR: Columnas esperadas en el CSV: {list(COL_MAPPING.keys())}", file=sys.stderr)
-        print(f"ERROR: Columnas encontradas en el DataFrame: {list(df.columns)}", file=sys.stderr)
+        log.error("Columnas esperadas en el CSV: %s", list(COL_MAPPING.keys()))
+        log.error("Columnas encontradas en el DataFrame: %s", list(df.columns))
         raise ValueError(f"Faltan columnas esenciales en el CSV: {', '.join(missing_csv_cols)}. Revise los nombres de encabezado en su CSV (mayúsculas, sin espacios extra) y el delimitador.")
 
     # Renombrar las columnas en el DataFrame
@@ -65,7 +72,8 @@ try:
         'precio_10', 'precio_25', 'precio_tambor_rollo'
     ]].copy()
 
-    print(f"DEBUG: DataFrame después de renombrar y seleccionar columnas:\n{df.head()}")
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("DataFrame después de renombrar y seleccionar columnas:\n%s", df.head())
 
     # 4. Limpiar y convertir datos a numérico, quitando IVA
     price_cols = [
@@ -74,59 +82,76 @@ try:
     ]
 
     for col in price_cols:
-        print(f"DEBUG: Procesando columna de precio: {col}. Tipo inicial: {df[col].dtype}")
+        log.debug("Procesando columna de precio: %s. Tipo inicial: %s", col, df[col].dtype)
         
         clean_strings = df[col].astype(str).str.strip() 
         
         numeric_vals = pd.to_numeric(clean_strings, errors='coerce')
         
         df.loc[:, col] = numeric_vals.apply(lambda x: round(x / (1 + IVA_RATE), 4) if pd.notna(x) and x > 0 else 0.0)
-        print(f"DEBUG: Columna {col} después de procesamiento (primeros 5):\n{df[col].head()}")
     
-    print(f"DEBUG: DataFrame después de limpieza y procesamiento de precios:\n{df.head()}")
-    print(f"DEBUG: Tipo de datos finales de las columnas de precio: \n{df[price_cols].dtypes}")
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("DataFrame después de limpieza y procesamiento de precios:\n%s", df.head())
+        log.debug("Tipo de datos finales de las columnas de precio:\n%s", df[price_cols].dtypes)
 
     # 5. Asegurarse de que el nombre del producto no sea nulo o vacío
     initial_rows = len(df)
     df = df.dropna(subset=['nombre_producto'])
     df = df[df['nombre_producto'] != ''].copy()
-    print(f"DEBUG: Filas después de filtrar nombres (NaN/vacío): {initial_rows} -> {len(df)}")
+    log.info("Filas después de filtrar nombres (NaN/vacío): %d -> %d", initial_rows, len(df))
     
     if df.empty:
         raise ValueError("DataFrame vacío después de la limpieza. No hay productos válidos para importar.")
 
-    # 6. Conectar a la base de datos SQLite y guardar el DataFrame
-    print(f"DEBUG: Conectando a la base de datos '{DB_NAME}' y guardando en la tabla '{TABLE_NAME}'")
-    conn = sqlite3.connect(DB_NAME)
-    
-    df.to_sql(TABLE_NAME, conn, if_exists='replace', index=False)
-    
-    print(f"DEBUG: Creando tabla '{DB_HISTORY_TABLE_NAME}' para el historial de presupuestos.")
+    # 6. Guardar en la tabla productos de la app: upsert por código (el nombre del producto en la lista,
+    # en mayúsculas como lo ingresa la app). Se actualizan descripción, costo y precios; el stock y el estado no se tocan.
+    conn = presupuesto_backend.conectar()
     cursor = conn.cursor()
-    cursor.execute(f"""
-        CREATE TABLE IF NOT EXISTS {DB_HISTORY_TABLE_NAME} (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            numero_presupuesto INTEGER NOT NULL UNIQUE,
-            fecha_presupuesto TEXT NOT NULL,
-            razon_social_cliente TEXT NOT NULL,
-            documento_cliente TEXT,
-            total_usd REAL NOT NULL,
-            total_ars REAL NOT NULL,
-            tipo_cambio REAL NOT NULL,
-            metodo_pago TEXT,
-            detalles_pago TEXT,
-            fecha_guardado TEXT DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    conn.commit()
-    
+    cursor.execute(f"PRAGMA table_info({TABLE_NAME})")
+    columnas_actuales = [fila[1] for fila in cursor.fetchall()]
+    if columnas_actuales and 'codigo' not in columnas_actuales:
+        # Tabla creada por versiones anteriores de este script (solo precios, sin código ni stock): se reemplaza
+        log.warning("La tabla '%s' tiene el formato viejo del importador; se reemplaza por la de la app.", TABLE_NAME)
+        cursor.execute(f"DROP TABLE {TABLE_NAME}")
+        conn.commit()
     conn.close()
-    print(f"DEBUG: [FIN] ¡Importación completada! Los datos de productos se guardaron en la tabla '{TABLE_NAME}' en '{DB_NAME}'.")
+    presupuesto_backend.inicializar_base_de_datos()
+
+    df['codigo'] = df['nombre_producto'].astype(str).str.strip().str.upper()
+    df['descripcion'] = df['nombre_producto'].astype(str).str.strip()
+    df = df.drop_duplicates(subset='codigo', keep='last')
+    columnas = ['codigo', 'descripcion'] + price_cols
+
+    conn = presupuesto_backend.conectar()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"SELECT COUNT(*) FROM {TABLE_NAME}")
+        productos_antes = cursor.fetchone()[0]
+        cambios_antes = conn.total_changes
+        # Los productos que no cambiaron no se reescriben (ni se anotan en registro_cambios)
+        cursor.executemany(f"""
+            INSERT INTO {TABLE_NAME} ({', '.join(columnas)}) VALUES ({', '.join('?' * len(columnas))})
+            ON CONFLICT(codigo) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in columnas[1:])}
+            WHERE ({', '.join(columnas[1:])}) IS NOT ({', '.join(f'excluded.{c}' for c in columnas[1:])})
+        """, df[columnas].itertuples(index=False, name=None))
+        cursor.execute(f"SELECT COUNT(*) FROM {TABLE_NAME}")
+        nuevos = cursor.fetchone()[0] - productos_antes
+        actualizados = conn.total_changes - cambios_antes - nuevos
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    log.info("¡Importación completada! %d productos en la lista: %d nuevos, %d actualizados y %d sin cambios en la tabla '%s' de '%s'.",
+             len(df), nuevos, actualizados, len(df) - nuevos - actualizados, TABLE_NAME, DB_NAME)
 
 except FileNotFoundError:
-    print(f"ERROR: El archivo CSV '{CSV_PRECIOS_PATH}' no fue encontrado. Asegúrese de que esté en la misma carpeta y su nombre sea correcto.", file=sys.stderr)
+    log.error("El archivo CSV '%s' no fue encontrado. Asegúrese de que esté en la misma carpeta y su nombre sea correcto.", CSV_PRECIOS_PATH)
+    sys.exit(1)
 except pd.errors.EmptyDataError:
-    print(f"ERROR: El archivo CSV '{CSV_PRECIOS_PATH}' está vacío o no contiene datos válidos después de la lectura inicial.", file=sys.stderr)
+    log.error("El archivo CSV '%s' está vacío o no contiene datos válidos después de la lectura inicial.", CSV_PRECIOS_PATH)
+    sys.exit(1)
 except Exception as e:
-    print(f"ERROR: Ocurrió un error inesperado durante la importación del CSV a SQLite: {e}", file=sys.stderr)
-    traceback.print_exc(file=sys.stderr)
\ No newline at end of file
+    log.exception("Ocurrió un error inesperado durante la importación del CSV a SQLite: %s", e)
+    sys.exit(1)
\ No newline at end of file
@@ -0,0 +1,331 @@
+import functools
+import heapq
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+
+# --- Instrumentación y perfilado de consultas ---
+# Mide cuánto tardan las funciones del backend marcadas con @medir() y cada sentencia SQL
+# ejecutada por conexiones abiertas con presupuesto_backend.conectar(). Las sentencias que superan
+# UMBRAL_CONSULTA_LENTA_MS se guardan junto con su EXPLAIN QUERY PLAN.
+# Desactivada por defecto: sin activar, @medir() solo agrega una comprobación de un booleano por
+# llamada y conectar() devuelve una conexión sqlite3 común, sin callbacks.
+# Se activa con la variable de entorno PRESUPUESTOS_INSTRUMENTACION=1 o llamando a activar().
+
+UMBRAL_CONSULTA_LENTA_MS = 50.0
+MAX_CONSULTAS_LENTAS = 100 # Se guardan las últimas N consultas lentas
+PASOS_PROGRESO = 1000 # Cada cuántas instrucciones de la VM de SQLite se llama al progress handler
+
+_activo = os.environ.get("PRESUPUESTOS_INSTRUMENTACION") == "1"
+_lock = threading.Lock()
+_operaciones = {} # nombre -> Estadistica
+_consultas = {} # sentencia normalizada -> Estadistica
+_consultas_lentas = deque(maxlen=MAX_CONSULTAS_LENTAS)
+
+_RE_ESPACIOS = re.compile(r"\s+")
+
+log = logging.getLogger(__name__)
+
+
+class Estadistica:
+    """Acumulado de una operación o sentencia: llamadas, tiempo total/máximo, filas y pasos de la VM."""
+
+    __slots__ = ("llamadas", "segundos", "maximo", "filas", "pasos_vm", "errores")
+
+    def __init__(self):
+        self.llamadas = 0
+        self.segundos = 0.0
+        self.maximo = 0.0
+        self.filas = 0
+        self.pasos_vm = 0
+        self.errores = 0
+
+    def registrar(self, segundos, filas=0, pasos_vm=0, error=False):
+        self.llamadas += 1
+        self.segundos += segundos
+        self.filas += filas
+        self.pasos_vm += pasos_vm
+        self.errores += error
+        if segundos > self.maximo:
+            self.maximo = segundos
+
+    def como_dict(self):
+        return {
+            "llamadas": self.llamadas,
+            "total_ms": round(self.segundos * 1000, 3),
+            "promedio_ms": round(self.segundos * 1000 / self.llamadas, 3) if self.llamadas else 0.0,
+            "max_ms": round(self.maximo * 1000, 3),
+            "filas": self.filas,
+            "pasos_vm": self.pasos_vm,
+            "errores": self.errores,
+        }
+
+
+def activo():
+    return _activo
+
+
+def activar():
+    global _activo
+    _activo = True
+
+
+def desactivar():
+    global _activo
+    _activo = False
+
+
+def reiniciar():
+    """Borra todos los contadores y consultas lentas registrados."""
+    with _lock:
+        _operaciones.clear()
+        _consultas.clear()
+        _consultas_lentas.clear()
+
+
+def _registrar(tabla, clave, segundos, **datos):
+    with _lock:
+        estadistica = tabla.get(clave)
+        if estadistica is None:
+            estadistica = tabla[clave] = Estadistica()
+        estadistica.registrar(segundos, **datos)
+
+
+# --- Funciones del backend ---
+
+def medir(nombre=None):
+    """
+    Decorador que registra la duración de cada llamada a la función cuando la instrumentación está activa.
+    'nombre' por defecto es modulo.funcion.
+    """
+    def decorador(funcion):
+        clave = nombre or f"{funcion.__module__}.{funcion.__qualname__}"
+
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            if not _activo:
+                return funcion(*args, **kwargs)
+            inicio = time.perf_counter()
+            error = True
+            try:
+                resultado = funcion(*args, **kwargs)
+                error = False
+                return resultado
+            finally:
+                _registrar(_operaciones, clave, time.perf_counter() - inicio, error=error)
+        return envoltura
+    return decorador
+
+
+# --- Sentencias SQL ---
+
+def _normalizar(sql):
+    return _RE_ESPACIOS.sub(" ", sql).strip()
+
+
+class CursorInstrumentado(sqlite3.Cursor):
+    """
+    Cursor que mide cada execute/executemany y cuenta las filas leídas o modificadas.
+    En un SELECT la mayor parte del trabajo ocurre al leer las filas, así que el tiempo y los pasos
+    de la VM de fetchone/fetchmany/fetchall se suman a la misma sentencia.
+    """
+
+    _medicion = None # [sentencia, sql, parámetros, segundos acumulados, ya registrada como lenta]
+
+    def _terminar_medicion(self, segundos, filas, pasos_vm, llamada, completa):
+        medicion = self._medicion
+        with _lock:
+            estadistica = _consultas.get(medicion[0])
+            if estadistica is None:
+                estadistica = _consultas[medicion[0]] = Estadistica()
+            if llamada:
+                estadistica.registrar(segundos, filas=filas, pasos_vm=pasos_vm)
+            else:
+                estadistica.segundos += segundos
+                estadistica.filas += filas
+                estadistica.pasos_vm += pasos_vm
+            medicion[3] += segundos
+            if medicion[3] > estadistica.maximo:
+                estadistica.maximo = medicion[3]
+        if completa and not medicion[4] and medicion[3] * 1000 >= UMBRAL_CONSULTA_LENTA_MS:
+            medicion[4] = True
+            _registrar_consulta_lenta(self.connection, medicion[0], medicion[1], medicion[2], medicion[3])
+
+    def execute(self, sql, parametros=()):
+        conexion = self.connection
+        pasos = conexion._pasos_vm
+        inicio = time.perf_counter()
+        try:
+            resultado = sqlite3.Cursor.execute(self, sql, parametros)
+        except sqlite3.Error:
+            self._medicion = None
+            _registrar(_consultas, _normalizar(sql), time.perf_counter() - inicio, error=True)
+            raise
+        self._medicion = [_normalizar(sql), sql, parametros, 0.0, False]
+        # Si la sentencia no devuelve filas (INSERT/UPDATE/DELETE) ya terminó acá
+        self._terminar_medicion(time.perf_counter() - inicio, max(self.rowcount, 0),
+                                (conexion._pasos_vm - pasos) * PASOS_PROGRESO, llamada=True, completa=self.description is None)
+        return resultado
+
+    def executemany(self, sql, secuencia_parametros):
+        # Se materializa para poder usar el primer juego de parámetros en el EXPLAIN si la sentencia es lenta
+        secuencia_parametros = list(secuencia_parametros)
+        conexion = self.connection
+        pasos = conexion._pasos_vm
+        inicio = time.perf_counter()
+        try:
+            return sqlite3.Cursor.executemany(self, sql, secuencia_parametros)
+        finally:
+            self._medicion = [_normalizar(sql), sql, secuencia_parametros[0] if secuencia_parametros else (), 0.0, False]
+            self._terminar_medicion(time.perf_counter() - inicio, max(self.rowcount, 0),
+                                    (conexion._pasos_vm - pasos) * PASOS_PROGRESO, llamada=True, completa=True)
+
+    def _leer(self, metodo, *args):
+        conexion = self.connection
+        pasos = conexion._pasos_vm
+        inicio = time.perf_counter()
+        resultado = metodo(*args)
+        return resultado, time.perf_counter() - inicio, (conexion._pasos_vm - pasos) * PASOS_PROGRESO
+
+    def fetchone(self):
+        if self._medicion is None:
+            return super().fetchone()
+        fila, segundos, pasos_vm = self._leer(super().fetchone)
+        self._terminar_medicion(segundos, int(fila is not None), pasos_vm, llamada=False, completa=fila is None)
+        return fila
+
+    def fetchmany(self, size=None):
+        size = size if size is not None else self.arraysize
+        if self._medicion is None:
+            return super().fetchmany(size)
+        filas, segundos, pasos_vm = self._leer(super().fetchmany, size)
+        self._terminar_medicion(segundos, len(filas), pasos_vm, llamada=False, completa=len(filas) < size)
+        return filas
+
+    def fetchall(self):
+        if self._medicion is None:
+            return super().fetchall()
+        filas, segundos, pasos_vm = self._leer(super().fetchall)
+        self._terminar_medicion(segundos, len(filas), pasos_vm, llamada=False, completa=True)
+        return filas
+
+
+class ConexionInstrumentada(sqlite3.Connection):
+    """
+    Conexión cuyos cursores son CursorInstrumentado. conn.execute y conn.executemany se redefinen para pasar
+    por cursor(): los de sqlite3.Connection arman un cursor interno común y las sentencias no se medirían.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pasos_vm = 0 # Contador creciente; cada sentencia toma la diferencia antes/después
+        self.set_progress_handler(self._progreso, PASOS_PROGRESO)
+
+    def _progreso(self):
+        self._pasos_vm += 1
+        return 0 # 0 = seguir ejecutando
+
+    def cursor(self, factory=CursorInstrumentado):
+        return super().cursor(factory)
+
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, secuencia_parametros):
+        return self.cursor().executemany(sql, secuencia_parametros)
+
+
+def _registrar_consulta_lenta(conexion, sentencia, sql, parametros, segundos):
+    """Guarda una consulta lenta con su plan de ejecución (EXPLAIN QUERY PLAN con los mismos parámetros)."""
+    try:
+        plan = [fila[3] for fila in sqlite3.Cursor(conexion).execute(f"EXPLAIN QUERY PLAN {sql}", parametros)]
+    except sqlite3.Error as e:
+        plan = [f"(sin plan: {e})"]
+    with _lock:
+        _consultas_lentas.append({
+            "sentencia": sentencia,
+            "ms": round(segundos * 1000, 3),
+            "momento": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "plan": plan,
+        })
+    log.warning("Consulta lenta (%.1f ms): %s | plan: %s", segundos * 1000, sentencia, " / ".join(plan))
+
+
+def conectar(db_path, **opciones):
+    """Abre una conexión instrumentada si la instrumentación está activa, o una común si no (opciones van a sqlite3.connect)."""
+    if _activo:
+        return sqlite3.connect(db_path, factory=ConexionInstrumentada, **opciones)
+    return sqlite3.connect(db_path, **opciones)
+
+
+# --- Consulta y exportación de los contadores ---
+
+def mas_lentas(n=20, criterio="max_ms"):
+    """
+    Las N operaciones más lentas (funciones y sentencias SQL) según 'criterio'
+    ('max_ms', 'total_ms' o 'promedio_ms'). Cada elemento: dict con 'tipo', 'nombre' y los contadores.
+    """
+    with _lock:
+        filas = [{"tipo": "funcion", "nombre": nombre, **e.como_dict()} for nombre, e in _operaciones.items()]
+        filas += [{"tipo": "sql", "nombre": sentencia, **e.como_dict()} for sentencia, e in _consultas.items()]
+    return heapq.nlargest(n, filas, key=lambda fila: fila[criterio])
+
+
+def consultas_lentas():
+    with _lock:
+        return list(_consultas_lentas)
+
+
+def instantanea():
+    """Todos los contadores como diccionario (base de las exportaciones)."""
+    with _lock:
+        return {
+            "activo": _activo,
+            "funciones": {nombre: e.como_dict() for nombre, e in _operaciones.items()},
+            "sql": {sentencia: e.como_dict() for sentencia, e in _consultas.items()},
+            "consultas_lentas": list(_consultas_lentas),
+        }
+
+
+def exportar_json(ruta=None):
+    """Devuelve los contadores en JSON; si se indica 'ruta', además los guarda en ese archivo."""
+    texto = json.dumps(instantanea(), indent=2, ensure_ascii=False)
+    if ruta:
+        with open(ruta, "w", encoding="utf-8") as archivo:
+            archivo.write(texto)
+    return texto
+
+
+def _etiqueta(valor):
+    return valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def exportar_prometheus(ruta=None):
+    """Devuelve los contadores en formato de texto de Prometheus; si se indica 'ruta', además los guarda."""
+    datos = instantanea()
+    lineas = []
+    for prefijo, etiqueta, grupo in (("presupuestos_funcion", "funcion", datos["funciones"]),
+                                     ("presupuestos_sql", "sentencia", datos["sql"])):
+        metricas = [("llamadas_total", "counter", "llamadas"),
+                    ("segundos_total", "counter", "total_ms"),
+                    ("segundos_max", "gauge", "max_ms"),
+                    ("errores_total", "counter", "errores")]
+        if prefijo == "presupuestos_sql":
+            metricas += [("filas_total", "counter", "filas"), ("pasos_vm_total", "counter", "pasos_vm")]
+        for sufijo, tipo, campo in metricas:
+            lineas.append(f"# TYPE {prefijo}_{sufijo} {tipo}")
+            for nombre, valores in grupo.items():
+                valor = valores[campo] / 1000 if campo.endswith("_ms") else valores[campo]
+                lineas.append(f'{prefijo}_{sufijo}{{{etiqueta}="{_etiqueta(nombre)}"}} {valor}')
+    lineas.append("# TYPE presupuestos_consultas_lentas gauge")
+    lineas.append(f"presupuestos_consultas_lentas {len(datos['consultas_lentas'])}")
+    texto = "\n".join(lineas) + "\n"
+    if ruta:
+        with open(ruta, "w", encoding="utf-8") as archivo:
+            archivo.write(texto)
+    return texto
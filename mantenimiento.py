@@ -0,0 +1,505 @@
+import argparse
+import datetime
+import glob
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+import cuenta_corriente
+import movimientos_stock
+import presupuesto_backend
+import registro
+import reposicion
+import revalidacion_precios
+
+log = logging.getLogger(__name__)
+
+# --- Mantenimiento de presupuestos.db ---
+# Backups en caliente, compactación, estadísticas del planificador y verificación de integridad.
+# Cada operación se mide y queda anotada en la tabla mantenimiento_historial con su duración total
+# y la "pausa máxima": el tramo más largo en el que tuvo tomada la base (lo máximo que pudo
+# esperar un usuario que quería escribir en ese momento).
+#
+# Los backups se copian con la API de backup de SQLite de a PAGINAS_POR_PASO páginas, soltando la
+# base entre paso y paso, así la aplicación puede seguir escribiendo mientras se copia.
+# Con un backup y la tabla registro_cambios (que llenan los triggers de presupuesto_backend) se
+# puede restaurar la base a cualquier momento posterior al backup.
+
+CARPETA_BACKUPS = "backups" # Relativa a la carpeta de la base
+PREFIJO_BACKUP = "presupuestos-"
+FORMATO_FECHA_BACKUP = "%Y%m%d-%H%M%S-%f" # Con microsegundos: dos backups seguidos no se pisan
+BACKUPS_A_CONSERVAR = 14
+PAGINAS_POR_PASO = 256 # Páginas copiadas por paso del backup (1 MB con páginas de 4 KB)
+PAUSA_ENTRE_PASOS = 0.005 # Segundos en que el backup suelta la base entre pasos
+MAXIMO_REINICIOS_BACKUP = 3 # Si la base cambia tanto que el backup se reinicia más veces, se copia de una vez
+PAGINAS_VACUUM_POR_PASO = 512 # Páginas libres devueltas al sistema por transacción
+INTERVALO_MANTENIMIENTO_HORAS = 24
+LIMITE_ANALISIS = 1000 # PRAGMA analysis_limit: filas muestreadas por índice en ANALYZE
+
+_programador = None
+
+
+def _conectar(ruta=None):
+    conn = sqlite3.connect(ruta or presupuesto_backend.DB_PATH, timeout=30)
+    conn.execute("PRAGMA busy_timeout = 30000")
+    return conn
+
+
+def carpeta_backups():
+    return os.path.join(os.path.dirname(os.path.abspath(presupuesto_backend.DB_PATH)), CARPETA_BACKUPS)
+
+
+def _registrar(operacion, inicio, segundos, pausa_max_ms, resultado, detalle=None):
+    """Anota una operación en mantenimiento_historial y en el log. Devuelve el resumen como diccionario."""
+    resumen = {'operacion': operacion, 'inicio': inicio.isoformat(timespec='seconds'), 'segundos': round(segundos, 3),
+               'pausa_max_ms': round(pausa_max_ms, 3), 'resultado': resultado, 'detalle': detalle or {}}
+    conn = _conectar()
+    try:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS mantenimiento_historial (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                operacion TEXT NOT NULL,
+                inicio TEXT NOT NULL,
+                segundos REAL NOT NULL,
+                pausa_max_ms REAL NOT NULL,
+                resultado TEXT NOT NULL,
+                detalle TEXT
+            )
+        """)
+        conn.execute("INSERT INTO mantenimiento_historial (operacion, inicio, segundos, pausa_max_ms, resultado, detalle) VALUES (?, ?, ?, ?, ?, ?)",
+                     (operacion, resumen['inicio'], resumen['segundos'], resumen['pausa_max_ms'], resultado,
+                      json.dumps(resumen['detalle'], ensure_ascii=False)))
+        conn.commit()
+    finally:
+        conn.close()
+    nivel = logging.INFO if resultado == 'ok' else logging.ERROR
+    log.log(nivel, "Mantenimiento '%s': %s en %.3f s (pausa máxima %.1f ms). %s", operacion, resultado,
+            segundos, pausa_max_ms, resumen['detalle'])
+    return resumen
+
+
+def historial(limite=50):
+    """Últimas operaciones de mantenimiento: lista de (operacion, inicio, segundos, pausa_max_ms, resultado, detalle)."""
+    conn = _conectar()
+    try:
+        return conn.execute("""SELECT operacion, inicio, segundos, pausa_max_ms, resultado, detalle
+                               FROM mantenimiento_historial ORDER BY id DESC LIMIT ?""", (limite,)).fetchall()
+    except sqlite3.OperationalError:
+        return [] # Todavía no se hizo ningún mantenimiento
+    finally:
+        conn.close()
+
+
+def preparar_base():
+    """
+    Deja la base en modo WAL (los lectores, incluido el backup, no bloquean a quien escribe) y con
+    auto_vacuum incremental. Cambiar auto_vacuum en una base existente requiere un VACUUM completo,
+    que bloquea la base mientras dura: conviene correrlo una sola vez, fuera de horario.
+    """
+    inicio, t0 = datetime.datetime.now(), time.perf_counter()
+    conn = _conectar()
+    try:
+        modo = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+        vacuum_completo = conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2
+        if vacuum_completo:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+    finally:
+        conn.close()
+    segundos = time.perf_counter() - t0
+    return _registrar('preparar', inicio, segundos, segundos * 1000, 'ok',
+                      {'journal_mode': modo, 'vacuum_completo': vacuum_completo})
+
+
+# --- Backups ---
+
+def backup(destino=None, paginas_por_paso=PAGINAS_POR_PASO, pausa=PAUSA_ENTRE_PASOS):
+    """
+    Copia la base en uso a 'destino' (por defecto backups/presupuestos-AAAAMMDD-HHMMSS-ffffff.db) sin detener la app.
+    Verifica la copia con quick_check y borra los backups más viejos que BACKUPS_A_CONSERVAR.
+    Devuelve el resumen de la operación (con la ruta del backup en detalle['archivo']).
+    """
+    inicio = datetime.datetime.now()
+    if destino is None:
+        os.makedirs(carpeta_backups(), exist_ok=True)
+        destino = os.path.join(carpeta_backups(), f"{PREFIJO_BACKUP}{inicio.strftime(FORMATO_FECHA_BACKUP)}.db")
+    temporal = destino + ".parcial"
+
+    pasos = {'cantidad': 0, 'pausa_max': 0.0, 'reinicios': 0, 'restantes': None, 'desde': 0.0}
+
+    def progreso(estado, restantes, total):
+        ahora = time.perf_counter()
+        pasos['cantidad'] += 1
+        pasos['pausa_max'] = max(pasos['pausa_max'], ahora - pasos['desde'])
+        if pasos['restantes'] is not None and restantes > pasos['restantes']:
+            # Otra conexión escribió: SQLite reinicia la copia desde el principio
+            pasos['reinicios'] += 1
+            if pasos['reinicios'] > MAXIMO_REINICIOS_BACKUP:
+                raise InterruptedError("la base cambia demasiado rápido para copiarla por pasos")
+        pasos['restantes'] = restantes
+        time.sleep(pausa) # Suelta la base para que la app pueda escribir
+        pasos['desde'] = time.perf_counter()
+
+    t0 = time.perf_counter()
+    origen = _conectar()
+    try:
+        copia = sqlite3.connect(temporal)
+        try:
+            pasos['desde'] = time.perf_counter()
+            try:
+                origen.backup(copia, pages=paginas_por_paso, progress=progreso)
+            except InterruptedError:
+                # Copia en un solo paso: en modo WAL no bloquea a quien escribe, solo a otros checkpoints
+                log.warning("Backup por pasos reiniciado %d veces; se copia en un solo paso.", pasos['reinicios'])
+                t_unico = time.perf_counter()
+                origen.backup(copia)
+                pasos['pausa_max'] = max(pasos['pausa_max'], time.perf_counter() - t_unico)
+            integridad = copia.execute("PRAGMA quick_check").fetchall()
+            ultimo_cambio = _ultimo_cambio(copia)
+        finally:
+            copia.close()
+    finally:
+        origen.close()
+
+    if integridad != [('ok',)]:
+        os.remove(temporal)
+        return _registrar('backup', inicio, time.perf_counter() - t0, pasos['pausa_max'] * 1000, 'error',
+                          {'integridad': [fila[0] for fila in integridad[:10]]})
+    os.replace(temporal, destino)
+    borrados = _podar_backups()
+    return _registrar('backup', inicio, time.perf_counter() - t0, pasos['pausa_max'] * 1000, 'ok', {
+        'archivo': destino, 'bytes': os.path.getsize(destino), 'pasos': pasos['cantidad'],
+        'reinicios': pasos['reinicios'], 'ultimo_cambio': ultimo_cambio, 'backups_borrados': borrados,
+    })
+
+
+def _ultimo_cambio(conn):
+    """ID del último cambio anotado en registro_cambios de una base (0 si no hay registro)."""
+    try:
+        return conn.execute("SELECT COALESCE(MAX(id), 0) FROM registro_cambios").fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+
+
+def listar_backups():
+    """Backups disponibles, del más viejo al más nuevo: lista de (momento, ruta)."""
+    backups = []
+    for ruta in glob.glob(os.path.join(carpeta_backups(), f"{PREFIJO_BACKUP}*.db")):
+        nombre = os.path.basename(ruta)[len(PREFIJO_BACKUP):-len(".db")]
+        try:
+            backups.append((datetime.datetime.strptime(nombre, FORMATO_FECHA_BACKUP), ruta))
+        except ValueError:
+            continue
+    return sorted(backups)
+
+
+def _podar_backups():
+    """
+    Borra los backups que exceden BACKUPS_A_CONSERVAR y, del registro de cambios, lo anterior al backup
+    más viejo que queda (ya no sirve para restaurar). Devuelve la cantidad de backups borrados.
+    """
+    backups = listar_backups()
+    sobrantes = backups[:-BACKUPS_A_CONSERVAR] if len(backups) > BACKUPS_A_CONSERVAR else []
+    for _, ruta in sobrantes:
+        os.remove(ruta)
+    if len(backups) > len(sobrantes):
+        copia = sqlite3.connect(backups[len(sobrantes)][1])
+        hasta = _ultimo_cambio(copia)
+        copia.close()
+        conn = _conectar()
+        try:
+            # Queda el último cambio del backup: así MAX(id) no vuelve atrás y los cambios nuevos siguen numerándose después
+            conn.execute("DELETE FROM registro_cambios WHERE id < ?", (hasta,))
+            conn.commit()
+        except sqlite3.OperationalError:
+            pass # Base sin registro de cambios
+        finally:
+            conn.close()
+    return len(sobrantes)
+
+
+def restaurar(momento=None, destino=None):
+    """
+    Restaura la base al estado que tenía en 'momento' (datetime o texto ISO; por defecto, el último cambio
+    registrado): toma el último backup anterior a ese momento y le aplica, en orden, los cambios de
+    registro_cambios posteriores al backup y hasta 'momento'.
+    Si se indica 'destino', el resultado se guarda ahí y la base en uso no se toca. Si no, antes de
+    reemplazar la base en uso se le hace un backup (para poder volver atrás).
+    Devuelve el resumen de la operación.
+    """
+    inicio, t0 = datetime.datetime.now(), time.perf_counter()
+    if isinstance(momento, str):
+        momento = datetime.datetime.fromisoformat(momento)
+    momento = momento or datetime.datetime.max
+    limite = momento.isoformat(timespec='milliseconds') # Mismo formato que registro_cambios.momento
+    # El último backup cuyo último cambio registrado no pase de 'momento'
+    elegido = None
+    for fecha, ruta in reversed(listar_backups()):
+        if fecha > momento:
+            continue
+        copia = sqlite3.connect(ruta)
+        try:
+            ultimo = copia.execute("SELECT momento FROM registro_cambios ORDER BY id DESC LIMIT 1").fetchone()
+        except sqlite3.OperationalError:
+            ultimo = None
+        finally:
+            copia.close()
+        if ultimo is None or ultimo[0] <= limite:
+            elegido = (fecha, ruta)
+            break
+    if elegido is None:
+        return _registrar('restaurar', inicio, time.perf_counter() - t0, 0, 'error',
+                          {'motivo': f"No hay backups anteriores a {limite}."})
+    fecha_backup, ruta_backup = elegido
+
+    temporal = (destino or presupuesto_backend.DB_PATH) + ".restaurando"
+    shutil.copyfile(ruta_backup, temporal)
+    restaurada = sqlite3.connect(temporal)
+    try:
+        desde = _ultimo_cambio(restaurada)
+        cambios = []
+        if os.path.exists(presupuesto_backend.DB_PATH):
+            actual = _conectar()
+            try:
+                cambios = actual.execute("""SELECT id, momento, tabla, operacion, datos FROM registro_cambios
+                                            WHERE id > ? AND momento <= ? ORDER BY id""",
+                                         (desde, limite)).fetchall()
+            except sqlite3.OperationalError:
+                cambios = []
+            finally:
+                actual.close()
+        _aplicar_cambios(restaurada, cambios)
+        restaurada.commit()
+    finally:
+        restaurada.close()
+
+    pausa_max = 0.0
+    if destino:
+        os.replace(temporal, destino)
+        archivo = destino
+    else:
+        resguardo = backup()['detalle'].get('archivo')
+        origen, actual = sqlite3.connect(temporal), _conectar()
+        try:
+            # La API de backup reemplaza el contenido de la base en uso de forma atómica para las demás conexiones
+            t_reemplazo = time.perf_counter()
+            origen.backup(actual)
+            pausa_max = time.perf_counter() - t_reemplazo
+        finally:
+            origen.close()
+            actual.close()
+        os.remove(temporal)
+        archivo = presupuesto_backend.DB_PATH
+        log.info("Base en uso reemplazada; el estado anterior quedó en '%s'.", resguardo)
+
+    return _registrar('restaurar', inicio, time.perf_counter() - t0, pausa_max * 1000, 'ok', {
+        'backup': ruta_backup, 'fecha_backup': fecha_backup.isoformat(), 'cambios_aplicados': len(cambios),
+        'hasta': cambios[-1][1] if cambios else None, 'archivo': archivo,
+    })
+
+
+def _aplicar_cambios(conn, cambios):
+    """
+    Aplica entradas de registro_cambios a una base. Los triggers de registro se quitan mientras tanto
+    (las entradas se copian tal cual, con su ID y momento) y se vuelven a crear al final; los de totales
+    siguen activos, así las cabeceras quedan consistentes con el detalle. La cuenta corriente se
+    reconstruye al final desde las notas y los comprobantes restaurados. Los movimientos de stock se
+    copian sin el trigger de proyección: las filas de productos del registro ya traen el stock resultante.
+    Las alertas de stock bajo se recalculan al final (reemplazar una fila de productos no dispara sus triggers).
+    """
+    cursor = conn.cursor()
+    presupuesto_backend._quitar_triggers_registro(cursor)
+    presupuesto_backend._quitar_triggers_cuenta_corriente(cursor)
+    presupuesto_backend._quitar_triggers_movimientos_stock(cursor)
+    for _, _, tabla, operacion, datos in cambios:
+        fila = json.loads(datos)
+        columnas = list(fila)
+        if operacion == 'D':
+            cursor.execute(f"DELETE FROM {tabla} WHERE {' AND '.join(f'{c} = ?' for c in columnas)}", list(fila.values()))
+        else:
+            cursor.execute(f"INSERT OR REPLACE INTO {tabla} ({', '.join(columnas)}) VALUES ({', '.join('?' * len(columnas))})",
+                           list(fila.values()))
+    cursor.executemany("INSERT INTO registro_cambios (id, momento, tabla, operacion, datos) VALUES (?, ?, ?, ?, ?)", cambios)
+    for tabla in presupuesto_backend.TABLAS_CON_REGISTRO:
+        presupuesto_backend._crear_triggers_registro(cursor, tabla)
+    presupuesto_backend._reconstruir_cuenta_corriente(cursor)
+    presupuesto_backend._crear_triggers_cuenta_corriente(cursor)
+    presupuesto_backend._crear_triggers_movimientos_stock(cursor)
+    presupuesto_backend._reconstruir_alertas_stock(cursor)
+
+
+# --- Compactación, estadísticas e integridad ---
+
+def vacuum_incremental(paginas_por_paso=PAGINAS_VACUUM_POR_PASO):
+    """
+    Devuelve al sistema las páginas libres de la base, de a 'paginas_por_paso' por transacción para no
+    tenerla tomada mucho tiempo. Solo tiene efecto con auto_vacuum incremental (ver preparar_base).
+    """
+    inicio, t0 = datetime.datetime.now(), time.perf_counter()
+    conn = _conectar()
+    pausa_max, pasos = 0.0, 0
+    try:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return _registrar('vacuum_incremental', inicio, time.perf_counter() - t0, 0, 'omitido',
+                              {'motivo': "auto_vacuum no es incremental; correr 'preparar' una vez."})
+        libres_antes = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        while conn.execute("PRAGMA freelist_count").fetchone()[0] > 0:
+            t_paso = time.perf_counter()
+            conn.execute(f"PRAGMA incremental_vacuum({int(paginas_por_paso)})").fetchall()
+            conn.commit()
+            pausa_max = max(pausa_max, time.perf_counter() - t_paso)
+            pasos += 1
+            time.sleep(PAUSA_ENTRE_PASOS)
+        tamano_pagina = conn.execute("PRAGMA page_size").fetchone()[0]
+    finally:
+        conn.close()
+    return _registrar('vacuum_incremental', inicio, time.perf_counter() - t0, pausa_max * 1000, 'ok',
+                      {'paginas_liberadas': libres_antes, 'bytes_liberados': libres_antes * tamano_pagina, 'pasos': pasos})
+
+
+def optimizar():
+    """ANALYZE acotado por analysis_limit y PRAGMA optimize: estadísticas al día para el planificador de consultas."""
+    inicio, t0 = datetime.datetime.now(), time.perf_counter()
+    conn = _conectar()
+    try:
+        conn.execute(f"PRAGMA analysis_limit = {LIMITE_ANALISIS}")
+        conn.execute("ANALYZE")
+        conn.execute("PRAGMA optimize")
+        conn.commit()
+    finally:
+        conn.close()
+    segundos = time.perf_counter() - t0
+    return _registrar('optimizar', inicio, segundos, segundos * 1000, 'ok', {'analysis_limit': LIMITE_ANALISIS})
+
+
+def verificar_integridad(completa=False):
+    """
+    PRAGMA quick_check (o integrity_check si completa=True, que además revisa los índices contra las tablas).
+    Lee la base sin bloquear a quien escribe en modo WAL. El resultado es 'ok' o 'error' con los problemas en detalle.
+    """
+    inicio, t0 = datetime.datetime.now(), time.perf_counter()
+    pragma = "integrity_check" if completa else "quick_check"
+    conn = _conectar()
+    try:
+        problemas = [fila[0] for fila in conn.execute(f"PRAGMA {pragma}").fetchall()]
+    finally:
+        conn.close()
+    ok = problemas == ['ok']
+    return _registrar(pragma, inicio, time.perf_counter() - t0, 0, 'ok' if ok else 'error',
+                      {} if ok else {'problemas': problemas[:20]})
+
+
+def cierres_cuenta_corriente():
+    """Cierres mensuales de la cuenta corriente hasta el mes anterior (ver cuenta_corriente.py)."""
+    inicio, t0 = datetime.datetime.now(), time.perf_counter()
+    cierres = cuenta_corriente.generar_cierres()
+    segundos = time.perf_counter() - t0
+    return _registrar('cierres_cuenta_corriente', inicio, segundos, segundos * 1000, 'ok', {'cierres': cierres})
+
+
+def instantaneas_stock():
+    """Instantáneas del stock de los productos con movimientos nuevos (ver movimientos_stock.py)."""
+    inicio, t0 = datetime.datetime.now(), time.perf_counter()
+    instantaneas = movimientos_stock.generar_instantaneas()
+    segundos = time.perf_counter() - t0
+    return _registrar('instantaneas_stock', inicio, segundos, segundos * 1000, 'ok', {'instantaneas': instantaneas})
+
+
+def reposicion_stock():
+    """Recalcula consumos y puntos de reposición y escribe el informe diario de alertas (ver reposicion.py)."""
+    inicio, t0 = datetime.datetime.now(), time.perf_counter()
+    consumos, puntos = reposicion.recalcular_puntos()
+    archivo, alertas = reposicion.informe_diario()
+    segundos = time.perf_counter() - t0
+    return _registrar('reposicion', inicio, segundos, segundos * 1000, 'ok',
+                      {'consumos': consumos, 'puntos': puntos, 'alertas': alertas, 'archivo': archivo})
+
+
+def revalidar_presupuestos():
+    """Vence los presupuestos sin renovar y marca (o actualiza) los de precios viejos (ver revalidacion_precios.py)."""
+    inicio, t0 = datetime.datetime.now(), time.perf_counter()
+    vencidos, marcados, repreciados = revalidacion_precios.revalidar(revalidacion_precios.REPRECIAR_BORRADORES)
+    segundos = time.perf_counter() - t0
+    return _registrar('revalidacion_precios', inicio, segundos, segundos * 1000, 'ok',
+                      {'vencidos': vencidos, 'marcados': marcados, 'repreciados': repreciados})
+
+
+def mantenimiento_completo():
+    """
+    Backup, verificación, cierres de cuenta corriente, instantáneas de stock, reposición, revalidación de precios,
+    compactación y estadísticas, en ese orden. Devuelve los resúmenes de cada operación.
+    """
+    resultados = [backup(), verificar_integridad()]
+    if resultados[-1]['resultado'] == 'ok':
+        resultados += [cierres_cuenta_corriente(), instantaneas_stock(), reposicion_stock(), revalidar_presupuestos(),
+                       vacuum_incremental(), optimizar()]
+    return resultados
+
+
+def _ultimo_mantenimiento():
+    for operacion, inicio, *_ in historial(200):
+        if operacion == 'backup':
+            return datetime.datetime.fromisoformat(inicio)
+    return None
+
+
+def iniciar_mantenimiento_programado(intervalo_horas=INTERVALO_MANTENIMIENTO_HORAS, revisar_cada=600):
+    """
+    Hilo en segundo plano que corre mantenimiento_completo() cuando pasaron 'intervalo_horas' desde el
+    último backup (revisa cada 'revisar_cada' segundos, así también se recupera si la app estuvo cerrada).
+    """
+    global _programador
+    if _programador is not None and _programador.is_alive():
+        return _programador
+
+    def programado():
+        while True:
+            try:
+                ultimo = _ultimo_mantenimiento()
+                if ultimo is None or datetime.datetime.now() - ultimo >= datetime.timedelta(hours=intervalo_horas):
+                    mantenimiento_completo()
+            except Exception:
+                log.exception("Error inesperado en el mantenimiento programado.")
+            time.sleep(revisar_cada)
+
+    _programador = threading.Thread(target=programado, name="mantenimiento-db", daemon=True)
+    _programador.start()
+    return _programador
+
+
+OPERACIONES = {
+    'backup': backup,
+    'verificar': verificar_integridad,
+    'vacuum': vacuum_incremental,
+    'optimizar': optimizar,
+    'cierres': cierres_cuenta_corriente,
+    'instantaneas': instantaneas_stock,
+    'reposicion': reposicion_stock,
+    'revalidacion': revalidar_presupuestos,
+    'todo': mantenimiento_completo,
+    'preparar': preparar_base,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mantenimiento de presupuestos.db: backups, compactación e integridad.")
+    parser.add_argument("operacion", choices=sorted(OPERACIONES) + ['restaurar', 'historial'])
+    parser.add_argument("--momento", help="Para 'restaurar': fecha y hora ISO (AAAA-MM-DDTHH:MM:SS) a la que volver.")
+    parser.add_argument("--destino", help="Para 'restaurar': guardar la base restaurada en este archivo en lugar de reemplazar la actual.")
+    parser.add_argument("--completa", action="store_true", help="Para 'verificar': integrity_check en lugar de quick_check.")
+    args = parser.parse_args()
+    registro.configurar(consola=True)
+
+    if args.operacion == 'historial':
+        for operacion, inicio, segundos, pausa, resultado, detalle in historial():
+            print(f"{inicio}  {operacion:<20} {resultado:<8} {segundos:>9.3f} s  pausa máx. {pausa:>9.1f} ms  {detalle}")
+    elif args.operacion == 'restaurar':
+        restaurar(args.momento, args.destino)
+    elif args.operacion == 'verificar':
+        verificar_integridad(args.completa)
+    else:
+        OPERACIONES[args.operacion]()
@@ -0,0 +1,186 @@
+import argparse
+import datetime
+import logging
+
+import consultas
+import presupuesto_backend
+
+log = logging.getLogger(__name__)
+
+# --- Movimientos de stock ---
+# El stock de cada producto es la suma de sus movimientos (tabla movimientos_stock, que solo crece):
+#  - Stock actual: stock_disponible y stock_reservado de productos, la proyección que un trigger de
+#    presupuesto_backend mantiene al insertar cada movimiento (una fila por lectura, como siempre).
+#  - Stock a un momento: la última instantánea hasta ese momento más los movimientos posteriores a ella,
+#    en lugar de sumar toda la historia del producto.
+#  - verificar() compara la proyección y las instantáneas con la suma de los movimientos, y con
+#    reparar=True las vuelve a calcular desde los movimientos.
+# generar_instantaneas() es incremental (solo mira los movimientos nuevos); la corre el mantenimiento
+# programado y conviene correrla al menos una vez por mes.
+
+MOMENTO_MINIMO = '0001-01-01'
+MOMENTO_MAXIMO = '9999-12-31T23:59:59.999'
+
+
+def _momento(valor, fin_del_dia=True):
+    """
+    Momento AAAA-MM-DDTHH:MM:SS.SSS de un datetime, un date o un texto ISO (None queda None). Una fecha sola
+    es el final de ese día, o su comienzo con fin_del_dia=False.
+    """
+    if valor is None:
+        return None
+    if isinstance(valor, datetime.datetime):
+        return valor.isoformat(timespec='milliseconds')
+    if isinstance(valor, datetime.date):
+        valor = valor.isoformat()
+    if len(valor) == 10: # Solo la fecha
+        return f"{valor}T23:59:59.999" if fin_del_dia else valor
+    return valor.replace(' ', 'T')
+
+
+def id_producto(codigo):
+    """ID del producto con ese código (o None)."""
+    fila = consultas.uno(presupuesto_backend.conexion(), "producto_stock", (codigo,))
+    return fila[0] if fila else None
+
+
+def registrar_movimiento(producto_id, tipo, disponible=0, reservado=0, nota_pedido_id=None, motivo=None):
+    """Agrega un movimiento de stock (la proyección en productos la actualiza el trigger). Devuelve su ID."""
+    if tipo not in presupuesto_backend.TIPOS_MOVIMIENTO_STOCK:
+        raise ValueError(f"Tipo de movimiento desconocido: {tipo}")
+    conn = presupuesto_backend.conexion()
+    with conn:
+        return consultas.ejecutar(conn, "registrar_movimiento_stock",
+                                  (producto_id, tipo, disponible, reservado, nota_pedido_id, motivo)).lastrowid
+
+
+def movimientos(producto_id, desde=None, hasta=None):
+    """Movimientos del producto entre 'desde' y 'hasta' (inclusive): (id, momento, tipo, disponible, reservado, nota, motivo)."""
+    desde = _momento(desde, fin_del_dia=False) or MOMENTO_MINIMO
+    hasta = _momento(hasta) or MOMENTO_MAXIMO
+    return consultas.todos(presupuesto_backend.conexion(), "movimientos_producto", (producto_id, desde, hasta))
+
+
+def stock_a_fecha(momento, producto_id=None):
+    """
+    Stock a 'momento' (datetime, date o texto ISO; una fecha sola cuenta hasta el final del día).
+    Con producto_id devuelve (disponible, reservado); sin él, una fila (id, codigo, disponible, reservado) por producto.
+    """
+    conn = presupuesto_backend.conexion()
+    momento = _momento(momento)
+    if producto_id is None:
+        return consultas.todos(conn, "stock_a_fecha", (momento,))
+    return consultas.uno(conn, "stock_producto_a_fecha", (producto_id, momento))
+
+
+def generar_instantaneas(hasta=None):
+    """
+    Anota una instantánea de cada producto con movimientos nuevos hasta 'hasta' (por defecto ahora).
+    Devuelve la cantidad de instantáneas escritas.
+    """
+    hasta = _momento(hasta) or datetime.datetime.now().isoformat(timespec='milliseconds')
+    conn = presupuesto_backend.conexion()
+    cambios_antes = conn.total_changes # rowcount no cuenta las sentencias que empiezan con WITH
+    with conn:
+        consultas.ejecutar(conn, "generar_instantaneas_stock", (hasta,))
+    instantaneas = conn.total_changes - cambios_antes
+    log.info("%d instantáneas de stock generadas hasta %s.", instantaneas, hasta)
+    return instantaneas
+
+
+def verificar(reparar=False):
+    """
+    Compara la proyección en productos y la última instantánea de cada producto con la suma de sus movimientos.
+    Devuelve (diferencias_proyeccion, diferencias_instantaneas). Con reparar=True corrige la proyección
+    y, si alguna instantánea no coincide, las vuelve a armar todas (una por producto y mes).
+    """
+    conn = presupuesto_backend.conexion()
+    proyeccion = consultas.todos(conn, "verificar_proyeccion_stock")
+    instantaneas = consultas.todos(conn, "verificar_instantaneas_stock")
+    for producto_id, codigo, disponible, reservado, disponible_ok, reservado_ok in proyeccion:
+        log.warning("Stock de %s: %d/%d en productos, %d/%d según los movimientos.",
+                    codigo, disponible, reservado, disponible_ok, reservado_ok)
+    if instantaneas:
+        log.warning("%d productos con la última instantánea distinta de sus movimientos.", len(instantaneas))
+    if reparar and (proyeccion or instantaneas):
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if proyeccion:
+                consultas.ejecutar(conn, "reparar_proyeccion_stock")
+            if instantaneas:
+                conn.execute("DELETE FROM stock_instantaneas")
+                consultas.ejecutar(conn, "reconstruir_instantaneas_stock")
+        log.info("Stock reparado desde los movimientos.")
+    return proyeccion, instantaneas
+
+
+def reconstruir():
+    """Vuelve a calcular la proyección y todas las instantáneas desde los movimientos. Devuelve la cantidad de instantáneas."""
+    conn = presupuesto_backend.conexion()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        consultas.ejecutar(conn, "reparar_proyeccion_stock")
+        conn.execute("DELETE FROM stock_instantaneas")
+        instantaneas = consultas.ejecutar(conn, "reconstruir_instantaneas_stock").rowcount
+    log.info("Stock reconstruido desde los movimientos: %d instantáneas.", instantaneas)
+    return instantaneas
+
+
+def _imprimir_movimientos(codigo, desde, hasta):
+    producto_id = id_producto(codigo)
+    if producto_id is None:
+        print(f"❌ Producto '{codigo}' no encontrado.")
+        return False
+    print(f"Movimientos de stock de {codigo}")
+    print(f"{'Momento':<24} {'Tipo':<11} {'Disponible':>10} {'Reservado':>10}  Detalle")
+    for _, momento, tipo, disponible, reservado, nota_pedido_id, motivo in movimientos(producto_id, desde, hasta):
+        detalle = f"Nota de Pedido #{nota_pedido_id}" if nota_pedido_id else (motivo or "")
+        print(f"{momento:<24} {tipo:<11} {disponible:>+10} {reservado:>+10}  {detalle}")
+    return True
+
+
+def _imprimir_stock(momento, codigo):
+    if codigo:
+        producto_id = id_producto(codigo)
+        if producto_id is None:
+            print(f"❌ Producto '{codigo}' no encontrado.")
+            return False
+        disponible, reservado = stock_a_fecha(momento, producto_id)
+        print(f"{codigo}: disponible {disponible}, reservado {reservado}")
+        return True
+    print(f"{'Código':<20} {'Disponible':>10} {'Reservado':>10}")
+    for _, codigo_producto, disponible, reservado in stock_a_fecha(momento):
+        print(f"{codigo_producto:<20} {disponible:>10} {reservado:>10}")
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Movimientos de stock: historial, stock a una fecha, instantáneas y verificación.")
+    parser.add_argument("operacion", choices=['movimientos', 'stock', 'instantaneas', 'verificar', 'reconstruir'])
+    parser.add_argument("--producto", help="Código del producto ('movimientos' lo necesita; en 'stock' es opcional).")
+    parser.add_argument("--desde", help="Para 'movimientos': momento inicial (AAAA-MM-DD o AAAA-MM-DDTHH:MM:SS).")
+    parser.add_argument("--hasta", help="Para 'movimientos' e 'instantaneas': momento final.")
+    parser.add_argument("--momento", help="Para 'stock': momento de la consulta (por defecto ahora).")
+    parser.add_argument("--reparar", action="store_true", help="Para 'verificar': corregir las diferencias.")
+    args = parser.parse_args()
+
+    presupuesto_backend.inicializar_base_de_datos()
+    if args.operacion == 'movimientos':
+        if not args.producto:
+            parser.error("'movimientos' necesita --producto.")
+        raise SystemExit(0 if _imprimir_movimientos(args.producto, args.desde, args.hasta) else 1)
+    elif args.operacion == 'stock':
+        momento = args.momento or datetime.datetime.now().isoformat(timespec='milliseconds')
+        raise SystemExit(0 if _imprimir_stock(momento, args.producto) else 1)
+    elif args.operacion == 'instantaneas':
+        print(f"✅ {generar_instantaneas(args.hasta)} instantáneas generadas.")
+    elif args.operacion == 'verificar':
+        proyeccion, instantaneas = verificar(args.reparar)
+        if not proyeccion and not instantaneas:
+            print("✅ La proyección y las instantáneas coinciden con los movimientos.")
+        else:
+            estado = "corregidas" if args.reparar else "encontradas"
+            print(f"⚠️ Diferencias {estado}: {len(proyeccion)} en la proyección, {len(instantaneas)} en las instantáneas.")
+            raise SystemExit(0 if args.reparar else 1)
+    else:
+        print(f"✅ Stock reconstruido: {reconstruir()} instantáneas.")
@@ -0,0 +1,260 @@
+import asyncio
+import atexit
+import collections
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytesseract
+
+try:
+    import tesserocr # Opcional: usa la API de Tesseract en el mismo proceso, sin lanzar un ejecutable por imagen
+except ImportError:
+    tesserocr = None
+
+log = logging.getLogger(__name__)
+
+# --- Servicio de OCR con trabajadores precalentados ---
+# pytesseract lanza un proceso tesseract por imagen, y cada proceso vuelve a cargar los datos del idioma:
+# en comprobantes chicos ese arranque es la mayor parte del tiempo. Este servicio mantiene trabajadores
+# vivos detrás de una cola asyncio acotada (si se llena, quien envía espera: contrapresión):
+#  - con tesserocr instalado, cada trabajador conserva su propia instancia de la API con el idioma ya cargado;
+#  - si no, cada trabajador junta hasta LOTE_MAXIMO imágenes de la cola y las pasa a una sola ejecución
+#    de tesseract (lista de archivos), que carga el idioma una vez para todo el lote.
+#
+# La ubicación de tesseract se resuelve la primera vez que se usa (ver ruta_tesseract), no al importar:
+#   PRESUPUESTOS_TESSERACT="C:\Program Files\Tesseract-OCR\tesseract.exe"
+
+IDIOMA = 'spa'
+TRABAJADORES = min(4, os.cpu_count() or 1)
+CAPACIDAD_COLA = 64 # Imágenes esperando en la cola; más allá de eso quien envía espera
+LOTE_MAXIMO = 16 # Imágenes por ejecución de tesseract (solo sin tesserocr)
+SEPARADOR_PAGINAS = '\f' # Tesseract separa con un salto de página el texto de cada imagen de una lista
+
+# Carpetas de instalación habituales, por si tesseract no está en el PATH
+RUTAS_HABITUALES_TESSERACT = [
+    r"C:\Program Files\Tesseract-OCR\tesseract.exe",
+    r"C:\Program Files (x86)\Tesseract-OCR\tesseract.exe",
+    "/opt/homebrew/bin/tesseract",
+    "/usr/local/bin/tesseract",
+]
+
+_ruta_tesseract = None
+_servicio = None
+_lock = threading.Lock()
+_hilos = threading.local() # Motor de cada hilo trabajador
+
+
+class TesseractNoEncontrado(Exception):
+    """No hay tesserocr ni un ejecutable de tesseract configurado o en el PATH."""
+
+
+def ruta_tesseract():
+    """
+    Ejecutable de tesseract: el de la variable de entorno PRESUPUESTOS_TESSERACT, el del PATH o el de una
+    carpeta de instalación habitual. Se busca una sola vez y queda configurado en pytesseract.
+    """
+    global _ruta_tesseract
+    if _ruta_tesseract is None:
+        candidatos = [os.environ.get("PRESUPUESTOS_TESSERACT"), shutil.which("tesseract"), *RUTAS_HABITUALES_TESSERACT]
+        ruta = next((c for c in candidatos if c and os.path.isfile(c)), None)
+        if ruta is None:
+            raise TesseractNoEncontrado(
+                "Tesseract OCR no está instalado o no se encuentra en el PATH. Instalá Tesseract "
+                "o indicá la ruta del ejecutable en la variable de entorno PRESUPUESTOS_TESSERACT.")
+        pytesseract.pytesseract.tesseract_cmd = _ruta_tesseract = ruta
+        log.info("Usando tesseract en '%s'.", ruta)
+    return _ruta_tesseract
+
+
+def olvidar_ruta_tesseract():
+    """Hace que la próxima imagen vuelva a buscar el ejecutable (por ejemplo, después de cambiar PRESUPUESTOS_TESSERACT)."""
+    global _ruta_tesseract
+    _ruta_tesseract = None
+
+
+# --- Motores: reconocen una lista de imágenes dentro de un hilo trabajador ---
+
+class _MotorTesserocr:
+    """Instancia de la API de Tesseract de un trabajador; el idioma se carga una sola vez."""
+
+    def __init__(self):
+        self.api = tesserocr.PyTessBaseAPI(lang=IDIOMA)
+
+    def reconocer(self, rutas):
+        textos = []
+        for ruta in rutas:
+            self.api.SetImageFile(ruta)
+            textos.append(self.api.GetUTF8Text())
+        return textos
+
+
+class _MotorEjecutable:
+    """Ejecutable de tesseract vía pytesseract: una sola ejecución para todas las imágenes del lote."""
+
+    def reconocer(self, rutas):
+        ruta_tesseract()
+        try:
+            return self._reconocer(rutas)
+        except pytesseract.TesseractNotFoundError:
+            olvidar_ruta_tesseract() # El ejecutable ya no está donde se lo encontró: se vuelve a buscar
+            raise TesseractNoEncontrado(f"No se pudo ejecutar tesseract en '{pytesseract.pytesseract.tesseract_cmd}'. "
+                                        "Revisá la instalación o la variable de entorno PRESUPUESTOS_TESSERACT.")
+
+    def _reconocer(self, rutas):
+        if len(rutas) == 1:
+            return [pytesseract.image_to_string(rutas[0], lang=IDIOMA)]
+        descriptor, lista = tempfile.mkstemp(prefix="ocr_lote_", suffix=".txt")
+        try:
+            with os.fdopen(descriptor, "w", encoding="utf-8") as archivo:
+                archivo.write("\n".join(os.path.abspath(ruta) for ruta in rutas))
+            paginas = pytesseract.image_to_string(lista, lang=IDIOMA).split(SEPARADOR_PAGINAS)
+        finally:
+            os.remove(lista)
+        if len(paginas) == len(rutas) + 1 and not paginas[-1].strip():
+            paginas.pop()
+        if len(paginas) != len(rutas):
+            # No se puede saber qué texto es de qué imagen: se reconocen de a una
+            log.warning("El lote de %d imágenes devolvió %d páginas; se procesan de a una.", len(rutas), len(paginas))
+            return [pytesseract.image_to_string(ruta, lang=IDIOMA) for ruta in rutas]
+        return paginas
+
+
+def _motor_del_hilo():
+    motor = getattr(_hilos, "motor", None)
+    if motor is None:
+        motor = _hilos.motor = _MotorTesserocr() if tesserocr is not None else _MotorEjecutable()
+    return motor
+
+
+def _reconocer_lote(rutas):
+    return _motor_del_hilo().reconocer(rutas)
+
+
+# --- Servicio ---
+
+class ServicioOCR:
+    """
+    Cola asyncio acotada atendida por 'trabajadores' tareas; cada una toma un lote de la cola y lo reconoce
+    en su hilo del pool. El bucle de eventos corre en un hilo propio, así el servicio se usa igual desde la
+    GUI, la línea de comandos o desde código asyncio (reconocer_async).
+    """
+
+    def __init__(self, trabajadores=TRABAJADORES, capacidad_cola=CAPACIDAD_COLA, lote_maximo=LOTE_MAXIMO):
+        self.trabajadores = trabajadores
+        self.capacidad_cola = capacidad_cola
+        self.lote_maximo = 1 if tesserocr is not None else lote_maximo # Con tesserocr no hace falta agrupar
+        self.estadisticas = {'imagenes': 0, 'lotes': 0, 'errores': 0}
+        self._pool = ThreadPoolExecutor(max_workers=trabajadores, thread_name_prefix="ocr")
+        self._loop = asyncio.new_event_loop()
+        listo = threading.Event()
+        self._hilo = threading.Thread(target=self._correr, args=(listo,), name="servicio-ocr", daemon=True)
+        self._hilo.start()
+        listo.wait()
+
+    def _correr(self, listo):
+        asyncio.set_event_loop(self._loop)
+        self._cola = asyncio.Queue(maxsize=self.capacidad_cola)
+        self._tareas = [self._loop.create_task(self._trabajador()) for _ in range(self.trabajadores)]
+        listo.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.close()
+
+    async def _trabajador(self):
+        while True:
+            lote = [await self._cola.get()]
+            while len(lote) < self.lote_maximo and not self._cola.empty():
+                lote.append(self._cola.get_nowait())
+            rutas = [ruta for ruta, _ in lote]
+            try:
+                textos = await self._loop.run_in_executor(self._pool, _reconocer_lote, rutas)
+            except Exception as e:
+                self.estadisticas['errores'] += len(lote)
+                for _, resultado in lote:
+                    if not resultado.done():
+                        resultado.set_exception(e)
+            else:
+                for (_, resultado), texto in zip(lote, textos):
+                    if not resultado.done():
+                        resultado.set_result(texto)
+            finally:
+                self.estadisticas['imagenes'] += len(lote)
+                self.estadisticas['lotes'] += 1
+                for _ in lote:
+                    self._cola.task_done()
+
+    async def reconocer_async(self, ruta):
+        """Texto de la imagen 'ruta'. Espera lugar en la cola si está llena. Solo desde el bucle del servicio."""
+        resultado = self._loop.create_future()
+        await self._cola.put((ruta, resultado))
+        return await resultado
+
+    def enviar(self, ruta):
+        """Encola una imagen desde cualquier hilo; devuelve un concurrent.futures.Future con el texto."""
+        return asyncio.run_coroutine_threadsafe(self.reconocer_async(ruta), self._loop)
+
+    def reconocer(self, ruta, timeout=None):
+        """Texto de la imagen 'ruta' (bloquea hasta tenerlo)."""
+        return self.enviar(ruta).result(timeout)
+
+    def reconocer_varios(self, rutas):
+        """
+        Reconoce muchas imágenes con todos los trabajadores. Es un generador: devuelve (ruta, texto, error)
+        en el orden de 'rutas', y nunca tiene más imágenes en vuelo que la capacidad de la cola.
+        """
+        en_vuelo = collections.deque()
+        for ruta in rutas:
+            if len(en_vuelo) >= self.capacidad_cola:
+                yield self._resultado(*en_vuelo.popleft())
+            en_vuelo.append((ruta, self.enviar(ruta)))
+        while en_vuelo:
+            yield self._resultado(*en_vuelo.popleft())
+
+    @staticmethod
+    def _resultado(ruta, futuro):
+        try:
+            return ruta, futuro.result(), None
+        except Exception as e:
+            return ruta, None, e
+
+    async def _detener(self):
+        for tarea in self._tareas:
+            tarea.cancel()
+        await asyncio.gather(*self._tareas, return_exceptions=True)
+        while not self._cola.empty(): # Quien espera una imagen que ya no se va a procesar recibe el error
+            _, resultado = self._cola.get_nowait()
+            if not resultado.done():
+                resultado.set_exception(RuntimeError("El servicio de OCR se cerró antes de procesar la imagen."))
+        self._loop.stop()
+
+    def cerrar(self):
+        """Detiene los trabajadores, el bucle y el pool; las imágenes que quedaban en la cola terminan con error."""
+        if self._loop.is_running():
+            asyncio.run_coroutine_threadsafe(self._detener(), self._loop)
+            self._hilo.join(timeout=5)
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+
+def servicio():
+    """Servicio de OCR compartido por el proceso (se crea la primera vez que se pide)."""
+    global _servicio
+    with _lock:
+        if _servicio is None:
+            _servicio = ServicioOCR()
+        return _servicio
+
+
+def cerrar_servicio():
+    global _servicio
+    with _lock:
+        if _servicio is not None:
+            _servicio.cerrar()
+            _servicio = None
+
+
+atexit.register(cerrar_servicio)
@@ -1,26 +1,394 @@
 import sqlite3
 import pandas as pd
 import gspread
-from PIL import Image
-import pytesseract
 import re
 import os
 import datetime
+import hashlib
+import json
+import logging
+import threading
+import time
 
-# --- CONFIGURACIÓN OPCIONAL PARA TESSERACT (solo si no está en tu PATH) ---
-# Si Tesseract OCR no está en tu PATH, descomenta la línea de abajo
-# y reemplaza la ruta con la ubicación real del ejecutable tesseract.exe
-# Ejemplo para Windows:
-pytesseract.pytesseract.tesseract_cmd = r'D:\Poliplast\Felipe\Tesseract\tesseract.exe' # <--- ASEGÚRATE QUE ESTA RUTA SEA CORRECTA
-# Ejemplo para macOS (si instalaste con Homebrew):
-# pytesseract.pytesseract.tesseract_cmd = '/usr/local/bin/tesseract'
+import google.auth.exceptions
+import google.auth.transport.requests
+import requests
+
+import consultas
+import duplicados
+import instrumentacion
+import ocr
+
+log = logging.getLogger(__name__)
+
+# --- Configuración general ---
+DB_PATH = 'presupuestos.db' # Archivo de la base de datos unificada
+IVA_RATE = 0.21 # Tasa de IVA usada en los totales guardados en las cabeceras
 
 
 # --- 1. Funciones de Base de Datos (SQLite) ---
 
+def conectar():
+    """Abre una conexión a la base de datos unificada (DB_PATH), instrumentada si el perfilado está activo."""
+    return instrumentacion.conectar(DB_PATH)
+
+
+def conexion():
+    """
+    Conexión de larga vida del hilo actual a DB_PATH, con las sentencias de consultas.py ya preparadas.
+    No se cierra al terminar; las escrituras van dentro de 'with conn:' (commit o rollback al salir).
+    """
+    return consultas.conexion(DB_PATH)
+
+
+def _agregar_columna_si_falta(cursor, tabla, columna, definicion):
+    """Agrega una columna a una tabla existente si todavía no existe. Devuelve True si la agregó."""
+    cursor.execute(f"PRAGMA table_info({tabla})")
+    if columna in [fila[1] for fila in cursor.fetchall()]:
+        return False
+    cursor.execute(f"ALTER TABLE {tabla} ADD COLUMN {columna} {definicion}")
+    return True
+
+
+def _sql_totales_cabecera(delta):
+    """
+    Arma el SET de un UPDATE que suma 'delta' al total de una cabecera (nota de pedido o presupuesto)
+    y recalcula el IVA y el total con IVA a partir del nuevo total.
+    Se redondea a 4 decimales en cada paso para que las sumas y restas sucesivas no acumulen error.
+    """
+    nuevo_total = f"ROUND(total + ({delta}), 4)"
+    return f"""
+        total = {nuevo_total},
+        total_iva = ROUND({nuevo_total} * {IVA_RATE}, 4),
+        total_con_iva = ROUND({nuevo_total} * {1 + IVA_RATE}, 4)"""
+
+
+def _crear_triggers_totales(cursor, tabla_detalle, tabla_cabecera, columna_fk):
+    """
+    Crea los triggers que mantienen total, IVA y cantidad de líneas en la cabecera
+    cada vez que se inserta, modifica o elimina una línea de detalle.
+    """
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_{tabla_detalle}_insert AFTER INSERT ON {tabla_detalle}
+    BEGIN
+        UPDATE {tabla_cabecera} SET {_sql_totales_cabecera('NEW.cantidad * NEW.precio_unitario')},
+            cantidad_lineas = cantidad_lineas + 1
+        WHERE id = NEW.{columna_fk};
+    END
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_{tabla_detalle}_update
+    AFTER UPDATE OF {columna_fk}, cantidad, precio_unitario ON {tabla_detalle}
+    BEGIN
+        UPDATE {tabla_cabecera} SET {_sql_totales_cabecera('-OLD.cantidad * OLD.precio_unitario')},
+            cantidad_lineas = cantidad_lineas - 1
+        WHERE id = OLD.{columna_fk};
+        UPDATE {tabla_cabecera} SET {_sql_totales_cabecera('NEW.cantidad * NEW.precio_unitario')},
+            cantidad_lineas = cantidad_lineas + 1
+        WHERE id = NEW.{columna_fk};
+    END
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_{tabla_detalle}_delete AFTER DELETE ON {tabla_detalle}
+    BEGIN
+        UPDATE {tabla_cabecera} SET {_sql_totales_cabecera('-OLD.cantidad * OLD.precio_unitario')},
+            cantidad_lineas = cantidad_lineas - 1
+        WHERE id = OLD.{columna_fk};
+    END
+    """)
+
+
+# Cabeceras con totales guardados: (tabla cabecera, tabla detalle, columna que apunta a la cabecera)
+TABLAS_CON_TOTALES = [
+    ('notas_pedido', 'detalle_pedido', 'nota_pedido_id'),
+    ('presupuestos', 'detalle_presupuesto', 'presupuesto_id'),
+]
+
+# Tablas cuyos cambios quedan anotados en registro_cambios (para restaurar a un momento dado, ver mantenimiento.py)
+TABLAS_CON_REGISTRO = [
+    'clientes', 'comprobantes', 'productos', 'notas_pedido', 'detalle_pedido',
+    'presupuestos', 'detalle_presupuesto', 'tipo_cambio', 'presupuestos_guardados', 'pagos_aplicados',
+    'movimientos_stock', 'reposicion_productos', 'revisiones_presupuesto', 'lineas_revision_presupuesto',
+    'reglas_precio',
+]
+
+
+def _crear_triggers_registro(cursor, tabla):
+    """
+    Crea (o recrea, por si cambiaron las columnas) los triggers que anotan en registro_cambios cada
+    alta, modificación o baja de 'tabla': la fila completa para altas y modificaciones, y solo la
+    clave primaria para las bajas.
+    """
+    cursor.execute(f"PRAGMA table_info({tabla})")
+    columnas = cursor.fetchall()
+    if not columnas:
+        return
+    clave = [fila[1] for fila in sorted(columnas, key=lambda fila: fila[5]) if fila[5]] or ['rowid']
+    def como_json(prefijo, nombres):
+        return "json_object(" + ", ".join(f"'{nombre}', {prefijo}.{nombre}" for nombre in nombres) + ")"
+    todas = [fila[1] for fila in columnas]
+    for evento, operacion, datos in (('insert', 'I', como_json('NEW', todas)),
+                                     ('update', 'U', como_json('NEW', todas)),
+                                     ('delete', 'D', como_json('OLD', clave))):
+        cursor.execute(f"DROP TRIGGER IF EXISTS trg_registro_{tabla}_{evento}")
+        cursor.execute(f"""
+        CREATE TRIGGER trg_registro_{tabla}_{evento} AFTER {evento.upper()} ON {tabla}
+        BEGIN
+            INSERT INTO registro_cambios (tabla, operacion, datos) VALUES ('{tabla}', '{operacion}', {datos});
+        END
+        """)
+
+
+def _quitar_triggers_registro(cursor):
+    """Quita los triggers de registro_cambios (para cargas masivas o para aplicar el registro al restaurar)."""
+    for tabla in TABLAS_CON_REGISTRO:
+        for evento in ('insert', 'update', 'delete'):
+            cursor.execute(f"DROP TRIGGER IF EXISTS trg_registro_{tabla}_{evento}")
+
+
+# --- Movimientos de stock (ver movimientos_stock.py) ---
+# movimientos_stock es la fuente de verdad del stock: solo se agregan filas (ingreso, ajuste, reserva,
+# liberacion, entrega), nunca se modifican ni se borran. stock_disponible y stock_reservado de productos
+# son la proyección al día: la mantiene un trigger sumando cada movimiento al insertarlo.
+
+TIPOS_MOVIMIENTO_STOCK = ('ingreso', 'ajuste', 'reserva', 'liberacion', 'entrega')
+
+
+def _crear_triggers_movimientos_stock(cursor):
+    """Crea (o recrea) el trigger de la proyección en productos y los que impiden modificar o borrar movimientos."""
+    _quitar_triggers_movimientos_stock(cursor)
+    cursor.execute("""
+    CREATE TRIGGER trg_movimientos_stock_proyeccion AFTER INSERT ON movimientos_stock
+    BEGIN
+        UPDATE productos SET stock_disponible = stock_disponible + NEW.disponible,
+                             stock_reservado = stock_reservado + NEW.reservado
+        WHERE id = NEW.producto_id;
+    END
+    """)
+    for evento in ('update', 'delete'):
+        cursor.execute(f"""
+        CREATE TRIGGER trg_movimientos_stock_{evento} BEFORE {evento.upper()} ON movimientos_stock
+        BEGIN
+            SELECT RAISE(ABORT, 'Los movimientos de stock no se modifican ni se borran: registrar un ajuste.');
+        END
+        """)
+
+
+def _quitar_triggers_movimientos_stock(cursor):
+    for nombre in ('proyeccion', 'update', 'delete'):
+        cursor.execute(f"DROP TRIGGER IF EXISTS trg_movimientos_stock_{nombre}")
+
+
+def _stock_inicial_en_movimientos(cursor):
+    """
+    Anota como movimiento 'ajuste' el stock de los productos que todavía no tienen movimientos (bases de antes
+    del registro de movimientos, cargas masivas), sin volver a sumarlo en la proyección.
+    """
+    _quitar_triggers_movimientos_stock(cursor)
+    cursor.execute("""
+        INSERT INTO movimientos_stock (producto_id, tipo, disponible, reservado, motivo)
+        SELECT id, 'ajuste', stock_disponible, stock_reservado, 'Stock inicial' FROM productos
+        WHERE (stock_disponible != 0 OR stock_reservado != 0)
+          AND NOT EXISTS (SELECT 1 FROM movimientos_stock m WHERE m.producto_id = productos.id)
+    """)
+    _crear_triggers_movimientos_stock(cursor)
+
+
+# --- Puntos de reposición y alertas de stock (ver reposicion.py) ---
+# reposicion_productos guarda por producto el plazo de entrega, el consumo diario promedio y el punto de
+# reposición. alertas_stock tiene los productos con el stock disponible en su punto o por debajo: la
+# mantienen triggers cuando cambia el stock de un producto (cada movimiento pasa por la proyección) o su
+# punto de reposición, mirando solo ese producto en lugar de recorrer el catálogo.
+
+def _sql_evaluar_alerta(producto):
+    """Cuerpo de un trigger que agrega, actualiza o quita la alerta de stock bajo del producto."""
+    condicion = f"""p.id = {producto} AND r.punto_reposicion > 0 AND p.stock_disponible <= r.punto_reposicion"""
+    return f"""
+        INSERT INTO alertas_stock (producto_id, stock_disponible, punto_reposicion)
+        SELECT p.id, p.stock_disponible, r.punto_reposicion
+        FROM productos p JOIN reposicion_productos r ON r.producto_id = p.id
+        WHERE {condicion}
+        ON CONFLICT(producto_id) DO UPDATE SET stock_disponible = excluded.stock_disponible,
+                                               punto_reposicion = excluded.punto_reposicion;
+        DELETE FROM alertas_stock WHERE producto_id = {producto} AND NOT EXISTS (
+            SELECT 1 FROM productos p JOIN reposicion_productos r ON r.producto_id = p.id WHERE {condicion});
+    """
+
+
+def _crear_triggers_alertas_stock(cursor):
+    """Crea (o recrea) los triggers que mantienen alertas_stock."""
+    _quitar_triggers_alertas_stock(cursor)
+    cursor.execute(f"""
+    CREATE TRIGGER trg_alertas_stock_productos AFTER UPDATE OF stock_disponible ON productos
+    WHEN NEW.stock_disponible IS NOT OLD.stock_disponible
+    BEGIN {_sql_evaluar_alerta('NEW.id')} END
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER trg_alertas_stock_reposicion_insert AFTER INSERT ON reposicion_productos
+    BEGIN {_sql_evaluar_alerta('NEW.producto_id')} END
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER trg_alertas_stock_reposicion_update AFTER UPDATE OF punto_reposicion ON reposicion_productos
+    WHEN NEW.punto_reposicion IS NOT OLD.punto_reposicion
+    BEGIN {_sql_evaluar_alerta('NEW.producto_id')} END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER trg_alertas_stock_reposicion_delete AFTER DELETE ON reposicion_productos
+    BEGIN
+        DELETE FROM alertas_stock WHERE producto_id = OLD.producto_id;
+    END
+    """)
+
+
+def _quitar_triggers_alertas_stock(cursor):
+    for nombre in ('productos', 'reposicion_insert', 'reposicion_update', 'reposicion_delete'):
+        cursor.execute(f"DROP TRIGGER IF EXISTS trg_alertas_stock_{nombre}")
+
+
+def _reconstruir_alertas_stock(cursor):
+    """Vuelve a armar alertas_stock recorriendo todos los productos con punto de reposición."""
+    cursor.execute("DELETE FROM alertas_stock")
+    cursor.execute("""
+        INSERT INTO alertas_stock (producto_id, stock_disponible, punto_reposicion)
+        SELECT p.id, p.stock_disponible, r.punto_reposicion
+        FROM productos p JOIN reposicion_productos r ON r.producto_id = p.id
+        WHERE r.punto_reposicion > 0 AND p.stock_disponible <= r.punto_reposicion
+    """)
+
+
+# --- Precios de lista y presupuestos abiertos (ver revalidacion_precios.py) ---
+# productos.precios_desde es el momento del último cambio de alguno de los precios de lista; lo pone un
+# trigger, así da igual si el cambio vino de la importación del CSV, de Google Sheets o de la GUI. La
+# revalidación solo compara contra la lista los presupuestos cotizados antes de ese momento.
+
+COLUMNAS_PRECIO = ('precio_0_1', 'precio_1', 'precio_5', 'precio_10', 'precio_25', 'precio_tambor_rollo')
+
+
+def _crear_trigger_precios_desde(cursor):
+    """Crea (o recrea) el trigger que anota en precios_desde cuándo cambiaron los precios de un producto."""
+    _quitar_trigger_precios_desde(cursor)
+    cambio = " OR ".join(f"NEW.{columna} IS NOT OLD.{columna}" for columna in COLUMNAS_PRECIO)
+    cursor.execute(f"""
+    CREATE TRIGGER trg_productos_precios_desde AFTER UPDATE OF {', '.join(COLUMNAS_PRECIO)} ON productos
+    WHEN {cambio}
+    BEGIN
+        UPDATE productos SET precios_desde = strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime') WHERE id = NEW.id;
+    END
+    """)
+
+
+def _quitar_trigger_precios_desde(cursor):
+    cursor.execute("DROP TRIGGER IF EXISTS trg_productos_precios_desde")
+
+
+# --- Cuenta corriente de clientes (ver cuenta_corriente.py) ---
+# Cada entrega de una nota de pedido va al debe del cliente y cada comprobante de pago, al haber. Los
+# asientos los escriben triggers, así cualquier camino que entregue una nota o cargue un pago (GUI,
+# consola, conversiones en lote) queda en la cuenta corriente. Los asientos no guardan un saldo propio (un
+# asiento con fecha anterior a otros ya cargados lo dejaría dependiendo del orden de carga): el trigger suma
+# el importe al saldo actual del cliente en cuenta_corriente_saldos y corrige en el mismo momento los
+# cierres mensuales de cuenta_corriente_cierres posteriores a su fecha. Los saldos corridos del estado de
+# cuenta se calculan al consultarlo, en orden de fecha.
+# Los asientos no se borran ni se modifican: una nota que deja de estar entregada o un comprobante que se
+# borra o se corrige se compensan con el mismo importe en negativo (el del comprobante, a la fecha
+# original), y un cambio del total de una nota entregada se anota como la diferencia, a la fecha de la entrega.
+
+def _sql_fecha_comprobante(columna):
+    """Fecha AAAA-MM-DD de la fecha de un comprobante (DD/MM/AAAA, DD-MM-AAAA o ISO); la de hoy si no se entiende."""
+    return f"""COALESCE(date(CASE WHEN {columna} GLOB '[0-9][0-9][/-][0-9][0-9][/-][0-9][0-9][0-9][0-9]*'
+                                 THEN substr({columna}, 7, 4) || '-' || substr({columna}, 4, 2) || '-' || substr({columna}, 1, 2)
+                                 ELSE {columna} END), date('now', 'localtime'))"""
+
+
+def _sql_asiento(cliente, fecha, tipo, referencia, debe, haber):
+    """Cuerpo de un trigger que anota un asiento, lo suma al saldo actual del cliente y corrige los cierres desde su fecha."""
+    return f"""
+        INSERT INTO cuenta_corriente (cliente_id, fecha, tipo, referencia_id, debe, haber)
+        VALUES ({cliente}, {fecha}, '{tipo}', {referencia}, {debe}, {haber});
+        INSERT INTO cuenta_corriente_saldos (cliente_id, saldo) VALUES ({cliente}, ROUND(({debe}) - ({haber}), 4))
+        ON CONFLICT(cliente_id) DO UPDATE SET saldo = ROUND(saldo + excluded.saldo, 4);
+        UPDATE cuenta_corriente_cierres SET saldo = ROUND(saldo + ({debe}) - ({haber}), 4)
+        WHERE cliente_id = {cliente} AND fecha >= {fecha};"""
+
+
+def _triggers_cuenta_corriente():
+    """{nombre: (evento y condición, cuerpo)} de los triggers que llevan la cuenta corriente."""
+    hoy = "date('now', 'localtime')"
+    pago_anterior = "OLD.cliente_id IS NOT NULL AND OLD.importe IS NOT NULL"
+    pago_nuevo = "NEW.cliente_id IS NOT NULL AND NEW.importe IS NOT NULL"
+    pago_cambiado = "(OLD.cliente_id IS NOT NEW.cliente_id OR OLD.importe IS NOT NEW.importe OR OLD.fecha IS NOT NEW.fecha)"
+    # Fecha de la última entrega de la nota: la del asiento que compensa un cambio de total ya entregada
+    fecha_entrega = f"""COALESCE((SELECT fecha FROM cuenta_corriente WHERE id = (
+                            SELECT MAX(id) FROM cuenta_corriente WHERE tipo = 'entrega' AND referencia_id = NEW.id)), {hoy})"""
+    diferencia = "(NEW.total_con_iva - OLD.total_con_iva)"
+    return {
+        # Nota cargada ya entregada (importaciones): el total se completa con el ajuste al agregar las líneas
+        'nota_insert': ("AFTER INSERT ON notas_pedido WHEN NEW.estado = 'entregada'",
+                        _sql_asiento('NEW.cliente_id', "COALESCE(NEW.fecha_entrega, substr(NEW.fecha_creacion, 1, 10))",
+                                     'entrega', 'NEW.id', 'NEW.total_con_iva', '0')),
+        'nota_entrega': ("AFTER UPDATE OF estado ON notas_pedido WHEN NEW.estado = 'entregada' AND OLD.estado != 'entregada'",
+                         _sql_asiento('NEW.cliente_id', f"COALESCE(NEW.fecha_entrega, {hoy})", 'entrega', 'NEW.id',
+                                      'NEW.total_con_iva', '0')),
+        'nota_anulacion': ("AFTER UPDATE OF estado ON notas_pedido WHEN OLD.estado = 'entregada' AND NEW.estado != 'entregada'",
+                           _sql_asiento('OLD.cliente_id', hoy, 'entrega', 'OLD.id', '-OLD.total_con_iva', '0')),
+        'nota_ajuste': (f"""AFTER UPDATE OF total_con_iva ON notas_pedido
+                            WHEN OLD.estado = 'entregada' AND NEW.estado = 'entregada' AND {diferencia} != 0""",
+                        _sql_asiento('NEW.cliente_id', fecha_entrega, 'entrega', 'NEW.id', f"ROUND({diferencia}, 4)", '0')),
+        'pago_insert': (f"AFTER INSERT ON comprobantes WHEN {pago_nuevo}",
+                        _sql_asiento('NEW.cliente_id', _sql_fecha_comprobante('NEW.fecha'), 'pago', 'NEW.id', '0', 'NEW.importe')),
+        'pago_delete': (f"AFTER DELETE ON comprobantes WHEN {pago_anterior}",
+                        _sql_asiento('OLD.cliente_id', _sql_fecha_comprobante('OLD.fecha'), 'pago', 'OLD.id', '0', '-OLD.importe')),
+        'pago_update_anterior': (f"AFTER UPDATE OF cliente_id, importe, fecha ON comprobantes WHEN {pago_anterior} AND {pago_cambiado}",
+                                 _sql_asiento('OLD.cliente_id', _sql_fecha_comprobante('OLD.fecha'), 'pago', 'OLD.id', '0', '-OLD.importe')),
+        'pago_update_nuevo': (f"AFTER UPDATE OF cliente_id, importe, fecha ON comprobantes WHEN {pago_nuevo} AND {pago_cambiado}",
+                              _sql_asiento('NEW.cliente_id', _sql_fecha_comprobante('NEW.fecha'), 'pago', 'NEW.id', '0', 'NEW.importe')),
+    }
+
+
+def _crear_triggers_cuenta_corriente(cursor):
+    """Crea (o recrea) los triggers que anotan entregas y pagos en la cuenta corriente."""
+    for nombre, (evento, cuerpo) in _triggers_cuenta_corriente().items():
+        cursor.execute(f"DROP TRIGGER IF EXISTS trg_cc_{nombre}")
+        cursor.execute(f"CREATE TRIGGER trg_cc_{nombre} {evento}\n    BEGIN{cuerpo}\n    END")
+
+
+def _quitar_triggers_cuenta_corriente(cursor):
+    """Quita los triggers de la cuenta corriente (cargas masivas y restauraciones, que la reconstruyen al final)."""
+    for nombre in _triggers_cuenta_corriente():
+        cursor.execute(f"DROP TRIGGER IF EXISTS trg_cc_{nombre}")
+
+
+def _reconstruir_cuenta_corriente(cursor):
+    """
+    Vuelve a armar la cuenta corriente desde las notas entregadas y los comprobantes, en orden de fecha, con
+    el saldo actual de cada cliente, y borra los cierres (los vuelve a generar cuenta_corriente.generar_cierres).
+    """
+    cursor.execute("DELETE FROM cuenta_corriente")
+    cursor.execute("DELETE FROM cuenta_corriente_cierres")
+    cursor.execute("DELETE FROM cuenta_corriente_saldos")
+    cursor.execute(f"""
+        INSERT INTO cuenta_corriente (cliente_id, fecha, tipo, referencia_id, debe, haber)
+        SELECT cliente_id, fecha, tipo, referencia_id, debe, haber
+        FROM (
+            SELECT cliente_id, COALESCE(fecha_entrega, substr(fecha_creacion, 1, 10)) AS fecha, 'entrega' AS tipo,
+                   id AS referencia_id, total_con_iva AS debe, 0.0 AS haber
+            FROM notas_pedido WHERE estado = 'entregada'
+            UNION ALL
+            SELECT cliente_id, {_sql_fecha_comprobante('fecha')}, 'pago', id, 0.0, importe
+            FROM comprobantes WHERE cliente_id IS NOT NULL AND importe IS NOT NULL
+        )
+        ORDER BY cliente_id, fecha, tipo, referencia_id
+    """)
+    cursor.execute("""
+        INSERT INTO cuenta_corriente_saldos (cliente_id, saldo)
+        SELECT cliente_id, ROUND(SUM(debe - haber), 4) FROM cuenta_corriente GROUP BY cliente_id
+    """)
+
+
+@instrumentacion.medir()
 def inicializar_base_de_datos():
     """Crea las tablas de clientes, comprobantes, productos, notas_pedido y presupuestos si no existen."""
-    conn = sqlite3.connect('presupuestos.db') # Conexión a la DB unificada
+    conn = conectar()
     cursor = conn.cursor()
 
     # Tabla de Clientes
@@ -42,6 +410,7 @@ def inicializar_base_de_datos():
         importe REAL,
         cuenta TEXT,
         cliente_id INTEGER,
+        hash_imagen TEXT,                             -- Hash perceptual del archivo (ver duplicados.py)
         FOREIGN KEY(cliente_id) REFERENCES clientes(id)
     )
     """)
@@ -77,7 +446,15 @@ def inicializar_base_de_datos():
         direccion_envio TEXT,
         telefono_contacto TEXT,
         estado TEXT NOT NULL DEFAULT 'pendiente',
-        FOREIGN KEY (cliente_id) REFERENCES clientes(id)
+        -- Totales mantenidos por triggers sobre detalle_pedido
+        total REAL NOT NULL DEFAULT 0.0,
+        total_iva REAL NOT NULL DEFAULT 0.0,
+        total_con_iva REAL NOT NULL DEFAULT 0.0,
+        cantidad_lineas INTEGER NOT NULL DEFAULT 0,
+        presupuesto_id INTEGER,                       -- Presupuesto del que se generó (si se generó de uno)
+        fecha_entrega TEXT,                           -- AAAA-MM-DD en que pasó a 'entregada'
+        FOREIGN KEY (cliente_id) REFERENCES clientes(id),
+        FOREIGN KEY (presupuesto_id) REFERENCES presupuestos(id)
     )
     """)
 
@@ -101,6 +478,11 @@ def inicializar_base_de_datos():
         cliente_id INTEGER NOT NULL,
         fecha_creacion TEXT NOT NULL,
         estado TEXT NOT NULL DEFAULT 'borrador',
+        -- Totales mantenidos por triggers sobre detalle_presupuesto
+        total REAL NOT NULL DEFAULT 0.0,
+        total_iva REAL NOT NULL DEFAULT 0.0,
+        total_con_iva REAL NOT NULL DEFAULT 0.0,
+        cantidad_lineas INTEGER NOT NULL DEFAULT 0,
         FOREIGN KEY (cliente_id) REFERENCES clientes(id)
     )
     """)
@@ -118,113 +500,576 @@ def inicializar_base_de_datos():
     )
     """)
 
+    # Tabla de Tipos de Cambio (historial de cotizaciones por fecha, ver tipo_cambio.py)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS tipo_cambio (
+        moneda TEXT NOT NULL,                         -- Moneda destino (ej: 'ARS')
+        fecha TEXT NOT NULL,                          -- Fecha de vigencia (AAAA-MM-DD)
+        valor REAL NOT NULL,                          -- Unidades de 'moneda' por 1 USD
+        PRIMARY KEY (moneda, fecha)
+    ) WITHOUT ROWID
+    """)
+
+    # Historial de presupuestos guardados con su conversión a pesos
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS presupuestos_guardados (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        numero_presupuesto INTEGER NOT NULL UNIQUE,
+        fecha_presupuesto TEXT NOT NULL,
+        razon_social_cliente TEXT NOT NULL,
+        documento_cliente TEXT,
+        total_usd REAL NOT NULL,
+        total_ars REAL NOT NULL,
+        tipo_cambio REAL NOT NULL,
+        metodo_pago TEXT,
+        detalles_pago TEXT,
+        fecha_guardado TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+    # Revisiones de presupuestos (ver revisiones_presupuesto.py): cada revisión guarda solo las líneas que
+    # cambiaron respecto de la anterior; detalle_presupuesto sigue teniendo siempre la última
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS revisiones_presupuesto (
+        id INTEGER PRIMARY KEY,
+        presupuesto_id INTEGER NOT NULL REFERENCES presupuestos(id),
+        numero INTEGER NOT NULL,                      -- 1: el presupuesto como estaba antes de la primera revisión
+        fecha TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime')),
+        motivo TEXT,
+        UNIQUE (presupuesto_id, numero)
+    )
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS lineas_revision_presupuesto (
+        revision_id INTEGER NOT NULL REFERENCES revisiones_presupuesto(id),
+        producto_id INTEGER NOT NULL REFERENCES productos(id),
+        cantidad INTEGER,                             -- NULL: la línea se quitó en esta revisión
+        precio_unitario REAL,
+        PRIMARY KEY (revision_id, producto_id)
+    ) WITHOUT ROWID
+    """)
+
+    # Pagos aplicados: qué parte de cada comprobante cancela qué nota de pedido (ver conciliacion.py)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS pagos_aplicados (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        comprobante_id INTEGER NOT NULL REFERENCES comprobantes(id),
+        nota_pedido_id INTEGER NOT NULL REFERENCES notas_pedido(id),
+        importe REAL NOT NULL,                        -- En la moneda del comprobante
+        tipo TEXT NOT NULL,                           -- 'exacto', 'parcial' o 'combinado'
+        fecha_aplicacion TEXT NOT NULL,
+        UNIQUE (comprobante_id, nota_pedido_id)
+    )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_pagos_aplicados_nota ON pagos_aplicados(nota_pedido_id)")
+
+    # --- Totales guardados en las cabeceras (bases creadas antes de tener estas columnas) ---
+    columnas_agregadas = False
+    for tabla_cabecera, tabla_detalle, columna_fk in TABLAS_CON_TOTALES:
+        for columna, definicion in [('total', 'REAL NOT NULL DEFAULT 0.0'),
+                                    ('total_iva', 'REAL NOT NULL DEFAULT 0.0'),
+                                    ('total_con_iva', 'REAL NOT NULL DEFAULT 0.0'),
+                                    ('cantidad_lineas', 'INTEGER NOT NULL DEFAULT 0')]:
+            columnas_agregadas |= _agregar_columna_si_falta(cursor, tabla_cabecera, columna, definicion)
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabla_detalle}_{columna_fk} ON {tabla_detalle}({columna_fk})")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabla_cabecera}_fecha ON {tabla_cabecera}(fecha_creacion, id)")
+        _crear_triggers_totales(cursor, tabla_detalle, tabla_cabecera, columna_fk)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_notas_pedido_estado ON notas_pedido(estado)")
+
+    # Hash perceptual de los comprobantes (bases creadas antes de detectar duplicados por imagen)
+    _agregar_columna_si_falta(cursor, 'comprobantes', 'hash_imagen', 'TEXT')
+
+    # Un presupuesto genera a lo sumo una nota de pedido
+    _agregar_columna_si_falta(cursor, 'notas_pedido', 'presupuesto_id', 'INTEGER REFERENCES presupuestos(id)')
+    cursor.execute("""CREATE UNIQUE INDEX IF NOT EXISTS idx_notas_pedido_presupuesto
+                      ON notas_pedido(presupuesto_id) WHERE presupuesto_id IS NOT NULL""")
+
+    if columnas_agregadas:
+        _reconstruir_totales(cursor)
+
+    # Movimientos de stock (fuente de verdad del stock) e instantáneas periódicas para consultar el stock a una fecha
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'movimientos_stock'")
+    movimientos_stock_nuevos = cursor.fetchone() is None
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS movimientos_stock (
+        id INTEGER PRIMARY KEY,                       -- Orden de los movimientos (también el orden en el tiempo)
+        producto_id INTEGER NOT NULL REFERENCES productos(id),
+        momento TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime')),
+        tipo TEXT NOT NULL,                           -- 'ingreso', 'ajuste', 'reserva', 'liberacion' o 'entrega'
+        disponible INTEGER NOT NULL DEFAULT 0,        -- Variación de stock_disponible
+        reservado INTEGER NOT NULL DEFAULT 0,         -- Variación de stock_reservado
+        nota_pedido_id INTEGER REFERENCES notas_pedido(id),
+        motivo TEXT
+    )
+    """)
+    # Con las variaciones en el índice, el stock a una fecha y la verificación no leen la tabla
+    cursor.execute("""CREATE INDEX IF NOT EXISTS idx_movimientos_stock_producto
+                      ON movimientos_stock(producto_id, momento, disponible, reservado)""")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS stock_instantaneas (
+        producto_id INTEGER NOT NULL,
+        momento TEXT NOT NULL,                        -- Momento del último movimiento incluido
+        movimiento_id INTEGER NOT NULL,               -- Último movimiento incluido
+        disponible INTEGER NOT NULL,
+        reservado INTEGER NOT NULL,
+        PRIMARY KEY (producto_id, momento)
+    ) WITHOUT ROWID
+    """)
+    if movimientos_stock_nuevos:
+        _stock_inicial_en_movimientos(cursor)
+
+    # Reposición: plazo de entrega, consumo y punto de reposición por producto, y alertas de stock bajo
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS reposicion_productos (
+        producto_id INTEGER PRIMARY KEY REFERENCES productos(id),
+        plazo_entrega_dias INTEGER NOT NULL DEFAULT 7, -- Días que tarda el proveedor en entregar
+        consumo_diario REAL NOT NULL DEFAULT 0.0,     -- Unidades entregadas por día, en promedio (ver reposicion.py)
+        punto_reposicion INTEGER NOT NULL DEFAULT 0,  -- Stock disponible en el que hay que volver a pedir (0: sin alerta)
+        punto_manual INTEGER NOT NULL DEFAULT 0       -- 1 si el punto lo fijó el usuario: el cálculo no lo cambia
+    )
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS alertas_stock (
+        producto_id INTEGER PRIMARY KEY REFERENCES productos(id),
+        desde TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime')),
+        stock_disponible INTEGER NOT NULL,
+        punto_reposicion INTEGER NOT NULL
+    )
+    """)
+
+    # Cuenta corriente de clientes: un asiento por entrega o pago, el saldo actual de cada cliente y cierres mensuales
+    _agregar_columna_si_falta(cursor, 'notas_pedido', 'fecha_entrega', 'TEXT')
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'cuenta_corriente'")
+    cuenta_corriente_nueva = cursor.fetchone() is None
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS cuenta_corriente (
+        id INTEGER PRIMARY KEY,                       -- Orden de los asientos
+        cliente_id INTEGER NOT NULL REFERENCES clientes(id),
+        fecha TEXT NOT NULL,                          -- AAAA-MM-DD
+        tipo TEXT NOT NULL,                           -- 'entrega' (nota de pedido) o 'pago' (comprobante)
+        referencia_id INTEGER NOT NULL,               -- ID de la nota de pedido o del comprobante
+        debe REAL NOT NULL DEFAULT 0.0,
+        haber REAL NOT NULL DEFAULT 0.0
+    )
+    """)
+    cursor.execute("PRAGMA table_info(cuenta_corriente)")
+    saldo_por_asiento = 'saldo' in [fila[1] for fila in cursor.fetchall()]
+    if saldo_por_asiento: # Bases que guardaban el saldo corrido en cada asiento (en el orden de carga, no de fecha)
+        _quitar_triggers_cuenta_corriente(cursor)
+        cursor.execute("DROP INDEX IF EXISTS idx_cuenta_corriente_cliente_orden")
+        cursor.execute("ALTER TABLE cuenta_corriente DROP COLUMN saldo")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_cuenta_corriente_cliente_fecha ON cuenta_corriente(cliente_id, fecha)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_cuenta_corriente_referencia ON cuenta_corriente(tipo, referencia_id)")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS cuenta_corriente_cierres (
+        cliente_id INTEGER NOT NULL,
+        fecha TEXT NOT NULL,                          -- Último día del mes
+        saldo REAL NOT NULL,                          -- Saldo del cliente al terminar ese día
+        PRIMARY KEY (cliente_id, fecha)
+    ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS cuenta_corriente_saldos (
+        cliente_id INTEGER PRIMARY KEY,               -- Saldo actual del cliente: la suma de todos sus asientos
+        saldo REAL NOT NULL
+    )
+    """)
+    if saldo_por_asiento:
+        cursor.execute("""
+            INSERT OR REPLACE INTO cuenta_corriente_saldos (cliente_id, saldo)
+            SELECT cliente_id, ROUND(SUM(debe - haber), 4) FROM cuenta_corriente GROUP BY cliente_id
+        """)
+    if cuenta_corriente_nueva: # Bases con notas entregadas y comprobantes de antes de la cuenta corriente
+        _reconstruir_cuenta_corriente(cursor)
+
+    # Revalidación de precios: cuándo cambió la lista de cada producto y los presupuestos abiertos con precios viejos
+    _agregar_columna_si_falta(cursor, 'productos', 'precios_desde', 'TEXT') # NULL: los precios nunca cambiaron
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_presupuestos_estado ON presupuestos(estado)")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS precios_desactualizados (
+        presupuesto_id INTEGER PRIMARY KEY REFERENCES presupuestos(id),
+        lineas INTEGER NOT NULL,                      -- Líneas con un precio distinto del de lista
+        total_presupuestado REAL NOT NULL,            -- Importe de esas líneas con los precios del presupuesto
+        total_lista REAL NOT NULL,                    -- Importe de esas líneas con los precios de lista actuales
+        detectado TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime'))
+    )
+    """)
+
+    # Reglas para generar los precios de lista desde el costo (ver reglas_precio.py)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS reglas_precio (
+        categoria TEXT NOT NULL,                      -- Rubro (primera palabra de la descripción) o '*' para todos
+        escala TEXT NOT NULL,                         -- Columna de precio: 'precio_0_1' ... 'precio_tambor_rollo'
+        recargo REAL NOT NULL,                        -- Sobre el costo: 0.6 es precio = costo * 1.6
+        margen_minimo REAL NOT NULL DEFAULT 0.0,      -- Sobre el precio: (precio - costo) / precio
+        redondeo REAL NOT NULL DEFAULT 0.01,          -- El precio se redondea hacia arriba a un múltiplo de este valor
+        PRIMARY KEY (categoria, escala)
+    ) WITHOUT ROWID
+    """)
+
+    # Cola de sincronizaciones con Google Sheets pendientes de enviar (ver sección 3)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS sheets_cola (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,         -- El orden de envío es el orden de los IDs
+        modulo TEXT NOT NULL,
+        hoja_calculo TEXT NOT NULL,
+        creado TEXT NOT NULL,
+        intentos INTEGER NOT NULL DEFAULT 0,
+        ultimo_error TEXT
+    )
+    """)
+
+    # Hash de cada fila editable tal como quedó en Google Sheets en la última sincronización (ver sección 3).
+    # Es la versión común contra la que se comparan la planilla y la base para saber quién cambió qué.
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS sheets_base (
+        modulo TEXT NOT NULL,
+        clave TEXT NOT NULL,                          -- Código del producto
+        hash TEXT NOT NULL,
+        PRIMARY KEY (modulo, clave)
+    ) WITHOUT ROWID
+    """)
+
+    # Registro de cambios: cada alta, baja o modificación de las tablas de TABLAS_CON_REGISTRO, en orden.
+    # Junto con un backup permite restaurar la base a cualquier momento posterior al backup (ver mantenimiento.py).
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS registro_cambios (
+        id INTEGER PRIMARY KEY,                       -- Orden de los cambios
+        momento TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime')),
+        tabla TEXT NOT NULL,
+        operacion TEXT NOT NULL,                      -- 'I' alta, 'U' modificación, 'D' baja
+        datos TEXT NOT NULL                           -- JSON: fila completa (I/U) o clave primaria (D)
+    )
+    """)
+    for tabla in TABLAS_CON_REGISTRO:
+        _crear_triggers_registro(cursor, tabla)
+    _crear_triggers_cuenta_corriente(cursor)
+    _crear_triggers_movimientos_stock(cursor)
+    _crear_triggers_alertas_stock(cursor)
+    _crear_trigger_precios_desde(cursor)
+
     conn.commit()
     conn.close()
-    print("Base de datos y tablas verificadas/creadas (incluyendo todos los módulos).")
+    mensaje = "Base de datos y tablas verificadas/creadas (incluyendo todos los módulos)."
+    log.info(mensaje)
+    return mensaje
+
+
+def _reconstruir_totales(cursor):
+    """Recalcula desde el detalle los totales guardados en todas las cabeceras."""
+    for tabla_cabecera, tabla_detalle, columna_fk in TABLAS_CON_TOTALES:
+        cursor.execute(f"""
+            UPDATE {tabla_cabecera} SET
+                total = t.total,
+                total_iva = ROUND(t.total * {IVA_RATE}, 4),
+                total_con_iva = ROUND(t.total * {1 + IVA_RATE}, 4),
+                cantidad_lineas = t.lineas
+            FROM (
+                SELECT cab.id AS id,
+                       ROUND(COALESCE(SUM(det.cantidad * det.precio_unitario), 0), 4) AS total,
+                       COUNT(det.id) AS lineas
+                FROM {tabla_cabecera} cab
+                LEFT JOIN {tabla_detalle} det ON det.{columna_fk} = cab.id
+                GROUP BY cab.id
+            ) AS t
+            WHERE {tabla_cabecera}.id = t.id
+        """)
+
+
+@instrumentacion.medir()
+def verificar_totales(reparar=False, tolerancia=0.005):
+    """
+    Compara los totales guardados en notas_pedido y presupuestos con los calculados desde el detalle.
+    Si reparar es True, reconstruye todos los totales y vuelve a verificar.
+    Devuelve una lista de diferencias: (tabla, id, total_guardado, total_calculado, lineas_guardadas, lineas_calculadas).
+    """
+    conn = conectar()
+    cursor = conn.cursor()
+
+    if reparar:
+        _reconstruir_totales(cursor)
+        conn.commit()
+        log.info("Totales reconstruidos desde el detalle.")
+
+    diferencias = []
+    for tabla_cabecera, tabla_detalle, columna_fk in TABLAS_CON_TOTALES:
+        cursor.execute(f"""
+            SELECT cab.id, cab.total, t.total, cab.cantidad_lineas, t.lineas, cab.total_iva, cab.total_con_iva
+            FROM {tabla_cabecera} cab
+            JOIN (
+                SELECT c.id AS id,
+                       COALESCE(SUM(d.cantidad * d.precio_unitario), 0) AS total,
+                       COUNT(d.id) AS lineas
+                FROM {tabla_cabecera} c
+                LEFT JOIN {tabla_detalle} d ON d.{columna_fk} = c.id
+                GROUP BY c.id
+            ) t ON t.id = cab.id
+        """)
+        for id_cab, total_guardado, total_calculado, lineas_guardadas, lineas_calculadas, iva, total_con_iva in cursor.fetchall():
+            if (abs(total_guardado - total_calculado) > tolerancia
+                    or lineas_guardadas != lineas_calculadas
+                    or abs(iva - total_calculado * IVA_RATE) > tolerancia
+                    or abs(total_con_iva - total_calculado * (1 + IVA_RATE)) > tolerancia):
+                diferencias.append((tabla_cabecera, id_cab, total_guardado, total_calculado, lineas_guardadas, lineas_calculadas))
+    conn.close()
+
+    if diferencias:
+        log.warning("Se encontraron %d cabeceras con totales desactualizados.", len(diferencias))
+        for tabla, id_cab, guardado, calculado, lineas_g, lineas_c in diferencias[:20]:
+            log.warning("   %s #%s: guardado %.2f (%s líneas) / calculado %.2f (%s líneas)", tabla, id_cab, guardado, lineas_g, calculado, lineas_c)
+    else:
+        log.info("Los totales guardados coinciden con el detalle.")
+    return diferencias
 
 
+@instrumentacion.medir()
 def obtener_o_crear_cliente(nombre):
     """Busca un cliente por nombre; si no existe, pide CUIT y Razón Social para crearlo."""
-    conn = sqlite3.connect('presupuestos.db')
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT id FROM clientes WHERE nombre = ?", (nombre,))
-    cliente = cursor.fetchone()
+    conn = conexion()
+    cliente = consultas.uno(conn, "cliente_por_nombre", (nombre,))
 
     if cliente:
-        print(f"✅ Cliente '{nombre}' encontrado.")
+        log.info("Cliente '%s' encontrado.", nombre)
         cliente_id = cliente[0]
     else:
         print(f"❌ Cliente '{nombre}' no existe. Vamos a registrarlo.")
         cuit = input("Ingrese CUIT: ")
         razon_social = input("Ingrese razón social: ")
         try:
-            cursor.execute("INSERT INTO clientes (nombre, cuit, razon_social) VALUES (?, ?, ?)",
-                           (nombre, cuit, razon_social))
-            conn.commit()
-            cliente_id = cursor.lastrowid
-            print(f"✅ Cliente '{nombre}' registrado con éxito.")
+            with conn:
+                cliente_id = consultas.ejecutar(conn, "insertar_cliente", (nombre, cuit, razon_social)).lastrowid
+            log.info("Cliente '%s' registrado con éxito.", nombre)
         except sqlite3.IntegrityError:
-            print(f"Error: Ya existe un cliente con el nombre '{nombre}'.")
+            log.error("Ya existe un cliente con el nombre '%s'.", nombre)
             cliente_id = None
         except Exception as e:
-            print(f"Error al registrar cliente: {e}")
+            log.error("Error al registrar cliente: %s", e)
             cliente_id = None
 
-    conn.close()
     return cliente_id
 
 
-def guardar_comprobante(nro_operacion, fecha, importe, cuenta, cliente_id):
-    """Guarda un comprobante en la base de datos si el número de operación no existe."""
-    conn = sqlite3.connect('presupuestos.db')
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT id FROM comprobantes WHERE nro_operacion = ?", (nro_operacion,))
-    comprobante_existente = cursor.fetchone()
+@instrumentacion.medir()
+def guardar_comprobante(nro_operacion, fecha, importe, cuenta, cliente_id, ruta_archivo=None):
+    """
+    Guarda un comprobante en la base de datos si el número de operación no existe. Devuelve (éxito, mensaje).
+    Con 'ruta_archivo' se guarda también el hash perceptual del archivo, para detectar duplicados por imagen.
+    Los casi duplicados no se rechazan acá: se revisan antes con buscar_comprobantes_duplicados.
+    """
+    conn = conexion()
+    comprobante_existente = consultas.uno(conn, "comprobante_por_nro_operacion", (nro_operacion,))
 
     if comprobante_existente:
-        print(f"❌ Error: El comprobante con número de operación '{nro_operacion}' ya existe.")
-        conn.close()
-        return False
-    else:
-        try:
-            cursor.execute("INSERT INTO comprobantes (nro_operacion, fecha, importe, cuenta, cliente_id) VALUES (?, ?, ?, ?, ?)",
-                           (nro_operacion, fecha, importe, cuenta, cliente_id))
-            conn.commit()
-            print(f"✅ Comprobante '{nro_operacion}' guardado con éxito.")
-            conn.close()
-            return True
-        except Exception as e:
-            print(f"Error al guardar el comprobante: {e}")
-            conn.close()
-            return False
+        mensaje = f"El comprobante con número de operación '{nro_operacion}' ya existe."
+        log.warning(mensaje)
+        return False, mensaje
+    try:
+        hash_imagen = duplicados.hash_a_texto(duplicados.hash_archivo(ruta_archivo)) if ruta_archivo else None
+        with conn:
+            consultas.ejecutar(conn, "insertar_comprobante", (nro_operacion, fecha, importe, cuenta, cliente_id, hash_imagen))
+        mensaje = f"Comprobante '{nro_operacion}' guardado con éxito."
+        log.info(mensaje)
+        return True, mensaje
+    except Exception as e:
+        log.error("Error al guardar el comprobante: %s", e)
+        return False, f"Error al guardar el comprobante: {e}"
+
+
+@instrumentacion.medir()
+def obtener_comprobantes():
+    """Devuelve los comprobantes, del más reciente al más antiguo. Cada fila: (id, cliente, nro_operacion, fecha, importe)."""
+    return consultas.todos(conexion(), "comprobantes")
+
+
+# --- 1.1. Detección de comprobantes duplicados (ver duplicados.py) ---
+
+_indice_comprobantes = None
+_estado_indice_comprobantes = None # (DB_PATH, conexión, PRAGMA data_version) con que se armó el índice
+_ultimo_id_indice = 0
+_lock_indice_comprobantes = threading.Lock()
+
+
+def _indice_duplicados(conn):
+    """
+    Índice de duplicados de los comprobantes guardados, compartido entre llamadas. Se rearma completo si otra
+    conexión escribió en la base (cambió PRAGMA data_version); si no, solo se le agregan los comprobantes nuevos
+    (id mayor al último indexado), que se leen por la clave primaria sin recorrer la tabla.
+    """
+    global _indice_comprobantes, _estado_indice_comprobantes, _ultimo_id_indice
+    estado = (DB_PATH, id(conn), conn.execute("PRAGMA data_version").fetchone()[0])
+    if estado != _estado_indice_comprobantes:
+        _indice_comprobantes = duplicados.IndiceComprobantes()
+        _estado_indice_comprobantes, _ultimo_id_indice = estado, 0
+    for fila in consultas.todos(conn, "comprobantes_para_indice", (_ultimo_id_indice,)):
+        _indice_comprobantes.agregar(fila[0], *fila[1:5], duplicados.hash_de_texto(fila[5]))
+        _ultimo_id_indice = fila[0]
+    return _indice_comprobantes
+
+
+def _descripcion_duplicados(conn, coincidencias):
+    """Coincidencias con clave = id de comprobante -> dicts con los datos del comprobante guardado."""
+    por_id = {coincidencia.clave: coincidencia for coincidencia in coincidencias}
+    filas = consultas.todos(conn, "comprobantes_por_ids", (json.dumps(list(por_id)),))
+    return [{'id': id_comprobante, 'nro_operacion': nro, 'fecha': fecha, 'importe': importe, 'cuenta': cuenta,
+             'motivos': por_id[id_comprobante].motivos, 'distancia_imagen': por_id[id_comprobante].distancia_imagen}
+            for id_comprobante, nro, fecha, importe, cuenta in filas]
+
+
+@instrumentacion.medir()
+def buscar_comprobantes_duplicados(nro_operacion, fecha, importe, cuenta, ruta_archivo=None):
+    """
+    Comprobantes guardados que podrían ser el mismo que se va a cargar: número de operación igual salvo
+    errores típicos del OCR, mismo importe y cuenta con fecha cercana, o imagen casi igual (si se pasa
+    'ruta_archivo'). Devuelve una lista de dicts (id, nro_operacion, fecha, importe, cuenta, motivos,
+    distancia_imagen), vacía si no hay sospechosos.
+    """
+    conn = conexion()
+    hash_imagen = duplicados.hash_archivo(ruta_archivo) if ruta_archivo else None
+    with _lock_indice_comprobantes:
+        coincidencias = _indice_duplicados(conn).buscar(nro_operacion, fecha, importe, cuenta, hash_imagen)
+    return _descripcion_duplicados(conn, coincidencias) if coincidencias else []
+
+
+@instrumentacion.medir()
+def detectar_comprobantes_duplicados(comprobantes=None):
+    """
+    Detección por lotes. 'comprobantes' es una lista de dicts con nro_operacion, fecha, importe, cuenta y
+    opcionalmente 'ruta' (como los que devuelve extraer_datos_comprobantes): cada uno se compara con los
+    guardados y con los anteriores del mismo lote. Devuelve [(posición en el lote, [Coincidencia])] solo de
+    los sospechosos; la clave de cada Coincidencia es el id del comprobante guardado o ('lote', posición).
+    Sin 'comprobantes' revisa los ya guardados entre sí y la clave es el id de cada uno.
+    Cada comprobante cuesta una búsqueda en los índices, no una pasada por la tabla.
+    """
+    conn = conexion()
+    if comprobantes is None:
+        with _lock_indice_comprobantes:
+            indice = _indice_duplicados(conn)
+            sospechosos = []
+            for fila in consultas.todos(conn, "comprobantes_para_indice", (0,)):
+                coincidencias = [c for c in indice.buscar(*fila[1:5], duplicados.hash_de_texto(fila[5]), excluir=fila[0])
+                                 if c.clave < fila[0]] # Cada par se informa una sola vez, en el más nuevo
+                if coincidencias:
+                    sospechosos.append((fila[0], coincidencias))
+        return sospechosos
+
+    comprobantes = list(comprobantes)
+    # Los hashes (la parte lenta) se calculan en paralelo y antes de tomar el índice
+    hashes = duplicados.hashes_archivos([datos.get('ruta') for datos in comprobantes])
+
+    lote = duplicados.IndiceComprobantes() # Los del lote van aparte, para no mezclarlos con los guardados
+    sospechosos = []
+    with _lock_indice_comprobantes:
+        indice = _indice_duplicados(conn)
+        for posicion, (datos, hash_imagen) in enumerate(zip(comprobantes, hashes)):
+            campos = (datos.get('nro_operacion'), datos.get('fecha'), datos.get('importe'), datos.get('cuenta'))
+            coincidencias = indice.buscar(*campos, hash_imagen) + lote.buscar(*campos, hash_imagen)
+            if coincidencias:
+                sospechosos.append((posicion, coincidencias))
+            lote.agregar(('lote', posicion), *campos, hash_imagen)
+    return sospechosos
 
 
 # --- 2. Funciones de Extracción de Datos (OCR) ---
 
+EXTENSIONES_IMAGEN = ('.png', '.jpg', '.jpeg')
+
+
+def _texto_pdf(ruta_archivo):
+    import fitz # Importar PyMuPDF aquí para no forzar su instalación si solo se usa imagen
+    documento = fitz.open(ruta_archivo)
+    try:
+        return "".join(documento.load_page(pagina_num).get_text() for pagina_num in range(documento.page_count))
+    finally:
+        documento.close()
+
+
+def _validar_archivo_comprobante(ruta_archivo):
+    """Mensaje de error si el archivo no existe o no es de un formato soportado, o None."""
+    if not os.path.exists(ruta_archivo):
+        return f"El archivo '{ruta_archivo}' no existe."
+    if not ruta_archivo.lower().endswith(EXTENSIONES_IMAGEN + ('.pdf',)):
+        return f"Formato de archivo no soportado ('{ruta_archivo}'). Por favor, usá PDF, PNG, JPG o JPEG."
+    return None
+
+
+def _datos_de_texto(ruta_archivo, texto_extraido, error):
+    """Resultado (datos, mensaje_de_error) de un comprobante a partir de su texto o del error al extraerlo."""
+    if error is not None:
+        if isinstance(error, ocr.TesseractNoEncontrado):
+            log.error("%s", error)
+            return None, str(error)
+        log.error("Error al procesar el archivo '%s': %s", ruta_archivo, error, exc_info=error)
+        return None, f"Error al procesar el archivo '{ruta_archivo}': {error}"
+    log.debug("Texto extraído del comprobante '%s':\n%s", ruta_archivo, texto_extraido)
+    return parsear_texto_comprobante(texto_extraido), None
+
+
+@instrumentacion.medir()
 def extraer_datos_comprobante(ruta_archivo):
     """
-    Extrae texto de PDF o imagen y busca patrones de datos.
+    Extrae texto de PDF o imagen y busca patrones de datos. Devuelve (datos, None) o (None, mensaje_de_error).
+    Las imágenes pasan por el servicio de OCR (ocr.py), que mantiene los trabajadores de Tesseract precalentados.
     NOTA: La extracción por patrones es básica. Necesitarás ajustar
     las expresiones regulares para que coincidan con el formato de tus documentos.
     """
-    if not os.path.exists(ruta_archivo):
-        print(f"❌ Error: El archivo '{ruta_archivo}' no existe.")
-        return None
+    error = _validar_archivo_comprobante(ruta_archivo)
+    if error:
+        log.error(error)
+        return None, error
 
-    texto_extraido = ""
+    texto_extraido, error = "", None
     try:
-        if ruta_archivo.lower().endswith(('.png', '.jpg', '.jpeg')):
-            img = Image.open(ruta_archivo)
-            texto_extraido = pytesseract.image_to_string(img, lang='spa')
-        elif ruta_archivo.lower().endswith('.pdf'):
-            import fitz # Importar PyMuPDF aquí para no forzar su instalación si solo se usa imagen
-            documento = fitz.open(ruta_archivo)
-            for pagina_num in range(documento.page_count):
-                pagina = documento.load_page(pagina_num)
-                texto_extraido += pagina.get_text()
-            documento.close()
+        if ruta_archivo.lower().endswith(EXTENSIONES_IMAGEN):
+            texto_extraido = ocr.servicio().reconocer(ruta_archivo)
         else:
-            print("Formato de archivo no soportado. Por favor, usá PDF, PNG, JPG o JPEG.")
-            return None
-    except pytesseract.TesseractNotFoundError:
-        print("❌ Error: Tesseract OCR no está instalado o no se encuentra en tu PATH.")
-        print("Por favor, instala Tesseract y/o configura 'pytesseract.pytesseract.tesseract_cmd' en el código.")
-        return None
+            texto_extraido = _texto_pdf(ruta_archivo)
     except Exception as e:
-        print(f"❌ Error al procesar el archivo '{ruta_archivo}': {e}")
-        return None
+        error = e
+    return _datos_de_texto(ruta_archivo, texto_extraido, error)
+
+
+@instrumentacion.medir()
+def extraer_datos_comprobantes(rutas):
+    """
+    Versión por lotes de extraer_datos_comprobante: las imágenes se envían todas al servicio de OCR
+    (que las reparte entre sus trabajadores y las agrupa por ejecución de Tesseract).
+    Es un generador: devuelve (ruta, datos, mensaje_de_error) en el orden de 'rutas'.
+    """
+    rutas = list(rutas)
+    imagenes = [ruta for ruta in rutas if ruta.lower().endswith(EXTENSIONES_IMAGEN) and os.path.exists(ruta)]
+    reconocidas = ocr.servicio().reconocer_varios(imagenes) if imagenes else iter(())
+    for ruta in rutas:
+        error = _validar_archivo_comprobante(ruta)
+        if error:
+            log.error(error)
+            yield ruta, None, error
+            continue
+        if ruta.lower().endswith(EXTENSIONES_IMAGEN):
+            _, texto_extraido, excepcion = next(reconocidas)
+        else:
+            try:
+                texto_extraido, excepcion = _texto_pdf(ruta), None
+            except Exception as e:
+                texto_extraido, excepcion = "", e
+        yield (ruta, *_datos_de_texto(ruta, texto_extraido, excepcion))
+
 
-    print("\n--- Texto extraído del comprobante ---")
-    print(texto_extraido)
-    print("--------------------------------------\n")
+# --- EXPRESIONES REGULARES (compiladas una sola vez al importar el módulo) ---
+RE_NRO_OPERACION = re.compile(r'(?:Nro\.?\s*Operación|No\.?\s*Operación|Operacion|Op\.?|Nº Operación):\s*(\S+)', re.IGNORECASE)
+RE_FECHA = re.compile(r'Fecha:\s*(\d{2}[-/]\d{2}[-/]\d{4})', re.IGNORECASE)
+RE_IMPORTE = re.compile(r'(?:Importe|Total|Monto):\s*[$€]?\s*([\d\.,]+)', re.IGNORECASE)
+RE_CUENTA = re.compile(r'(?:Cuenta|Cta|Destino):\s*(\S+)', re.IGNORECASE)
 
-    # --- EXPRESIONES REGULARES ---
-    nro_operacion = re.search(r'(?:Nro\.?\s*Operación|No\.?\s*Operación|Operacion|Op\.?|Nº Operación):\s*(\S+)', texto_extraido, re.IGNORECASE)
-    fecha = re.search(r'Fecha:\s*(\d{2}[-/]\d{2}[-/]\d{4})', texto_extraido, re.IGNORECASE)
-    importe = re.search(r'(?:Importe|Total|Monto):\s*[$€]?\s*([\d\.,]+)', texto_extraido, re.IGNORECASE)
-    cuenta = re.search(r'(?:Cuenta|Cta|Destino):\s*(\S+)', texto_extraido, re.IGNORECASE)
+@instrumentacion.medir()
+def parsear_texto_comprobante(texto_extraido):
+    """
+    Busca número de operación, fecha, importe y cuenta en el texto de un comprobante.
+    Separado de extraer_datos_comprobante para poder reutilizarlo (y medirlo) sin pasar por el OCR.
+    """
+    nro_operacion = RE_NRO_OPERACION.search(texto_extraido)
+    fecha = RE_FECHA.search(texto_extraido)
+    importe = RE_IMPORTE.search(texto_extraido)
+    cuenta = RE_CUENTA.search(texto_extraido)
 
     importe_valor = None
     if importe:
@@ -232,7 +1077,7 @@ def extraer_datos_comprobante(ruta_archivo):
             importe_str = importe.group(1).replace('.', '').replace(',', '.')
             importe_valor = float(importe_str)
         except ValueError:
-            print(f"Advertencia: No se pudo convertir el importe '{importe.group(1)}' a número.")
+            log.warning("No se pudo convertir el importe '%s' a número.", importe.group(1))
             importe_valor = None
 
     datos = {
@@ -246,46 +1091,50 @@ def extraer_datos_comprobante(ruta_archivo):
 
 # --- 2.1. Funciones de Gestión de Productos ---
 
-def agregar_producto():
-    """Permite añadir un nuevo producto al inventario."""
-    conn = sqlite3.connect('presupuestos.db')
-    cursor = conn.cursor()
-    
-    codigo = input("Ingrese el código del producto (ej: SKU-001): ").strip().upper()
-    descripcion = input("Ingrese la descripción del producto: ").strip()
-    
-    while True:
+def agregar_producto(codigo=None, descripcion=None, stock=None):
+    """
+    Permite añadir un nuevo producto al inventario. El stock inicial entra como movimiento 'ingreso'.
+    Si no se pasan los datos se piden por consola. Devuelve (éxito, mensaje).
+    """
+    conn = conexion()
+
+    if codigo is None:
+        codigo = input("Ingrese el código del producto (ej: SKU-001): ")
+    if descripcion is None:
+        descripcion = input("Ingrese la descripción del producto: ")
+    codigo, descripcion = codigo.strip().upper(), descripcion.strip()
+
+    while stock is None:
         try:
             stock = int(input("Ingrese el stock inicial disponible: "))
             if stock < 0:
                 print("El stock no puede ser negativo.")
-                continue
-            break
+                stock = None
         except ValueError:
             print("Por favor, ingrese un número entero para el stock.")
+    if stock < 0:
+        return False, "El stock no puede ser negativo."
 
     # Las columnas de precios se inicializarán a 0.0 si no se especifican.
     # Si quieres pedir precios aquí, deberías agregar más inputs.
     try:
-        cursor.execute("INSERT INTO productos (codigo, descripcion, stock_disponible) VALUES (?, ?, ?)",
-                       (codigo, descripcion, stock))
-        conn.commit()
-        print(f"✅ Producto '{descripcion}' ({codigo}) agregado con {stock} unidades en stock.")
+        with conn:
+            producto_id = consultas.ejecutar(conn, "insertar_producto", (codigo, descripcion)).lastrowid
+            if stock:
+                consultas.ejecutar(conn, "registrar_movimiento_stock", (producto_id, 'ingreso', stock, 0, None, 'Stock inicial'))
+        mensaje = f"Producto '{descripcion}' ({codigo}) agregado con {stock} unidades en stock."
+        log.info(mensaje)
+        return True, mensaje
     except sqlite3.IntegrityError:
-        print(f"❌ Error: Ya existe un producto con el código '{codigo}'.")
+        log.error("Ya existe un producto con el código '%s'.", codigo)
+        return False, f"Ya existe un producto con el código '{codigo}'."
     except Exception as e:
-        print(f"❌ Error al agregar producto: {e}")
-    finally:
-        conn.close()
+        log.error("Error al agregar producto: %s", e)
+        return False, f"Error al agregar producto: {e}"
 
 def ver_productos():
     """Muestra la lista completa de productos con su stock y estado."""
-    conn = sqlite3.connect('presupuestos.db')
-    cursor = conn.cursor()
-    # Ahora seleccionamos también las columnas de precios para mostrar
-    cursor.execute("SELECT codigo, descripcion, stock_disponible, stock_reservado, estado_producto, precio_1 FROM productos ORDER BY codigo")
-    productos = cursor.fetchall()
-    conn.close()
+    productos = consultas.todos(conexion(), "productos")
 
     if not productos:
         print("\nNo hay productos registrados en el inventario.")
@@ -298,57 +1147,59 @@ def ver_productos():
         print(f"{prod[0]:<15} {prod[1]:<30} {prod[2]:<8} {prod[3]:<8} {prod[4]:<15} {prod[5]:<10.2f}")
     print("-" * 86)
 
-def modificar_stock_producto():
-    """Permite ajustar el stock disponible de un producto existente."""
-    conn = sqlite3.connect('presupuestos.db')
-    cursor = conn.cursor()
+def modificar_stock_producto(codigo=None, cambio_stock=None, tipo=None, motivo=None):
+    """
+    Permite ajustar el stock disponible de un producto existente, registrando un movimiento de stock:
+    'ingreso' si suma y 'ajuste' si resta (o el 'tipo' indicado). Si no se pasan código y cantidad se
+    piden por consola. Devuelve (éxito, mensaje).
+    """
+    conn = conexion()
 
-    codigo = input("Ingrese el código del producto a modificar: ").strip().upper()
-    
-    cursor.execute("SELECT id, descripcion, stock_disponible, stock_reservado FROM productos WHERE codigo = ?", (codigo,))
-    producto = cursor.fetchone()
+    if codigo is None:
+        codigo = input("Ingrese el código del producto a modificar: ")
+    codigo = codigo.strip().upper()
+
+    producto = consultas.uno(conn, "producto_stock", (codigo,))
 
     if not producto:
-        print(f"❌ Error: Producto con código '{codigo}' no encontrado.")
-        conn.close()
-        return
+        log.error("Producto con código '%s' no encontrado.", codigo)
+        return False, f"Producto con código '{codigo}' no encontrado."
 
     prod_id, descripcion, stock_actual_disponible, stock_actual_reservado = producto
-    print(f"\nProducto: {descripcion} (Código: {codigo})")
-    print(f"Stock Disponible Actual: {stock_actual_disponible}")
-    print(f"Stock Reservado Actual: {stock_actual_reservado}")
-
-    while True:
+    if cambio_stock is None:
+        print(f"\nProducto: {descripcion} (Código: {codigo})")
+        print(f"Stock Disponible Actual: {stock_actual_disponible}")
+        print(f"Stock Reservado Actual: {stock_actual_reservado}")
+    while cambio_stock is None:
         try:
             cambio_stock = int(input("Ingrese la cantidad a SUMAR (+) o RESTAR (-) al stock disponible: "))
-            break
         except ValueError:
             print("Por favor, ingrese un número entero.")
 
     nuevo_stock_disponible = stock_actual_disponible + cambio_stock
 
     if nuevo_stock_disponible < 0:
-        print("⚠️ Advertencia: El stock disponible no puede ser negativo. Ajuste no realizado.")
-        conn.close()
-        return
+        log.warning("El stock disponible no puede ser negativo. Ajuste no realizado.")
+        return False, "El stock disponible no puede ser negativo. Ajuste no realizado."
+    tipo = tipo or ('ingreso' if cambio_stock > 0 else 'ajuste')
+    if tipo not in TIPOS_MOVIMIENTO_STOCK:
+        return False, f"Tipo de movimiento inválido. Opciones: {', '.join(TIPOS_MOVIMIENTO_STOCK)}."
 
     try:
-        cursor.execute("UPDATE productos SET stock_disponible = ? WHERE id = ?",
-                       (nuevo_stock_disponible, prod_id))
-        conn.commit()
-        print(f"✅ Stock de '{descripcion}' ({codigo}) actualizado.")
-        print(f"Nuevo Stock Disponible: {nuevo_stock_disponible}")
+        with conn:
+            consultas.ejecutar(conn, "registrar_movimiento_stock", (prod_id, tipo, cambio_stock, 0, None, motivo))
+        mensaje = f"Stock de '{descripcion}' ({codigo}) actualizado. Nuevo stock disponible: {nuevo_stock_disponible}"
+        log.info(mensaje)
         actualizar_estado_producto_automatico(prod_id, nuevo_stock_disponible, stock_actual_reservado)
+        return True, mensaje
 
     except Exception as e:
-        print(f"❌ Error al modificar stock: {e}")
-    finally:
-        conn.close()
+        log.error("Error al modificar stock: %s", e)
+        return False, f"Error al modificar stock: {e}"
 
 def actualizar_estado_producto_automatico(producto_id, stock_disponible, stock_reservado):
     """Actualiza el estado_producto basado en stock (ej: sin_stock)."""
-    conn = sqlite3.connect('presupuestos.db')
-    cursor = conn.cursor()
+    conn = conexion()
     
     nuevo_estado = 'disponible'
     if stock_disponible == 0 and stock_reservado == 0:
@@ -356,24 +1207,20 @@ def actualizar_estado_producto_automatico(producto_id, stock_disponible, stock_r
     elif stock_disponible == 0 and stock_reservado > 0:
         nuevo_estado = 'reservado'
     
-    cursor.execute("UPDATE productos SET estado_producto = ? WHERE id = ?", (nuevo_estado, producto_id))
-    conn.commit()
-    conn.close()
+    with conn:
+        consultas.ejecutar(conn, "actualizar_estado_producto", (nuevo_estado, producto_id))
     
-    print(f"Estado de producto actualizado a '{nuevo_estado}'.")
+    log.info("Estado del producto #%s actualizado a '%s'.", producto_id, nuevo_estado)
 
 def cambiar_estado_producto_manual():
     """Permite cambiar manualmente el estado de un producto (ej: discontinuado)."""
-    conn = sqlite3.connect('presupuestos.db')
-    cursor = conn.cursor()
+    conn = conexion()
 
     codigo = input("Ingrese el código del producto para cambiar su estado: ").strip().upper()
-    cursor.execute("SELECT id, descripcion, estado_producto FROM productos WHERE codigo = ?", (codigo,))
-    producto = cursor.fetchone()
+    producto = consultas.uno(conn, "producto_estado", (codigo,))
 
     if not producto:
-        print(f"❌ Error: Producto con código '{codigo}' no encontrado.")
-        conn.close()
+        log.error("Producto con código '%s' no encontrado.", codigo)
         return
 
     prod_id, descripcion, estado_actual = producto
@@ -382,34 +1229,29 @@ def cambiar_estado_producto_manual():
     nuevo_estado = input("Ingrese el nuevo estado: ").strip().lower()
 
     if nuevo_estado not in ['disponible', 'discontinuado', 'en_transito', 'pedida', 'sin_stock']:
-        print("❌ Estado inválido. Por favor, elija uno de la lista.")
-        conn.close()
+        log.error("Estado inválido (%r). Por favor, elija uno de la lista.", nuevo_estado)
         return
 
     try:
-        cursor.execute("UPDATE productos SET estado_producto = ? WHERE id = ?",
-                       (nuevo_estado, prod_id))
-        conn.commit()
-        print(f"✅ Estado de '{descripcion}' ({codigo}) cambiado a '{nuevo_estado}'.")
+        with conn:
+            consultas.ejecutar(conn, "actualizar_estado_producto", (nuevo_estado, prod_id))
+        log.info("Estado de '%s' (%s) cambiado a '%s'.", descripcion, codigo, nuevo_estado)
     except Exception as e:
-        print(f"❌ Error al cambiar estado del producto: {e}")
-    finally:
-        conn.close()
+        log.error("Error al cambiar estado del producto: %s", e)
 
 
 # --- 2.2. Funciones de Gestión de Notas de Pedido ---
 
+@instrumentacion.medir()
 def crear_nota_pedido():
     """Permite crear una nueva nota de pedido, seleccionando productos y gestionando el tipo de entrega."""
-    conn = sqlite3.connect('presupuestos.db')
-    cursor = conn.cursor()
+    conn = conexion()
 
     nombre_cliente = input("Ingrese el nombre del cliente para la nota de pedido: ").strip()
     cliente_id = obtener_o_crear_cliente(nombre_cliente)
 
     if not cliente_id:
-        print("No se pudo identificar al cliente. Abortando creación de nota de pedido.")
-        conn.close()
+        log.error("No se pudo identificar al cliente. Abortando creación de nota de pedido.")
         return
 
     print("\n--- Productos para la Nota de Pedido ---")
@@ -422,8 +1264,7 @@ def crear_nota_pedido():
             break
 
         # Seleccionamos también los precios para que estén disponibles
-        cursor.execute("SELECT id, descripcion, stock_disponible, stock_reservado, estado_producto, precio_1 FROM productos WHERE codigo = ?", (codigo_producto,))
-        producto = cursor.fetchone()
+        producto = consultas.uno(conn, "producto_para_pedido", (codigo_producto,))
 
         if not producto:
             print(f"❌ Producto con código '{codigo_producto}' no encontrado.")
@@ -475,8 +1316,7 @@ def crear_nota_pedido():
         print(f"'{descripcion}' ({cantidad} unidades) agregado al pedido temporal.")
 
     if not detalle_pedido_temp:
-        print("No se agregaron productos al pedido. Abortando creación de nota de pedido.")
-        conn.close()
+        log.warning("No se agregaron productos al pedido. Abortando creación de nota de pedido.")
         return
 
     tipo_entrega = "Retiro por mostrador"
@@ -492,57 +1332,32 @@ def crear_nota_pedido():
     fecha_creacion = datetime.date.today().isoformat()
 
     try:
-        cursor.execute("""
-            INSERT INTO notas_pedido (cliente_id, fecha_creacion, tipo_entrega, direccion_envio, telefono_contacto, estado)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (cliente_id, fecha_creacion, tipo_entrega, direccion_envio, telefono_contacto, 'pendiente'))
-        nota_pedido_id = cursor.lastrowid
-        print(f"\n✅ Nota de Pedido #{nota_pedido_id} creada como 'pendiente'.")
-
-        for prod_id, cantidad, precio_unitario in detalle_pedido_temp:
-            cursor.execute("""
-                INSERT INTO detalle_pedido (nota_pedido_id, producto_id, cantidad, precio_unitario)
-                VALUES (?, ?, ?, ?)
-            """, (nota_pedido_id, prod_id, cantidad, precio_unitario))
-        
-        conn.commit()
-        print("✅ Detalles del pedido guardados.")
+        with conn:
+            nota_pedido_id = consultas.ejecutar(conn, "insertar_nota_pedido", (
+                cliente_id, fecha_creacion, tipo_entrega, direccion_envio, telefono_contacto, 'pendiente')).lastrowid
+            consultas.muchos(conn, "insertar_detalle_pedido",
+                             [(nota_pedido_id, prod_id, cantidad, precio_unitario)
+                              for prod_id, cantidad, precio_unitario in detalle_pedido_temp])
+        log.info("Nota de Pedido #%s creada como 'pendiente' con %d líneas.", nota_pedido_id, len(detalle_pedido_temp))
 
     except Exception as e:
-        print(f"❌ Error al guardar la Nota de Pedido o sus detalles: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
+        log.error("Error al guardar la Nota de Pedido o sus detalles: %s", e)
+
+@instrumentacion.medir()
+def obtener_notas_pedido(filtrar_expedicion=False):
+    """
+    Devuelve las notas de pedido con sus totales guardados, incluyendo las que todavía no tienen líneas.
+    Cada fila: (id, cliente, fecha, tipo_entrega, direccion, telefono, estado, total, total_con_iva, cantidad_lineas).
+    Si filtrar_expedicion es True, solo devuelve pedidos 'pendiente' y 'aprobada'.
+    """
+    return consultas.todos(conexion(), "notas_pedido_expedicion" if filtrar_expedicion else "notas_pedido")
 
 def ver_notas_pedido(filtrar_expedicion=False):
     """
     Muestra las notas de pedido.
     Si filtrar_expedicion es True, solo muestra pedidos 'pendiente' y 'aprobada'.
     """
-    conn = sqlite3.connect('presupuestos.db')
-    cursor = conn.cursor()
-
-    query = """
-    SELECT 
-        np.id, c.nombre, np.fecha_creacion, np.tipo_entrega, np.direccion_envio, 
-        np.telefono_contacto, np.estado, SUM(dp.cantidad * dp.precio_unitario) AS total
-    FROM 
-        notas_pedido np
-    JOIN 
-        clientes c ON np.cliente_id = c.id
-    JOIN
-        detalle_pedido dp ON np.id = dp.nota_pedido_id
-    """
-    params = []
-    
-    if filtrar_expedicion:
-        query += " WHERE np.estado IN ('pendiente', 'aprobada')"
-    
-    query += " GROUP BY np.id ORDER BY np.fecha_creacion DESC, np.id DESC"
-
-    cursor.execute(query, params)
-    notas = cursor.fetchall()
-    conn.close()
+    notas = obtener_notas_pedido(filtrar_expedicion)
 
     if not notas:
         if filtrar_expedicion:
@@ -585,28 +1400,31 @@ def ver_notas_pedido(filtrar_expedicion=False):
         except ValueError:
             print("Por favor, ingrese un ID válido.")
 
+@instrumentacion.medir()
+def obtener_detalle_nota_pedido(nota_pedido_id):
+    """
+    Devuelve ({'nota_pedido': cabecera, 'detalles': líneas}, None) o (None, mensaje_de_error).
+    cabecera: (id, cliente, fecha, tipo_entrega, direccion, telefono, estado, total, total_iva, total_con_iva)
+    líneas: (codigo, descripcion, cantidad, precio_unitario)
+    """
+    conn = conexion()
+    nota = consultas.uno(conn, "nota_pedido", (nota_pedido_id,))
+
+    if not nota:
+        return None, f"Nota de Pedido con ID {nota_pedido_id} no encontrada."
+
+    detalles = consultas.todos(conn, "detalle_nota_pedido", (nota_pedido_id,))
+    return {'nota_pedido': nota, 'detalles': detalles}, None
+
 def mostrar_detalle_nota_pedido(nota_pedido_id):
     """Muestra los productos y detalles específicos de una nota de pedido."""
-    conn = sqlite3.connect('presupuestos.db')
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        SELECT 
-            np.id, c.nombre, np.fecha_creacion, np.tipo_entrega, np.direccion_envio, 
-            np.telefono_contacto, np.estado
-        FROM 
-            notas_pedido np
-        JOIN 
-            clientes c ON np.cliente_id = c.id
-        WHERE np.id = ?
-    """, (nota_pedido_id,))
-    nota = cursor.fetchone()
+    datos, error = obtener_detalle_nota_pedido(nota_pedido_id)
 
-    if not nota:
-        print(f"Nota de Pedido con ID {nota_pedido_id} no encontrada.")
-        conn.close()
+    if error:
+        print(error)
         return
 
+    nota = datos['nota_pedido']
     print(f"\n--- Detalles de Nota de Pedido #{nota[0]} ---")
     print(f"Cliente: {nota[1]}")
     print(f"Fecha de Creación: {nota[2]}")
@@ -619,123 +1437,106 @@ def mostrar_detalle_nota_pedido(nota_pedido_id):
     print(f"{'Código':<15} {'Descripción':<30} {'Cantidad':<10} {'P. Unit.':<10} {'Subtotal':<10}")
     print("-" * 80)
 
-    cursor.execute("""
-        SELECT 
-            p.codigo, p.descripcion, dp.cantidad, dp.precio_unitario
-        FROM 
-            detalle_pedido dp
-        JOIN 
-            productos p ON dp.producto_id = p.id
-        WHERE dp.nota_pedido_id = ?
-    """, (nota_pedido_id,))
-    detalles = cursor.fetchall()
-    
-    total_pedido = 0
-    for det in detalles:
+    for det in datos['detalles']:
         subtotal = det[2] * det[3]
-        total_pedido += subtotal
         print(f"{det[0]:<15} {det[1]:<30} {det[2]:<10} {det[3]:<10.2f} {subtotal:<10.2f}")
     print("-" * 80)
-    print(f"{'TOTAL PEDIDO:':<66} {total_pedido:<10.2f}")
-    conn.close()
+    print(f"{'TOTAL PEDIDO (s/IVA):':<66} {nota[7]:<10.2f}")
+    print(f"{f'IVA ({IVA_RATE*100:.0f}%):':<66} {nota[8]:<10.2f}")
+    print(f"{'TOTAL PEDIDO (c/IVA):':<66} {nota[9]:<10.2f}")
 
-def actualizar_estado_nota_pedido():
+@instrumentacion.medir()
+def actualizar_estado_nota_pedido(id_nota=None, nuevo_estado=None, confirmar_salto=None):
     """
     Permite cambiar el estado de una nota de pedido y ajusta el stock reservado/disponible.
     Estados: pendiente, aprobada, entregada, cancelada.
+    Si no se pasan id_nota y nuevo_estado se piden por consola (igual que para confirmar el salto
+    de 'pendiente' a 'entregada' si confirmar_salto es None). Devuelve (éxito, mensaje).
     """
-    conn = sqlite3.connect('presupuestos.db')
-    cursor = conn.cursor()
+    interactivo = id_nota is None or nuevo_estado is None
+    conn = conexion()
 
-    id_nota = input("Ingrese el ID de la nota de pedido a actualizar: ").strip()
+    if id_nota is None:
+        id_nota = input("Ingrese el ID de la nota de pedido a actualizar: ").strip()
     try:
         id_nota = int(id_nota)
     except ValueError:
-        print("❌ ID de nota de pedido inválido. Debe ser un número.")
-        conn.close()
-        return
+        log.error("ID de nota de pedido inválido (%r). Debe ser un número.", id_nota)
+        return False, "ID de nota de pedido inválido. Debe ser un número."
 
-    cursor.execute("SELECT estado FROM notas_pedido WHERE id = ?", (id_nota,))
-    nota_actual = cursor.fetchone()
+    nota_actual = consultas.uno(conn, "estado_nota_pedido", (id_nota,))
 
     if not nota_actual:
-        print(f"❌ Nota de pedido con ID {id_nota} no encontrada.")
-        conn.close()
-        return
+        log.error("Nota de pedido con ID %s no encontrada.", id_nota)
+        return False, f"Nota de pedido con ID {id_nota} no encontrada."
 
     estado_actual = nota_actual[0]
-    print(f"Estado actual de la Nota de Pedido #{id_nota}: {estado_actual}")
-    print("Nuevos estados posibles: pendiente, aprobada, entregada, cancelada")
-    nuevo_estado = input("Ingrese el nuevo estado: ").strip().lower()
+    if nuevo_estado is None:
+        print(f"Estado actual de la Nota de Pedido #{id_nota}: {estado_actual}")
+        print("Nuevos estados posibles: pendiente, aprobada, entregada, cancelada")
+        nuevo_estado = input("Ingrese el nuevo estado: ")
+    nuevo_estado = nuevo_estado.strip().lower()
 
     if nuevo_estado not in ['pendiente', 'aprobada', 'entregada', 'cancelada']:
-        print("❌ Estado inválido. Por favor, elija uno de la lista.")
-        conn.close()
-        return
+        log.error("Estado inválido (%r). Por favor, elija uno de la lista.", nuevo_estado)
+        return False, "Estado inválido. Opciones: pendiente, aprobada, entregada, cancelada."
     
     if nuevo_estado == estado_actual:
-        print("El estado es el mismo. No se realizaron cambios.")
-        conn.close()
-        return
-
-    cursor.execute("SELECT producto_id, cantidad FROM detalle_pedido WHERE nota_pedido_id = ?", (id_nota,))
-    detalles = cursor.fetchall()
+        log.info("El estado es el mismo. No se realizaron cambios.")
+        return False, "El estado es el mismo. No se realizaron cambios."
+
+    # Movimiento de stock de la transición (sentencia de consultas.py, una ejecución por línea del pedido)
+    movimiento = None
+    if estado_actual == 'pendiente' and nuevo_estado == 'aprobada':
+        movimiento = "reservar_stock"
+    elif estado_actual == 'aprobada' and nuevo_estado == 'entregada':
+        movimiento = "entregar_reservado"
+    elif nuevo_estado == 'cancelada' and estado_actual == 'aprobada':
+        movimiento = "liberar_reserva"
+    elif estado_actual == 'pendiente' and nuevo_estado == 'entregada':
+        log.warning("Nota de Pedido #%s: un pedido pendiente no debería pasar directamente a entregado sin antes ser aprobado y reservar stock.", id_nota)
+        if confirmar_salto is None:
+            confirmar_salto = interactivo and input("¿Confirmar salto de estado y descontar directamente de disponible? (s/n): ").lower() == 's'
+        if not confirmar_salto:
+            log.info("Operación cancelada. El estado no se actualizó.")
+            return False, "Un pedido pendiente debe aprobarse antes de entregarse. El estado no se actualizó."
+        movimiento = "descontar_disponible"
 
     try:
-        if estado_actual == 'pendiente' and nuevo_estado == 'aprobada':
-            for prod_id, cantidad in detalles:
-                cursor.execute("UPDATE productos SET stock_disponible = stock_disponible - ?, stock_reservado = stock_reservado + ? WHERE id = ?",
-                               (cantidad, cantidad, prod_id))
-            print(f"✅ Mercadería para Nota de Pedido #{id_nota} RESERVADA.")
-        
-        elif estado_actual == 'aprobada' and nuevo_estado == 'entregada':
-            for prod_id, cantidad in detalles:
-                cursor.execute("UPDATE productos SET stock_reservado = stock_reservado - ? WHERE id = ?",
-                               (cantidad, prod_id))
-            print(f"✅ Mercadería para Nota de Pedido #{id_nota} ENTREGADA y stock ajustado.")
-        
-        elif nuevo_estado == 'cancelada' and estado_actual != 'entregada':
-            for prod_id, cantidad in detalles:
-                cursor.execute("UPDATE productos SET stock_disponible = stock_disponible + ?, stock_reservado = stock_reservado - ? WHERE id = ?",
-                               (cantidad, cantidad, prod_id))
-            print(f"✅ Nota de Pedido #{id_nota} CANCELADA y stock liberado.")
-        
-        elif estado_actual == 'pendiente' and nuevo_estado == 'entregada':
-             print("⚠️ Advertencia: Un pedido pendiente no debería pasar directamente a entregado sin antes ser aprobado y reservar stock.")
-             confirm = input("¿Confirmar salto de estado y descontar directamente de disponible? (s/n): ").lower()
-             if confirm == 's':
-                for prod_id, cantidad in detalles:
-                    cursor.execute("UPDATE productos SET stock_disponible = stock_disponible - ? WHERE id = ?", (cantidad, prod_id))
-                print(f"✅ Nota de Pedido #{id_nota} entregada directamente y stock descontado de disponible.")
-             else:
-                print("Operación cancelada. El estado no se actualizó.")
-                conn.close()
-                return
-
-        cursor.execute("UPDATE notas_pedido SET estado = ? WHERE id = ?", (nuevo_estado, id_nota))
-        conn.commit()
-        print(f"✅ Estado de Nota de Pedido #{id_nota} actualizado a '{nuevo_estado}'.")
+        with conn:
+            if movimiento:
+                lineas = consultas.todos(conn, "lineas_nota_pedido", (id_nota,))
+                consultas.muchos(conn, movimiento, [(cantidad, prod_id, id_nota) for prod_id, cantidad in lineas])
+            consultas.ejecutar(conn, "actualizar_estado_nota_pedido", (nuevo_estado, id_nota))
+
+        if movimiento == "reservar_stock":
+            log.info("Mercadería para Nota de Pedido #%s RESERVADA.", id_nota)
+        elif movimiento == "entregar_reservado":
+            log.info("Mercadería para Nota de Pedido #%s ENTREGADA y stock ajustado.", id_nota)
+        elif movimiento == "liberar_reserva":
+            log.info("Nota de Pedido #%s CANCELADA y stock liberado.", id_nota)
+        elif movimiento == "descontar_disponible":
+            log.info("Nota de Pedido #%s entregada directamente y stock descontado de disponible.", id_nota)
+        log.info("Estado de Nota de Pedido #%s actualizado a '%s'.", id_nota, nuevo_estado)
+        return True, f"Estado de Nota de Pedido #{id_nota} actualizado a '{nuevo_estado}'."
 
     except Exception as e:
-        print(f"❌ Error al actualizar estado o ajustar stock: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
+        log.error("Error al actualizar estado o ajustar stock: %s", e)
+        return False, f"Error al actualizar estado o ajustar stock: {e}"
 
 
 # --- 2.3. Funciones de Gestión de Presupuestos ---
 
+@instrumentacion.medir()
 def crear_presupuesto():
     """Permite crear un nuevo presupuesto, seleccionando productos."""
-    conn = sqlite3.connect('presupuestos.db')
-    cursor = conn.cursor()
+    conn = conexion()
 
     nombre_cliente = input("Ingrese el nombre del cliente para el presupuesto: ").strip()
     cliente_id = obtener_o_crear_cliente(nombre_cliente)
 
     if not cliente_id:
-        print("No se pudo identificar al cliente. Abortando creación de presupuesto.")
-        conn.close()
+        log.error("No se pudo identificar al cliente. Abortando creación de presupuesto.")
         return
 
     print("\n--- Productos para el Presupuesto ---")
@@ -748,8 +1549,7 @@ def crear_presupuesto():
             break
 
         # Seleccionamos también los precios para que estén disponibles
-        cursor.execute("SELECT id, descripcion, precio_1 FROM productos WHERE codigo = ?", (codigo_producto,))
-        producto = cursor.fetchone()
+        producto = consultas.uno(conn, "producto_para_presupuesto", (codigo_producto,))
 
         if not producto:
             print(f"❌ Producto con código '{codigo_producto}' no encontrado.")
@@ -787,56 +1587,34 @@ def crear_presupuesto():
         print(f"'{descripcion}' ({cantidad} unidades) agregado al presupuesto temporal.")
 
     if not detalle_presupuesto_temp:
-        print("No se agregaron productos al presupuesto. Abortando creación.")
-        conn.close()
+        log.warning("No se agregaron productos al presupuesto. Abortando creación.")
         return
 
     fecha_creacion = datetime.date.today().isoformat()
 
     try:
-        cursor.execute("""
-            INSERT INTO presupuestos (cliente_id, fecha_creacion, estado)
-            VALUES (?, ?, ?)
-        """, (cliente_id, fecha_creacion, 'borrador'))
-        presupuesto_id = cursor.lastrowid
-        print(f"\n✅ Presupuesto #{presupuesto_id} creado como 'borrador'.")
-
-        for prod_id, cantidad, precio_unitario in detalle_presupuesto_temp:
-            cursor.execute("""
-                INSERT INTO detalle_presupuesto (presupuesto_id, producto_id, cantidad, precio_unitario)
-                VALUES (?, ?, ?, ?)
-            """, (presupuesto_id, prod_id, cantidad, precio_unitario))
-        
-        conn.commit()
-        print("✅ Detalles del presupuesto guardados.")
+        with conn:
+            presupuesto_id = consultas.ejecutar(conn, "insertar_presupuesto", (cliente_id, fecha_creacion, 'borrador')).lastrowid
+            consultas.muchos(conn, "insertar_detalle_presupuesto",
+                             [(presupuesto_id, prod_id, cantidad, precio_unitario)
+                              for prod_id, cantidad, precio_unitario in detalle_presupuesto_temp])
+        log.info("Presupuesto #%s creado como 'borrador' con %d líneas.", presupuesto_id, len(detalle_presupuesto_temp))
 
     except Exception as e:
-        print(f"❌ Error al guardar el Presupuesto o sus detalles: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
+        log.error("Error al guardar el Presupuesto o sus detalles: %s", e)
 
 
+@instrumentacion.medir()
+def obtener_todos_los_presupuestos():
+    """
+    Devuelve los presupuestos con sus totales guardados, incluyendo los que todavía no tienen líneas.
+    Cada fila: (id, cliente, fecha, estado, total, total_con_iva, cantidad_lineas).
+    """
+    return consultas.todos(conexion(), "presupuestos")
+
 def ver_presupuestos():
     """Muestra la lista completa de presupuestos con su estado."""
-    conn = sqlite3.connect('presupuestos.db')
-    cursor = conn.cursor()
-
-    query = """
-    SELECT
-        p.id, c.nombre, p.fecha_creacion, p.estado, SUM(dp.cantidad * dp.precio_unitario) AS total
-    FROM
-        presupuestos p
-    JOIN
-        clientes c ON p.cliente_id = c.id
-    JOIN
-        detalle_presupuesto dp ON p.id = dp.presupuesto_id
-    GROUP BY p.id
-    ORDER BY p.fecha_creacion DESC, p.id DESC
-    """
-    cursor.execute(query)
-    presupuestos = cursor.fetchall()
-    conn.close()
+    presupuestos = obtener_todos_los_presupuestos()
 
     if not presupuestos:
         print("\nNo hay presupuestos registrados.")
@@ -870,27 +1648,31 @@ def ver_presupuestos():
         except ValueError:
             print("Por favor, ingrese un ID válido.")
 
+@instrumentacion.medir()
+def obtener_detalle_presupuesto(presupuesto_id):
+    """
+    Devuelve ({'presupuesto': cabecera, 'detalles': líneas}, None) o (None, mensaje_de_error).
+    cabecera: (id, cliente, fecha, estado, total, total_iva, total_con_iva)
+    líneas: (codigo, descripcion, cantidad, precio_unitario)
+    """
+    conn = conexion()
+    presupuesto = consultas.uno(conn, "presupuesto", (presupuesto_id,))
+
+    if not presupuesto:
+        return None, f"Presupuesto con ID {presupuesto_id} no encontrado."
+
+    detalles = consultas.todos(conn, "detalle_presupuesto", (presupuesto_id,))
+    return {'presupuesto': presupuesto, 'detalles': detalles}, None
+
 def mostrar_detalle_presupuesto(presupuesto_id):
     """Muestra los productos y detalles específicos de un presupuesto."""
-    conn = sqlite3.connect('presupuestos.db')
-    cursor = conn.cursor()
+    datos, error = obtener_detalle_presupuesto(presupuesto_id)
 
-    cursor.execute("""
-        SELECT 
-            p.id, c.nombre, p.fecha_creacion, p.estado
-        FROM 
-            presupuestos p
-        JOIN 
-            clientes c ON p.cliente_id = c.id
-        WHERE p.id = ?
-    """, (presupuesto_id,))
-    presupuesto = cursor.fetchone()
-
-    if not presupuesto:
-        print(f"Presupuesto con ID {presupuesto_id} no encontrado.")
-        conn.close()
+    if error:
+        print(error)
         return
 
+    presupuesto = datos['presupuesto']
     print(f"\n--- Detalles de Presupuesto #{presupuesto[0]} ---")
     print(f"Cliente: {presupuesto[1]}")
     print(f"Fecha de Creación: {presupuesto[2]}")
@@ -899,263 +1681,678 @@ def mostrar_detalle_presupuesto(presupuesto_id):
     print(f"{'Código':<15} {'Descripción':<30} {'Cantidad':<10} {'P. Unit.':<10} {'Subtotal':<10}")
     print("-" * 80)
 
-    cursor.execute("""
-        SELECT 
-            prod.codigo, prod.descripcion, dp.cantidad, dp.precio_unitario
-        FROM 
-            detalle_presupuesto dp
-        JOIN 
-            productos prod ON dp.producto_id = prod.id
-        WHERE dp.presupuesto_id = ?
-    """, (presupuesto_id,))
-    detalles = cursor.fetchall()
-    
-    total_presupuesto = 0
-    for det in detalles:
+    for det in datos['detalles']:
         subtotal = det[2] * det[3]
-        total_presupuesto += subtotal
         print(f"{det[0]:<15} {det[1]:<30} {det[2]:<10} {det[3]:<10.2f} {subtotal:<10.2f}")
     print("-" * 80)
-    print(f"{'TOTAL PRESUPUESTO:':<66} {total_presupuesto:<10.2f}")
-    conn.close()
+    print(f"{'TOTAL PRESUPUESTO (s/IVA):':<66} {presupuesto[4]:<10.2f}")
+    print(f"{f'IVA ({IVA_RATE*100:.0f}%):':<66} {presupuesto[5]:<10.2f}")
+    print(f"{'TOTAL PRESUPUESTO (c/IVA):':<66} {presupuesto[6]:<10.2f}")
 
 
-def actualizar_estado_presupuesto():
+@instrumentacion.medir()
+def actualizar_estado_presupuesto(id_presupuesto=None, nuevo_estado=None, crear_nota_pedido=None):
     """
     Permite cambiar el estado de un presupuesto.
-    Estados: borrador, aprobado, facturado, rechazado.
+    Estados: borrador, aprobado, facturado, rechazado, vencido (ver revalidacion_precios.py).
+    Al pasar a 'facturado' puede generar una Nota de Pedido con las mismas líneas (crear_nota_pedido).
+    Si no se pasan id_presupuesto y nuevo_estado se piden por consola (igual que crear_nota_pedido
+    si es None). Devuelve (éxito, mensaje).
     """
-    conn = sqlite3.connect('presupuestos.db')
-    cursor = conn.cursor()
+    interactivo = id_presupuesto is None or nuevo_estado is None
+    conn = conexion()
 
-    id_presupuesto = input("Ingrese el ID del presupuesto a actualizar: ").strip()
+    if id_presupuesto is None:
+        id_presupuesto = input("Ingrese el ID del presupuesto a actualizar: ").strip()
     try:
         id_presupuesto = int(id_presupuesto)
     except ValueError:
-        print("❌ ID de presupuesto inválido. Debe ser un número.")
-        conn.close()
-        return
+        log.error("ID de presupuesto inválido (%r). Debe ser un número.", id_presupuesto)
+        return False, "ID de presupuesto inválido. Debe ser un número."
 
-    cursor.execute("SELECT estado FROM presupuestos WHERE id = ?", (id_presupuesto,))
-    presupuesto_actual = cursor.fetchone()
+    presupuesto_actual = consultas.uno(conn, "estado_presupuesto", (id_presupuesto,))
 
     if not presupuesto_actual:
-        print(f"❌ Presupuesto con ID {id_presupuesto} no encontrado.")
-        conn.close()
-        return
+        log.error("Presupuesto con ID %s no encontrado.", id_presupuesto)
+        return False, f"Presupuesto con ID {id_presupuesto} no encontrado."
 
     estado_actual = presupuesto_actual[0]
-    print(f"Estado actual del Presupuesto #{id_presupuesto}: {estado_actual}")
-    print("Nuevos estados posibles: borrador, aprobado, facturado, rechazado")
-    nuevo_estado = input("Ingrese el nuevo estado: ").strip().lower()
-
-    if nuevo_estado not in ['borrador', 'aprobado', 'facturado', 'rechazado']:
-        print("❌ Estado inválido. Por favor, elija uno de la lista.")
-        conn.close()
-        return
+    if nuevo_estado is None:
+        print(f"Estado actual del Presupuesto #{id_presupuesto}: {estado_actual}")
+        print("Nuevos estados posibles: borrador, aprobado, facturado, rechazado, vencido")
+        nuevo_estado = input("Ingrese el nuevo estado: ")
+    nuevo_estado = nuevo_estado.strip().lower()
+
+    if nuevo_estado not in ['borrador', 'aprobado', 'facturado', 'rechazado', 'vencido']:
+        log.error("Estado inválido (%r). Por favor, elija uno de la lista.", nuevo_estado)
+        return False, "Estado inválido. Opciones: borrador, aprobado, facturado, rechazado, vencido."
     
     if nuevo_estado == estado_actual:
-        print("El estado es el mismo. No se realizaron cambios.")
-        conn.close()
-        return
+        log.info("El estado es el mismo. No se realizaron cambios.")
+        return False, "El estado es el mismo. No se realizaron cambios."
+
+    if nuevo_estado == 'facturado' and crear_nota_pedido is None:
+        print("\nEste presupuesto se marcará como 'Facturado'.")
+        crear_nota_pedido = interactivo and input("¿Desea crear una Nota de Pedido a partir de este presupuesto? (s/n): ").lower() == 's'
 
     try:
-        if nuevo_estado == 'facturado' and estado_actual != 'facturado':
-            print("\nEste presupuesto se marcará como 'Facturado'.")
-            confirmar_facturar = input("¿Desea crear una Nota de Pedido a partir de este presupuesto? (s/n): ").lower()
-            if confirmar_facturar == 's':
-                cursor.execute("""
-                    SELECT cliente_id FROM presupuestos WHERE id = ?
-                """, (id_presupuesto,))
-                cliente_id = cursor.fetchone()[0]
-
-                cursor.execute("""
-                    SELECT producto_id, cantidad, precio_unitario
-                    FROM detalle_presupuesto WHERE presupuesto_id = ?
-                """, (id_presupuesto,))
-                detalles_presupuesto = cursor.fetchall()
-
-                if not detalles_presupuesto:
-                    print("No hay productos en este presupuesto para crear una Nota de Pedido.")
-                    conn.close()
-                    return
-
-                fecha_creacion_np = datetime.date.today().isoformat()
-                cursor.execute("""
-                    INSERT INTO notas_pedido (cliente_id, fecha_creacion, tipo_entrega, estado)
-                    VALUES (?, ?, ?, ?)
-                """, (cliente_id, fecha_creacion_np, 'Retiro por mostrador', 'pendiente'))
-                id_nueva_nota_pedido = cursor.lastrowid
-                
-                for prod_id, cantidad, precio_unitario in detalles_presupuesto:
-                    cursor.execute("""
-                        INSERT INTO detalle_pedido (nota_pedido_id, producto_id, cantidad, precio_unitario)
-                        VALUES (?, ?, ?, ?)
-                    """, (id_nueva_nota_pedido, prod_id, cantidad, precio_unitario))
-                
-                print(f"✅ Se ha creado la Nota de Pedido #{id_nueva_nota_pedido} a partir de este presupuesto.")
-                print("Recuerde ir al módulo de Notas de Pedido para gestionar su estado y el stock.")
-                
-                sincronizar_a_google_sheets(modulo='pedidos')
+        with conn:
+            if nuevo_estado == 'facturado' and crear_nota_pedido:
+                convertidos, omitidos = _convertir_presupuestos(conn, [id_presupuesto], datetime.date.today().isoformat())
+                if omitidos:
+                    motivo = f"No se creó la Nota de Pedido: el presupuesto #{id_presupuesto} {omitidos[id_presupuesto]}."
+                    log.warning(motivo)
+                    return False, motivo
             else:
-                print("No se creó Nota de Pedido. El presupuesto solo cambiará a 'Facturado'.")
-
-        cursor.execute("UPDATE presupuestos SET estado = ? WHERE id = ?", (nuevo_estado, id_presupuesto))
-        conn.commit()
-        print(f"✅ Estado de Presupuesto #{id_presupuesto} actualizado a '{nuevo_estado}'.")
-
+                convertidos = {}
+                consultas.ejecutar(conn, "actualizar_estado_presupuesto", (nuevo_estado, id_presupuesto))
     except Exception as e:
-        print(f"❌ Error al actualizar estado del presupuesto: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
+        log.error("Error al actualizar estado del presupuesto: %s", e)
+        return False, f"Error al actualizar estado del presupuesto: {e}"
+
+    mensaje = f"Estado de Presupuesto #{id_presupuesto} actualizado a '{nuevo_estado}'."
+    log.info(mensaje)
+    if convertidos:
+        mensaje += f" Se creó la Nota de Pedido #{convertidos[id_presupuesto]}."
+        log.info("Se ha creado la Nota de Pedido #%s a partir del presupuesto #%s.", convertidos[id_presupuesto], id_presupuesto)
+        if interactivo:
+            print("Recuerde ir al módulo de Notas de Pedido para gestionar su estado y el stock.")
+            # Recién después del commit: la sincronización lee (y anota en la cola) con sus propias transacciones
+            sincronizar_a_google_sheets(modulo='pedidos')
+    elif nuevo_estado == 'facturado':
+        log.info("No se creó Nota de Pedido. El presupuesto #%s solo cambió a 'Facturado'.", id_presupuesto)
+    return True, mensaje
+
+
+def _convertir_presupuestos(conn, ids_presupuestos, fecha, estados=None):
+    """
+    Dentro de la transacción en curso de conn, genera una nota de pedido 'pendiente' por presupuesto
+    (mismo cliente y mismas líneas) y los marca como facturados. Las líneas se copian con un único
+    INSERT ... SELECT para todos los presupuestos, sin pasar por Python.
+    Se omiten los que no existen, no tienen líneas, ya generaron su nota de pedido o (si se pasa 'estados')
+    no están en uno de esos estados.
+    Devuelve ({presupuesto_id: nota_pedido_id}, {presupuesto_id: motivo de los omitidos}).
+    """
+    ids_presupuestos = list(dict.fromkeys(int(presupuesto_id) for presupuesto_id in ids_presupuestos))
+    encontrados = {fila[0]: fila[1:] for fila in
+                   consultas.todos(conn, "presupuestos_a_convertir", (json.dumps(ids_presupuestos),))}
+
+    omitidos = {}
+    for presupuesto_id in ids_presupuestos:
+        if presupuesto_id not in encontrados:
+            omitidos[presupuesto_id] = "no existe"
+            continue
+        estado, cantidad_lineas, nota_pedido_id = encontrados[presupuesto_id]
+        if nota_pedido_id is not None:
+            omitidos[presupuesto_id] = f"ya generó la Nota de Pedido #{nota_pedido_id}"
+        elif estados and estado not in estados:
+            omitidos[presupuesto_id] = f"está '{estado}'"
+        elif not cantidad_lineas:
+            omitidos[presupuesto_id] = "no tiene productos"
+
+    a_convertir = json.dumps([presupuesto_id for presupuesto_id in ids_presupuestos if presupuesto_id not in omitidos])
+    if a_convertir == "[]":
+        return {}, omitidos
+    consultas.ejecutar(conn, "insertar_notas_pedido_de_presupuestos", (a_convertir, fecha))
+    consultas.ejecutar(conn, "copiar_detalle_presupuestos_a_pedidos", (a_convertir,))
+    consultas.ejecutar(conn, "facturar_presupuestos", (a_convertir,))
+    return dict(consultas.todos(conn, "notas_pedido_de_presupuestos", (a_convertir,))), omitidos
+
+
+@instrumentacion.medir()
+def convertir_presupuestos_en_pedidos(ids_presupuestos=None):
+    """
+    Convierte varios presupuestos aprobados en notas de pedido en una sola transacción (por defecto,
+    todos los que están 'aprobado') y los marca como facturados. Si algo falla no se convierte ninguno.
+    Devuelve (éxito, mensaje, {'convertidos': {presupuesto_id: nota_pedido_id}, 'omitidos': {presupuesto_id: motivo}}).
+    """
+    conn = conexion()
+    try:
+        with conn:
+            conn.execute("BEGIN IMMEDIATE") # Los estados que se validan no pueden cambiar hasta el commit
+            if ids_presupuestos is None:
+                ids_presupuestos = [fila[0] for fila in consultas.todos(conn, "presupuestos_aprobados")]
+            convertidos, omitidos = _convertir_presupuestos(conn, ids_presupuestos, datetime.date.today().isoformat(),
+                                                            estados=('aprobado',))
+    except Exception as e:
+        log.error("Error al convertir presupuestos en notas de pedido: %s", e)
+        return False, f"Error al convertir presupuestos en notas de pedido: {e}", {'convertidos': {}, 'omitidos': {}}
+
+    mensaje = f"{len(convertidos)} presupuestos convertidos en notas de pedido."
+    if omitidos:
+        mensaje += f" {len(omitidos)} omitidos."
+        for presupuesto_id, motivo in list(omitidos.items())[:20]:
+            log.warning("Presupuesto #%s omitido: %s.", presupuesto_id, motivo)
+    log.info(mensaje)
+    return True, mensaje, {'convertidos': convertidos, 'omitidos': omitidos}
 
 
 # --- 3. Funciones de Sincronización con Google Sheets ---
+# El cliente autenticado y las planillas abiertas se reutilizan durante toda la vida del proceso,
+# y un hilo en segundo plano refresca el token antes de que venza.
+# Cada sincronización se anota primero en la tabla sheets_cola (write-ahead) y recién después se envía;
+# si no hay conexión queda en la cola y se reenvía cuando vuelve la conexión.
+# Todo lo pendiente para una hoja de cálculo se sube junto, con values_batch_update (un request para
+# todos los módulos en lugar de un clear() y un update() por módulo).
+# Los precios y el stock de los productos también se pueden editar en la planilla: antes de subir
+# 'productos' se traen esos cambios (ver traer_productos_de_google_sheets).
 
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
+NOMBRE_HOJA_CALCULO = "Comprobantes App Data"
+MARGEN_REFRESCO_TOKEN = 300 # Segundos antes del vencimiento en que se refresca el token
+INTERVALO_REINTENTO_SHEETS = 60 # Segundos entre reintentos de la cola cuando no hay conexión
+LIMITE_CELDAS_POR_ENVIO = 40_000 # Celdas por values_batch_update, para quedar lejos del límite de ~2 MB por request de la API
+MARGEN_FILAS_PESTANA = 0.1 # Al crear o agrandar una pestaña se deja un 10% de filas libres, así no se redimensiona en cada sincronización
+
+# Módulo -> (pestaña, consulta con los datos que se suben; ver las sentencias 'sheets_*' de consultas.py)
+MODULOS_SHEETS = {
+    'comprobantes': ("Comprobantes", consultas.SENTENCIAS['sheets_comprobantes']),
+    'productos': ("Productos", consultas.SENTENCIAS['sheets_productos']),
+    'pedidos': ("Notas_Pedido", consultas.SENTENCIAS['sheets_pedidos']),
+    'presupuestos': ("Presupuestos", consultas.SENTENCIAS['sheets_presupuestos']),
+}
+
+# Columnas de la pestaña de productos que se pueden editar en la planilla -> columna de la tabla productos
+COLUMNAS_EDITABLES_PRODUCTOS = {
+    'Stock_Disponible': 'stock_disponible',
+    'Costo_Base': 'costo_base',
+    'Precio_0_1': 'precio_0_1',
+    'Precio_1': 'precio_1',
+    'Precio_5': 'precio_5',
+    'Precio_10': 'precio_10',
+    'Precio_25': 'precio_25',
+    'Precio_Tambor_Rollo': 'precio_tambor_rollo',
+}
+CLAVE_PRODUCTOS_SHEETS = 'Codigo_Producto'
+
+_sheets_lock = threading.RLock()
+_cliente_sheets = None
+_planillas = {} # nombre -> (cliente, planilla, {pestaña: worksheet})
+_reintento_sheets = None
+
+# Último estado conocido de la conexión (lo consulta la GUI para no mostrar un error por módulo sin conexión)
+estado_sheets = {'conectado': None, 'ultimo_error': None}
+
+
+def _es_error_de_conexion(e):
+    """True si el error es de red o un fallo temporal del servicio (vale la pena reintentar más tarde)."""
+    if isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                      google.auth.exceptions.TransportError, ConnectionError, TimeoutError)):
+        return True
+    if isinstance(e, gspread.exceptions.APIError):
+        codigo = getattr(getattr(e, 'response', None), 'status_code', 0)
+        return codigo == 429 or codigo >= 500
+    return False
+
+
+def _credenciales(gc):
+    """Credenciales OAuth de un cliente gspread (o None si el cliente no las expone)."""
+    return getattr(getattr(gc, 'http_client', None), 'auth', None) or getattr(gc, 'auth', None)
+
+
+def _iniciar_refresco_token(gc, archivo_token='token.json'):
+    """Hilo en segundo plano que refresca el token OAuth antes de que venza y lo guarda en archivo_token."""
+    credenciales = _credenciales(gc)
+    if credenciales is None or not hasattr(credenciales, 'refresh'):
+        return
+
+    def refrescar():
+        while True:
+            vencimiento = getattr(credenciales, 'expiry', None) # En UTC y sin zona horaria
+            ahora = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+            espera = 60 if vencimiento is None else (vencimiento - ahora).total_seconds() - MARGEN_REFRESCO_TOKEN
+            time.sleep(max(30, espera))
+            try:
+                credenciales.refresh(google.auth.transport.requests.Request())
+                with open(archivo_token, 'w') as archivo:
+                    archivo.write(credenciales.to_json())
+                log.debug("Token de Google Sheets refrescado (vence %s).", credenciales.expiry)
+            except Exception as e:
+                log.warning("No se pudo refrescar el token de Google Sheets (se reintenta): %s", e)
+
+    threading.Thread(target=refrescar, name="refresco-token-sheets", daemon=True).start()
+
 
 def get_google_sheet_client():
-    """Obtiene un cliente de gspread autenticado."""
+    """
+    Obtiene el cliente de gspread autenticado. Se crea una sola vez por proceso (no vuelve a leer
+    credentials.json/token.json en cada sincronización); si falla, se reintenta en la próxima llamada.
+    """
+    global _cliente_sheets
+    with _sheets_lock:
+        if _cliente_sheets is None:
+            try:
+                _cliente_sheets = gspread.oauth(credentials_filename='credentials.json', authorized_user_filename='token.json', scopes=SCOPES)
+            except Exception as e:
+                log.error("Error al autenticar con Google Sheets: %s. Asegúrate de que 'credentials.json' esté en la misma carpeta "
+                          "que el script; la primera vez se abrirá una ventana del navegador para que inicies sesión y autorices.", e)
+                return None
+            _iniciar_refresco_token(_cliente_sheets)
+        return _cliente_sheets
+
+
+def olvidar_cliente_sheets():
+    """Descarta el cliente y las planillas cacheadas (por ejemplo, después de cambiar de cuenta)."""
+    global _cliente_sheets
+    with _sheets_lock:
+        _cliente_sheets = None
+        _planillas.clear()
+
+
+def _planilla(gc, nombre_hoja_calculo):
+    """
+    Planilla cacheada por proceso junto con sus pestañas y el tamaño de cada una ({título: [worksheet, filas, columnas]}).
+    Se abre y se listan sus pestañas una sola vez (dos requests), no en cada sincronización.
+    """
+    with _sheets_lock:
+        cliente, planilla, pestanas = _planillas.get(nombre_hoja_calculo, (None, None, None))
+        if cliente is not gc:
+            planilla = gc.open(nombre_hoja_calculo)
+            pestanas = {ws.title: [ws, ws.row_count, ws.col_count] for ws in planilla.worksheets()}
+            _planillas[nombre_hoja_calculo] = (gc, planilla, pestanas)
+            log.debug("Hoja de cálculo '%s' abierta (%d pestañas).", nombre_hoja_calculo, len(pestanas))
+        return planilla, pestanas
+
+
+def _valores_modulo(modulo):
+    """Filas (encabezado incluido) que se suben a la pestaña de un módulo; los nulos van como celdas vacías."""
+    df = pd.read_sql_query(MODULOS_SHEETS[modulo][1], conexion())
+    if df.empty:
+        return []
+    df = df.astype(object).where(df.notna(), "")
+    return [df.columns.tolist()] + df.values.tolist()
+
+
+def _dimensionar_pestanas(planilla, pestanas, tamanos):
+    """
+    Deja cada pestaña con lugar para sus datos ({título: (filas, columnas)}): crea las que faltan ya con el
+    tamaño necesario y agranda las chicas en un único batch_update. Las pestañas nunca se achican.
+    """
+    pedidos, nuevos_tamanos = [], {}
+    for titulo, (filas, columnas) in tamanos.items():
+        filas_con_margen = max(1, filas + int(filas * MARGEN_FILAS_PESTANA))
+        columnas = max(1, columnas)
+        if titulo not in pestanas:
+            log.info("Pestaña '%s' no encontrada. Creando nueva pestaña de %d x %d...", titulo, filas_con_margen, columnas)
+            pestanas[titulo] = [planilla.add_worksheet(title=titulo, rows=filas_con_margen, cols=columnas), filas_con_margen, columnas]
+            continue
+        worksheet, filas_actuales, columnas_actuales = pestanas[titulo]
+        if filas > filas_actuales or columnas > columnas_actuales:
+            nuevos_tamanos[titulo] = (max(filas_actuales, filas_con_margen), max(columnas_actuales, columnas))
+            pedidos.append({'updateSheetProperties': {
+                'properties': {'sheetId': worksheet.id,
+                               'gridProperties': {'rowCount': nuevos_tamanos[titulo][0], 'columnCount': nuevos_tamanos[titulo][1]}},
+                'fields': 'gridProperties(rowCount,columnCount)',
+            }})
+    if pedidos:
+        planilla.batch_update({'requests': pedidos})
+        for titulo, (filas, columnas) in nuevos_tamanos.items():
+            pestanas[titulo][1:] = [filas, columnas]
+
+
+def _partir_en_envios(valores_por_pestana, limite_celdas=LIMITE_CELDAS_POR_ENVIO):
+    """
+    Reparte los rangos a escribir ({título: filas}) en grupos de hasta 'limite_celdas' celdas, cada uno para
+    un values_batch_update. Las pestañas grandes se cortan en bloques de filas consecutivas.
+    """
+    envio, celdas = [], 0
+    for titulo, filas in valores_por_pestana.items():
+        ancho = max(1, len(filas[0])) if filas else 1
+        inicio = 0
+        while inicio < len(filas):
+            if envio and celdas + ancho > limite_celdas:
+                yield envio
+                envio, celdas = [], 0
+            bloque = filas[inicio:inicio + max(1, (limite_celdas - celdas) // ancho)]
+            envio.append({'range': f"'{titulo}'!A{inicio + 1}", 'values': bloque})
+            celdas += len(bloque) * ancho
+            inicio += len(bloque)
+    if envio:
+        yield envio
+
+
+def _enviar_modulos(gc, modulos, nombre_hoja_calculo):
+    """
+    Sube a sus pestañas el estado actual de varios módulos (reemplaza todo el contenido de cada pestaña).
+    En régimen son dos requests en total, sin importar la cantidad de módulos: un values_batch_clear de
+    todas las pestañas y un values_batch_update con todos los rangos (más de uno si los datos superan
+    LIMITE_CELDAS_POR_ENVIO, y un batch_update si alguna pestaña quedó chica).
+    """
+    planilla, pestanas = _planilla(gc, nombre_hoja_calculo)
+    if 'productos' in modulos:
+        # Primero se traen las ediciones hechas en la planilla, para que el envío no las pise
+        resumen = _traer_productos(planilla, pestanas)
+        if resumen['conflictos']:
+            log.warning("%d productos modificados en la base y en Google Sheets desde la última sincronización (%s...). "
+                        "Se conservan los valores de la base.", len(resumen['conflictos']),
+                        ", ".join(c['codigo'] for c in resumen['conflictos'][:10]))
+    valores = {MODULOS_SHEETS[modulo][0]: _valores_modulo(modulo) for modulo in modulos}
+    _dimensionar_pestanas(planilla, pestanas, {titulo: (len(filas), max(map(len, filas), default=0))
+                                               for titulo, filas in valores.items()})
+    planilla.values_batch_clear(body={'ranges': [f"'{titulo}'" for titulo in valores]})
+    envios = 0
+    for data in _partir_en_envios(valores):
+        planilla.values_batch_update(body={'valueInputOption': 'RAW', 'data': data})
+        envios += 1
+    if 'productos' in modulos:
+        _guardar_base_productos(valores[MODULOS_SHEETS['productos'][0]])
+    log.info("Módulos %s sincronizados con éxito en Google Sheets '%s' (%d filas en %d envíos).",
+             ", ".join(modulos), nombre_hoja_calculo, sum(map(len, valores.values())), envios)
+
+
+def _normalizar_editables(valores):
+    """Valores editables de una fila como texto comparable ('' si la celda está vacía). ValueError si no son números."""
+    return tuple("" if valor in (None, "") else f"{float(valor):.4f}" for valor in valores)
+
+
+def _hash_fila(valores_normalizados):
+    return hashlib.blake2b("\x1f".join(valores_normalizados).encode(), digest_size=8).hexdigest()
+
+
+def _columna_a1(indice):
+    """0 -> 'A', 25 -> 'Z', 26 -> 'AA'."""
+    letras = ""
+    indice += 1
+    while indice:
+        indice, resto = divmod(indice - 1, 26)
+        letras = chr(ord('A') + resto) + letras
+    return letras
+
+
+def _guardar_base_productos(filas):
+    """Guarda el hash de las columnas editables de cada producto tal como se subieron (filas con encabezado)."""
+    conn = conexion()
+    with conn:
+        consultas.ejecutar(conn, "borrar_base_productos")
+        if filas:
+            encabezado = filas[0]
+            clave = encabezado.index(CLAVE_PRODUCTOS_SHEETS)
+            indices = [encabezado.index(columna) for columna in COLUMNAS_EDITABLES_PRODUCTOS]
+            consultas.muchos(conn, "insertar_base_productos",
+                             ((str(fila[clave]), _hash_fila(_normalizar_editables([fila[i] for i in indices]))) for fila in filas[1:]))
+
+
+def _leer_columnas_productos(planilla, titulo):
+    """
+    Lee de la pestaña de productos solo la columna del código y las editables (no descripción, reservas ni estado),
+    en un único values_batch_get. Devuelve las filas como diccionarios {encabezado: valor}, sin el encabezado.
+    """
+    encabezado = [d[0] for d in conexion().execute(f"SELECT * FROM ({MODULOS_SHEETS['productos'][1]}) LIMIT 0").description]
+    indices = sorted(encabezado.index(columna) for columna in [CLAVE_PRODUCTOS_SHEETS, *COLUMNAS_EDITABLES_PRODUCTOS])
+
+    grupos = [] # Columnas contiguas se piden en un solo rango
+    for indice in indices:
+        if grupos and grupos[-1][-1] == indice - 1:
+            grupos[-1].append(indice)
+        else:
+            grupos.append([indice])
+    rangos = [f"'{titulo}'!{_columna_a1(g[0])}:{_columna_a1(g[-1])}" for g in grupos]
+    respuesta = planilla.values_batch_get(rangos, params={'valueRenderOption': 'UNFORMATTED_VALUE'})
+
+    # La API omite las filas y celdas vacías del final: se completan para unir los rangos fila por fila
+    bloques = [rango.get('values', []) for rango in respuesta.get('valueRanges', [])]
+    cantidad_filas = max(map(len, bloques), default=0)
+    filas = []
+    for i in range(cantidad_filas):
+        fila = []
+        for grupo, bloque in zip(grupos, bloques):
+            celdas = bloque[i] if i < len(bloque) else []
+            fila.extend(list(celdas) + [""] * (len(grupo) - len(celdas)))
+        filas.append(fila)
+
+    nombres = [encabezado[i] for i in indices]
+    if not filas or [str(celda) for celda in filas[0]] != nombres:
+        raise ValueError(f"Las columnas de la pestaña '{titulo}' no coinciden con las esperadas ({', '.join(nombres)}).")
+    return [dict(zip(nombres, fila)) for fila in filas[1:]]
+
+
+def _traer_productos(planilla, pestanas):
+    """
+    Aplica a la tabla productos, en una sola transacción, los precios y el stock editados en la planilla.
+    Cada fila se compara contra su hash en sheets_base (la versión de la última sincronización):
+    - cambió solo la planilla: se aplica a la base;
+    - cambiaron la planilla y la base (con valores distintos): conflicto, no se aplica;
+    - códigos que no existen en la base o valores que no son números válidos: se ignoran.
+    Si los encabezados de la pestaña no son los esperados (una columna renombrada o movida a mano) no se trae
+    nada: el motivo queda en 'omitido' y la subida siguiente restablece la pestaña sin frenar a los demás módulos.
+    Devuelve {'aplicadas', 'sin_cambios', 'conflictos', 'ignoradas', 'omitido'}.
+    """
+    resumen = {'aplicadas': 0, 'sin_cambios': 0, 'conflictos': [], 'ignoradas': [], 'omitido': None}
+    titulo = MODULOS_SHEETS['productos'][0]
+    if titulo not in pestanas:
+        return resumen # Nunca se subió: no hay nada para traer
     try:
-        gc = gspread.oauth(credentials_filename='credentials.json', authorized_user_filename='token.json', scopes=SCOPES)
-        return gc
-    except Exception as e:
-        print(f"❌ Error al autenticar con Google Sheets: {e}")
-        print("Asegúrate de que 'credentials.json' esté en la misma carpeta que el script.")
-        print("La primera vez, se abrirá una ventana del navegador para que inicies sesión y autorices.")
-        return None
+        filas_hoja = _leer_columnas_productos(planilla, titulo)
+    except ValueError as e:
+        resumen['omitido'] = str(e)
+        log.warning("No se traen los cambios de productos de Google Sheets: %s Se sube la pestaña con los encabezados de la base.", e)
+        return resumen
+
+    columnas = list(COLUMNAS_EDITABLES_PRODUCTOS.values())
+    conn = conexion()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE") # La base no puede cambiar entre la comparación y la escritura
+        locales = {codigo: _normalizar_editables(valores) for codigo, *valores in consultas.todos(conn, "editables_productos")}
+        base = dict(consultas.todos(conn, "base_productos"))
+
+        cambios, nueva_base = [], []
+        for fila in filas_hoja:
+            codigo = str(fila[CLAVE_PRODUCTOS_SHEETS]).strip()
+            if not codigo:
+                continue
+            if codigo not in locales:
+                resumen['ignoradas'].append({'codigo': codigo, 'motivo': "no existe en la base"})
+                continue
+            try:
+                remotos = _normalizar_editables([fila[columna] for columna in COLUMNAS_EDITABLES_PRODUCTOS])
+            except ValueError:
+                resumen['ignoradas'].append({'codigo': codigo, 'motivo': "valores no numéricos"})
+                continue
+            hash_remoto, hash_local = _hash_fila(remotos), _hash_fila(locales[codigo])
+            if hash_remoto == base.get(codigo) or hash_remoto == hash_local:
+                resumen['sin_cambios'] += 1
+                if hash_remoto != base.get(codigo):
+                    nueva_base.append((codigo, hash_remoto))
+            elif hash_local != base.get(codigo):
+                resumen['conflictos'].append({'codigo': codigo, 'base': dict(zip(columnas, locales[codigo])),
+                                              'hoja': dict(zip(columnas, remotos))})
+            elif "" in remotos or float(remotos[0]) < 0 or not float(remotos[0]).is_integer():
+                resumen['ignoradas'].append({'codigo': codigo, 'motivo': "celdas vacías o stock inválido"})
+            else:
+                cambios.append([int(float(remotos[0]))] + [float(v) for v in remotos[1:]] + [codigo])
+                nueva_base.append((codigo, hash_remoto))
+
+        if cambios:
+            # El stock cambia con un movimiento de ajuste (que ya deja la proyección en el valor de la hoja)
+            ultimo_movimiento = consultas.uno(conn, "ultimo_movimiento_stock")[0]
+            consultas.muchos(conn, "ajustar_stock_desde_sheets", [(cambio[0], cambio[-1]) for cambio in cambios])
+            consultas.muchos(conn, "actualizar_editables_producto", cambios)
+            consultas.ejecutar(conn, "actualizar_estado_productos_movidos", (ultimo_movimiento,))
+        consultas.muchos(conn, "guardar_base_producto", nueva_base)
+
+    resumen['aplicadas'] = len(cambios)
+    log.info("Productos traídos de Google Sheets: %d aplicados, %d sin cambios, %d conflictos, %d ignorados.",
+             resumen['aplicadas'], resumen['sin_cambios'], len(resumen['conflictos']), len(resumen['ignoradas']))
+    return resumen
 
-def sincronizar_a_google_sheets(modulo=None, nombre_hoja_calculo="Comprobantes App Data"):
+
+@instrumentacion.medir()
+def traer_productos_de_google_sheets(nombre_hoja_calculo=NOMBRE_HOJA_CALCULO):
+    """
+    Trae a la base los precios y el stock editados en la pestaña de productos de Google Sheets, sin subir nada.
+    Los conflictos (misma fila cambiada en la base y en la planilla) no se aplican; en la próxima
+    sincronización de 'productos' gana la base.
+    Devuelve (éxito, mensaje, resumen) con el resumen de _traer_productos (o None si falló); si los encabezados de
+    la pestaña no son los esperados, éxito es False y el motivo queda en resumen['omitido'].
+    """
+    with _sheets_lock:
+        gc = get_google_sheet_client()
+        if not gc:
+            return False, "No se pudo autenticar con Google Sheets.", None
+        try:
+            planilla, pestanas = _planilla(gc, nombre_hoja_calculo)
+            resumen = _traer_productos(planilla, pestanas)
+        except Exception as e:
+            if _es_error_de_conexion(e):
+                estado_sheets.update(conectado=False, ultimo_error=f"Sin conexión con Google Sheets: {e}")
+            log.error("Error al traer productos de Google Sheets: %s", e)
+            return False, f"Error al traer productos de Google Sheets: {e}", None
+    if resumen['omitido']:
+        return False, f"No se trajeron productos de Google Sheets: {resumen['omitido']}", resumen
+
+    mensaje = f"{resumen['aplicadas']} productos actualizados desde Google Sheets."
+    if resumen['conflictos']:
+        mensaje += (f" {len(resumen['conflictos'])} con conflicto (modificados también en la base): "
+                    f"{', '.join(c['codigo'] for c in resumen['conflictos'][:10])}.")
+    if resumen['ignoradas']:
+        mensaje += f" {len(resumen['ignoradas'])} filas ignoradas."
+    return True, mensaje, resumen
+
+
+def encolar_sincronizacion(modulo, nombre_hoja_calculo=NOMBRE_HOJA_CALCULO):
+    """Anota una sincronización pendiente en sheets_cola. Devuelve el ID de la entrada."""
+    conn = conexion()
+    with conn:
+        return consultas.ejecutar(conn, "encolar_sheets", (
+            modulo, nombre_hoja_calculo, datetime.datetime.now().isoformat(timespec='seconds'))).lastrowid
+
+
+def pendientes_sheets():
+    """Entradas pendientes de la cola, en orden: (id, modulo, hoja_calculo, creado, intentos, ultimo_error)."""
+    return consultas.todos(conexion(), "cola_sheets")
+
+
+def procesar_cola_sheets():
+    """
+    Envía las sincronizaciones pendientes. Como cada envío sube el estado actual completo del módulo,
+    todas las entradas de una misma hoja de cálculo se resuelven con un solo envío por lotes de sus
+    módulos (en el orden en que aparecieron), y las entradas repetidas se dan por cumplidas juntas.
+    Ante un error de conexión se detiene y deja el resto en la cola (el motivo queda en estado_sheets['ultimo_error']).
+    Devuelve (procesadas, pendientes, errores) donde errores es {id_entrada: mensaje} de las entradas
+    descartadas por un error permanente.
+    """
+    with _sheets_lock:
+        filas = pendientes_sheets()
+        if not filas:
+            return 0, 0, {}
+
+        gc = get_google_sheet_client()
+        if not gc:
+            estado_sheets.update(conectado=False, ultimo_error="No se pudo autenticar con Google Sheets.")
+            return 0, len(filas), {}
+
+        # Hoja de cálculo -> (módulos sin repetir y en orden de llegada, IDs de las entradas que cubre el envío)
+        lotes = {}
+        for entrada_id, modulo, nombre_hoja_calculo, _, _, _ in filas:
+            modulos, ids = lotes.setdefault(nombre_hoja_calculo, ({}, []))
+            modulos.setdefault(modulo)
+            ids.append(entrada_id)
+
+        conn = conexion()
+        errores = {}
+        procesadas = 0
+        for nombre_hoja_calculo, (modulos, ids) in lotes.items():
+            try:
+                _enviar_modulos(gc, list(modulos), nombre_hoja_calculo)
+            except Exception as e:
+                with conn:
+                    consultas.muchos(conn, "error_cola_sheets", [(str(e), entrada_id) for entrada_id in ids])
+                if _es_error_de_conexion(e):
+                    error = f"Sin conexión con Google Sheets: {e}"
+                    log.warning("%s Quedan %d sincronizaciones en cola.", error, len(filas) - procesadas)
+                    estado_sheets.update(conectado=False, ultimo_error=error)
+                    return procesadas, len(filas) - procesadas, errores
+                # Un error permanente (planilla inexistente, sin permisos...) no se arregla reintentando
+                mensaje = f"Error al sincronizar {', '.join(modulos)} con Google Sheets: {e}"
+                errores.update(dict.fromkeys(ids, mensaje))
+                log.error("%s. Se descarta de la cola.", mensaje)
+            with conn:
+                consultas.muchos(conn, "quitar_de_cola_sheets", [(entrada_id,) for entrada_id in ids])
+            procesadas += len(ids)
+
+        estado_sheets.update(conectado=True, ultimo_error=None)
+        return procesadas, 0, errores
+
+
+@instrumentacion.medir()
+def sincronizar_modulos_a_google_sheets(modulos=None, nombre_hoja_calculo=NOMBRE_HOJA_CALCULO):
+    """
+    Sincroniza varios módulos (por defecto todos los de MODULOS_SHEETS) en un solo envío por lotes.
+    Las sincronizaciones se anotan primero en la cola; si no hay conexión quedan pendientes para el reintento.
+    Devuelve (éxito, mensaje).
+    """
+    modulos = list(modulos or MODULOS_SHEETS)
+    invalidos = [modulo for modulo in modulos if modulo not in MODULOS_SHEETS]
+    if invalidos:
+        log.error("Módulo de sincronización no especificado o inválido: %r", invalidos)
+        return False, f"Módulo de sincronización inválido: '{invalidos[0]}'. Opciones: {', '.join(MODULOS_SHEETS)}."
+
+    ids = [encolar_sincronizacion(modulo, nombre_hoja_calculo) for modulo in modulos]
+    _, pendientes, errores = procesar_cola_sheets()
+    fallidas = [errores[entrada_id] for entrada_id in ids if entrada_id in errores]
+    if fallidas:
+        return False, fallidas[0]
+    if pendientes and any(fila[0] in ids for fila in pendientes_sheets()):
+        return False, (f"{estado_sheets['ultimo_error']}. La sincronización de {', '.join(modulos)} quedó en cola "
+                       f"({pendientes} pendientes) y se reenviará al recuperar la conexión.")
+    return True, f"{', '.join(modulos)} sincronizado en '{nombre_hoja_calculo}'."
+
+
+@instrumentacion.medir()
+def sincronizar_a_google_sheets(modulo=None, nombre_hoja_calculo=NOMBRE_HOJA_CALCULO):
     """
     Sincroniza datos específicos de la base de datos SQLite a una pestaña de Google Sheets.
     El parámetro 'modulo' indica qué datos sincronizar ('comprobantes', 'productos', 'pedidos', 'presupuestos').
+    Si había otras sincronizaciones en cola para la misma hoja de cálculo, se envían en el mismo lote.
+    Devuelve (éxito, mensaje).
     """
-    gc = get_google_sheet_client()
-    if not gc:
-        return
+    if modulo not in MODULOS_SHEETS:
+        log.error("Módulo de sincronización no especificado o inválido: %r", modulo)
+        return False, f"Módulo de sincronización inválido: '{modulo}'. Opciones: {', '.join(MODULOS_SHEETS)}."
+    exito, mensaje = sincronizar_modulos_a_google_sheets([modulo], nombre_hoja_calculo)
+    if exito:
+        mensaje = f"Módulo '{modulo}' sincronizado en '{nombre_hoja_calculo}' -> '{MODULOS_SHEETS[modulo][0]}'."
+    return exito, mensaje
+
+
+def iniciar_reintento_sheets(intervalo=INTERVALO_REINTENTO_SHEETS):
+    """Hilo en segundo plano que reintenta la cola de Google Sheets cada 'intervalo' segundos mientras haya pendientes."""
+    global _reintento_sheets
+    if _reintento_sheets is not None and _reintento_sheets.is_alive():
+        return _reintento_sheets
+
+    def reintentar():
+        while True:
+            time.sleep(intervalo)
+            try:
+                if pendientes_sheets():
+                    enviadas, pendientes, _ = procesar_cola_sheets()
+                    if enviadas:
+                        log.info("Cola de Google Sheets: %d sincronizaciones reenviadas, %d pendientes.", enviadas, pendientes)
+            except Exception:
+                log.exception("Error inesperado al reintentar la cola de Google Sheets.")
 
-    try:
-        spreadsheet = gc.open(nombre_hoja_calculo)
-        print(f"✅ Hoja de cálculo '{nombre_hoja_calculo}' abierta.")
-
-        conn = sqlite3.connect('presupuestos.db') # Conexión a la DB unificada
-        df = pd.DataFrame()
-        nombre_pestana = ""
-
-        if modulo == 'comprobantes':
-            nombre_pestana = "Comprobantes"
-            query = """
-            SELECT
-                c.nombre AS Nombre_Cliente,
-                c.cuit AS CUIT_Cliente,
-                c.razon_social AS Razon_Social_Cliente,
-                comp.nro_operacion AS Numero_Operacion,
-                comp.fecha AS Fecha_Comprobante,
-                comp.importe AS Importe_Comprobante,
-                comp.cuenta AS Cuenta_Destino
-            FROM
-                comprobantes comp
-            JOIN
-                clientes c ON comp.cliente_id = c.id
-            ORDER BY comp.id ASC
-            """
-            df = pd.read_sql_query(query, conn)
-        
-        elif modulo == 'productos':
-            nombre_pestana = "Productos"
-            query = """
-            SELECT
-                codigo AS Codigo_Producto,
-                descripcion AS Descripcion,
-                stock_disponible AS Stock_Disponible,
-                stock_reservado AS Stock_Reservado,
-                estado_producto AS Estado,
-                costo_base AS Costo_Base,
-                precio_0_1 AS Precio_0_1,
-                precio_1 AS Precio_1,
-                precio_5 AS Precio_5,
-                precio_10 AS Precio_10,
-                precio_25 AS Precio_25,
-                precio_tambor_rollo AS Precio_Tambor_Rollo
-            FROM
-                productos
-            ORDER BY codigo ASC
-            """
-            df = pd.read_sql_query(query, conn)
-
-        elif modulo == 'pedidos':
-            nombre_pestana = "Notas_Pedido"
-            query = """
-            SELECT
-                np.id AS ID_Pedido,
-                c.nombre AS Cliente,
-                np.fecha_creacion AS Fecha_Creacion,
-                np.tipo_entrega AS Tipo_Entrega,
-                np.direccion_envio AS Direccion_Envio,
-                np.telefono_contacto AS Telefono_Contacto,
-                np.estado AS Estado_Pedido,
-                SUM(dp.cantidad * dp.precio_unitario) AS Total_Pedido
-            FROM
-                notas_pedido np
-            JOIN
-                clientes c ON np.cliente_id = c.id
-            JOIN
-                detalle_pedido dp ON np.id = dp.nota_pedido_id
-            GROUP BY np.id
-            ORDER BY np.fecha_creacion DESC, np.id DESC
-            """
-            df = pd.read_sql_query(query, conn)
-        
-        elif modulo == 'presupuestos':
-            nombre_pestana = "Presupuestos"
-            query = """
-            SELECT
-                p.id AS ID_Presupuesto,
-                c.nombre AS Cliente,
-                p.fecha_creacion AS Fecha_Creacion,
-                p.estado AS Estado_Presupuesto,
-                SUM(dp.cantidad * dp.precio_unitario) AS Total_Presupuesto
-            FROM
-                presupuestos p
-            JOIN
-                clientes c ON p.cliente_id = c.id
-            JOIN
-                detalle_presupuesto dp ON p.id = dp.presupuesto_id
-            GROUP BY p.id
-            ORDER BY p.fecha_creacion DESC, p.id DESC
-            """
-            df = pd.read_sql_query(query, conn)
+    _reintento_sheets = threading.Thread(target=reintentar, name="reintento-sheets", daemon=True)
+    _reintento_sheets.start()
+    return _reintento_sheets
 
-        else:
-            print("❌ Módulo de sincronización no especificado o inválido.")
-            conn.close()
-            return
 
-        conn.close()
+# --- 4. Comandos de mantenimiento por línea de comandos ---
 
-        try:
-            worksheet = spreadsheet.worksheet(nombre_pestana)
-            print(f"✅ Pestaña '{nombre_pestana}' encontrada.")
-        except gspread.exceptions.WorksheetNotFound:
-            print(f"Pestaña '{nombre_pestana}' no encontrada. Creando nueva pestaña...")
-            worksheet = spreadsheet.add_worksheet(title=nombre_pestana, rows="100", cols="20")
-            print(f"✅ Pestaña '{nombre_pestana}' creada con éxito.")
-
-        if df.empty:
-            print(f"No hay datos en la base de datos para sincronizar en el módulo '{modulo}'.")
-            worksheet.clear()
-            return
-
-        datos_para_sheets = [df.columns.tolist()] + df.values.tolist()
-
-        worksheet.clear()
-        worksheet.update(datos_para_sheets)
-        print(f"✅ Datos del módulo '{modulo}' sincronizados con éxito en Google Sheets: '{nombre_hoja_calculo}' -> Pestaña '{nombre_pestana}'.")
-
-    except gspread.exceptions.SpreadsheetNotFound:
-        print(f"❌ Error: Hoja de cálculo '{nombre_hoja_calculo}' no encontrada en tu Google Drive.")
-        print("Asegúrate de que el nombre sea exacto y que tengas permisos.")
-    except Exception as e:
-        print(f"❌ Error al sincronizar con Google Sheets: {e}")
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Comandos de mantenimiento de presupuestos.db")
+    subcomandos = parser.add_subparsers(dest="comando", required=True)
+
+    cmd_totales = subcomandos.add_parser("verificar-totales", help="Compara los totales guardados en las cabeceras con el detalle.")
+    cmd_totales.add_argument("--reparar", action="store_true", help="Reconstruye los totales desde el detalle antes de verificar.")
+
+    args = parser.parse_args()
+    import registro
+    registro.configurar(consola=True)
+    inicializar_base_de_datos()
 
+    if args.comando == "verificar-totales":
+        diferencias = verificar_totales(reparar=args.reparar)
+        raise SystemExit(1 if diferencias else 0)
@@ -0,0 +1,115 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+
+# --- Registro (logging) de la aplicación ---
+# Los módulos solo piden su logger con logging.getLogger(__name__) y registran con formato diferido
+# (log.info("Pedido #%s creado", id)): si el nivel está desactivado el mensaje nunca se arma.
+# Los registros pasan por una cola (QueueHandler) y un hilo aparte (QueueListener) los escribe
+# en un archivo rotativo con una línea JSON por registro, así la escritura a disco no frena al llamador.
+#
+# Niveles por módulo con la variable de entorno PRESUPUESTOS_LOG, por ejemplo:
+#   PRESUPUESTOS_LOG="INFO,presupuesto_backend=DEBUG,gspread=WARNING"
+# (el primer valor sin '=' es el nivel general).
+
+LOG_PATH = os.path.join("logs", "presupuestos.log")
+TAMANO_MAXIMO_BYTES = 5 * 1024 * 1024
+ARCHIVOS_ROTADOS = 5
+NIVEL_POR_DEFECTO = "INFO"
+
+# Librerías que a nivel INFO/DEBUG escriben mucho y no aportan al diagnóstico de la app
+NIVELES_LIBRERIAS = {
+    "urllib3": "WARNING",
+    "google": "WARNING",
+    "gspread": "WARNING",
+    "PIL": "WARNING",
+}
+
+_listener = None
+
+
+class FormateadorJSON(logging.Formatter):
+    """Una línea JSON por registro: momento, nivel, módulo, función, línea, mensaje y excepción si la hay."""
+
+    def format(self, record):
+        datos = {
+            "momento": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "nivel": record.levelname,
+            "modulo": record.name,
+            "funcion": record.funcName,
+            "linea": record.lineno,
+            "hilo": record.threadName,
+            "mensaje": record.getMessage(),
+        }
+        if record.exc_info:
+            datos["excepcion"] = self.formatException(record.exc_info)
+        return json.dumps(datos, ensure_ascii=False)
+
+
+def _parsear_niveles(texto):
+    """'INFO,modulo=DEBUG' -> ('INFO', {'modulo': 'DEBUG'})."""
+    general, por_modulo = None, {}
+    for parte in filter(None, (p.strip() for p in (texto or "").split(","))):
+        if "=" in parte:
+            modulo, nivel = parte.split("=", 1)
+            por_modulo[modulo.strip()] = nivel.strip().upper()
+        else:
+            general = parte.upper()
+    return general, por_modulo
+
+
+def configurar(nivel=None, niveles_por_modulo=None, ruta=LOG_PATH, consola=False, nivel_consola="INFO"):
+    """
+    Configura el logging de todo el proceso (se llama una vez, desde el punto de entrada: GUI, CLI o script).
+    - nivel: nivel general (por defecto el de PRESUPUESTOS_LOG o INFO).
+    - niveles_por_modulo: {'presupuesto_backend': 'DEBUG', ...}; se suman a los de PRESUPUESTOS_LOG.
+    - consola: además mostrar los mensajes en la terminal (para los scripts de línea de comandos).
+    Llamarla de nuevo reemplaza la configuración anterior.
+    """
+    global _listener
+    nivel_entorno, niveles_entorno = _parsear_niveles(os.environ.get("PRESUPUESTOS_LOG"))
+    niveles = {**NIVELES_LIBRERIAS, **niveles_entorno, **(niveles_por_modulo or {})}
+
+    detener()
+    raiz = logging.getLogger()
+    for handler in list(raiz.handlers):
+        raiz.removeHandler(handler)
+    raiz.setLevel(nivel or nivel_entorno or NIVEL_POR_DEFECTO)
+    for modulo, nivel_modulo in niveles.items():
+        logging.getLogger(modulo).setLevel(nivel_modulo)
+
+    destinos = []
+    if ruta:
+        carpeta = os.path.dirname(ruta)
+        if carpeta:
+            os.makedirs(carpeta, exist_ok=True)
+        archivo = logging.handlers.RotatingFileHandler(ruta, maxBytes=TAMANO_MAXIMO_BYTES,
+                                                       backupCount=ARCHIVOS_ROTADOS, encoding="utf-8")
+        archivo.setFormatter(FormateadorJSON())
+        destinos.append(archivo)
+    if consola:
+        terminal = logging.StreamHandler()
+        terminal.setLevel(nivel_consola)
+        terminal.setFormatter(logging.Formatter("%(message)s"))
+        destinos.append(terminal)
+
+    cola = queue.SimpleQueue()
+    raiz.addHandler(logging.handlers.QueueHandler(cola))
+    _listener = logging.handlers.QueueListener(cola, *destinos, respect_handler_level=True)
+    _listener.start()
+
+
+def detener():
+    """Vacía la cola y detiene el hilo escritor (se llama sola al salir del proceso)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(detener)
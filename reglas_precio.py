@@ -0,0 +1,259 @@
+import argparse
+import logging
+
+import numpy as np
+import pandas as pd
+
+import consultas
+import presupuesto_backend
+
+log = logging.getLogger(__name__)
+
+# --- Reglas de precios ---
+# Los precios de lista por escala (precio_0_1 ... precio_tambor_rollo) se calculan desde costo_base con
+# reglas guardadas en reglas_precio, una por rubro y escala (el rubro es la primera palabra de la
+# descripción; CATEGORIA_GENERAL vale para los rubros sin regla propia en esa escala):
+#   precio = max(costo * (1 + recargo), costo / (1 - margen_minimo)), redondeado hacia arriba a un múltiplo
+#   de 'redondeo' (así el redondeo nunca come margen).
+#  - El cálculo es vectorial (NumPy) sobre todo el catálogo de una vez; no hay un bucle por producto.
+#  - vista_previa() muestra qué precios cambiarían sin escribir nada; aplicar() recalcula dentro de la
+#    transacción y escribe solo los productos con algún precio distinto.
+#  - Una escala en 0 es una escala en la que el producto no se vende y queda en 0, salvo en los productos
+#    sin ningún precio (recién cargados con su costo), que reciben todas las escalas con regla.
+#  - Los productos sin costo y las escalas sin regla quedan como están.
+#  - sugerir_reglas() propone recargos a partir de la lista actual (la mediana de precio / costo por rubro).
+# El costo y los precios van sin IVA, como los deja import_data_to_sql.py. Aplicar una lista nueva mueve
+# productos.precios_desde: la próxima revalidación marca los presupuestos abiertos afectados.
+
+CATEGORIA_GENERAL = '*'
+MARGEN_MINIMO = 0.10 # Por defecto al guardar una regla: el precio deja al menos un 10 % sobre el precio
+REDONDEO = 0.01
+TOLERANCIA = 0.00005 # Los precios se guardan con 4 decimales
+COLUMNAS_REGLA = ['categoria', 'escala', 'recargo', 'margen_minimo', 'redondeo']
+COLUMNAS_VISTA_PREVIA = ['codigo', 'descripcion', 'categoria', 'escala', 'costo_base', 'precio_actual', 'precio_nuevo',
+                         'variacion_pct', 'margen_pct']
+
+
+def categorias(descripciones):
+    """Rubro de cada descripción (Series): la primera palabra, en mayúsculas."""
+    return descripciones.str.extract(r'^\s*(\S*)', expand=False).fillna('').str.upper()
+
+
+def reglas(conn=None):
+    """Reglas guardadas: (categoria, escala, recargo, margen_minimo, redondeo), por rubro y escala."""
+    return consultas.todos(conn or presupuesto_backend.conexion(), "reglas_precio")
+
+
+def _validar_regla(escala, recargo, margen_minimo, redondeo):
+    """Mensaje de error si la regla no sirve, o None."""
+    if escala not in presupuesto_backend.COLUMNAS_PRECIO:
+        return f"Escala desconocida: '{escala}'. Opciones: {', '.join(presupuesto_backend.COLUMNAS_PRECIO)}."
+    if recargo <= -1:
+        return "El recargo debe ser mayor a -100 %."
+    if not 0 <= margen_minimo < 1:
+        return "El margen mínimo debe estar entre 0 y 100 % (sin incluir el 100 %)."
+    if redondeo <= 0:
+        return "El redondeo debe ser mayor a 0."
+    return None
+
+
+def guardar_regla(categoria, escala, recargo, margen_minimo=MARGEN_MINIMO, redondeo=REDONDEO):
+    """Crea o modifica la regla del rubro 'categoria' (o CATEGORIA_GENERAL) para 'escala'. Devuelve (éxito, mensaje)."""
+    categoria = categoria.strip().upper() or CATEGORIA_GENERAL
+    error = _validar_regla(escala, recargo, margen_minimo, redondeo)
+    if error:
+        return False, error
+    conn = presupuesto_backend.conexion()
+    with conn:
+        consultas.ejecutar(conn, "guardar_regla_precio", (categoria, escala, recargo, margen_minimo, redondeo))
+    mensaje = (f"Regla {categoria}/{escala}: recargo {recargo:.2%}, margen mínimo {margen_minimo:.2%}, "
+               f"redondeo {redondeo:g}.")
+    log.info(mensaje)
+    return True, mensaje
+
+
+def guardar_reglas(filas):
+    """Guarda varias reglas (filas con COLUMNAS_REGLA, por ejemplo las de sugerir_reglas()) en una transacción."""
+    for _, escala, recargo, margen_minimo, redondeo in filas:
+        error = _validar_regla(escala, recargo, margen_minimo, redondeo)
+        if error:
+            raise ValueError(error)
+    conn = presupuesto_backend.conexion()
+    with conn:
+        consultas.muchos(conn, "guardar_regla_precio", [(categoria.strip().upper() or CATEGORIA_GENERAL, escala, recargo, margen_minimo, redondeo)
+                                                        for categoria, escala, recargo, margen_minimo, redondeo in filas])
+    return len(filas)
+
+
+def quitar_regla(categoria, escala):
+    """Quita la regla; el rubro pasa a usar la de CATEGORIA_GENERAL para esa escala. Devuelve (éxito, mensaje)."""
+    categoria = categoria.strip().upper() or CATEGORIA_GENERAL
+    conn = presupuesto_backend.conexion()
+    with conn:
+        quitadas = consultas.ejecutar(conn, "quitar_regla_precio", (categoria, escala)).rowcount
+    if not quitadas:
+        return False, f"No hay una regla {categoria}/{escala}."
+    return True, f"Regla {categoria}/{escala} quitada."
+
+
+def _catalogo(conn):
+    """Catálogo como DataFrame: id, codigo, descripcion, costo_base, las columnas de precio y categoria."""
+    catalogo = pd.DataFrame(consultas.todos(conn, "catalogo_para_reglas"),
+                            columns=['id', 'codigo', 'descripcion', 'costo_base', *presupuesto_backend.COLUMNAS_PRECIO])
+    catalogo['categoria'] = categorias(catalogo['descripcion'])
+    return catalogo
+
+
+def _parametros(filas_reglas, rubros):
+    """
+    Arreglos (recargo, margen_minimo, redondeo) de forma (rubros, escalas) con la regla de cada rubro o la
+    general; NaN donde no hay ninguna.
+    """
+    por_clave = {(categoria, escala): (recargo, margen, redondeo) for categoria, escala, recargo, margen, redondeo in filas_reglas}
+    forma = (len(rubros), len(presupuesto_backend.COLUMNAS_PRECIO))
+    recargo, margen, redondeo = np.full(forma, np.nan), np.full(forma, np.nan), np.full(forma, np.nan)
+    for j, escala in enumerate(presupuesto_backend.COLUMNAS_PRECIO):
+        general = por_clave.get((CATEGORIA_GENERAL, escala))
+        for i, rubro in enumerate(rubros):
+            regla = por_clave.get((rubro, escala), general)
+            if regla is not None:
+                recargo[i, j], margen[i, j], redondeo[i, j] = regla
+    return recargo, margen, redondeo
+
+
+def calcular(catalogo, filas_reglas):
+    """
+    Precios nuevos del catálogo (DataFrame de _catalogo) con 'filas_reglas'. Devuelve (actuales, nuevos),
+    matrices de productos x escalas en el orden de presupuesto_backend.COLUMNAS_PRECIO.
+    """
+    codigos, rubros = pd.factorize(catalogo['categoria'])
+    recargo, margen, redondeo = (parametro[codigos] for parametro in _parametros(filas_reglas, list(rubros)))
+    costo = catalogo['costo_base'].to_numpy(dtype=float)[:, None]
+    actuales = catalogo[list(presupuesto_backend.COLUMNAS_PRECIO)].to_numpy(dtype=float)
+
+    with np.errstate(invalid='ignore'): # Las escalas sin regla dan NaN y quedan como están
+        precio = np.maximum(costo * (1 + recargo), costo / (1 - margen))
+        # El redondeo previo evita que un error de coma flotante (10.000000001) suba un escalón entero
+        precio = np.round(np.ceil(np.round(precio / redondeo, 6)) * redondeo, 4)
+    sin_precios = (actuales == 0).all(axis=1, keepdims=True)
+    aplica = ~np.isnan(recargo) & (costo > 0) & ((actuales > 0) | sin_precios)
+    return actuales, np.where(aplica, precio, actuales)
+
+
+def vista_previa(filas_reglas=None):
+    """
+    Precios que cambiarían con las reglas guardadas (o con 'filas_reglas'), sin escribir nada: DataFrame con
+    COLUMNAS_VISTA_PREVIA, una fila por producto y escala que cambia.
+    """
+    conn = presupuesto_backend.conexion()
+    catalogo = _catalogo(conn)
+    actuales, nuevos = calcular(catalogo, reglas(conn) if filas_reglas is None else filas_reglas)
+    productos, escalas = np.nonzero(np.abs(nuevos - actuales) >= TOLERANCIA)
+    vista = pd.DataFrame({
+        'codigo': catalogo['codigo'].to_numpy()[productos],
+        'descripcion': catalogo['descripcion'].to_numpy()[productos],
+        'categoria': catalogo['categoria'].to_numpy()[productos],
+        'escala': np.array(presupuesto_backend.COLUMNAS_PRECIO)[escalas],
+        'costo_base': catalogo['costo_base'].to_numpy(dtype=float)[productos],
+        'precio_actual': actuales[productos, escalas],
+        'precio_nuevo': nuevos[productos, escalas],
+    })
+    actual, nuevo = vista['precio_actual'], vista['precio_nuevo']
+    vista['variacion_pct'] = ((nuevo / actual.where(actual > 0) - 1) * 100).round(2)
+    vista['margen_pct'] = ((nuevo - vista['costo_base']) / nuevo * 100).round(2)
+    return vista[COLUMNAS_VISTA_PREVIA]
+
+
+def exportar_vista_previa(ruta, filas_reglas=None):
+    """Escribe la vista previa en un CSV (';' y coma decimal). Devuelve la cantidad de precios que cambiarían."""
+    vista = vista_previa(filas_reglas)
+    vista.to_csv(ruta, sep=';', decimal=',', index=False, encoding='utf-8-sig')
+    return len(vista)
+
+
+def aplicar():
+    """
+    Recalcula la lista con las reglas guardadas y escribe, en una transacción, solo los productos con algún
+    precio distinto. Devuelve (productos actualizados, precios cambiados).
+    """
+    conn = presupuesto_backend.conexion()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE") # Nadie cambia costos ni precios entre el cálculo y la escritura
+        catalogo = _catalogo(conn)
+        actuales, nuevos = calcular(catalogo, reglas(conn))
+        cambios = np.abs(nuevos - actuales) >= TOLERANCIA
+        cambiados = cambios.any(axis=1)
+        consultas.muchos(conn, "actualizar_precios_producto",
+                         [(producto_id, *precios) for producto_id, precios in
+                          zip(catalogo['id'].to_numpy()[cambiados].tolist(), nuevos[cambiados].tolist())])
+    productos, precios = int(cambiados.sum()), int(cambios.sum())
+    log.info("Lista de precios regenerada desde el costo: %d precios cambiados en %d productos.", precios, productos)
+    return productos, precios
+
+
+def sugerir_reglas(margen_minimo=MARGEN_MINIMO, redondeo=REDONDEO):
+    """
+    Reglas que más se acercan a la lista actual: el recargo de cada escala es la mediana de precio / costo - 1
+    de los productos con costo y precio, para todo el catálogo (CATEGORIA_GENERAL) y para cada rubro cuya
+    mediana se aparta más de un punto de la general. Devuelve filas con COLUMNAS_REGLA (no guarda nada).
+    """
+    catalogo = _catalogo(presupuesto_backend.conexion())
+    catalogo = catalogo[catalogo['costo_base'] > 0]
+    precios = catalogo[list(presupuesto_backend.COLUMNAS_PRECIO)]
+    recargos = (precios.where(precios > 0).div(catalogo['costo_base'], axis=0) - 1).round(4)
+    generales = recargos.median()
+    por_rubro = recargos.groupby(catalogo['categoria']).median()
+    filas = [(CATEGORIA_GENERAL, escala, round(float(recargo), 4), margen_minimo, redondeo)
+             for escala, recargo in generales.items() if pd.notna(recargo)]
+    for rubro, fila in por_rubro.iterrows():
+        filas += [(rubro, escala, round(float(recargo), 4), margen_minimo, redondeo) for escala, recargo in fila.items()
+                  if rubro and pd.notna(recargo) and abs(recargo - generales[escala]) > 0.01]
+    return filas
+
+
+def _imprimir_reglas(filas):
+    print(f"{'Rubro':<20} {'Escala':<20} {'Recargo':>9} {'Margen mín.':>12} {'Redondeo':>9}")
+    for categoria, escala, recargo, margen_minimo, redondeo in filas:
+        print(f"{categoria:<20} {escala:<20} {recargo:>9.2%} {margen_minimo:>12.2%} {redondeo:>9g}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reglas de precios: genera la lista de precios por escala desde el costo.")
+    parser.add_argument("operacion", choices=['reglas', 'regla', 'quitar', 'sugerir', 'vista', 'aplicar'])
+    parser.add_argument("--rubro", default=CATEGORIA_GENERAL, help="Para 'regla' y 'quitar': rubro (por defecto '*', todos).")
+    parser.add_argument("--escala", choices=presupuesto_backend.COLUMNAS_PRECIO, help="Para 'regla' y 'quitar': columna de precio.")
+    parser.add_argument("--recargo", type=float, help="Para 'regla': recargo sobre el costo en %% (60 = costo x 1,6).")
+    parser.add_argument("--margen", type=float, default=MARGEN_MINIMO * 100, help="Para 'regla' y 'sugerir': margen mínimo en %%.")
+    parser.add_argument("--redondeo", type=float, default=REDONDEO, help="Para 'regla' y 'sugerir': múltiplo al que se redondea hacia arriba.")
+    parser.add_argument("--guardar", action="store_true", help="Para 'sugerir': guardar las reglas sugeridas.")
+    parser.add_argument("--csv", help="Para 'vista': escribir la vista previa completa en este CSV.")
+    args = parser.parse_args()
+
+    presupuesto_backend.inicializar_base_de_datos()
+    if args.operacion == 'reglas':
+        _imprimir_reglas(reglas())
+    elif args.operacion in ('regla', 'quitar'):
+        if not args.escala or (args.operacion == 'regla' and args.recargo is None):
+            parser.error(f"'{args.operacion}' necesita --escala" + (" y --recargo." if args.operacion == 'regla' else "."))
+        if args.operacion == 'regla':
+            exito, mensaje = guardar_regla(args.rubro, args.escala, args.recargo / 100, args.margen / 100, args.redondeo)
+        else:
+            exito, mensaje = quitar_regla(args.rubro, args.escala)
+        print(("✅ " if exito else "❌ ") + mensaje)
+        raise SystemExit(0 if exito else 1)
+    elif args.operacion == 'sugerir':
+        sugeridas = sugerir_reglas(args.margen / 100, args.redondeo)
+        _imprimir_reglas(sugeridas)
+        if args.guardar:
+            print(f"✅ {guardar_reglas(sugeridas)} reglas guardadas.")
+    elif args.operacion == 'vista':
+        if args.csv:
+            print(f"✅ {exportar_vista_previa(args.csv)} precios cambiarían (detalle en '{args.csv}').")
+        else:
+            vista = vista_previa()
+            if len(vista):
+                print(vista.head(50).to_string(index=False))
+            print(f"{len(vista)} precios cambiarían en {vista['codigo'].nunique()} productos.")
+    else:
+        productos, precios = aplicar()
+        print(f"✅ {precios} precios actualizados en {productos} productos.")
@@ -0,0 +1,139 @@
+import argparse
+import csv
+import datetime
+import logging
+import os
+
+import consultas
+import presupuesto_backend
+
+log = logging.getLogger(__name__)
+
+# --- Puntos de reposición y alertas de stock bajo ---
+# El punto de reposición de cada producto es el consumo de su plazo de entrega más unos días de
+# seguridad: consumo_diario * (plazo_entrega_dias + DIAS_SEGURIDAD), redondeado hacia arriba.
+#  - recalcular_puntos(): consumo diario promedio de todos los productos en una sola pasada sobre las
+#    notas de pedido entregadas de los últimos VENTANA_CONSUMO_DIAS días, y los puntos que cambiaron.
+#    Los puntos fijados a mano (configurar(..., punto_reposicion=N)) no se tocan.
+#  - Las alertas (tabla alertas_stock) las mantienen los triggers de presupuesto_backend a medida que se
+#    mueve el stock; alertas() solo las lee.
+#  - informe_diario(): CSV con los productos en alerta y la cantidad sugerida a pedir; lo genera el
+#    mantenimiento programado junto con el recálculo.
+
+VENTANA_CONSUMO_DIAS = 90
+DIAS_SEGURIDAD = 3       # Stock de seguridad, en días de consumo
+DIAS_ENTRE_PEDIDOS = 30  # La cantidad sugerida cubre el punto de reposición más estos días de consumo
+CARPETA_INFORMES = "informes" # Relativa a la carpeta de la base
+COLUMNAS_ALERTAS = ['codigo', 'descripcion', 'disponible', 'reservado', 'punto_reposicion', 'consumo_diario',
+                    'dias_de_cobertura', 'cantidad_sugerida', 'plazo_entrega_dias', 'desde']
+
+
+def recalcular_puntos(hasta=None, ventana_dias=VENTANA_CONSUMO_DIAS):
+    """
+    Recalcula el consumo diario (notas entregadas en los 'ventana_dias' días hasta 'hasta', por defecto hoy)
+    y los puntos de reposición automáticos. Devuelve (consumos_cambiados, puntos_cambiados).
+    """
+    hasta = hasta or datetime.date.today()
+    if isinstance(hasta, str):
+        hasta = datetime.date.fromisoformat(hasta)
+    desde = hasta - datetime.timedelta(days=ventana_dias)
+    conn = presupuesto_backend.conexion()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        consumos = consultas.ejecutar(conn, "recalcular_consumo_reposicion", (desde.isoformat(), hasta.isoformat(), ventana_dias)).rowcount
+        puntos = consultas.ejecutar(conn, "recalcular_puntos_reposicion", (DIAS_SEGURIDAD,)).rowcount
+    log.info("Reposición recalculada hasta %s: %d consumos y %d puntos cambiados.", hasta, consumos, puntos)
+    return consumos, puntos
+
+
+def configurar(codigo, plazo_entrega_dias=None, punto_reposicion=None, punto_automatico=False):
+    """
+    Fija el plazo de entrega y/o el punto de reposición de un producto. Un punto fijado a mano queda así
+    hasta pedir punto_automatico=True, que lo vuelve a calcular desde el consumo. Devuelve (éxito, mensaje).
+    """
+    conn = presupuesto_backend.conexion()
+    codigo = codigo.strip().upper()
+    producto = consultas.uno(conn, "producto_stock", (codigo,))
+    if not producto:
+        return False, f"Producto con código '{codigo}' no encontrado."
+    if any(valor is not None and valor < 0 for valor in (plazo_entrega_dias, punto_reposicion)):
+        return False, "El plazo de entrega y el punto de reposición no pueden ser negativos."
+    producto_id = producto[0]
+    with conn:
+        consultas.ejecutar(conn, "configurar_reposicion", (producto_id, plazo_entrega_dias, punto_reposicion, punto_automatico))
+        consultas.ejecutar(conn, "punto_reposicion_automatico", (DIAS_SEGURIDAD, producto_id))
+    _, _, disponible, plazo, consumo, punto, manual, en_alerta = consultas.uno(conn, "reposicion_producto", (codigo,))
+    mensaje = (f"Reposición de {codigo}: plazo {plazo} días, punto {punto} ({'manual' if manual else 'automático'}, "
+               f"consumo {consumo:.2f}/día), disponible {disponible}.{' En alerta de stock bajo.' if en_alerta else ''}")
+    log.info(mensaje)
+    return True, mensaje
+
+
+def cantidad_alertas():
+    return consultas.uno(presupuesto_backend.conexion(), "cantidad_alertas_stock")[0]
+
+
+def alertas():
+    """Productos con el stock disponible en su punto de reposición o por debajo (filas con COLUMNAS_ALERTAS)."""
+    return consultas.todos(presupuesto_backend.conexion(), "alertas_stock", (DIAS_ENTRE_PEDIDOS,))
+
+
+def informe_diario(carpeta=None):
+    """Escribe el CSV de alertas del día (reposicion-AAAA-MM-DD.csv). Devuelve (ruta, cantidad de alertas)."""
+    carpeta = carpeta or os.path.join(os.path.dirname(os.path.abspath(presupuesto_backend.DB_PATH)), CARPETA_INFORMES)
+    os.makedirs(carpeta, exist_ok=True)
+    ruta = os.path.join(carpeta, f"reposicion-{datetime.date.today().isoformat()}.csv")
+    filas = alertas()
+    with open(ruta, "w", newline="", encoding="utf-8-sig") as archivo:
+        escritor = csv.writer(archivo, delimiter=';')
+        escritor.writerow(COLUMNAS_ALERTAS)
+        escritor.writerows(filas)
+    if filas:
+        log.warning("%d productos en su punto de reposición o por debajo (ver '%s').", len(filas), ruta)
+    return ruta, len(filas)
+
+
+def reconstruir_alertas():
+    """Vuelve a armar las alertas recorriendo todo el catálogo (las mantienen los triggers; esto es por si acaso)."""
+    conn = presupuesto_backend.conexion()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        presupuesto_backend._reconstruir_alertas_stock(conn.cursor())
+    return cantidad_alertas()
+
+
+def _imprimir_alertas():
+    filas = alertas()
+    print(f"{'Código':<20} {'Disp.':>7} {'Punto':>7} {'Consumo/día':>12} {'Días':>6} {'Pedir':>7}  Descripción")
+    for codigo, descripcion, disponible, _, punto, consumo, dias, sugerida, *_ in filas:
+        print(f"{codigo:<20} {disponible:>7} {punto:>7} {consumo:>12.2f} {'' if dias is None else dias:>6} {sugerida:>7}  {descripcion}")
+    print(f"{len(filas)} productos en alerta.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Puntos de reposición y alertas de stock bajo.")
+    parser.add_argument("operacion", choices=['alertas', 'recalcular', 'informe', 'configurar', 'reconstruir'])
+    parser.add_argument("--producto", help="Para 'configurar': código del producto.")
+    parser.add_argument("--plazo", type=int, help="Para 'configurar': plazo de entrega en días.")
+    parser.add_argument("--punto", type=int, help="Para 'configurar': punto de reposición fijo.")
+    parser.add_argument("--automatico", action="store_true", help="Para 'configurar': volver al punto calculado.")
+    parser.add_argument("--hasta", help="Para 'recalcular': último día de la ventana de consumo (AAAA-MM-DD).")
+    args = parser.parse_args()
+
+    presupuesto_backend.inicializar_base_de_datos()
+    if args.operacion == 'alertas':
+        _imprimir_alertas()
+    elif args.operacion == 'recalcular':
+        consumos, puntos = recalcular_puntos(args.hasta)
+        print(f"✅ {consumos} consumos y {puntos} puntos de reposición actualizados; {cantidad_alertas()} productos en alerta.")
+    elif args.operacion == 'informe':
+        ruta, cantidad = informe_diario()
+        print(f"✅ Informe con {cantidad} alertas en '{ruta}'.")
+    elif args.operacion == 'configurar':
+        if not args.producto:
+            parser.error("'configurar' necesita --producto.")
+        exito, mensaje = configurar(args.producto, args.plazo, args.punto, args.automatico)
+        print(("✅ " if exito else "❌ ") + mensaje)
+        raise SystemExit(0 if exito else 1)
+    else:
+        print(f"✅ Alertas reconstruidas: {reconstruir_alertas()} productos en alerta.")
@@ -0,0 +1,107 @@
+import argparse
+import datetime
+import logging
+
+import consultas
+import presupuesto_backend
+
+log = logging.getLogger(__name__)
+
+# --- Revalidación de precios y vencimiento de presupuestos ---
+# Un presupuesto guarda el precio unitario de cada línea al cotizarlo; si después se importa una lista de
+# precios nueva, los borradores y aprobados siguen con los viejos. revalidar() corre en una transacción:
+#  - Vence los borradores cotizados hace más de DIAS_VALIDEZ días (pasan a 'vencido'; revisarlos los renueva).
+#  - Compara en una sola consulta las líneas de los presupuestos abiertos con el precio de lista de la escala
+#    de su cantidad, solo para los productos cuya lista cambió después de cotizado el presupuesto
+#    (productos.precios_desde), y deja en precios_desactualizados un resumen por presupuesto.
+#  - Con repreciar=True pasa los borradores marcados a los precios de lista guardando una revisión
+#    (ver revisiones_presupuesto.py) con solo las líneas que cambiaron, todo en SQL. Los aprobados solo se
+#    marcan: el cliente aceptó esos precios.
+# La corre el mantenimiento programado (en su hilo, sin trabar la GUI) y se puede correr a mano.
+
+DIAS_VALIDEZ = 30
+REPRECIAR_BORRADORES = False # Si el mantenimiento programado, además de marcarlos, actualiza los borradores
+MOTIVO_REVALIDACION = "Revalidación de precios"
+COLUMNAS_DESACTUALIZADOS = ['presupuesto_id', 'cliente', 'fecha', 'estado', 'lineas', 'total_presupuestado',
+                            'total_lista', 'detectado']
+
+
+def revalidar(repreciar=False, hoy=None, dias_validez=DIAS_VALIDEZ):
+    """
+    Vence los borradores sin revisar desde hace 'dias_validez' días a 'hoy' (por defecto la fecha actual) y marca
+    los presupuestos abiertos con precios distintos de la lista; con repreciar=True además actualiza los
+    borradores marcados. Devuelve (vencidos, marcados, repreciados).
+    """
+    hoy = hoy or datetime.date.today()
+    if isinstance(hoy, str):
+        hoy = datetime.date.fromisoformat(hoy)
+    limite = (hoy - datetime.timedelta(days=dias_validez)).isoformat()
+    conn = presupuesto_backend.conexion()
+    repreciados = 0
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        vencidos = consultas.ejecutar(conn, "vencer_presupuestos", (limite,)).rowcount
+        consultas.ejecutar(conn, "crear_revalidacion_lineas")
+        consultas.ejecutar(conn, "vaciar_revalidacion_lineas")
+        lineas = consultas.ejecutar(conn, "detectar_precios_desactualizados").rowcount
+        consultas.ejecutar(conn, "quitar_precios_al_dia")
+        consultas.ejecutar(conn, "marcar_precios_desactualizados")
+        if repreciar:
+            repreciados = _repreciar_borradores(conn)
+        marcados = consultas.uno(conn, "cantidad_precios_desactualizados")[0]
+        consultas.ejecutar(conn, "vaciar_revalidacion_lineas")
+    log.info("Revalidación de precios: %d presupuestos vencidos, %d líneas con precios viejos, %d presupuestos "
+             "marcados y %d actualizados.", vencidos, lineas, marcados, repreciados)
+    if marcados:
+        log.warning("%d presupuestos abiertos con precios distintos de la lista (ver revalidacion_precios.py).", marcados)
+    return vencidos, marcados, repreciados
+
+
+def _repreciar_borradores(conn):
+    """
+    Dentro de la transacción de revalidar(), pasa a los precios de lista las líneas marcadas de los borradores,
+    con una revisión por presupuesto. Devuelve la cantidad de presupuestos actualizados.
+    """
+    consultas.ejecutar(conn, "crear_revalidacion_presupuestos")
+    consultas.ejecutar(conn, "vaciar_revalidacion_presupuestos")
+    repreciados = consultas.ejecutar(conn, "repreciables_revalidacion").rowcount
+    if repreciados:
+        ultima = consultas.uno(conn, "ultimo_id_revision")[0]
+        if consultas.ejecutar(conn, "revisiones_base_revalidacion").rowcount: # Nunca revisados: primero la revisión 1
+            consultas.ejecutar(conn, "lineas_base_revalidacion", (ultima,))
+            ultima = consultas.uno(conn, "ultimo_id_revision")[0]
+        consultas.ejecutar(conn, "revisiones_revalidacion", (MOTIVO_REVALIDACION,))
+        consultas.ejecutar(conn, "lineas_revalidacion", (ultima,))
+        consultas.ejecutar(conn, "repreciar_revalidacion")
+        consultas.ejecutar(conn, "quitar_precios_repreciados")
+    consultas.ejecutar(conn, "vaciar_revalidacion_presupuestos")
+    return repreciados
+
+
+def desactualizados():
+    """Presupuestos marcados en la última revalidación (filas con COLUMNAS_DESACTUALIZADOS), la mayor diferencia primero."""
+    return consultas.todos(presupuesto_backend.conexion(), "precios_desactualizados")
+
+
+def _imprimir_desactualizados():
+    filas = desactualizados()
+    print(f"{'Presup.':>7}  {'Fecha':<10} {'Estado':<9} {'Líneas':>6} {'Presupuestado':>14} {'Lista':>12}  Cliente")
+    for presupuesto_id, cliente, fecha, estado, lineas, total_presupuestado, total_lista, _ in filas:
+        print(f"{presupuesto_id:>7}  {fecha:<10} {estado:<9} {lineas:>6} {total_presupuestado:>14.2f} {total_lista:>12.2f}  {cliente}")
+    print(f"{len(filas)} presupuestos con precios desactualizados.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Revalidación de precios y vencimiento de presupuestos abiertos.")
+    parser.add_argument("operacion", choices=['revalidar', 'listar'])
+    parser.add_argument("--repreciar", action="store_true", help="Para 'revalidar': pasar los borradores marcados a los precios de lista.")
+    parser.add_argument("--hoy", help="Para 'revalidar': fecha contra la que se calcula el vencimiento (AAAA-MM-DD).")
+    parser.add_argument("--dias", type=int, default=DIAS_VALIDEZ, help="Para 'revalidar': días de validez de un presupuesto.")
+    args = parser.parse_args()
+
+    presupuesto_backend.inicializar_base_de_datos()
+    if args.operacion == 'revalidar':
+        vencidos, marcados, repreciados = revalidar(args.repreciar, args.hoy, args.dias)
+        print(f"✅ {vencidos} presupuestos vencidos, {marcados} con precios desactualizados, {repreciados} actualizados.")
+    else:
+        _imprimir_desactualizados()
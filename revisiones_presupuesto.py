@@ -0,0 +1,209 @@
+import argparse
+import datetime
+import json
+import logging
+
+import consultas
+import presupuesto_backend
+
+log = logging.getLogger(__name__)
+
+# --- Revisiones de presupuestos ---
+# Revisar un presupuesto no obliga a cargarlo de nuevo: revisar() recibe el contenido nuevo completo y
+# guarda una revisión con solo las líneas que cambiaron respecto de la anterior (lineas_revision_presupuesto,
+# una fila por producto agregado, modificado o quitado).
+#  - detalle_presupuesto sigue teniendo siempre la última revisión (la usan el PDF, la conversión en nota de
+#    pedido y los listados); revisar() la actualiza tocando solo las líneas del delta.
+#  - Cualquier revisión se arma con una consulta: la última versión de cada producto hasta esa revisión.
+#  - diferencias() compara dos revisiones mirando solo los productos con cambios entre ambas.
+#  - clonar() copia un presupuesto (o una revisión) para otro cliente con un INSERT ... SELECT.
+# La revisión 1 es el presupuesto como estaba antes de la primera revisión; se guarda al revisarlo por primera vez.
+# Las líneas se identifican por producto: un presupuesto no repite productos (la GUI ya los suma).
+
+ESTADOS_REVISABLES = ('borrador', 'aprobado', 'rechazado', 'vencido') # Uno facturado ya generó su nota de pedido
+
+
+def _revision_base(conn, presupuesto_id):
+    """
+    Dentro de la transacción en curso de conn, guarda la revisión 1 si el presupuesto todavía no tiene
+    revisiones (un producto repetido en el detalle queda en una sola línea). Devuelve la última revisión.
+    """
+    ultima = consultas.uno(conn, "ultima_revision_presupuesto", (presupuesto_id,))[0]
+    if ultima:
+        return ultima
+    revision_id = consultas.ejecutar(conn, "insertar_revision_presupuesto", (presupuesto_id, 1, "Original")).lastrowid
+    consultas.ejecutar(conn, "revision_base_presupuesto", (presupuesto_id, revision_id))
+    if consultas.uno(conn, "productos_repetidos_presupuesto", (presupuesto_id,))[0]:
+        consultas.ejecutar(conn, "vaciar_detalle_presupuesto", (presupuesto_id,))
+        consultas.ejecutar(conn, "agregar_lineas_revisadas", (presupuesto_id, revision_id))
+    return 1
+
+
+def _validar_lineas(lineas):
+    """Mensaje de error si las líneas no sirven para una revisión, o None."""
+    if not lineas:
+        return "El presupuesto revisado no tiene productos."
+    productos = [producto_id for producto_id, _, _ in lineas]
+    if len(set(productos)) != len(productos):
+        return "Hay productos repetidos en las líneas."
+    if any(cantidad <= 0 or precio_unitario <= 0 for _, cantidad, precio_unitario in lineas):
+        return "Las cantidades y los precios deben ser mayores a 0."
+    return None
+
+
+def revisar(presupuesto_id, lineas, motivo=None):
+    """
+    Guarda una revisión del presupuesto con 'lineas' [(producto_id, cantidad, precio_unitario)], su contenido
+    completo. Solo se escriben las líneas agregadas, modificadas o quitadas. Un presupuesto aprobado,
+    rechazado o vencido vuelve a 'borrador'. Devuelve (éxito, mensaje, número de la revisión o None).
+    """
+    error = _validar_lineas(lineas)
+    if error:
+        return False, error, None
+    lineas_json = json.dumps([[int(producto_id), int(cantidad), float(precio)] for producto_id, cantidad, precio in lineas])
+    conn = presupuesto_backend.conexion()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        estado = consultas.uno(conn, "estado_presupuesto", (presupuesto_id,))
+        if not estado:
+            return False, f"Presupuesto con ID {presupuesto_id} no encontrado.", None
+        if estado[0] not in ESTADOS_REVISABLES:
+            return False, f"El presupuesto #{presupuesto_id} está '{estado[0]}' y no se puede revisar.", None
+        if consultas.uno(conn, "productos_inexistentes", (lineas_json,))[0]:
+            return False, "Alguno de los productos no existe.", None
+        numero = _revision_base(conn, presupuesto_id) + 1
+        revision_id = consultas.ejecutar(conn, "insertar_revision_presupuesto", (presupuesto_id, numero, motivo)).lastrowid
+        cambios = consultas.ejecutar(conn, "insertar_delta_revision", (presupuesto_id, revision_id, lineas_json)).rowcount
+        if not cambios:
+            conn.rollback() # No queda una revisión vacía
+            return False, f"El presupuesto #{presupuesto_id} no tiene cambios.", None
+        consultas.ejecutar(conn, "actualizar_lineas_revisadas", (presupuesto_id, revision_id))
+        consultas.ejecutar(conn, "agregar_lineas_revisadas", (presupuesto_id, revision_id))
+        consultas.ejecutar(conn, "quitar_lineas_revisadas", (presupuesto_id, revision_id))
+        consultas.ejecutar(conn, "volver_a_borrador", (presupuesto_id,))
+    mensaje = f"Presupuesto #{presupuesto_id}: revisión {numero} guardada con {cambios} líneas cambiadas."
+    log.info(mensaje)
+    return True, mensaje, numero
+
+
+def revisiones(presupuesto_id):
+    """Revisiones del presupuesto: (numero, fecha, motivo, líneas cambiadas), de la primera a la última."""
+    return consultas.todos(presupuesto_backend.conexion(), "revisiones_de_presupuesto", (presupuesto_id,))
+
+
+def ultima_revision(presupuesto_id):
+    """Número de la última revisión (0 si el presupuesto nunca se revisó)."""
+    return consultas.uno(presupuesto_backend.conexion(), "ultima_revision_presupuesto", (presupuesto_id,))[0]
+
+
+def lineas(presupuesto_id, numero=None):
+    """
+    Líneas del presupuesto en la revisión 'numero' (por defecto la actual): (producto_id, codigo, descripcion,
+    cantidad, precio_unitario), por código.
+    """
+    conn = presupuesto_backend.conexion()
+    if numero is None or (numero == 1 and not ultima_revision(presupuesto_id)):
+        return consultas.todos(conn, "lineas_actuales_presupuesto", (presupuesto_id,))
+    return consultas.todos(conn, "lineas_revision", (presupuesto_id, numero))
+
+
+def diferencias(presupuesto_id, desde, hasta=None):
+    """
+    Cambios de la revisión 'desde' a la 'hasta' (por defecto la última): (codigo, descripcion, cantidad_antes,
+    precio_antes, cantidad_despues, precio_despues, cambio), con cambio 'agregada', 'quitada' o 'modificada'.
+    """
+    hasta = ultima_revision(presupuesto_id) if hasta is None else hasta
+    filas = consultas.todos(presupuesto_backend.conexion(), "diferencias_revisiones", (presupuesto_id, desde, hasta))
+    return [fila + ('agregada' if fila[2] is None else 'quitada' if fila[4] is None else 'modificada',) for fila in filas]
+
+
+def volver_a_revision(presupuesto_id, numero, motivo=None):
+    """Guarda una revisión nueva con el contenido de la revisión 'numero'. Devuelve lo mismo que revisar()."""
+    anteriores = [(producto_id, cantidad, precio) for producto_id, _, _, cantidad, precio in lineas(presupuesto_id, numero)]
+    if not anteriores:
+        return False, f"El presupuesto #{presupuesto_id} no tiene la revisión {numero}.", None
+    return revisar(presupuesto_id, anteriores, motivo or f"Vuelve a la revisión {numero}")
+
+
+def clonar(presupuesto_id, cliente_id, numero=None):
+    """
+    Crea un presupuesto 'borrador' para 'cliente_id' con las líneas del presupuesto (las actuales o las de la
+    revisión 'numero'), copiadas en SQL. Devuelve (éxito, mensaje, ID del presupuesto nuevo o None).
+    """
+    conn = presupuesto_backend.conexion()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        if not consultas.uno(conn, "estado_presupuesto", (presupuesto_id,)):
+            return False, f"Presupuesto con ID {presupuesto_id} no encontrado.", None
+        if not consultas.uno(conn, "cliente_existe", (cliente_id,)):
+            return False, f"Cliente con ID {cliente_id} no encontrado.", None
+        ultima = consultas.uno(conn, "ultima_revision_presupuesto", (presupuesto_id,))[0]
+        if numero is not None and not 1 <= numero <= max(ultima, 1): # Sin revisiones, la 1 es el detalle actual
+            return False, f"El presupuesto #{presupuesto_id} no tiene la revisión {numero}.", None
+        nuevo_id = consultas.ejecutar(conn, "insertar_presupuesto",
+                                      (cliente_id, datetime.date.today().isoformat(), 'borrador')).lastrowid
+        if numero is None or not ultima:
+            copiadas = consultas.ejecutar(conn, "clonar_detalle_presupuesto", (presupuesto_id, nuevo_id)).rowcount
+        else:
+            copiadas = consultas.ejecutar(conn, "clonar_revision_presupuesto", (presupuesto_id, nuevo_id, numero)).rowcount
+    origen = f"#{presupuesto_id}" + (f" (revisión {numero})" if numero is not None else "")
+    mensaje = f"Presupuesto #{nuevo_id} creado como copia de {origen} con {copiadas} líneas."
+    log.info(mensaje)
+    return True, mensaje, nuevo_id
+
+
+def _imprimir_revisiones(presupuesto_id):
+    filas = revisiones(presupuesto_id)
+    if not filas:
+        print(f"El presupuesto #{presupuesto_id} no tiene revisiones.")
+        return
+    print(f"{'Rev.':>4}  {'Fecha':<19} {'Líneas':>6}  Motivo")
+    for numero, fecha, motivo, cambiadas in filas:
+        print(f"{numero:>4}  {fecha[:19].replace('T', ' '):<19} {cambiadas:>6}  {motivo or ''}")
+
+
+def _imprimir_lineas(presupuesto_id, numero):
+    filas = lineas(presupuesto_id, numero)
+    print(f"{'Código':<20} {'Cantidad':>9} {'P. Unit.':>10} {'Subtotal':>12}  Descripción")
+    for _, codigo, descripcion, cantidad, precio in filas:
+        print(f"{codigo:<20} {cantidad:>9} {precio:>10.2f} {cantidad * precio:>12.2f}  {descripcion}")
+    print(f"{len(filas)} líneas, total {sum(cantidad * precio for *_, cantidad, precio in filas):.2f}")
+
+
+def _imprimir_diferencias(presupuesto_id, desde, hasta):
+    def valor(cantidad, precio):
+        return "" if cantidad is None else f"{cantidad} x {precio:.2f}"
+    for codigo, descripcion, cantidad_antes, precio_antes, cantidad_despues, precio_despues, cambio in diferencias(presupuesto_id, desde, hasta):
+        print(f"{cambio:<11} {codigo:<20} {valor(cantidad_antes, precio_antes):>18} -> {valor(cantidad_despues, precio_despues):<18} {descripcion}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Revisiones de presupuestos: historial, líneas de una revisión, diferencias y clonación.")
+    parser.add_argument("operacion", choices=['revisiones', 'lineas', 'diferencias', 'volver', 'clonar'])
+    parser.add_argument("presupuesto", type=int, help="ID del presupuesto.")
+    parser.add_argument("--revision", type=int, help="Para 'lineas', 'volver' y 'clonar': número de revisión.")
+    parser.add_argument("--desde", type=int, help="Para 'diferencias': revisión inicial (por defecto la anterior a --hasta).")
+    parser.add_argument("--hasta", type=int, help="Para 'diferencias': revisión final (por defecto la última).")
+    parser.add_argument("--cliente", help="Para 'clonar': nombre del cliente del presupuesto nuevo.")
+    args = parser.parse_args()
+
+    presupuesto_backend.inicializar_base_de_datos()
+    if args.operacion == 'revisiones':
+        _imprimir_revisiones(args.presupuesto)
+    elif args.operacion == 'lineas':
+        _imprimir_lineas(args.presupuesto, args.revision)
+    elif args.operacion == 'diferencias':
+        hasta = args.hasta or ultima_revision(args.presupuesto)
+        _imprimir_diferencias(args.presupuesto, args.desde or max(hasta - 1, 1), hasta)
+    else:
+        if args.operacion == 'volver':
+            if args.revision is None:
+                parser.error("'volver' necesita --revision.")
+            exito, mensaje, _ = volver_a_revision(args.presupuesto, args.revision)
+        else:
+            if not args.cliente:
+                parser.error("'clonar' necesita --cliente.")
+            fila = consultas.uno(presupuesto_backend.conexion(), "cliente_por_nombre", (args.cliente,))
+            exito, mensaje, _ = clonar(args.presupuesto, fila[0], args.revision) if fila else (False, f"Cliente '{args.cliente}' no encontrado.", None)
+        print(("✅ " if exito else "❌ ") + mensaje)
+        raise SystemExit(0 if exito else 1)
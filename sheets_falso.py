@@ -0,0 +1,196 @@
+import json
+import random
+import time
+
+import gspread
+import requests
+
+# --- Google Sheets falso (en memoria) ---
+# Imita la parte de gspread que usa el backend (open, worksheet, add_worksheet, clear, update...)
+# sin tocar la red. Cuenta cada llamada que en gspread sería un request HTTP y los bytes enviados y recibidos,
+# y puede simular latencia y caídas del servicio. Se usa en los benchmarks y para probar la sincronización.
+
+
+class EstadisticasSheets:
+    """Contadores compartidos por el cliente, sus planillas y sus pestañas."""
+
+    def __init__(self):
+        self.requests = 0
+        self.bytes_enviados = 0
+        self.bytes_recibidos = 0
+        self.por_operacion = {}
+
+    def registrar(self, operacion, payload=None):
+        self.requests += 1
+        self.por_operacion[operacion] = self.por_operacion.get(operacion, 0) + 1
+        if payload is not None:
+            self.bytes_enviados += len(json.dumps(payload, default=str))
+
+    def como_dict(self):
+        return {'requests': self.requests, 'bytes_enviados': self.bytes_enviados, 'bytes_recibidos': self.bytes_recibidos,
+                'por_operacion': dict(self.por_operacion)}
+
+
+class ClienteSheetsFalso:
+    """
+    Reemplazo de gspread.Client. 'latencia' son los segundos que tarda cada request,
+    'probabilidad_falla' la chance de que un request falle como si no hubiera conexión,
+    y 'caido' hace fallar todos los requests (para simular una caída prolongada).
+    """
+
+    def __init__(self, latencia=0.0, probabilidad_falla=0.0, caido=False, semilla=0, crear_planillas=True):
+        self.latencia = latencia
+        self.probabilidad_falla = probabilidad_falla
+        self.caido = caido
+        self.crear_planillas = crear_planillas
+        self.estadisticas = EstadisticasSheets()
+        self.planillas = {}
+        self._rnd = random.Random(semilla)
+
+    def _request(self, operacion, payload=None):
+        """Simula un request HTTP: espera la latencia, puede fallar y queda registrado en las estadísticas."""
+        if self.latencia:
+            time.sleep(self.latencia)
+        if self.caido or (self.probabilidad_falla and self._rnd.random() < self.probabilidad_falla):
+            raise requests.exceptions.ConnectionError(f"Google Sheets no disponible ({operacion}).")
+        self.estadisticas.registrar(operacion, payload)
+
+    def open(self, titulo):
+        self._request('open')
+        if titulo not in self.planillas:
+            if not self.crear_planillas:
+                raise gspread.exceptions.SpreadsheetNotFound(titulo)
+            self.planillas[titulo] = PlanillaFalsa(self, titulo)
+        return self.planillas[titulo]
+
+
+class PlanillaFalsa:
+    """Reemplazo de gspread.Spreadsheet."""
+
+    def __init__(self, cliente, titulo):
+        self.cliente = cliente
+        self.title = titulo
+        self.pestanas = {}
+
+    def worksheet(self, titulo):
+        self.cliente._request('worksheet')
+        if titulo not in self.pestanas:
+            raise gspread.exceptions.WorksheetNotFound(titulo)
+        return self.pestanas[titulo]
+
+    def worksheets(self):
+        self.cliente._request('worksheets')
+        return list(self.pestanas.values())
+
+    def add_worksheet(self, title, rows, cols, index=None):
+        self.cliente._request('add_worksheet', {'title': title, 'rows': rows, 'cols': cols})
+        self.pestanas[title] = PestanaFalsa(self, title, int(rows), int(cols))
+        return self.pestanas[title]
+
+    def values_batch_update(self, body):
+        """Escribe varios rangos (de una o varias pestañas) en un solo request, como la API real."""
+        self.cliente._request('values_batch_update', body)
+        for rango in body.get('data', []):
+            titulo, _, celda = rango['range'].rpartition('!')
+            self.pestanas[titulo.strip("'")]._escribir(celda.split(':')[0], rango['values'])
+        return {'totalUpdatedCells': sum(len(fila) for rango in body.get('data', []) for fila in rango['values'])}
+
+    def values_batch_get(self, ranges, params=None):
+        """Lee varios rangos tipo "'Pestaña'!A:C" en un solo request. Como la API, omite filas y celdas vacías del final."""
+        self.cliente._request('values_batch_get')
+        respuesta = []
+        for rango in ranges:
+            titulo, _, celdas = rango.rpartition('!')
+            desde, _, hasta = celdas.partition(':')
+            columna_desde = _columna_a_indice(''.join(c for c in desde if c.isalpha()))
+            columna_hasta = _columna_a_indice(''.join(c for c in (hasta or desde) if c.isalpha()))
+            valores = []
+            for fila in self.pestanas[titulo.strip("'")].valores:
+                recorte = list(fila[columna_desde:columna_hasta + 1])
+                while recorte and recorte[-1] in ('', None):
+                    recorte.pop()
+                valores.append(recorte)
+            while valores and not valores[-1]:
+                valores.pop()
+            respuesta.append({'range': rango, 'values': valores})
+            self.cliente.estadisticas.bytes_recibidos += len(json.dumps(valores, default=str))
+        return {'valueRanges': respuesta}
+
+    def values_batch_clear(self, params=None, body=None):
+        self.cliente._request('values_batch_clear', body)
+        for rango in body.get('ranges', []):
+            self.pestanas[rango.rpartition('!')[0].strip("'") or rango.strip("'")].valores = []
+
+    def batch_update(self, body):
+        self.cliente._request('batch_update', body)
+        for pedido in body.get('requests', []):
+            propiedades = pedido.get('updateSheetProperties', {}).get('properties', {})
+            for pestana in self.pestanas.values():
+                if pestana.id == propiedades.get('sheetId'):
+                    grilla = propiedades.get('gridProperties', {})
+                    pestana.row_count = grilla.get('rowCount', pestana.row_count)
+                    pestana.col_count = grilla.get('columnCount', pestana.col_count)
+        return {}
+
+
+def _columna_a_indice(letras):
+    indice = 0
+    for letra in letras:
+        indice = indice * 26 + (ord(letra.upper()) - ord('A') + 1)
+    return indice - 1
+
+
+class PestanaFalsa:
+    """Reemplazo de gspread.Worksheet. Guarda los valores como una lista de filas."""
+
+    _siguiente_id = 0
+
+    def __init__(self, planilla, titulo, filas, columnas):
+        PestanaFalsa._siguiente_id += 1
+        self.id = PestanaFalsa._siguiente_id
+        self.planilla = planilla
+        self.title = titulo
+        self.row_count = filas
+        self.col_count = columnas
+        self.valores = []
+
+    def _escribir(self, celda, valores):
+        """Escribe un bloque de valores a partir de una celda tipo 'A1' (amplía la grilla si hace falta)."""
+        letras = ''.join(c for c in celda if c.isalpha()) or 'A'
+        fila_inicio = int(''.join(c for c in celda if c.isdigit()) or 1) - 1
+        columna_inicio = _columna_a_indice(letras)
+        for i, fila in enumerate(valores):
+            while len(self.valores) <= fila_inicio + i:
+                self.valores.append([])
+            destino = self.valores[fila_inicio + i]
+            while len(destino) < columna_inicio + len(fila):
+                destino.append('')
+            destino[columna_inicio:columna_inicio + len(fila)] = list(fila)
+        self.row_count = max(self.row_count, len(self.valores))
+        self.col_count = max(self.col_count, max((len(f) for f in self.valores), default=0))
+
+    def clear(self):
+        self.planilla.cliente._request('clear')
+        self.valores = []
+
+    def update(self, values=None, range_name='A1', **kwargs):
+        # gspread acepta update(valores) y update(rango, valores); se aceptan las dos formas
+        if isinstance(values, str):
+            values, range_name = range_name, values
+        self.planilla.cliente._request('update', values)
+        self._escribir(range_name, values)
+
+    def resize(self, rows=None, cols=None):
+        self.planilla.cliente._request('resize', {'rows': rows, 'cols': cols})
+        self.row_count = rows or self.row_count
+        self.col_count = cols or self.col_count
+
+    def get_all_values(self):
+        self.planilla.cliente._request('get_all_values')
+        return [list(fila) for fila in self.valores]
+
+    def get_all_records(self):
+        filas = self.get_all_values()
+        if not filas:
+            return []
+        return [dict(zip(filas[0], fila)) for fila in filas[1:]]
@@ -0,0 +1,62 @@
+import os
+import stat
+import sys
+import time
+
+# --- Tesseract falso ---
+# Imita la línea de comandos de tesseract tal como la llama pytesseract
+# (tesseract <imagen|lista.txt> <salida> [-l idioma] [txt]) sin hacer OCR: el "texto reconocido" de cada
+# imagen es el del archivo <imagen>.texto que se deja al lado. Simula el costo de arrancar el proceso y
+# cargar el idioma (ARRANQUE_MS, una vez por ejecución) y el de reconocer cada imagen (POR_IMAGEN_MS).
+# Se usa en los benchmarks cuando no hay un tesseract real instalado.
+
+ARRANQUE_MS = float(os.environ.get("TESSERACT_FALSO_ARRANQUE_MS", 120))
+POR_IMAGEN_MS = float(os.environ.get("TESSERACT_FALSO_POR_IMAGEN_MS", 15))
+SUFIJO_TEXTO = ".texto"
+
+
+def instalar(carpeta):
+    """Crea en 'carpeta' un ejecutable 'tesseract' que corre este script con el intérprete actual. Devuelve su ruta."""
+    os.makedirs(carpeta, exist_ok=True)
+    script = os.path.abspath(__file__)
+    if os.name == "nt":
+        ruta = os.path.join(carpeta, "tesseract.bat")
+        contenido = f'@"{sys.executable}" "{script}" %*\r\n'
+    else:
+        ruta = os.path.join(carpeta, "tesseract")
+        contenido = f'#!/bin/sh\nexec "{sys.executable}" "{script}" "$@"\n'
+    with open(ruta, "w", encoding="utf-8") as archivo:
+        archivo.write(contenido)
+    os.chmod(ruta, os.stat(ruta).st_mode | stat.S_IEXEC)
+    return ruta
+
+
+def escribir_imagen(ruta, texto):
+    """Deja el texto que el tesseract falso 'reconocerá' en la imagen 'ruta' (la imagen puede ser cualquier archivo)."""
+    with open(ruta + SUFIJO_TEXTO, "w", encoding="utf-8") as archivo:
+        archivo.write(texto)
+
+
+def main(argumentos):
+    entrada, salida = argumentos[0], argumentos[1]
+    time.sleep(ARRANQUE_MS / 1000)
+    if entrada.lower().endswith(".txt"):
+        with open(entrada, encoding="utf-8") as archivo:
+            imagenes = [linea.strip() for linea in archivo if linea.strip()]
+    else:
+        imagenes = [entrada]
+    paginas = []
+    for imagen in imagenes:
+        time.sleep(POR_IMAGEN_MS / 1000)
+        with open(imagen + SUFIJO_TEXTO, encoding="utf-8") as archivo:
+            paginas.append(archivo.read())
+    if salida == "stdout":
+        sys.stdout.write("\f".join(paginas))
+    else:
+        with open(salida + ".txt", "w", encoding="utf-8") as archivo:
+            archivo.write("\f".join(paginas))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
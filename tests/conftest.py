@@ -0,0 +1,39 @@
+import contextlib
+import io
+import os
+import sys
+
+import pytest
+
+# Los módulos del proyecto están en la raíz del repositorio
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import consultas
+import presupuesto_backend
+
+
+@pytest.fixture
+def base(tmp_path, monkeypatch):
+    """Base de datos nueva en una carpeta temporal (nunca presupuestos.db), ya inicializada."""
+    monkeypatch.setattr(presupuesto_backend, "DB_PATH", str(tmp_path / "test.db"))
+    with contextlib.redirect_stdout(io.StringIO()):
+        presupuesto_backend.inicializar_base_de_datos()
+    yield presupuesto_backend.DB_PATH
+    consultas.cerrar_conexion()
+
+
+@pytest.fixture
+def sheets(base, monkeypatch):
+    """Google Sheets falso (sheets_falso) en lugar del cliente real, con la base cargada con datos sintéticos."""
+    import datos_sinteticos
+    import sheets_falso
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        datos_sinteticos.generar_base(base, 200)
+    cliente = sheets_falso.ClienteSheetsFalso()
+    monkeypatch.setattr(presupuesto_backend, "get_google_sheet_client", lambda: cliente)
+    monkeypatch.setitem(presupuesto_backend.estado_sheets, 'conectado', None)
+    monkeypatch.setitem(presupuesto_backend.estado_sheets, 'ultimo_error', None)
+    presupuesto_backend.olvidar_cliente_sheets()
+    yield cliente
+    presupuesto_backend.olvidar_cliente_sheets()
@@ -0,0 +1,25 @@
+import consultas
+import instrumentacion
+import presupuesto_backend
+
+
+def test_los_helpers_pasan_por_el_perfilador(base):
+    instrumentacion.activar()
+    instrumentacion.reiniciar()
+    try:
+        conn = presupuesto_backend.conexion()
+        with conn:
+            cliente_id = consultas.ejecutar(conn, "insertar_cliente", ("Cliente", "20-1-1", "Cliente SA")).lastrowid
+            presupuesto_id = consultas.ejecutar(conn, "insertar_presupuesto", (cliente_id, "2024-01-01", "borrador")).lastrowid
+            producto_id = consultas.ejecutar(conn, "insertar_producto", ("SKU-1", "Producto")).lastrowid
+            consultas.muchos(conn, "insertar_detalle_presupuesto", [(presupuesto_id, producto_id, 2, 10.0)])
+        presupuestos = presupuesto_backend.obtener_todos_los_presupuestos()
+        sentencias = instrumentacion.instantanea()["sql"]
+    finally:
+        instrumentacion.desactivar()
+        instrumentacion.reiniciar()
+
+    assert len(presupuestos) == 1
+    for nombre in ("insertar_cliente", "insertar_presupuesto", "insertar_detalle_presupuesto", "presupuestos"):
+        medida = sentencias.get(instrumentacion._normalizar(consultas.SENTENCIAS[nombre]))
+        assert medida and medida["llamadas"] >= 1, nombre
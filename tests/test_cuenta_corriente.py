@@ -0,0 +1,64 @@
+import cuenta_corriente
+import presupuesto_backend
+
+
+def _cliente(conn):
+    return conn.execute("INSERT INTO clientes (nombre, cuit, razon_social) VALUES ('Cliente', '20-1-1', 'Cliente SA')").lastrowid
+
+
+def _entregar(conn, cliente_id, fecha, importe):
+    nota_id = conn.execute("""INSERT INTO notas_pedido (cliente_id, fecha_creacion, estado, total, total_con_iva, cantidad_lineas)
+                              VALUES (?, ?, 'aprobada', ROUND(?3 / 1.21, 4), ?3, 1)""", (cliente_id, fecha, importe)).lastrowid
+    conn.execute("UPDATE notas_pedido SET estado = 'entregada', fecha_entrega = ? WHERE id = ?", (fecha, nota_id))
+    return nota_id
+
+
+def _pagar(conn, cliente_id, fecha, importe):
+    return conn.execute("INSERT INTO comprobantes (nro_operacion, fecha, importe, cuenta, cliente_id) VALUES (?, ?, ?, 'CBU-0001', ?)",
+                        (f"OP-{fecha}-{importe}", fecha, importe, cliente_id)).lastrowid
+
+
+def test_un_pago_con_fecha_anterior_da_el_mismo_estado_de_cuenta_que_la_reconstruccion(base):
+    conn = presupuesto_backend.conexion()
+    with conn:
+        cliente_id = _cliente(conn)
+        _entregar(conn, cliente_id, '2026-03-10', 121.0)
+        _pagar(conn, cliente_id, '01/02/2026', 50.0) # Cargado después, con fecha anterior a la entrega
+    cuenta_corriente.generar_cierres('2026-03-31')
+    por_triggers = cuenta_corriente.estado_de_cuenta(cliente_id)
+    saldo_por_triggers = cuenta_corriente.saldo_actual(cliente_id)
+    cierre_por_triggers = cuenta_corriente.saldo_a_fecha(cliente_id, '2026-02-28')
+    asientos = "SELECT cliente_id, fecha, tipo, referencia_id, debe, haber FROM cuenta_corriente ORDER BY fecha, tipo"
+    asientos_por_triggers = conn.execute(asientos).fetchall()
+
+    cuenta_corriente.reconstruir()
+
+    assert asientos_por_triggers == conn.execute(asientos).fetchall()
+    assert por_triggers == cuenta_corriente.estado_de_cuenta(cliente_id)
+    assert [movimiento[4] for movimiento in por_triggers[1]] == [-50.0, 71.0]
+    assert saldo_por_triggers == cuenta_corriente.saldo_actual(cliente_id) == 71.0
+    assert cierre_por_triggers == cuenta_corriente.saldo_a_fecha(cliente_id, '2026-02-28') == -50.0
+
+
+def test_un_cambio_de_total_de_una_nota_entregada_se_anota_como_ajuste(base):
+    conn = presupuesto_backend.conexion()
+    with conn:
+        cliente_id = _cliente(conn)
+        nota_id = _entregar(conn, cliente_id, '2026-01-15', 100.0)
+        _pagar(conn, cliente_id, '20/02/2026', 30.0)
+    cuenta_corriente.generar_cierres('2026-02-28')
+    asientos_anteriores = conn.execute("SELECT * FROM cuenta_corriente ORDER BY id").fetchall()
+
+    with conn:
+        conn.execute("UPDATE notas_pedido SET total_con_iva = 110.0 WHERE id = ?", (nota_id,))
+
+    asientos = conn.execute("SELECT * FROM cuenta_corriente ORDER BY id").fetchall()
+    assert asientos[:len(asientos_anteriores)] == asientos_anteriores # La historia no se toca
+    assert asientos[len(asientos_anteriores):] == [(len(asientos), cliente_id, '2026-01-15', 'entrega', nota_id, 10.0, 0.0)]
+    assert cuenta_corriente.saldo_actual(cliente_id) == 80.0
+    assert cuenta_corriente.saldo_a_fecha(cliente_id, '2026-01-31') == 110.0 # Cierre de enero corregido
+
+    cuenta_corriente.reconstruir()
+    assert cuenta_corriente.saldo_actual(cliente_id) == 80.0
+    assert cuenta_corriente.saldo_a_fecha(cliente_id, '2026-01-31') == 110.0
+    assert cuenta_corriente.antiguedad_saldos('2026-03-01', cliente_id)[0][-1] == 80.0
@@ -0,0 +1,38 @@
+import instrumentacion
+import presupuesto_backend
+
+
+def test_las_sentencias_del_backend_llegan_al_perfilador(base):
+    instrumentacion.activar()
+    instrumentacion.reiniciar()
+    try:
+        presupuesto_backend.obtener_todos_los_presupuestos()
+        presupuesto_backend.obtener_notas_pedido()
+        datos = instrumentacion.instantanea()
+    finally:
+        instrumentacion.desactivar()
+        instrumentacion.reiniciar()
+
+    assert "presupuesto_backend.obtener_notas_pedido" in datos["funciones"]
+    sentencias = datos["sql"]
+    assert any("FROM presupuestos p" in sentencia for sentencia in sentencias)
+    assert any("FROM notas_pedido np" in sentencia for sentencia in sentencias)
+    assert all(e["llamadas"] >= 1 for e in sentencias.values())
+
+
+def test_executemany_de_la_conexion_tambien_se_mide(base):
+    instrumentacion.activar()
+    instrumentacion.reiniciar()
+    try:
+        conn = presupuesto_backend.conectar()
+        with conn:
+            conn.execute("CREATE TEMP TABLE numeros (n INTEGER)")
+            conn.executemany("INSERT INTO numeros (n) VALUES (?)", [(i,) for i in range(10)])
+        conn.close()
+        sentencias = instrumentacion.instantanea()["sql"]
+    finally:
+        instrumentacion.desactivar()
+        instrumentacion.reiniciar()
+
+    insercion = sentencias["INSERT INTO numeros (n) VALUES (?)"]
+    assert insercion["filas"] == 10
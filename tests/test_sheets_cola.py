@@ -0,0 +1,66 @@
+import pytest
+
+import presupuesto_backend
+import sheets_falso
+
+
+@pytest.fixture
+def envios(monkeypatch):
+    """Registra cada values_batch_update como (hoja de cálculo, [pestañas en el orden del envío])."""
+    registrados = []
+    original = sheets_falso.PlanillaFalsa.values_batch_update
+
+    def values_batch_update(planilla, body):
+        registrados.append((planilla.title, [rango['range'].rpartition('!')[0].strip("'") for rango in body['data']]))
+        return original(planilla, body)
+    monkeypatch.setattr(sheets_falso.PlanillaFalsa, "values_batch_update", values_batch_update)
+    return registrados
+
+
+def test_sin_conexion_la_sincronizacion_queda_en_cola(sheets):
+    sheets.caido = True
+
+    exito, mensaje = presupuesto_backend.sincronizar_a_google_sheets('productos')
+    assert not exito and "quedó en cola" in mensaje
+    exito, _ = presupuesto_backend.sincronizar_a_google_sheets('presupuestos')
+    assert not exito
+
+    pendientes = presupuesto_backend.pendientes_sheets()
+    assert [fila[1] for fila in pendientes] == ['productos', 'presupuestos']
+    assert all(fila[4] >= 1 and fila[5] for fila in pendientes) # Intentos y último error anotados
+    assert presupuesto_backend.estado_sheets['conectado'] is False
+    assert sheets.estadisticas.por_operacion.get('values_batch_update', 0) == 0
+
+
+def test_al_reconectar_se_reenvia_en_orden_un_lote_por_hoja_de_calculo(sheets, envios):
+    sheets.caido = True
+    for modulo, hoja in [('productos', 'Hoja A'), ('pedidos', 'Hoja B'), ('presupuestos', 'Hoja A'),
+                         ('productos', 'Hoja A'), ('comprobantes', 'Hoja B')]:
+        presupuesto_backend.encolar_sincronizacion(modulo, hoja)
+    assert presupuesto_backend.procesar_cola_sheets() == (0, 5, {})
+    assert len(presupuesto_backend.pendientes_sheets()) == 5
+
+    sheets.caido = False
+    assert presupuesto_backend.procesar_cola_sheets() == (5, 0, {})
+
+    assert presupuesto_backend.pendientes_sheets() == []
+    assert envios == [('Hoja A', ['Productos', 'Presupuestos']), ('Hoja B', ['Notas_Pedido', 'Comprobantes'])]
+    assert sheets.estadisticas.por_operacion['values_batch_clear'] == 2
+    assert presupuesto_backend.estado_sheets['conectado'] is True
+    for hoja, titulo, modulo in [('Hoja A', 'Productos', 'productos'), ('Hoja B', 'Comprobantes', 'comprobantes')]:
+        assert sheets.planillas[hoja].pestanas[titulo].valores == presupuesto_backend._valores_modulo(modulo)
+
+
+def test_un_error_permanente_descarta_solo_sus_entradas(sheets, envios):
+    sheets.crear_planillas = False # open() de una planilla inexistente falla con SpreadsheetNotFound
+    sheets.planillas['Existente'] = sheets_falso.PlanillaFalsa(sheets, 'Existente')
+    inexistente = presupuesto_backend.encolar_sincronizacion('productos', 'Inexistente')
+    existente = presupuesto_backend.encolar_sincronizacion('presupuestos', 'Existente')
+
+    procesadas, pendientes, errores = presupuesto_backend.procesar_cola_sheets()
+
+    assert (procesadas, pendientes) == (2, 0)
+    assert list(errores) == [inexistente]
+    assert existente not in errores
+    assert presupuesto_backend.pendientes_sheets() == []
+    assert envios == [('Existente', ['Presupuestos'])]
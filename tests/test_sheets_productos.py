@@ -0,0 +1,146 @@
+import pytest
+
+import presupuesto_backend
+
+
+@pytest.fixture
+def pestana(sheets):
+    """Pestaña de productos ya subida a la planilla falsa."""
+    exito, mensaje = presupuesto_backend.sincronizar_a_google_sheets('productos')
+    assert exito, mensaje
+    return sheets.planillas[presupuesto_backend.NOMBRE_HOJA_CALCULO].pestanas['Productos']
+
+
+def _celda(pestana, fila, columna):
+    return pestana.valores[fila][pestana.valores[0].index(columna)]
+
+
+def _editar(pestana, fila, columna, valor):
+    pestana.valores[fila][pestana.valores[0].index(columna)] = valor
+
+
+def _producto(codigo, columna):
+    return presupuesto_backend.conexion().execute(f"SELECT {columna} FROM productos WHERE codigo = ?", (codigo,)).fetchone()[0]
+
+
+def _hashes_base():
+    return dict(presupuesto_backend.conexion().execute("SELECT clave, hash FROM sheets_base WHERE modulo = 'productos'"))
+
+
+def _hashes_esperados():
+    filas = presupuesto_backend._valores_modulo('productos')
+    encabezado = filas[0]
+    indices = [encabezado.index(columna) for columna in presupuesto_backend.COLUMNAS_EDITABLES_PRODUCTOS]
+    return {str(fila[0]): presupuesto_backend._hash_fila(presupuesto_backend._normalizar_editables([fila[i] for i in indices]))
+            for fila in filas[1:]}
+
+
+def test_una_edicion_solo_en_la_planilla_se_aplica(pestana):
+    codigo = _celda(pestana, 1, 'Codigo_Producto')
+    nuevo_precio = round(_celda(pestana, 1, 'Precio_1') + 7.5, 4)
+    nuevo_stock = _celda(pestana, 1, 'Stock_Disponible') + 3
+    _editar(pestana, 1, 'Precio_1', nuevo_precio)
+    _editar(pestana, 1, 'Stock_Disponible', nuevo_stock)
+
+    exito, mensaje, resumen = presupuesto_backend.traer_productos_de_google_sheets()
+
+    assert exito, mensaje
+    assert resumen['aplicadas'] == 1 and not resumen['conflictos'] and not resumen['ignoradas']
+    assert _producto(codigo, 'precio_1') == pytest.approx(nuevo_precio)
+    assert _producto(codigo, 'stock_disponible') == nuevo_stock
+
+
+def test_un_conflicto_conserva_el_valor_de_la_base(pestana):
+    codigo = _celda(pestana, 2, 'Codigo_Producto')
+    _editar(pestana, 2, 'Precio_1', round(_celda(pestana, 2, 'Precio_1') + 1, 4))
+    conn = presupuesto_backend.conexion()
+    with conn:
+        conn.execute("UPDATE productos SET precio_1 = 999.5 WHERE codigo = ?", (codigo,))
+
+    exito, _, resumen = presupuesto_backend.traer_productos_de_google_sheets()
+
+    assert exito
+    assert [conflicto['codigo'] for conflicto in resumen['conflictos']] == [codigo]
+    assert resumen['aplicadas'] == 0
+    assert _producto(codigo, 'precio_1') == 999.5
+    # En la próxima subida gana la base
+    assert presupuesto_backend.sincronizar_a_google_sheets('productos')[0]
+    assert _celda(pestana, 2, 'Precio_1') == 999.5
+
+
+def test_una_celda_no_numerica_se_ignora(pestana):
+    codigo = _celda(pestana, 3, 'Codigo_Producto')
+    precio = _producto(codigo, 'precio_5')
+    _editar(pestana, 3, 'Precio_5', "consultar")
+
+    exito, _, resumen = presupuesto_backend.traer_productos_de_google_sheets()
+
+    assert exito
+    assert resumen['ignoradas'] == [{'codigo': codigo, 'motivo': "valores no numéricos"}]
+    assert resumen['aplicadas'] == 0
+    assert _producto(codigo, 'precio_5') == precio
+
+
+def test_la_subida_actualiza_los_hashes_de_sheets_base(pestana):
+    assert _hashes_base() == _hashes_esperados()
+
+    codigo = _celda(pestana, 1, 'Codigo_Producto')
+    anterior = _hashes_base()[codigo]
+    conn = presupuesto_backend.conexion()
+    with conn:
+        conn.execute("UPDATE productos SET precio_10 = precio_10 + 2 WHERE codigo = ?", (codigo,))
+    assert presupuesto_backend.sincronizar_a_google_sheets('productos')[0]
+
+    assert _hashes_base()[codigo] != anterior
+    assert _hashes_base() == _hashes_esperados()
+
+
+def test_encabezados_cambiados_no_frenan_la_subida_de_los_demas_modulos(pestana, sheets):
+    codigo = _celda(pestana, 1, 'Codigo_Producto')
+    precio = _producto(codigo, 'precio_1')
+    _editar(pestana, 1, 'Precio_1', round(precio + 5, 4))
+    _editar(pestana, 0, 'Precio_1', "Precio x 1") # Encabezado renombrado a mano
+
+    exito, mensaje, resumen = presupuesto_backend.traer_productos_de_google_sheets()
+    assert not exito and resumen['omitido'] and "Precio_1" in mensaje
+
+    for modulo in ('productos', 'presupuestos', 'pedidos'):
+        presupuesto_backend.encolar_sincronizacion(modulo)
+    assert presupuesto_backend.procesar_cola_sheets() == (3, 0, {})
+
+    planilla = sheets.planillas[presupuesto_backend.NOMBRE_HOJA_CALCULO]
+    assert planilla.pestanas['Presupuestos'].valores == presupuesto_backend._valores_modulo('presupuestos')
+    assert planilla.pestanas['Notas_Pedido'].valores == presupuesto_backend._valores_modulo('pedidos')
+    # La edición no se trajo y la subida restableció la pestaña de productos con los encabezados de la base
+    assert _producto(codigo, 'precio_1') == precio
+    assert pestana.valores == presupuesto_backend._valores_modulo('productos')
+    assert presupuesto_backend.traer_productos_de_google_sheets()[0]
+
+
+def test_el_stock_traido_actualiza_el_estado_y_pasa_por_el_perfilador(pestana):
+    import consultas
+    import instrumentacion
+
+    codigo = _celda(pestana, 1, 'Codigo_Producto')
+    conn = presupuesto_backend.conexion()
+    with conn:
+        conn.execute("UPDATE productos SET stock_reservado = 0 WHERE codigo = ?", (codigo,))
+    assert presupuesto_backend.sincronizar_a_google_sheets('productos')[0]
+    _editar(pestana, 1, 'Stock_Disponible', 0)
+
+    instrumentacion.activar()
+    instrumentacion.reiniciar()
+    try:
+        exito, mensaje, resumen = presupuesto_backend.traer_productos_de_google_sheets()
+        sentencias = instrumentacion.instantanea()["sql"]
+    finally:
+        instrumentacion.desactivar()
+        instrumentacion.reiniciar()
+
+    assert exito, mensaje
+    assert resumen['aplicadas'] == 1
+    assert _producto(codigo, 'stock_disponible') == 0
+    assert _producto(codigo, 'estado_producto') == 'sin_stock'
+    for nombre in ("editables_productos", "ajustar_stock_desde_sheets", "actualizar_editables_producto",
+                   "actualizar_estado_productos_movidos", "guardar_base_producto"):
+        assert instrumentacion._normalizar(consultas.SENTENCIAS[nombre]) in sentencias, nombre
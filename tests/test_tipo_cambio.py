@@ -0,0 +1,55 @@
+import sqlite3
+
+import pytest
+
+import consultas
+import presupuesto_backend
+import tipo_cambio
+
+
+def _cargar_desde_otra_conexion(base, filas):
+    """Cotizaciones guardadas por otra conexión (otro proceso, o una restauración de mantenimiento.py)."""
+    otra = sqlite3.connect(base)
+    with otra:
+        otra.executemany("INSERT OR REPLACE INTO tipo_cambio (moneda, fecha, valor) VALUES ('ARS', ?, ?)", filas)
+    otra.close()
+
+
+@pytest.fixture(autouse=True)
+def cache_vacia():
+    tipo_cambio.limpiar_cache()
+    yield
+    tipo_cambio.limpiar_cache()
+
+
+def test_una_cotizacion_cargada_despues_de_consultar_aparece(base):
+    assert tipo_cambio.obtener_tipo_cambio("2024-03-01") is None
+
+    _cargar_desde_otra_conexion(base, [("2024-02-28", 850.0)])
+
+    assert tipo_cambio.obtener_tipo_cambio("2024-03-01") == 850.0
+
+
+def test_la_cache_se_descarta_cuando_otra_conexion_cambia_la_base(base):
+    _cargar_desde_otra_conexion(base, [("2024-02-28", 850.0)])
+    assert tipo_cambio.obtener_tipo_cambio("2024-03-01") == 850.0
+
+    _cargar_desde_otra_conexion(base, [("2024-02-28", 860.0)])
+
+    assert tipo_cambio.obtener_tipo_cambio("2024-03-01") == 860.0
+
+
+def test_totales_convertidos_usa_la_cotizacion_vigente_y_el_rango(base):
+    _cargar_desde_otra_conexion(base, [("2024-01-01", 800.0), ("2024-02-01", 900.0)])
+    conn = presupuesto_backend.conexion()
+    with conn:
+        cliente_id = consultas.ejecutar(conn, "insertar_cliente", ("Cliente", "20-1-1", "Cliente SA")).lastrowid
+        conn.executemany("INSERT INTO notas_pedido (cliente_id, fecha_creacion, total, total_con_iva) VALUES (?, ?, ?, ?)",
+                         [(cliente_id, "2023-12-31", 10.0, 12.1), (cliente_id, "2024-01-15", 10.0, 12.1),
+                          (cliente_id, "2024-02-10", 20.0, 24.2)])
+
+    filas = tipo_cambio.totales_convertidos('notas_pedido')
+    assert [(fila[1], fila[4], fila[5]) for fila in filas] == [
+        ("2023-12-31", None, None), ("2024-01-15", 800.0, 8000.0), ("2024-02-10", 900.0, 18000.0)]
+    assert [fila[1] for fila in tipo_cambio.totales_convertidos('notas_pedido', desde="2024-01-01", hasta="2024-01-31")] \
+        == ["2024-01-15"]
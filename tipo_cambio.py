@@ -0,0 +1,156 @@
+import sys
+
+import pandas as pd
+
+import consultas
+import presupuesto_backend
+
+# --- Tipos de cambio USD -> moneda local ---
+# Los precios y totales del sistema están en USD. La tabla tipo_cambio guarda la cotización
+# vigente desde cada fecha; para convertir un importe se usa la última cotización con
+# fecha <= fecha del documento (as-of join, en consultas._SQL_COTIZACION_VIGENTE).
+# Las cotizaciones consultadas se cachean y la caché se invalida sola cuando otra conexión guarda
+# cambios en la base (PRAGMA data_version), por ejemplo otro proceso que carga cotizaciones o una
+# restauración de mantenimiento.py.
+
+MONEDA_LOCAL = 'ARS'
+
+TABLAS_CONVERTIBLES = { # Tabla -> sentencia de consultas.SENTENCIAS
+    'notas_pedido': "totales_convertidos_notas_pedido",
+    'presupuestos': "totales_convertidos_presupuestos",
+}
+
+_estado_cache = None # (DB_PATH, conexión, PRAGMA data_version) con que se llenó la caché
+_cache = {} # (fecha, moneda) -> cotización
+
+
+def limpiar_cache():
+    """Descarta las cotizaciones cacheadas por obtener_tipo_cambio()."""
+    global _estado_cache
+    _cache.clear()
+    _estado_cache = None
+
+
+def cargar_tipos_cambio_csv(ruta_csv, moneda=MONEDA_LOCAL):
+    """
+    Carga cotizaciones desde un CSV local con columnas 'fecha' y 'valor' (separador ';' y decimal ',',
+    igual que la lista de precios). Las fechas pueden venir como DD/MM/AAAA o AAAA-MM-DD.
+    Si una fecha ya existe para esa moneda, se reemplaza. Devuelve (éxito, mensaje).
+    """
+    try:
+        df = pd.read_csv(ruta_csv, sep=';', decimal=',', encoding='latin-1', dtype={'fecha': str})
+    except FileNotFoundError:
+        return False, f"El archivo '{ruta_csv}' no fue encontrado."
+
+    df.columns = df.columns.astype(str).str.strip().str.lower()
+    if 'fecha' not in df.columns or 'valor' not in df.columns:
+        return False, f"El CSV debe tener las columnas 'fecha' y 'valor'. Columnas encontradas: {list(df.columns)}"
+
+    fechas_iso = pd.to_datetime(df['fecha'].str.strip(), format='%Y-%m-%d', errors='coerce')
+    fechas_dia_primero = pd.to_datetime(df['fecha'].str.strip(), format='%d/%m/%Y', errors='coerce')
+    df['fecha'] = fechas_iso.fillna(fechas_dia_primero).dt.strftime('%Y-%m-%d')
+    df['valor'] = pd.to_numeric(df['valor'], errors='coerce')
+    df = df.dropna(subset=['fecha', 'valor'])
+    df = df[df['valor'] > 0]
+
+    if df.empty:
+        return False, f"El archivo '{ruta_csv}' no contiene cotizaciones válidas."
+
+    conn = presupuesto_backend.conexion()
+    with conn:
+        consultas.muchos(conn, "guardar_tipo_cambio",
+                         [(moneda, fecha, float(valor)) for fecha, valor in zip(df['fecha'], df['valor'])])
+
+    limpiar_cache() # La escritura es de esta conexión: su data_version no cambia
+    return True, f"Se cargaron {len(df)} cotizaciones {moneda} desde '{ruta_csv}'."
+
+
+def obtener_tipo_cambio(fecha, moneda=MONEDA_LOCAL):
+    """
+    Cotización vigente a una fecha (AAAA-MM-DD): la última cargada con fecha <= 'fecha'.
+    Devuelve None si no hay ninguna. Cacheado por (fecha, moneda) mientras la base no cambie desde otra
+    conexión; los None no se cachean, así una cotización cargada después aparece en la próxima consulta.
+    """
+    global _estado_cache
+    conn = presupuesto_backend.conexion()
+    # data_version es propia de cada conexión: con otra (otro hilo, otra base) la caché también se descarta
+    estado = (presupuesto_backend.DB_PATH, id(conn), conn.execute("PRAGMA data_version").fetchone()[0])
+    if estado != _estado_cache:
+        _cache.clear()
+        _estado_cache = estado
+
+    clave = (fecha, moneda)
+    if clave not in _cache:
+        fila = consultas.uno(conn, "tipo_cambio_vigente", (moneda, fecha))
+        if fila is None:
+            return None
+        _cache[clave] = fila[0]
+    return _cache[clave]
+
+
+def totales_convertidos(tabla='notas_pedido', moneda=MONEDA_LOCAL, desde=None, hasta=None):
+    """
+    Devuelve los totales de todas las cabeceras de 'tabla' (notas_pedido o presupuestos) convertidos
+    a 'moneda' con la cotización vigente a la fecha de cada documento, en una sola consulta.
+    Cada fila: (id, fecha, total_usd, total_con_iva_usd, tipo_cambio, total_moneda, total_con_iva_moneda).
+    Las cabeceras anteriores a la primera cotización cargada quedan con tipo_cambio e importes en None.
+    """
+    if tabla not in TABLAS_CONVERTIBLES:
+        raise ValueError(f"Tabla inválida: '{tabla}'. Opciones: {', '.join(TABLAS_CONVERTIBLES)}")
+    return consultas.todos(presupuesto_backend.conexion(), TABLAS_CONVERTIBLES[tabla],
+                           {'moneda': moneda, 'desde': desde or None, 'hasta': hasta or None})
+
+
+def convertir_dataframe(df, columna_fecha, columnas_importe, moneda=MONEDA_LOCAL):
+    """
+    Agrega a un DataFrame la columna 'tipo_cambio' y una columna '<importe>_<moneda>' por cada importe,
+    usando pandas.merge_asof contra la tabla tipo_cambio (sin recorrer las filas en Python).
+    Las fechas deben estar en formato AAAA-MM-DD.
+    """
+    cotizaciones = pd.DataFrame(consultas.todos(presupuesto_backend.conexion(), "cotizaciones_moneda", (moneda,)),
+                                columns=['fecha', 'tipo_cambio'])
+
+    resultado = df.copy()
+    resultado['_fecha_orden'] = pd.to_datetime(resultado[columna_fecha])
+    resultado['_posicion'] = range(len(resultado))
+    cotizaciones['_fecha_orden'] = pd.to_datetime(cotizaciones['fecha'])
+
+    resultado = pd.merge_asof(resultado.sort_values('_fecha_orden'), cotizaciones[['_fecha_orden', 'tipo_cambio']],
+                              on='_fecha_orden', direction='backward')
+    for columna in columnas_importe:
+        resultado[f"{columna}_{moneda.lower()}"] = (resultado[columna] * resultado['tipo_cambio']).round(2)
+    return resultado.sort_values('_posicion').drop(columns=['_fecha_orden', '_posicion']).reset_index(drop=True)
+
+
+def registrar_presupuesto_guardado(presupuesto_id, metodo_pago=None, detalles_pago=None, moneda=MONEDA_LOCAL):
+    """
+    Guarda un presupuesto en presupuestos_guardados con su total en USD (con IVA) y en pesos,
+    usando la cotización vigente a la fecha del presupuesto. Devuelve (éxito, mensaje).
+    """
+    conn = presupuesto_backend.conexion()
+    fila = consultas.uno(conn, "presupuesto_con_cotizacion", {'id': presupuesto_id, 'moneda': moneda})
+    if not fila:
+        return False, f"Presupuesto con ID {presupuesto_id} no encontrado."
+
+    fecha, razon_social, cuit, total_usd, valor = fila
+    if valor is None:
+        return False, f"No hay tipo de cambio {moneda} cargado para la fecha {fecha}."
+
+    try:
+        with conn:
+            consultas.ejecutar(conn, "guardar_presupuesto_guardado",
+                               (presupuesto_id, fecha, razon_social, cuit, total_usd, round(total_usd * valor, 2), valor,
+                                metodo_pago, detalles_pago))
+    except Exception as e:
+        return False, f"Error al guardar el historial del presupuesto: {e}"
+    return True, f"Presupuesto #{presupuesto_id} guardado: {total_usd:.2f} USD = {total_usd * valor:.2f} {moneda} (TC {valor:.2f})."
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Uso: python tipo_cambio.py <archivo.csv> [moneda]")
+        raise SystemExit(1)
+    presupuesto_backend.inicializar_base_de_datos()
+    exito, mensaje = cargar_tipos_cambio_csv(sys.argv[1], *(sys.argv[2:3]))
+    print(("✅ " if exito else "❌ ") + mensaje)
+    raise SystemExit(0 if exito else 1)